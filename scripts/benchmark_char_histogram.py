@@ -0,0 +1,143 @@
+"""
+Verifica di equivalenza e benchmark dell'istogramma dei code point (blocks.char_histogram).
+
+comando:
+    python3 scripts/benchmark_char_histogram.py
+    python3 scripts/benchmark_char_histogram.py --files "data/train/*.jsonl" --n-fuzz 20000
+
+Questo script:
+1. Legge i testi dei JSONL indicati e genera testi casuali con caratteri Unicode "difficili"
+   (maiuscole cerchiate, sigma finale, İ, surrogati isolati, spazi non ASCII)
+2. Confronta i conteggi per classe e l'entropia di CharHistogram con i calcoli carattere per
+   carattere usati finora in DocStatsCsv e spam_stats (str.isspace, Counter, ...)
+3. Misura il tempo dei due percorsi sui testi reali
+4. Esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.char_histogram import CharHistogram, SPECIAL_CHARS, STATS_PUNCTUATION, VOWELS
+from blocks.spam_classifier.spam_keywords import ACCENTED_CHARS
+
+_FUZZ_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789 .,;:!?()[]\"'«»@#$%^&*+=€"
+    "àèéìòùÀÈÉÌÒÙ \n\t\r\x0b\x0c\xa0  ½²³ ÆØÅß İıΣσς ⒶⓐⅠⅻ ٣ 😀🎉 ﬁ 𐏿 \ud800\udfff"
+)
+
+
+def reference_counts(text: str) -> dict:
+    """I conteggi come venivano calcolati prima, una generator expression per classe."""
+    digit = upper = punct = space = 0
+    for c in text:
+        if c.isdigit():
+            digit += 1
+        elif c.isupper():
+            upper += 1
+        elif c.isspace():
+            space += 1
+        elif not c.isalnum():
+            punct += 1
+    counts = Counter(text)
+    text_len = len(text)
+    return {
+        "whitespace": sum(1 for c in text if c.isspace()),
+        "non_alnum": sum(1 for c in text if not c.isalnum()),
+        "non_alnum_non_space": sum((not ch.isalnum()) and (not ch.isspace()) for ch in text),
+        "digit": sum(1 for c in text if c.isdigit()),
+        "upper": sum(1 for c in text if c.isupper()),
+        "lower": sum(1 for c in text if c.islower()),
+        "alpha": sum(ch.isalpha() for ch in text),
+        "vowel": sum(1 for c in text.lower() if c in VOWELS),
+        "consonant": sum(1 for c in text if c.isalpha() and c.lower() not in VOWELS),
+        "punctuation": sum(1 for c in text if c in STATS_PUNCTUATION),
+        "special": sum(1 for c in text if c in SPECIAL_CHARS),
+        "accented": sum(ch.lower() in ACCENTED_CHARS for ch in text),
+        "spam_upper": upper,
+        "spam_space": space,
+        "spam_punct": punct,
+        "entropy": -sum((n / text_len) * math.log2(n / text_len) for n in counts.values()) if text else 0.0,
+        "count": {c: text.count(c) for c in "!?\n€$.,'\"()«»:;"},
+    }
+
+
+def histogram_counts(text: str) -> dict:
+    hist = CharHistogram(text)
+    result = dict(hist.class_counts())
+    result["entropy"] = hist.entropy()
+    result["count"] = {c: hist.count(c) for c in "!?\n€$.,'\"()«»:;"}
+    return result
+
+
+def load_texts(patterns: list[str]) -> list[str]:
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text")
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(text, str):
+                        texts.append(text)
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e benchmark di CharHistogram.")
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=["data/train/*.jsonl", "data/test/*.jsonl", "data/dataset/*.jsonl", "data/spam/*.jsonl"],
+    )
+    parser.add_argument("--n-fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    texts = load_texts(args.files)
+    rng = random.Random(args.seed)
+    fuzz = ["".join(rng.choices(_FUZZ_ALPHABET, k=rng.randint(0, 300))) for _ in range(args.n_fuzz)]
+
+    mismatches = 0
+    for text in texts + fuzz:
+        expected, got = reference_counts(text), histogram_counts(text)
+        if expected != got:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {k: (expected[k], got.get(k)) for k in expected if expected[k] != got.get(k)}
+                print(f"[DIFF] {text[:60]!r}: {diff}")
+
+    start = time.perf_counter()
+    for text in texts:
+        reference_counts(text)
+    reference_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts:
+        histogram_counts(text)
+    histogram_s = time.perf_counter() - start
+
+    n_chars = sum(len(t) for t in texts)
+    print("=" * 64)
+    print(f"Testi reali: {len(texts)} ({n_chars} caratteri) | testi casuali: {len(fuzz)}")
+    print(f"Differenze: {mismatches}")
+    print(f"Passaggi per classe + Counter: {reference_s:.2f} s")
+    print(f"CharHistogram:                 {histogram_s:.2f} s ({reference_s / histogram_s:.1f}x)")
+    print("=" * 64)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Verifica di equivalenza e benchmark delle feature di co-occorrenza per frase (spam_keywords.chunk_signal_masks).
+
+comando:
+    python3 scripts/benchmark_chunk_signals.py
+    python3 scripts/benchmark_chunk_signals.py --files "data/spam/*.jsonl" --n-fuzz 20000
+
+Questo script:
+1. Legge i testi dei JSONL indicati e genera testi casuali con frasi che mescolano termini CTA,
+   brand, urgenza e denaro, URL spezzati dalla punteggiatura, importi e simboli di valuta
+2. Confronta cta_plus_url_score, brand_plus_link_score, urgency_cta_url_combo e money_cta_combo
+   calcolati dalle maschere per frase con le quattro funzioni usate finora, che dividevano e
+   normalizzavano il testo una volta ciascuna
+3. Misura il tempo dei due percorsi sui testi reali
+4. Esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.spam_classifier.spam_keywords import (
+    AMOUNT_RE,
+    BRAND_TERMS,
+    CTA_TERMS,
+    MONEY_TERMS,
+    URGENCY_TERMS,
+    chunk_signal_masks,
+    combo_counts,
+    extract_urls,
+    normalize_for_matching,
+)
+
+_FUZZ_PIECES = [
+    "https://bit.ly/abc", "http:/esempio", "HTTPS://Poste.it/login", "www.sito.xyz", "mario@posta.it",
+    "10 €", "€5", "20,50 euro", "€", "$", "!", "?", ".", "\n", "ciao", "il", "di", "la", "grazie",
+]
+
+
+_CANDIDATES = {
+    id(terms): [f" {normalize_for_matching(term)} " for term in terms]
+    for terms in (CTA_TERMS, BRAND_TERMS, URGENCY_TERMS, MONEY_TERMS)
+}
+
+
+def _count_term_matches(normalized_text: str, terms) -> int:
+    padded = f" {normalize_for_matching(normalized_text)} "
+    return sum(padded.count(candidate) for candidate in _CANDIDATES[id(terms)])
+
+
+def reference_combos(text: str) -> dict:
+    """Le quattro funzioni originali, ognuna con la propria divisione in frasi."""
+    chunks = [chunk for chunk in re.split(r"[\n.!?]+", text) if chunk.strip()]
+    cta_url = brand_url = urgency_cta_url = money_cta = 0
+    for chunk in chunks:
+        normalized = normalize_for_matching(chunk)
+        if extract_urls(chunk) and _count_term_matches(normalized, CTA_TERMS) > 0:
+            cta_url += 1
+    for chunk in chunks:
+        normalized = normalize_for_matching(chunk)
+        if extract_urls(chunk) and _count_term_matches(normalized, BRAND_TERMS) > 0:
+            brand_url += 1
+    for chunk in chunks:
+        normalized = normalize_for_matching(chunk)
+        if (
+            extract_urls(chunk)
+            and _count_term_matches(normalized, URGENCY_TERMS) > 0
+            and _count_term_matches(normalized, CTA_TERMS) > 0
+        ):
+            urgency_cta_url += 1
+    for chunk in chunks:
+        normalized = normalize_for_matching(chunk)
+        has_money = _count_term_matches(normalized, MONEY_TERMS) > 0 or sum(1 for _ in AMOUNT_RE.finditer(chunk)) > 0
+        if has_money and _count_term_matches(normalized, CTA_TERMS) > 0:
+            money_cta += 1
+    return {
+        "cta_plus_url_score": cta_url,
+        "brand_plus_link_score": brand_url,
+        "urgency_cta_url_combo": urgency_cta_url,
+        "money_cta_combo": money_cta,
+    }
+
+
+def load_texts(patterns: list[str]) -> list[str]:
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text")
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(text, str):
+                        texts.append(text)
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e benchmark delle maschere per frase.")
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=["data/train/*.jsonl", "data/test/*.jsonl", "data/dataset/*.jsonl", "data/spam/*.jsonl"],
+    )
+    parser.add_argument("--n-fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = sorted(CTA_TERMS | BRAND_TERMS | URGENCY_TERMS | MONEY_TERMS) + _FUZZ_PIECES
+    fuzz = [""] + [" ".join(rng.choices(vocabulary, k=rng.randint(1, 30))) for _ in range(args.n_fuzz)]
+    texts = load_texts(args.files)
+
+    mismatches = 0
+    for text in texts + fuzz:
+        expected, got = reference_combos(text), combo_counts(chunk_signal_masks(text))
+        if expected != got:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {k: (expected[k], got[k]) for k in expected if expected[k] != got[k]}
+                print(f"[DIFF] {text[:60]!r}: {diff}")
+
+    start = time.perf_counter()
+    for text in texts:
+        reference_combos(text)
+    reference_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts:
+        combo_counts(chunk_signal_masks(text))
+    masks_s = time.perf_counter() - start
+
+    print("=" * 64)
+    print(f"Testi reali: {len(texts)} | testi casuali: {len(fuzz)}")
+    print(f"Differenze: {mismatches}")
+    print(f"Quattro passate per frase: {reference_s:.2f} s")
+    print(f"Maschere per frase:        {masks_s:.2f} s ({reference_s / masks_s:.1f}x)")
+    print("=" * 64)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
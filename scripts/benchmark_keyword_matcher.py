@@ -0,0 +1,112 @@
+"""
+Verifica di equivalenza e benchmark del conteggio keyword con Aho-Corasick (spam_keywords.KeywordMatcher).
+
+comando:
+    python3 scripts/benchmark_keyword_matcher.py
+    python3 scripts/benchmark_keyword_matcher.py --files "data/train/*.jsonl" --n-fuzz 20000
+
+Questo script:
+1. Legge i testi dei JSONL indicati e genera testi casuali composti da termini delle categorie,
+   ripetuti e adiacenti (es. "ora ora ora"), con punteggiatura, accenti e testi vuoti
+2. Confronta i conteggi per categoria di count_keyword_categories con il calcolo usato finora:
+   una ``padded.count(candidate)`` per ogni termine di ogni categoria
+3. Misura il tempo dei due percorsi sui testi reali (normalizzazione esclusa)
+4. Esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.spam_classifier.spam_keywords import (
+    TERM_CATEGORIES,
+    count_keyword_categories,
+    matching_text,
+    normalize_for_matching,
+)
+
+_FUZZ_FILLERS = ["il", "la", "di", "e", ".", ",", "!", "'", "€", "  ", "\n", "identità", "ORA", "Clicca-qui"]
+
+
+_CANDIDATES = {
+    category: [f" {normalize_for_matching(term)} " for term in terms]
+    for category, terms in TERM_CATEGORIES.items()
+}
+
+
+def reference_counts(padded: str) -> dict:
+    """Il calcolo originale (con i candidati già normalizzati): una scansione del testo per ogni termine."""
+    return {category: sum(padded.count(c) for c in candidates) for category, candidates in _CANDIDATES.items()}
+
+
+def load_texts(patterns: list[str]) -> list[str]:
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text")
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(text, str):
+                        texts.append(text)
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e benchmark del KeywordMatcher.")
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=["data/train/*.jsonl", "data/test/*.jsonl", "data/dataset/*.jsonl", "data/spam/*.jsonl"],
+    )
+    parser.add_argument("--n-fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = sorted({term for terms in TERM_CATEGORIES.values() for term in terms}) + _FUZZ_FILLERS
+    fuzz = [""] + [" ".join(rng.choices(vocabulary, k=rng.randint(1, 40))) for _ in range(args.n_fuzz)]
+    texts = load_texts(args.files)
+    padded_texts = [matching_text(normalize_for_matching(text)) for text in texts]
+
+    mismatches = 0
+    for padded in padded_texts + [matching_text(normalize_for_matching(text)) for text in fuzz]:
+        expected, got = reference_counts(padded), count_keyword_categories(padded)
+        if expected != got:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {k: (expected[k], got[k]) for k in expected if expected[k] != got[k]}
+                print(f"[DIFF] {padded[:60]!r}: {diff}")
+
+    start = time.perf_counter()
+    for padded in padded_texts:
+        reference_counts(padded)
+    reference_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for padded in padded_texts:
+        count_keyword_categories(padded)
+    matcher_s = time.perf_counter() - start
+
+    n_terms = sum(len(terms) for terms in TERM_CATEGORIES.values())
+    print("=" * 64)
+    print(f"Testi reali: {len(texts)} | testi casuali: {len(fuzz)} | termini: {n_terms}")
+    print(f"Differenze: {mismatches}")
+    print(f"str.count per termine: {reference_s:.2f} s")
+    print(f"Aho-Corasick:          {matcher_s:.2f} s ({reference_s / matcher_s:.1f}x)")
+    print("=" * 64)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Verifica di equivalenza e tempi per funzione della normalizzazione per il matching (spam_keywords.normalize_for_matching).
+
+comando:
+    python3 scripts/benchmark_normalization.py
+    python3 scripts/benchmark_normalization.py --files "data/spam/*.jsonl" --n-fuzz 20000
+
+Questo script:
+1. Confronta normalize_for_matching (tabella per ``str.translate``) con la versione originale
+   (NFKD, filtro dei segni combinanti e due regex) su ogni code point Unicode, sui testi dei
+   JSONL indicati e su testi casuali con accenti, legature, sigma finale e surrogati isolati
+2. Misura il tempo di ogni funzione di spam_keywords che normalizza il testo, prima (versione
+   originale) e dopo, e quello di extract_spam_features su un documento
+3. Esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+
+from blocks import text_analysis
+from blocks.spam_classifier import spam_keywords as sk
+from blocks.spam_classifier.spam_stats import extract_spam_features
+
+_FUZZ_ALPHABET = (
+    "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789 .,;:!?'’«»-_/@€$%"
+    "àèéìòùÀÈÉÌÒÙçÇñÑ \n\t\xa0 ﬁﬀ ½²³ ÆØÅßİıΣσς ℌⒶⓐ ᴭ 가 ȩ́ 😀 \ud800"
+)
+
+
+def reference_normalize(text: str) -> str:
+    """normalize_for_matching com'era prima della tabella di traduzione."""
+    if not text:
+        normalized = ""
+    else:
+        lowered = text.lower()
+        decomposed = unicodedata.normalize("NFKD", lowered)
+        stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        normalized = " ".join(stripped.split())
+    normalized = normalized.replace("'", " ")
+    normalized = re.sub(r"[^0-9a-zA-ZÀ-ÖØ-öø-ÿ]+", " ", normalized, flags=re.UNICODE)
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+FUNCTIONS = [
+    "normalize_for_matching",
+    "keyword_bundle",
+    "count_ham_business_terms",
+    "count_ham_formal_terms",
+    "count_ham_admin_doc_terms",
+    "count_ham_technical_business_terms",
+    "count_action_phrases",
+    "count_safe_security_ham_terms",
+    "chunk_signal_masks",
+    "quick_pattern_counts",
+]
+
+
+def use_normalizer(normalize) -> None:
+    """Sostituisce la normalizzazione usata da spam_keywords e text_analysis."""
+    sk.normalize_for_matching = normalize
+    text_analysis.normalize_for_matching = normalize
+
+
+def time_functions(texts: list[str]) -> dict:
+    timings = {}
+    for name in FUNCTIONS:
+        fn = getattr(sk, name)
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        timings[name] = time.perf_counter() - start
+    start = time.perf_counter()
+    for i, text in enumerate(texts):
+        extract_spam_features(Document(text=text, id=str(i)))
+    timings["extract_spam_features"] = time.perf_counter() - start
+    return timings
+
+
+def load_texts(patterns: list[str]) -> list[str]:
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text")
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(text, str):
+                        texts.append(text)
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e tempi della normalizzazione per il matching.")
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=["data/train/*.jsonl", "data/test/*.jsonl", "data/dataset/*.jsonl", "data/spam/*.jsonl"],
+    )
+    parser.add_argument("--n-fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    new_normalize = sk.normalize_for_matching
+    texts = load_texts(args.files)
+    rng = random.Random(args.seed)
+    fuzz = ["".join(rng.choices(_FUZZ_ALPHABET, k=rng.randint(0, 200))) for _ in range(args.n_fuzz)]
+    codepoints = [chr(cp) for cp in range(sys.maxunicode + 1)]
+
+    mismatches = 0
+    for text in codepoints + texts + fuzz:
+        expected, got = reference_normalize(text), new_normalize(text)
+        if expected != got:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"[DIFF] {text[:40]!r}: {expected[:40]!r} != {got[:40]!r}")
+        # matching_text normalizza due volte: anche la seconda passata deve coincidere
+        elif reference_normalize(expected) != new_normalize(got):
+            mismatches += 1
+
+    use_normalizer(reference_normalize)
+    before = time_functions(texts)
+    use_normalizer(new_normalize)
+    after = time_functions(texts)
+
+    print("=" * 72)
+    print(f"Code point: {len(codepoints)} | testi reali: {len(texts)} | testi casuali: {len(fuzz)}")
+    print(f"Differenze: {mismatches}")
+    print("-" * 72)
+    print(f"{'funzione':<38}{'prima s':>10}{'dopo s':>10}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<38}{before[name]:>10.2f}{after[name]:>10.2f}{before[name] / after[name]:>9.1f}x")
+    print("=" * 72)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark del throughput di ItalianClassification al variare di batch_size.
+
+comando:
+    python3 scripts/benchmark_quality_batch.py --csv data/splits/doc_stats_test.csv --batch-sizes 1 64 512 4096
+
+Questo script:
+1. Carica un CSV di feature prodotto da DocStatsCsv e ricostruisce i documenti con le feature nei metadata
+2. Misura il percorso storico documento per documento (DataFrame a riga singola + scaler + predict_proba)
+3. Misura filter_batch() per ogni batch_size richiesto
+4. Verifica che label e score coincidano con il percorso storico e stampa docs/sec e speedup
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+warnings.filterwarnings(
+    "ignore",
+    message="X does not have valid feature names.*",
+    category=UserWarning,
+)
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+from datatrove.utils.batching import batched
+
+from blocks.filters import ItalianClassification
+
+
+def load_documents(csv_path: str, repeat: int) -> list[Document]:
+    """Ricostruisce i documenti a partire dalle righe del CSV di feature."""
+    df = pd.read_csv(csv_path)
+    rows = df.to_dict(orient="records")
+    docs = []
+    for r in range(repeat):
+        for i, row in enumerate(rows):
+            docs.append(Document(text="", id=f"{row.get('doc_id', i)}_{r}", metadata=dict(row)))
+    return docs
+
+
+def legacy_predict(step: ItalianClassification, doc: Document) -> tuple[float, str]:
+    """Riproduce il percorso di inferenza per singolo documento precedente al batching."""
+    clf = step.classifier
+    features = clf._extract_features(doc)
+    x = pd.DataFrame([features], columns=clf.feature_names)
+    x_scaled = pd.DataFrame(clf.scale_features(x), columns=clf.feature_names)
+    score_good = float(clf.model.predict_proba(x_scaled)[0][1])
+    return score_good, step._label(score_good)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark batch scoring del QualityClassifier.")
+    parser.add_argument("--model", default="models/lgbm_quality_model.joblib", help="Modello qualità (.joblib)")
+    parser.add_argument("--csv", default="data/splits/doc_stats_test.csv", help="CSV di feature DocStatsCsv")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 512, 4096])
+    parser.add_argument("--repeat", type=int, default=2, help="Replica il CSV per avere batch grandi pieni")
+    parser.add_argument("--legacy-limit", type=int, default=2000, help="Documenti misurati sul percorso storico")
+    args = parser.parse_args()
+
+    docs = load_documents(args.csv, args.repeat)
+    print(f"Documenti: {len(docs)} | feature: {args.csv}")
+
+    step = ItalianClassification(model_path=args.model, batch_size=1)
+
+    # 1. Percorso storico (documento per documento)
+    legacy_docs = docs[: args.legacy_limit]
+    start = time.perf_counter()
+    legacy = [legacy_predict(step, doc) for doc in legacy_docs]
+    legacy_dps = len(legacy_docs) / (time.perf_counter() - start)
+
+    print("\n" + "=" * 60)
+    print(f"{'Modalità':24}{'docs/sec':>14}{'speedup':>12}{'max |Δscore|':>14}")
+    print("-" * 60)
+    print(f"{'per-doc (storico)':24}{legacy_dps:>14.0f}{1.0:>12.1f}{'-':>14}")
+
+    # 2. filter_batch con batch_size diversi
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        results = []
+        for batch in batched(docs, batch_size):
+            results.extend(step.filter_batch(batch))
+        dps = len(docs) / (time.perf_counter() - start)
+
+        max_delta = 0.0
+        for doc, (score_good, label) in zip(legacy_docs, legacy):
+            if doc.metadata["quality_label"] != label:
+                raise AssertionError(f"Label diversa per {doc.id}: {doc.metadata['quality_label']} != {label}")
+            max_delta = max(max_delta, abs(doc.metadata["quality_score"] - round(score_good, 4)))
+
+        print(f"{f'batch_size={batch_size}':24}{dps:>14.0f}{dps / legacy_dps:>12.1f}{max_delta:>14.2g}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
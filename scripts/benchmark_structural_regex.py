@@ -0,0 +1,168 @@
+"""
+Verifica di equivalenza e benchmark del conteggio delle regex strutturali di DocStatsCsv (stats.count_structural_matches).
+
+comando:
+    python3 scripts/benchmark_structural_regex.py
+    python3 scripts/benchmark_structural_regex.py --files "data/train/*.jsonl" "data/spam/*.jsonl" --n-fuzz 20000
+
+Questo script:
+1. Legge i testi dei JSONL indicati (default data/train) e genera testi casuali con elenchi puntati,
+   URL, email, tag HTML, caratteri e parole ripetuti, spazi e punteggiatura consecutivi
+2. Confronta i conteggi di count_structural_matches con ``len(RE_xxx.findall(text))`` per le
+   nove regex (RE_ELIPSIS, RE_BULLET, RE_URL, RE_EMAIL, RE_HTML, RE_REPEATED_CHARS,
+   RE_REPEATED_SEQ, RE_SPACES, RE_PUNC_SEQ)
+3. Riporta il numero di scansioni del testo per documento e i tempi: le nove findall come prima
+   dell'analisi condivisa (due per le regex usate sia nel conteggio sia nel rapporto), una findall
+   per regex, count_structural_matches (un finditer per regex, senza liste)
+4. Ripete confronto e tempi su testi avversari da 50-100K caratteri (caratteri ripetuti,
+   punteggiatura ripetuta, righe di separatori, parole ripetute): il conteggio deve restare
+   lineare come findall
+5. Esce con codice 1 se c'è anche una sola differenza o se su un testo avversario
+   count_structural_matches è molto più lento di findall
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.stats import (
+    RE_BULLET,
+    RE_ELIPSIS,
+    RE_EMAIL,
+    RE_HTML,
+    RE_PUNC_SEQ,
+    RE_REPEATED_CHARS,
+    RE_REPEATED_SEQ,
+    RE_SPACES,
+    RE_URL,
+    count_structural_matches,
+)
+
+REGEXES = {
+    "elipsis": RE_ELIPSIS,
+    "bullet": RE_BULLET,
+    "url": RE_URL,
+    "email": RE_EMAIL,
+    "html": RE_HTML,
+    "repeated_char": RE_REPEATED_CHARS,
+    "repeated_seq": RE_REPEATED_SEQ,
+    "spaces": RE_SPACES,
+    "punc_seq": RE_PUNC_SEQ,
+}
+# Regex lette due volte (conteggio e rapporto) prima dell'analisi condivisa
+_READ_TWICE = {"url", "email", "html", "bullet", "repeated_char"}
+
+# Testi che rendono quadratica una scansione con lookahead sovrapposti: ogni posizione di una
+# sequenza ripetuta riapre il match fino alla fine della sequenza
+ADVERSARIAL = {
+    '"a" * 50000': "a" * 50000,
+    '"!" * 50000': "!" * 50000,
+    "10 righe di 5000 \"-\"": "\n".join(["-" * 5000] * 10),
+    '"offerta " * 12500': "offerta " * 12500,
+    '"<" * 50000 + ">"': "<" * 50000 + ">",
+    '"  " * 25000': "  " * 25000,
+}
+# Margine sul tempo di findall oltre il quale un testo avversario è considerato un regresso
+_SLOWDOWN_LIMIT = 5.0
+_SLOWDOWN_MIN_S = 0.05
+
+_FUZZ_PIECES = [
+    "ciao", "Ciao", "CIAO", "ciao ciao", "la la la", "- voce", "* voce", "• voce", "\n", "\n\n", " ", "  ",
+    "   ", "...", "…", "!!", "?!", ".,", "<b>", "</p>", "<", ">", "https://sito.it/a?b=1", "http://x",
+    "mario.rossi@posta.it", "a@b.c", "aaa", "zzzz", "!!!", "12", "ééé", "\t",
+]
+
+
+def reference_counts(text: str) -> dict:
+    return {name: len(regex.findall(text)) for name, regex in REGEXES.items()}
+
+
+def load_texts(patterns: list[str]) -> list[str]:
+    texts = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text = json.loads(line).get("text")
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(text, str):
+                        texts.append(text)
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e benchmark della scansione unica delle regex strutturali.")
+    parser.add_argument("--files", nargs="+", default=["data/train/*.jsonl"])
+    parser.add_argument("--n-fuzz", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni della misura dei tempi")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    fuzz = [""] + ["".join(rng.choices(_FUZZ_PIECES, k=rng.randint(1, 40))) for _ in range(args.n_fuzz)]
+    texts = load_texts(args.files)
+
+    mismatches = 0
+    for text in texts + fuzz + list(ADVERSARIAL.values()):
+        expected, got = reference_counts(text), count_structural_matches(text)
+        if expected != got:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {k: (expected[k], got[k]) for k in expected if expected[k] != got[k]}
+                print(f"[DIFF] {text[:60]!r}: {diff}")
+
+    def timed(fn) -> float:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in texts:
+                fn(text)
+        return (time.perf_counter() - start) / args.repeat
+
+    original_s = timed(lambda text: [len(REGEXES[n].findall(text)) for n in list(REGEXES) + sorted(_READ_TWICE)])
+    findall_s = timed(reference_counts)
+    counted_s = timed(count_structural_matches)
+
+    def best_of(fn, text: str) -> float:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn(text)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    adversarial = [
+        (label, best_of(reference_counts, text), best_of(count_structural_matches, text))
+        for label, text in ADVERSARIAL.items()
+    ]
+    slow = [label for label, ref_s, got_s in adversarial if got_s > max(_SLOWDOWN_LIMIT * ref_s, _SLOWDOWN_MIN_S)]
+
+    n_chars = sum(len(t) for t in texts)
+    print("=" * 72)
+    print(f"Testi reali: {len(texts)} ({n_chars} caratteri) | testi casuali: {len(fuzz)}")
+    print(f"Differenze: {mismatches}")
+    print("-" * 72)
+    print(f"{'percorso':<34}{'scansioni/doc':>14}{'tempo s':>10}{'speedup':>10}")
+    print(f"{'findall doppie (originale)':<34}{len(REGEXES) + len(_READ_TWICE):>14}{original_s:>10.3f}{1.0:>9.1f}x")
+    print(f"{'una findall per regex':<34}{len(REGEXES):>14}{findall_s:>10.3f}{original_s / findall_s:>9.1f}x")
+    print(f"{'finditer per regex, senza liste':<34}{len(REGEXES):>14}{counted_s:>10.3f}{original_s / counted_s:>9.1f}x")
+    print("-" * 72)
+    print(f"{'testo avversario':<34}{'findall s':>14}{'conteggio s':>12}")
+    for label, ref_s, got_s in adversarial:
+        flag = "  [LENTO]" if label in slow else ""
+        print(f"{label:<34}{ref_s:>14.4f}{got_s:>12.4f}{flag}")
+    print("=" * 72)
+    if mismatches or slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
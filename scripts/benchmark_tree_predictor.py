@@ -0,0 +1,116 @@
+"""
+Verifica di equivalenza e benchmark del backend NumPy (TreeEnsemblePredictor) rispetto a LightGBM.
+
+comando:
+    python3 scripts/benchmark_tree_predictor.py
+    python3 scripts/benchmark_tree_predictor.py --quality-csv data/splits/doc_stats_test.csv --spam-csv output/feature/spam_doc_features.csv
+
+Questo script:
+1. Carica gli artifact di qualità e spam e costruisce il predittore ad array piatti
+2. Confronta predict_proba del percorso standard (scaler + wrapper sklearn) con quello NumPy
+   su un CSV di feature o su righe sintetiche, e verifica che le label alla soglia coincidano
+3. Misura docs/sec dei due percorsi per ogni batch_size richiesto
+4. Esce con codice 1 se la differenza supera --atol
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings(
+    "ignore",
+    message="X does not have valid feature names.*",
+    category=UserWarning,
+)
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.model_optimization import synthetic_feature_frame
+from blocks.tree_predictor import TreeEnsemblePredictor
+
+
+def stock_proba(artifact: dict, X: np.ndarray) -> np.ndarray:
+    """Percorso standard dei classificatori: DataFrame + scaler.transform + predict_proba."""
+    feature_names = list(artifact["feature_names"])
+    frame = pd.DataFrame(X, columns=feature_names, copy=False)
+    if artifact.get("scaler") is not None:
+        frame = pd.DataFrame(artifact["scaler"].transform(frame), columns=feature_names)
+    return artifact["model"].predict_proba(frame)[:, 1]
+
+
+def load_features(artifact: dict, csv_path: str | None, n_synthetic: int) -> tuple[np.ndarray, str]:
+    if csv_path and os.path.exists(csv_path):
+        X = pd.read_csv(csv_path)[list(artifact["feature_names"])]
+        X = X.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        return X.to_numpy(dtype=np.float64), csv_path
+    if artifact.get("scaler") is None:
+        raise ValueError("Artifact senza scaler: indicare un CSV di feature per la verifica")
+    return synthetic_feature_frame(artifact, n_rows=n_synthetic).to_numpy(), f"{n_synthetic} righe sintetiche"
+
+
+def throughput(fn, X: np.ndarray, batch_size: int, repeat: int) -> float:
+    """docs/sec di fn applicata a blocchi di batch_size righe (migliore di repeat ripetizioni)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(X), batch_size):
+            fn(X[i:i + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return len(X) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Equivalenza e benchmark di TreeEnsemblePredictor.")
+    parser.add_argument("--quality-model", default="models/lgbm_quality_model.joblib")
+    parser.add_argument("--quality-csv", default="data/splits/doc_stats_test.csv")
+    parser.add_argument("--spam-model", default="models/spam_lgbm.joblib")
+    parser.add_argument("--spam-csv", default=None, help="CSV di feature spam (default: righe sintetiche)")
+    parser.add_argument("--n-synthetic", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 512, 4096])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-12)
+    args = parser.parse_args()
+
+    failed = False
+    for name, model_path, csv_path in [
+        ("quality", args.quality_model, args.quality_csv),
+        ("spam", args.spam_model, args.spam_csv),
+    ]:
+        artifact = joblib.load(model_path)
+        predictor = TreeEnsemblePredictor.from_artifact(artifact)
+        X, source = load_features(artifact, csv_path, args.n_synthetic)
+        threshold = float(artifact.get("threshold") or 0.5)
+
+        expected = stock_proba(artifact, X)
+        got = predictor.predict_proba(X)[:, 1]
+        max_diff = float(np.abs(expected - got).max())
+        label_mismatch = int(((expected >= threshold) != (got >= threshold)).sum())
+
+        print("\n" + "=" * 64)
+        print(f"{name}: {model_path} | {predictor.n_trees} alberi | {source}")
+        print(f"max |Δproba| = {max_diff:.3g} | label diverse alla soglia {threshold}: {label_mismatch}")
+        if max_diff > args.atol or label_mismatch:
+            print(f"[ERRORE] backend NumPy non equivalente (atol={args.atol})")
+            failed = True
+
+        print("-" * 64)
+        print(f"{'batch_size':>12}{'lightgbm docs/s':>18}{'numpy docs/s':>16}{'rapporto':>12}")
+        for batch_size in args.batch_sizes:
+            stock_dps = throughput(lambda b: stock_proba(artifact, b), X, batch_size, args.repeat)
+            numpy_dps = throughput(predictor.predict_proba, X, batch_size, args.repeat)
+            print(f"{batch_size:>12}{stock_dps:>18.0f}{numpy_dps:>16.0f}{numpy_dps / stock_dps:>12.2f}")
+    print("=" * 64)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
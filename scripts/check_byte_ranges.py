@@ -0,0 +1,104 @@
+"""
+Verifica che la lettura a intervalli di byte (blocks.readers.ByteRangeJsonlReader) restituisca
+esattamente i documenti di JsonlReader, per qualsiasi numero di task.
+
+comando:
+    python3 scripts/check_byte_ranges.py
+    python3 scripts/check_byte_ranges.py --data-dir data --pattern "dataset/*.jsonl" --tasks 1 3 14 64
+
+Questo script:
+1. Legge l'input con JsonlReader (un task) come riferimento: id, testo e metadata di ogni documento
+2. Per ogni numero di task legge l'input con ByteRangeJsonlReader su tutti i rank e controlla che
+   l'unione dei documenti coincida con il riferimento, senza documenti persi né duplicati
+3. Ripete il controllo su un file sintetico con righe vuote, righe non valide, caratteri multibyte,
+   ultima riga senza "a capo" e tutti i numeri di task fino alla sua dimensione in byte (ogni
+   possibile confine cade almeno una volta a metà riga, su un "a capo" e a inizio riga)
+4. Stampa byte e documenti per rank ed esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.readers import ByteRangeJsonlReader
+
+
+def doc_key(doc) -> tuple:
+    return doc.id, doc.text, json.dumps(doc.metadata, sort_keys=True, default=str)
+
+
+def read_all(reader_cls, data_dir: str, pattern: str, world_size: int) -> tuple[Counter, list]:
+    docs = Counter()
+    per_rank = []
+    for rank in range(world_size):
+        reader = reader_cls(data_folder=data_dir, glob_pattern=pattern)
+        rank_docs = [doc_key(doc) for doc in reader.run(rank=rank, world_size=world_size)]
+        docs.update(rank_docs)
+        per_rank.append(len(rank_docs))
+    return docs, per_rank
+
+
+def check(data_dir: str, pattern: str, task_counts: list[int], verbose: bool = True) -> int:
+    expected, _ = read_all(JsonlReader, data_dir, pattern, 1)
+    errors = 0
+    for world_size in task_counts:
+        got, per_rank = read_all(ByteRangeJsonlReader, data_dir, pattern, world_size)
+        missing, extra = expected - got, got - expected
+        if missing or extra:
+            errors += 1
+            print(f"[DIFF] {pattern} con {world_size} task: {sum(missing.values())} persi, {sum(extra.values())} in più")
+        elif verbose:
+            print(f"[OK] {pattern} con {world_size} task: {sum(got.values())} documenti | per rank: {per_rank}")
+    return errors
+
+
+def write_synthetic(path: str) -> None:
+    lines = [
+        json.dumps({"text": "primo documento"}),
+        "",
+        json.dumps({"text": "àèìòù € 😀 multibyte", "id": "con-id"}, ensure_ascii=False),
+        "{non valido",
+        json.dumps({"text": ""}),
+        json.dumps({"text": "x"}),
+        json.dumps({"text": "riga lunga " * 20, "metadata": {"label": "ham"}}),
+        json.dumps({"text": "ultima riga senza a capo"}),
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica della lettura JSONL a intervalli di byte.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--pattern", default="train/*.jsonl")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 2, 3, 7, 14, 64])
+    args = parser.parse_args()
+    # I log per intervallo dei reader coprirebbero il risultato
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    errors = check(args.data_dir, args.pattern, args.tasks)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic(os.path.join(tmp, "a.jsonl"))
+        write_synthetic(os.path.join(tmp, "b.jsonl"))
+        size = 2 * os.path.getsize(os.path.join(tmp, "a.jsonl"))
+        errors += check(tmp, "*.jsonl", list(range(1, size + 2)), verbose=False)
+        print(f"File sintetici: numeri di task da 1 a {size + 1} controllati")
+
+    print(f"Differenze: {errors}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
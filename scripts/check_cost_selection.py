@@ -0,0 +1,144 @@
+"""
+Verifica la selezione delle feature per costo di estrazione (blocks.feature_cost) sui dati del
+repository: budget di ROC-AUC rispettato, modello riaddestrato coerente con il report e
+documenti/secondo misurati dell'estrazione ridotta.
+
+comando:
+    python3 scripts/check_cost_selection.py
+    python3 scripts/check_cost_selection.py --auc-budget 0.005 --cost-docs 300
+
+Questo script:
+1. Misura il costo dei nodi di STATS_FEATURE_GRAPH e SPAM_FEATURE_GRAPH su --cost-docs documenti
+   di --cost-pattern (per lo spam con le feature delle regole di evidenza forte come fisse)
+2. Addestra il classificatore di qualità con selezione per costo (doc_stats_val.csv come training e
+   doc_stats_test.csv come validazione: il CSV di training non è nel repository)
+3. Costruisce il CSV delle feature spam da --spam-pattern e addestra il classificatore spam con
+   selezione per costo (split interno come training_spam_lgbmclassifier.py)
+4. Per entrambi controlla che la perdita di ROC-AUC resti entro il budget sui fold delle
+   righe di training usati dalla selezione e sullo split di test (o validazione) che la selezione non ha visto, che
+   il modello riaddestrato abbia la ROC-AUC e le feature del report e stampa i documenti/secondo
+   stimati e misurati
+5. Salva il modello di qualità riaddestrato e lo carica con ItalianClassification (backend
+   lightgbm e numpy): le statistiche richieste devono essere solo quelle scelte, e gli score dei
+   documenti di --cost-pattern, con le sole statistiche calcolate da DocStatsCsv ridotto, devono
+   coincidere con quelli del modello sulle statistiche complete. Esce con codice 1 se un
+   controllo fallisce
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.classifiers import FEATURE_DTYPE, QualityClassifier
+from blocks.feature_cost import FeatureCostModel, format_cost_report
+from blocks.filters import ItalianClassification
+from blocks.spam_classifier.spam_classifier import STRONG_EVIDENCE_FEATURES, SpamClassifier
+from blocks.spam_classifier.spam_stats import SPAM_FEATURE_GRAPH, extract_spam_features, spam_feature_inputs
+from blocks.stats import STATS_FEATURE_GRAPH, DocStatsCsv
+
+
+def check(name: str, result: dict, auc: float, budget: float) -> int:
+    selection = result["cost_selection"]
+    test = selection["test_roc_auc"]
+    errors = 0
+    ok = selection["auc_loss"] <= budget
+    errors += not ok
+    print(f"[{'OK' if ok else 'DIFF'}] {name}: perdita ROC-AUC sui fold di selezione {selection['auc_loss']:.4f} (budget {budget})")
+    ok = test["within_budget"]
+    errors += not ok
+    print(f"[{'OK' if ok else 'DIFF'}] {name}: perdita ROC-AUC sullo split di test {test['auc_loss']:.4f} (budget {budget})")
+    ok = abs(auc - test["selected"]) < 1e-4 and result["feature_names"] == selection["selected_features"]
+    errors += not ok
+    print(f"[{'OK' if ok else 'DIFF'}] {name}: modello riaddestrato con ROC-AUC {auc:.4f} e {len(result['feature_names'])} feature del report")
+    print(format_cost_report(selection))
+    return errors
+
+
+def check_pipeline_scoring(result: dict, docs: list, workdir: str) -> int:
+    """Score del modello riaddestrato caricato da ItalianClassification, come nella pipeline."""
+    model_path = QualityClassifier.save_model(result, os.path.join(workdir, "quality_cost.joblib"))
+    selected = [f for f in result["feature_names"] if f != "language_score"]
+    # Riferimento: statistiche complete, colonne scelte, scaler e modello di train_from_csv
+    full = DocStatsCsv(output_folder=workdir)
+    rows = [{**full.extract_stats(doc), "language_score": 1.0} for doc in docs]
+    X = np.array([[row[f] for f in result["feature_names"]] for row in rows], dtype=FEATURE_DTYPE)
+    X = pd.DataFrame(X, columns=result["feature_names"])
+    expected = result["model"].predict_proba(result["scaler"].transform(X))[:, 1]
+
+    errors = 0
+    for backend in ("lightgbm", "numpy"):
+        quality_filter = ItalianClassification(model_path=model_path, backend=backend)
+        required = quality_filter.required_features()
+        ok = sorted(required) == sorted(selected)
+        errors += not ok
+        print(f"[{'OK' if ok else 'DIFF'}] qualità ({backend}): statistiche richieste {len(required)} (scelte {len(selected)})")
+        pruned = DocStatsCsv(output_folder=workdir, features=required)
+        batch = [Document(text=doc.text, id=doc.id, metadata={**pruned.extract_stats(doc), "language_score": 1.0}) for doc in docs]
+        quality_filter.filter_batch(batch)
+        scores = np.array([doc.metadata["quality_score"] for doc in batch])
+        diff = int(np.sum(np.abs(scores - expected) > 1e-4))
+        errors += diff
+        print(f"[{'OK' if not diff else 'DIFF'}] qualità ({backend}): {len(docs)} documenti valutati dalla pipeline, {diff} score diversi")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica della selezione delle feature per costo.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--cost-pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--cost-docs", type=int, default=300)
+    parser.add_argument("--spam-pattern", type=str, default="spam/train/*.jsonl")
+    parser.add_argument("--auc-budget", type=float, default=0.002)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    workdir = tempfile.mkdtemp()
+    sample = list(JsonlReader(args.data_dir, glob_pattern=args.cost_pattern, limit=args.cost_docs).run())
+    stats_cost = FeatureCostModel.measure(STATS_FEATURE_GRAPH, sample, DocStatsCsv(output_folder=workdir).feature_inputs)
+    # Il costo si misura sul piano completo, con l'analisi condivisa anche per i documenti lunghi
+    spam_cost = FeatureCostModel.measure(
+        SPAM_FEATURE_GRAPH, sample, lambda doc: spam_feature_inputs(doc, streaming_min_chars=float("inf")), fixed=STRONG_EVIDENCE_FEATURES
+    )
+
+    errors = 0
+    splits = os.path.join(args.data_dir, "splits")
+    quality = QualityClassifier.train_from_csv(
+        csv_path=os.path.join(splits, "doc_stats_val.csv"),
+        validation_csv_path=os.path.join(splits, "doc_stats_test.csv"),
+        cost_model=stats_cost,
+        auc_budget=args.auc_budget,
+    )
+    print("=" * 60)
+    errors += check("qualità", quality, quality["validation_metrics"]["roc_auc"], args.auc_budget)
+    errors += check_pipeline_scoring(quality, sample, workdir)
+
+    spam_docs = JsonlReader(args.data_dir, glob_pattern=args.spam_pattern).run()
+    spam_csv = os.path.join(workdir, "spam_doc_features.csv")
+    pd.DataFrame([extract_spam_features(doc) for doc in spam_docs]).to_csv(spam_csv, index=False)
+    spam = SpamClassifier.train_from_csv(
+        csv_path=spam_csv,
+        errors_output_dir=os.path.join(workdir, "spam"),
+        cost_model=spam_cost,
+        auc_budget=args.auc_budget,
+    )
+    print("=" * 60)
+    errors += check("spam", spam, spam["roc_auc"], args.auc_budget)
+
+    print("Nessun errore." if not errors else f"{errors} controlli falliti.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
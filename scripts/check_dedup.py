@@ -0,0 +1,136 @@
+"""
+Verifica la deduplicazione (blocks.dedup) su un corpus con duplicati noti.
+
+comando:
+    python3 scripts/check_dedup.py
+    python3 scripts/check_dedup.py --data-dir data --pattern "dataset/*.jsonl" --docs 1000 --tasks 1 3 7
+
+Questo script:
+1. Prende --docs documenti dall'input e costruisce in una cartella temporanea un corpus diviso in
+   tre file con, oltre agli originali, copie esatte (nuovo id, stesso testo) e quasi copie (una
+   parola ogni --edit-every cambiata e una frase aggiunta) sparse tra i file
+2. Esegue prepare_dedup con ogni numero di task indicato e controlla che le decisioni siano
+   identiche: il primo documento del cluster in ordine di input è sempre lo stesso
+3. Controlla che ogni copia esatta sia scartata come exact_duplicate dell'originale, che nessun
+   originale sia scartato in favore di una copia e misura quante quasi copie vengono riconosciute
+4. Fa passare il corpus da DedupFilter e controlla che tenuti + scartati in rejected/0_dedup
+   coincidano con l'input; stampa tempi e caratteri risparmiati ed esce con codice 1 se ci sono errori
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.pipeline.readers import JsonlReader
+
+from blocks.dedup import DedupFilter, prepare_dedup
+
+
+def near_copy(text: str, rng: random.Random, edit_every: int) -> str:
+    words = text.split(" ")
+    for i in range(rng.randrange(edit_every), len(words), edit_every):
+        words[i] = words[i][::-1] or "x"
+    return " ".join(words) + " Articolo aggiornato."
+
+
+def build_corpus(data_dir: str, pattern: str, target: str, docs: int, edit_every: int, seed: int):
+    rng = random.Random(seed)
+    records = []
+    for path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+        if len(records) >= docs:
+            break
+    originals = [{"id": f"orig-{i}", "text": r["text"]} for i, r in enumerate(records[:docs])]
+    exact = [{"id": f"exact-{i}", "text": originals[i]["text"]} for i in rng.sample(range(docs), docs // 5)]
+    near = [{"id": f"near-{i}", "text": near_copy(originals[i]["text"], rng, edit_every)} for i in rng.sample(range(docs), docs // 5)]
+
+    # Gli originali precedono le loro copie: primo file gli originali, poi le copie mescolate
+    copies = exact + near
+    rng.shuffle(copies)
+    files = [originals, copies[: len(copies) // 2], copies[len(copies) // 2:]]
+    os.makedirs(target, exist_ok=True)
+    for k, rows in enumerate(files):
+        with open(os.path.join(target, f"part_{k}.jsonl"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+    return originals, exact, near
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica della deduplicazione esatta e MinHash-LSH.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--edit-every", type=int, default=40, help="Una parola cambiata ogni N nelle quasi copie")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 3, 7])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        originals, exact, near = build_corpus(args.data_dir, args.pattern, corpus, args.docs, args.edit_every, args.seed)
+        total = len(originals) + len(exact) + len(near)
+        print(f"Corpus: {len(originals)} originali, {len(exact)} copie esatte, {len(near)} quasi copie")
+
+        reference = None
+        for tasks in args.tasks:
+            index_dir = os.path.join(tmp, f"dedup_{tasks}")
+            start = time.time()
+            summary = prepare_dedup(corpus, "*.jsonl", index_dir, workers=1, tasks=tasks)
+            elapsed = time.time() - start
+            with open(os.path.join(index_dir, "decisions.json"), encoding="utf-8") as f:
+                decisions = json.load(f)
+            print(f"[OK] {tasks} task: {summary['documents']} documenti in {elapsed:.2f}s")
+            if reference is None:
+                reference = (decisions, index_dir)
+            elif decisions != reference[0]:
+                errors += 1
+                print(f"[DIFF] decisioni con {tasks} task diverse da quelle con {args.tasks[0]} task")
+        decisions, index_dir = reference
+
+        for record in exact:
+            entry = decisions.get(record["id"])
+            # Il documento tenuto è l'originale, o il primo originale del suo cluster
+            original = "orig-" + record["id"].split("-")[1]
+            kept = original if decisions[original][1] is None else decisions[original][1]
+            if entry is None or entry[2] != "exact_duplicate" or entry[1] != kept:
+                errors += 1
+                print(f"[DIFF] {record['id']} non scartato come copia esatta di {kept}: {entry}")
+        dropped_originals = [r["id"] for r in originals if not ((decisions.get(r["id"]) or [0, None])[1] or "orig-").startswith("orig-")]
+        if dropped_originals:
+            errors += 1
+            print(f"[DIFF] originali scartati in favore di una copia: {dropped_originals[:5]}")
+        found_near = sum(1 for r in near if (decisions.get(r["id"]) or [0, None])[1] is not None)
+        among_originals = sum(1 for r in originals if (decisions.get(r["id"]) or [0, None])[1] is not None)
+        print(f"Quasi copie riconosciute: {found_near}/{len(near)} | originali già duplicati nell'input: {among_originals}")
+
+        rejected_dir = os.path.join(tmp, "rejected")
+        dedup_filter = DedupFilter(index_dir=index_dir, rejected_dir=rejected_dir)
+        kept = sum(1 for _ in dedup_filter.run(JsonlReader(corpus, glob_pattern="*.jsonl").run()))
+        dedup_filter.exclusion_writer.close()
+        with open(glob.glob(os.path.join(rejected_dir, "0_dedup", "*.jsonl"))[0], encoding="utf-8") as f:
+            rejected = [json.loads(line) for line in f]
+        if kept + len(rejected) != total or len(rejected) != summary["exact"] + summary["near"]:
+            errors += 1
+            print(f"[DIFF] DedupFilter: {kept} tenuti + {len(rejected)} scartati su {total} (attesi {summary['exact'] + summary['near']} scarti)")
+        else:
+            print(
+                f"[OK] DedupFilter: {kept} tenuti, {len(rejected)} in rejected/0_dedup "
+                f"({summary['duplicate_chars'] / summary['total_chars']:.1%} dei caratteri non arriva a LID e feature)"
+            )
+
+    print("Nessuna differenza." if not errors else f"{errors} errori.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Verifica la stima a campione di utils.run_estimate (``main.py --estimate``): la stima di documenti
+tenuti, dimensione dell'output, scarti per cartella e tempo di calcolo confrontata con
+un'esecuzione completa.
+
+comando:
+    python3 scripts/check_estimate.py
+    python3 scripts/check_estimate.py --pattern "dataset/data_0000[01].jsonl" --estimate-docs 500 --spam-cascade
+
+Questo script:
+1. Stima l'esecuzione su --estimate-docs documenti di --pattern (campione stratificato per file,
+   --replicates sottocampioni) con la pipeline di pipeline_factory in una cartella temporanea
+   (il filtro lingua è sostituito da un punteggio fisso, perché il modello LID non è disponibile offline)
+2. Esegue la stessa pipeline su tutto l'input con un task per file e un worker
+3. Stampa stima, intervallo al 95% e valore misurato di ogni grandezza. Esce con codice 1 se un
+   conteggio o la dimensione dell'output cadono fuori dall'intervallo; il tempo viene solo stampato
+   (dipende dal carico della macchina)
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.executor import LocalPipelineExecutor
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from loguru import logger
+
+from pipeline_factory import build_italian_cleaning_pipeline
+from utils.input_manifest import update_manifest
+from utils.run_estimate import NO_TEXT_BUCKET, estimate_run, format_estimate, task_bytes
+
+
+class FixedLanguageFilter(BaseFilter):
+    """Al posto di LanguageFilter: tutti i documenti italiani con punteggio 1."""
+
+    name = "Fixed Language Score"
+
+    def filter(self, doc) -> bool:
+        doc.metadata["language"] = "it"
+        doc.metadata["language_score"] = 1.0
+        return True
+
+
+def build(args, output_dir: str) -> list:
+    blocks = build_italian_cleaning_pipeline(
+        data_dir=os.path.abspath(args.data_dir),
+        output_dir=output_dir,
+        rejected_dir=os.path.join(output_dir, "rejected"),
+        pattern=args.pattern,
+        model_path=os.path.abspath(args.model_dir),
+        batch_size=args.batch_size,
+        spam_cascade=args.spam_cascade,
+    )
+    blocks[1] = FixedLanguageFilter()
+    return blocks
+
+
+def count(paths) -> tuple:
+    lines, size = 0, 0
+    for path in paths:
+        size += os.path.getsize(path)
+        with open(path, "rb") as f:
+            lines += sum(1 for _ in f)
+    return lines, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica della stima a campione dell'esecuzione.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--model-dir", type=str, default="models")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--spam-cascade", action="store_true")
+    parser.add_argument("--estimate-docs", type=int, default=1000)
+    parser.add_argument("--replicates", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    data_dir = os.path.abspath(args.data_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = update_manifest(data_dir, args.pattern, os.path.join(tmp, "input_manifest.json"))
+        files = manifest["files"]
+        estimate_dir = os.path.join(tmp, "estimate")
+        report = estimate_run(
+            data_dir,
+            files,
+            build(args, estimate_dir),
+            estimate_dir,
+            os.path.join(estimate_dir, "rejected"),
+            task_bytes(files, len(files)),
+            workers=1,
+            sample_docs=args.estimate_docs,
+            replicates=args.replicates,
+            seed=args.seed,
+        )
+        print(format_estimate(report))
+        print("=" * 60)
+
+        run_dir = os.path.join(tmp, "run")
+        start = time.perf_counter()
+        LocalPipelineExecutor(pipeline=build(args, run_dir), tasks=len(files), workers=1, logging_dir=os.path.join(run_dir, "logs")).run()
+        elapsed = time.perf_counter() - start
+
+        kept, output_bytes = count(glob.glob(os.path.join(run_dir, "italiano_pulito_*.jsonl")))
+        actual = {"kept_docs": kept, "output_bytes": output_bytes}
+        rejected_total = 0
+        for name in report["rejected_docs"]:
+            if name == NO_TEXT_BUCKET:
+                continue
+            actual[name] = count(glob.glob(os.path.join(run_dir, "rejected", name, "*.jsonl")))[0]
+            rejected_total += actual[name]
+        # Le righe senza testo non finiscono in nessun file
+        if NO_TEXT_BUCKET in report["rejected_docs"]:
+            actual[NO_TEXT_BUCKET] = report["input"]["lines"] - kept - rejected_total
+
+    errors = 0
+    for name, value in actual.items():
+        interval = report[name] if name in ("kept_docs", "output_bytes") else report["rejected_docs"][name]
+        inside = interval["low"] <= value <= interval["high"]
+        errors += not inside
+        print(
+            f"[{'OK' if inside else 'FUORI'}] {name}: stima {interval['estimate']:.0f} "
+            f"[{interval['low']:.0f}, {interval['high']:.0f}], misurato {value}"
+        )
+    cpu = report["cpu_seconds"]
+    print(f"Tempo: stima {cpu['estimate']:.1f}s [{cpu['low']:.1f}, {cpu['high']:.1f}], esecuzione completa {elapsed:.1f}s")
+    print("Stima coerente con l'esecuzione." if not errors else f"{errors} grandezze fuori dall'intervallo.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Verifica l'estrazione ridotta alle feature lette dai modelli (blocks.feature_graph): stessi score
+e stesse decisioni di spam e qualità dell'estrazione completa, e tempo risparmiato.
+
+comando:
+    python3 scripts/check_feature_pruning.py
+    python3 scripts/check_feature_pruning.py --pattern "dataset/*.jsonl" --limit 2000 --stats-features length digit_ratio text_entropy
+
+Questo script:
+1. Legge i documenti con JsonlReader (punteggio lingua fisso, il modello LID non è disponibile
+   offline) e carica SpamFilter e ItalianClassification da --model-dir, da cui prende le feature
+   richieste (required_features: feature del modello più quelle delle regole di evidenza forte)
+2. Controlla le dipendenze dichiarate nei due grafi: ogni feature calcolata da sola (solo lei e i
+   suoi prerequisiti) deve coincidere con il valore dell'estrazione completa
+3. Calcola feature spam e statistiche complete e ridotte e controlla che i valori calcolati siano
+   identici, che score spam, regole di evidenza forte e score qualità coincidano
+4. Misura il tempo delle due estrazioni (analisi condivisa ricalcolata ogni volta, migliore di
+   --repeat ripetizioni) e stampa le feature e le primitive saltate; --stats-features mostra il
+   risparmio con un sottoinsieme qualsiasi di statistiche. Esce con codice 1 se c'è anche una
+   sola differenza
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks import text_analysis
+from blocks.filters import ItalianClassification
+from blocks.spam_classifier.spam_classifier import SpamFilter
+from blocks.spam_classifier.spam_stats import SPAM_FEATURE_GRAPH, SpamFeatureExtractor, extract_spam_features
+from blocks.stats import STATS_FEATURE_GRAPH, DocStatsCsv
+
+
+def fresh(docs: list) -> list:
+    """Copie dei documenti con l'analisi condivisa azzerata, per misurare ogni estrazione da capo."""
+    text_analysis.clear_analysis_cache()
+    return [Document(text=doc.text, id=doc.id, metadata=dict(doc.metadata)) for doc in docs]
+
+
+def timed(func, docs: list, repeat: int) -> tuple:
+    """Risultati e tempo migliore su ``repeat`` ripetizioni."""
+    best = float("inf")
+    for _ in range(repeat):
+        copies = fresh(docs)
+        gc.collect()
+        start = time.perf_counter()
+        results = [func(doc) for doc in copies]
+        best = min(best, time.perf_counter() - start)
+    return results, best
+
+
+def check_graph(name: str, graph, full: list, evaluate) -> int:
+    """Ogni feature calcolata da sola deve coincidere con l'estrazione completa."""
+    bad = []
+    for feature in graph.features:
+        for i, reference in enumerate(full):
+            value = evaluate(i, feature)[feature]
+            if value != reference[feature] or type(value) is not type(reference[feature]):
+                bad.append(feature)
+                break
+    print(f"[{'OK' if not bad else 'DIFF'}] dipendenze del grafo {name}: {len(graph.features) - len(bad)}/{len(graph.features)} feature" + (f" | diverse: {bad}" if bad else ""))
+    return len(bad)
+
+
+def compare_values(name: str, full: list, pruned: list) -> int:
+    bad = sum(1 for f, p in zip(full, pruned) if any(f[k] != v or type(f[k]) is not type(v) for k, v in p.items()))
+    print(f"[{'OK' if not bad else 'DIFF'}] {name}: {len(full) - bad}/{len(full)} documenti con valori identici")
+    return bad
+
+
+def with_metadata(docs: list, features: list) -> list:
+    return [Document(text=doc.text, id=doc.id, metadata={**doc.metadata, **feats}) for doc, feats in zip(docs, features)]
+
+
+def skipped(graph, plan) -> str:
+    computed = set(plan.computed)
+    primitives = [name for name in graph.primitives if name not in computed]
+    features = [name for name in graph.features if name not in computed]
+    return f"{len(features)} feature saltate ({', '.join(features) or '-'}); primitive saltate: {', '.join(primitives) or '-'}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica dell'estrazione ridotta alle feature dei modelli.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--model-dir", type=str, default="models")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni di ogni misura (vale la più veloce)")
+    parser.add_argument("--graph-docs", type=int, default=50, help="Documenti usati per controllare le dipendenze di ogni feature")
+    parser.add_argument("--stats-features", type=str, nargs="*", default=["length", "digit_ratio", "uppercase_ratio", "punctuation_ratio", "text_entropy"])
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    docs = list(JsonlReader(args.data_dir, glob_pattern=args.pattern, limit=args.limit).run())
+    for doc in docs:
+        doc.metadata["language_score"] = 1.0
+    rejected = tempfile.mkdtemp()
+    spam_filter = SpamFilter(model_path=os.path.join(args.model_dir, "spam_lgbm.joblib"), rejected_dir=rejected)
+    quality_filter = ItalianClassification(model_path=os.path.join(args.model_dir, "lgbm_quality_model.joblib"))
+    # Come nella pipeline: le feature richieste più le colonne dei metadata (doc_id, etichette)
+    spam_required = SpamFeatureExtractor(features=spam_filter.required_features()).features
+    stats_required = quality_filter.required_features()
+    full_stats = DocStatsCsv(output_folder=rejected)
+    pruned_stats = DocStatsCsv(output_folder=rejected, features=stats_required)
+    print(f"{len(docs)} documenti | feature spam richieste {len(spam_required)} | statistiche richieste {len(stats_required)}")
+
+    errors = 0
+    sample = fresh(docs[: args.graph_docs])
+    spam_ref = [extract_spam_features(doc) for doc in sample]
+    errors += check_graph("spam", SPAM_FEATURE_GRAPH, spam_ref, lambda i, f: extract_spam_features(sample[i], [f]))
+    stats_ref = [full_stats.extract_stats(doc) for doc in sample]
+    single = {f: DocStatsCsv(output_folder=rejected, features=[f]) for f in STATS_FEATURE_GRAPH.features}
+    errors += check_graph("statistiche", STATS_FEATURE_GRAPH, stats_ref, lambda i, f: single[f].extract_stats(sample[i]))
+
+    spam_full, t_spam_full = timed(extract_spam_features, docs, args.repeat)
+    spam_pruned, t_spam_pruned = timed(lambda doc: extract_spam_features(doc, spam_required), docs, args.repeat)
+    errors += compare_values("feature spam ridotte", spam_full, spam_pruned)
+    stats_full, t_stats_full = timed(full_stats.extract_stats, docs, args.repeat)
+    stats_pruned, t_stats_pruned = timed(pruned_stats.extract_stats, docs, args.repeat)
+    errors += compare_values("statistiche ridotte", stats_full, stats_pruned)
+
+    full_docs, pruned_docs = with_metadata(docs, spam_full), with_metadata(docs, spam_pruned)
+    spam_scores, _ = spam_filter.score_batch(full_docs)
+    pruned_scores, _ = spam_filter.score_batch(pruned_docs)
+    strong = spam_filter._strong_evidence_mask([d.metadata for d in full_docs], spam_scores)
+    pruned_strong = spam_filter._strong_evidence_mask([d.metadata for d in pruned_docs], pruned_scores)
+    spam_diff = int(np.sum(spam_scores != pruned_scores)) + int(np.sum(strong != pruned_strong))
+    errors += spam_diff
+    print(f"[{'OK' if not spam_diff else 'DIFF'}] score spam e regole di evidenza forte: {spam_diff} differenze")
+
+    quality_full, _ = quality_filter.classifier.predict_batch(with_metadata(full_docs, stats_full))
+    quality_pruned, _ = quality_filter.classifier.predict_batch(with_metadata(pruned_docs, stats_pruned))
+    quality_diff = int(np.sum(quality_full != quality_pruned))
+    errors += quality_diff
+    print(f"[{'OK' if not quality_diff else 'DIFF'}] score qualità: {quality_diff} differenze")
+
+    print(f"Spam: {t_spam_full:.2f}s -> {t_spam_pruned:.2f}s ({t_spam_full / t_spam_pruned:.2f}x) | {skipped(SPAM_FEATURE_GRAPH, SPAM_FEATURE_GRAPH.plan(spam_required))}")
+    print(f"Statistiche: {t_stats_full:.2f}s -> {t_stats_pruned:.2f}s ({t_stats_full / t_stats_pruned:.2f}x) | {skipped(STATS_FEATURE_GRAPH, STATS_FEATURE_GRAPH.plan(stats_required))}")
+    if args.stats_features:
+        subset = DocStatsCsv(output_folder=rejected, features=args.stats_features)
+        _, t_subset = timed(subset.extract_stats, docs, args.repeat)
+        print(f"Statistiche {args.stats_features}: {t_stats_full:.2f}s -> {t_subset:.2f}s ({t_stats_full / t_subset:.2f}x)")
+
+    print("Nessuna differenza." if not errors else f"{errors} differenze.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Verifica dell'archivio delle feature per digest (blocks.feature_store) usato da
+SpamFeatureExtractor e DocStatsCsv.
+
+comando:
+    python3 scripts/check_feature_store.py
+    python3 scripts/check_feature_store.py --pattern "dataset/*.jsonl" --limit 2000
+
+Questo script:
+1. Calcola le feature spam e le statistiche di ogni documento senza archivio (riferimento)
+2. Esegue SpamFeatureExtractor e DocStatsCsv con un archivio vuoto (tutti miss) e poi di nuovo
+   sugli stessi documenti (tutti hit), misurando il tempo dei due passaggi
+3. Controlla che le feature lette dall'archivio coincidano esattamente con il riferimento
+4. Rilegge gli stessi testi con un'altra lingua e un altro punteggio LID nei metadata (en, 0.05):
+   le feature che ne dipendono (lang_score, lang_is_ita, noise_score...) devono coincidere con
+   un'estrazione da capo e non con i valori del primo passaggio
+5. Confronta score ed etichette dei modelli spam e qualità calcolati sulle feature del riferimento
+   e su quelle dell'archivio
+6. Controlla l'evizione: con un limite di righe restano solo i documenti usati più di recente
+7. Stampa hit/miss e tempi ed esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.classifiers import QualityClassifier
+from blocks.feature_store import doc_digest
+from blocks.spam_classifier.spam_classifier import SpamClassifier
+from blocks.spam_classifier.spam_stats import SpamFeatureExtractor, extract_spam_features
+from blocks.stats import DocStatsCsv
+
+
+
+def read_docs(data_dir: str, pattern: str, limit: int, language: str = "it", language_score: float = 1.0) -> list:
+    docs = list(JsonlReader(data_folder=data_dir, glob_pattern=pattern, limit=limit).run())
+    for doc in docs:
+        # Nessun modello LID offline: lingua e punteggio fissi
+        doc.metadata["language"] = language
+        doc.metadata["language_score"] = language_score
+    return docs
+
+
+def run_steps(docs: list, store_path: str, csv_dir: str, max_rows: int = 2_000_000) -> tuple[list, dict]:
+    spam = SpamFeatureExtractor(feature_store=store_path, feature_store_max_rows=max_rows)
+    stats = DocStatsCsv(output_folder=csv_dir, groups_to_compute=["summary"], feature_store=store_path, feature_store_max_rows=max_rows)
+    out = list(stats.run(spam.run(iter(docs))))
+    counters = {
+        "spam": (spam.feature_store.hits, spam.feature_store.misses),
+        "stats": (stats.feature_store.hits, stats.feature_store.misses),
+    }
+    return out, counters
+
+
+def same_value(expected, got) -> bool:
+    return type(expected) is type(got) and expected == got
+
+
+def mismatched_keys(ref_docs: list, got_docs: list) -> set:
+    mismatched = set()
+    for ref, got in zip(ref_docs, got_docs):
+        for key, value in ref.metadata.items():
+            if not same_value(value, got.metadata.get(key)):
+                mismatched.add(key)
+    return mismatched
+
+
+def model_diffs(classifier, ref_docs: list, got_docs: list) -> tuple[float, int]:
+    ref_scores, _ = classifier.predict_batch(ref_docs)
+    got_scores, _ = classifier.predict_batch(got_docs)
+    ref_labels = ref_scores >= classifier.threshold
+    got_labels = got_scores >= classifier.threshold
+    return float(np.max(np.abs(ref_scores - got_scores), initial=0.0)), int(np.sum(ref_labels != got_labels))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica dell'archivio delle feature.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--pattern", default="train/*.jsonl")
+    parser.add_argument("--limit", type=int, default=-1)
+    parser.add_argument("--model-dir", default="models")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    ref_docs = read_docs(args.data_dir, args.pattern, args.limit)
+    stats_ref = DocStatsCsv(output_folder=tempfile.mkdtemp(), groups_to_compute=["summary"])
+    for doc in ref_docs:
+        doc.metadata.update(extract_spam_features(doc))
+        doc.metadata.update(stats_ref.extract_stats(doc))
+    n_unique = len({doc_digest(doc) for doc in ref_docs})
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, "features.sqlite")
+        timings, counters = {}, {}
+        for phase in ("cold", "warm"):
+            start = time.perf_counter()
+            docs, counters[phase] = run_steps(read_docs(args.data_dir, args.pattern, args.limit), store_path, tmp)
+            timings[phase] = time.perf_counter() - start
+
+        for name, (hits, misses) in counters["cold"].items():
+            if misses != n_unique or hits != len(ref_docs) - n_unique:
+                errors += 1
+                print(f"[DIFF] {name}, primo passaggio: {hits} hit, {misses} miss")
+        for name, (hits, misses) in counters["warm"].items():
+            if hits != len(ref_docs) or misses:
+                errors += 1
+                print(f"[DIFF] {name}, secondo passaggio: {hits} hit, {misses} miss")
+
+        if [doc.id for doc in ref_docs] != [doc.id for doc in docs]:
+            errors += 1
+            print("[DIFF] ordine dei documenti diverso dal riferimento")
+        mismatched = mismatched_keys(ref_docs, docs)
+        if mismatched:
+            errors += 1
+            print(f"[DIFF] feature diverse dal riferimento: {sorted(mismatched)}")
+
+        # Stessi testi, LID diverso: le feature dei metadata vanno ricalcolate, non rilette
+        relabeled_ref = read_docs(args.data_dir, args.pattern, args.limit, "en", 0.05)
+        for doc in relabeled_ref:
+            doc.metadata.update(extract_spam_features(doc))
+        relabeled = SpamFeatureExtractor(feature_store=store_path)
+        relabeled_docs = list(relabeled.run(iter(read_docs(args.data_dir, args.pattern, args.limit, "en", 0.05))))
+        changed = sum(ref.metadata["lang_score"] != doc.metadata["lang_score"] for ref, doc in zip(ref_docs, relabeled_ref))
+        if relabeled.feature_store.misses:
+            errors += 1
+            print(f"[DIFF] LID cambiato: {relabeled.feature_store.misses} miss, attesi solo hit")
+        mismatched = mismatched_keys(relabeled_ref, relabeled_docs)
+        if mismatched:
+            errors += 1
+            print(f"[DIFF] LID cambiato, feature diverse da un'estrazione da capo: {sorted(mismatched)}")
+
+        spam_model = SpamClassifier(model_path=os.path.join(args.model_dir, "spam_lgbm.joblib"))
+        quality_model = QualityClassifier(model_path=os.path.join(args.model_dir, "lgbm_quality_model.joblib"))
+        spam_delta, spam_flips = model_diffs(spam_model, ref_docs, docs)
+        quality_delta, quality_flips = model_diffs(quality_model, ref_docs, docs)
+
+        # Evizione: archivio limitato, poi un secondo passaggio su metà dei documenti
+        evict_path = os.path.join(tmp, "evict.sqlite")
+        max_rows = max(1, n_unique // 4)
+        run_steps(read_docs(args.data_dir, args.pattern, args.limit), evict_path, tmp)
+        recent = read_docs(args.data_dir, args.pattern, args.limit)[-max_rows:]
+        run_steps(recent, evict_path, tmp, max_rows=max_rows)
+        with sqlite3.connect(evict_path) as conn:
+            kept = {row[0] for row in conn.execute("SELECT digest FROM spam_features")}
+        if kept != {doc_digest(doc) for doc in recent}:
+            errors += 1
+            print(f"[DIFF] evizione: {len(kept)} righe rimaste invece delle {max_rows} più recenti")
+        db_size = os.path.getsize(store_path)
+
+    print("=" * 64)
+    print(f"Documenti: {len(ref_docs)} ({n_unique} digest distinti) | archivio: {db_size / 1e6:.1f} MB")
+    for phase in ("cold", "warm"):
+        detail = ", ".join(f"{name} {hits} hit / {misses} miss" for name, (hits, misses) in counters[phase].items())
+        print(f"{phase}: {timings[phase]:.2f} s | {detail}")
+    print(f"LID cambiato (en, 0.05): lang_score diverso in {changed} documenti, feature come da capo")
+    print(f"Modello spam: max |delta score| {spam_delta:.2e}, etichette cambiate {spam_flips}")
+    print(f"Modello qualità: max |delta score| {quality_delta:.2e}, etichette cambiate {quality_flips}")
+    print(f"Evizione: limite {max_rows} righe, rimaste le più recenti")
+    print(f"Differenze: {errors}")
+    print("=" * 64)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
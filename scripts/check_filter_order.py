@@ -0,0 +1,131 @@
+"""
+Verifica l'ordine dei filtri scelto da blocks.filter_planner: stessi documenti tenuti con gli
+stessi metadata in ogni ordine valido, e costo previsto accanto a quello misurato.
+
+comando:
+    python3 scripts/check_filter_order.py
+    python3 scripts/check_filter_order.py --pattern "dataset/data_0000[01].jsonl" --sample-docs 500 --spam-cascade
+
+Questo script:
+1. Misura costo e scarti di lingua, spam e qualità su --sample-docs documenti di --pattern e stampa
+   il piano (il filtro lingua è sostituito da un punteggio fisso, perché il modello LID non è
+   disponibile offline)
+2. Esegue la pipeline di pipeline_factory in cartelle temporanee con ogni ordine valido e
+   confronta i documenti tenuti (testo e metadata, per id) e gli id scartati con l'ordine predefinito
+3. Stampa per ogni ordine i ms/documento previsti e misurati e i risparmi previsti e misurati
+   (FilterPlanner.compare_with_run). Esce con codice 1 se c'è una differenza negli output
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.executor import LocalPipelineExecutor
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.filter_planner import DEFAULT_FILTER_ORDER, FilterPlanner, FilterStage, format_filter_plan
+from pipeline_factory import build_filter_stages, build_italian_cleaning_pipeline
+
+
+class FixedLanguageFilter(BaseFilter):
+    """Al posto di LanguageFilter: tutti i documenti italiani con punteggio 1."""
+
+    name = "Fixed Language Score"
+
+    def filter(self, doc) -> bool:
+        doc.metadata["language"] = "it"
+        doc.metadata["language_score"] = 1.0
+        return True
+
+
+def stages_for(args, output_dir: str) -> dict:
+    stages = build_filter_stages(
+        output_dir,
+        os.path.join(output_dir, "rejected"),
+        os.path.abspath(args.model_dir),
+        batch_size=args.batch_size,
+        spam_cascade=args.spam_cascade,
+    )
+    stages["language"] = FilterStage("language", [FixedLanguageFilter()], writes={"language", "language_score"})
+    return stages
+
+
+def read_docs(paths) -> dict:
+    docs = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                doc = json.loads(line)
+                doc.pop("filter_reason", None)
+                docs[doc["id"]] = doc
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica dell'ordine dei filtri.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--model-dir", type=str, default="models")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--spam-cascade", action="store_true")
+    parser.add_argument("--sample-docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = list(JsonlReader(args.data_dir, glob_pattern=args.pattern, limit=args.sample_docs).run())
+        planner = FilterPlanner(stages_for(args, os.path.join(tmp, "plan")))
+        report = planner.plan(planner.measure(sample, repeat=args.repeat))
+        print(format_filter_plan(report))
+        print("=" * 60)
+
+        outputs = {}
+        for option in report["orders"]:
+            order = option["order"]
+            output_dir = os.path.join(tmp, "_".join(order))
+            stages = stages_for(args, output_dir)
+            pipeline = build_italian_cleaning_pipeline(
+                data_dir=os.path.abspath(args.data_dir),
+                output_dir=output_dir,
+                rejected_dir=os.path.join(output_dir, "rejected"),
+                pattern=args.pattern,
+                model_path=os.path.abspath(args.model_dir),
+                batch_size=args.batch_size,
+                spam_cascade=args.spam_cascade,
+                filter_order=order,
+                stages=stages,
+            )
+            stats = LocalPipelineExecutor(pipeline=pipeline, tasks=1, workers=1, logging_dir=os.path.join(output_dir, "logs")).run()
+            comparison = FilterPlanner(stages).compare_with_run(report, order, pipeline, stats)
+            kept = read_docs(glob.glob(os.path.join(output_dir, "italiano_pulito_*.jsonl")))
+            rejected = set(read_docs(glob.glob(os.path.join(output_dir, "rejected", "*", "*.jsonl"))))
+            outputs[tuple(order)] = (kept, rejected)
+            # Il risparmio è sempre rispetto all'ordine predefinito, che quindi ha 0%
+            label = " (predefinito)" if tuple(order) == tuple(DEFAULT_FILTER_ORDER) else ""
+            print(
+                f"{' -> '.join(order)}{label}: {comparison['predicted_ms_per_doc']} ms/doc previsti, "
+                f"{comparison['actual_ms_per_doc']} misurati | risparmio previsto {comparison['predicted_saving']:.1%}, "
+                f"misurato {comparison['actual_saving']:.1%} | tenuti {len(kept)}, scartati {len(rejected)}"
+            )
+        for order, output in outputs.items():
+            same = output == outputs[DEFAULT_FILTER_ORDER]
+            errors += not same
+            print(f"[{'OK' if same else 'DIFF'}] {' -> '.join(order)}: documenti tenuti e scartati come l'ordine predefinito")
+
+    print("Nessuna differenza." if not errors else f"{errors} differenze.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Verifica del manifest dell'input (utils.input_manifest) e della lettura con i file divisi per
+dimensione (blocks.readers.AssignedFilesJsonlReader).
+
+comando:
+    python3 scripts/check_input_manifest.py
+    python3 scripts/check_input_manifest.py --pattern "dataset/*.jsonl" --tasks 3
+
+Questo script:
+1. Costruisce il manifest dell'input in una cartella temporanea e controlla che righe e dimensioni
+   coincidano con quelle dei file
+2. Lo ricostruisce senza modifiche (nessun file riscansionato, nessun glob: cartelle invariate),
+   dopo aver aggiunto un file (solo quel file riscansionato) e dopo averne modificato uno sul posto,
+   con rescan=True (solo quel file riscansionato)
+3. Divide i file tra --tasks task con pack_files e controlla che l'unione dei documenti letti con
+   AssignedFilesJsonlReader coincida con quella di JsonlReader
+4. Stampa byte per task, confrontati con la divisione per posizione di DataTrove, e il riepilogo
+   con la stima della durata; esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from unittest import mock
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.readers import AssignedFilesJsonlReader
+from utils.input_manifest import describe_plan, pack_files, record_run, update_manifest
+
+
+def doc_key(doc) -> tuple:
+    return doc.id, doc.text, json.dumps(doc.metadata, sort_keys=True, default=str)
+
+
+def rescanned(data_dir: str, pattern: str, manifest_path: str, rescan: bool = False) -> int:
+    out = io.StringIO()
+    with redirect_stdout(out):
+        update_manifest(data_dir, pattern, manifest_path, rescan=rescan)
+    return int(out.getvalue().split("(")[1].split()[0])
+
+
+def timed_update(data_dir: str, pattern: str, manifest_path: str, rescan: bool) -> float:
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        update_manifest(data_dir, pattern, manifest_path, rescan=rescan)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica del manifest dell'input.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--pattern", default="train/*.jsonl")
+    parser.add_argument("--tasks", type=int, default=4)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # Copia dell'input, così il file toccato al punto 2 non è quello del repository
+        data_dir = os.path.join(tmp, "data")
+        for path in glob.glob(os.path.join(args.data_dir, args.pattern)):
+            target = os.path.join(data_dir, os.path.relpath(path, args.data_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+        manifest_path = os.path.join(tmp, "input_manifest.json")
+
+        manifest = update_manifest(data_dir, args.pattern, manifest_path)
+        for rel_path, entry in manifest["files"].items():
+            with open(os.path.join(data_dir, rel_path), "rb") as f:
+                content = f.read()
+            lines = content.count(b"\n") + (1 if content and not content.endswith(b"\n") else 0)
+            if entry["lines"] != lines or entry["size"] != len(content):
+                errors += 1
+                print(f"[DIFF] {rel_path}: righe {entry['lines']} invece di {lines}")
+
+        # Cartelle invariate: l'elenco viene dal manifest, senza glob dell'input
+        with mock.patch("glob.glob", side_effect=AssertionError("glob con le cartelle invariate")):
+            unchanged = rescanned(data_dir, args.pattern, manifest_path)
+        first = sorted(manifest["files"])[0]
+        added = os.path.join(data_dir, os.path.dirname(first), "aggiunto_" + os.path.basename(first))
+        shutil.copy2(os.path.join(data_dir, first), added)
+        after_add = rescanned(data_dir, args.pattern, manifest_path)
+        os.remove(added)
+        rescanned(data_dir, args.pattern, manifest_path)
+        with open(os.path.join(data_dir, first), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"text": "documento aggiunto"}) + "\n")
+        after_touch = rescanned(data_dir, args.pattern, manifest_path, rescan=True)
+        print(
+            f"Riscansionati: {unchanged} senza modifiche, {after_add} dopo aver aggiunto un file, "
+            f"{after_touch} dopo averne modificato uno (rescan)"
+        )
+        if unchanged != 0 or after_add != 1 or after_touch != 1:
+            errors += 1
+            print("[DIFF] riuso incrementale del manifest")
+        fast = timed_update(data_dir, args.pattern, manifest_path, rescan=False)
+        full = timed_update(data_dir, args.pattern, manifest_path, rescan=True)
+        print(f"Avvio con il manifest: {fast * 1e3:.2f} ms con le cartelle invariate, {full * 1e3:.2f} ms con glob e stat di ogni file")
+
+        manifest = update_manifest(data_dir, args.pattern, manifest_path)
+        files = manifest["files"]
+        assignment = pack_files(files, args.tasks)
+        expected = Counter(doc_key(doc) for doc in JsonlReader(data_folder=data_dir, glob_pattern=args.pattern).run())
+        got = Counter()
+        for rank in range(args.tasks):
+            reader = AssignedFilesJsonlReader(data_folder=data_dir, assignment=assignment, glob_pattern=args.pattern)
+            got.update(doc_key(doc) for doc in reader.run(rank=rank, world_size=args.tasks))
+        if got != expected:
+            errors += 1
+            print(f"[DIFF] {sum((expected - got).values())} documenti persi, {sum((got - expected).values())} in più")
+
+        # Divisione di DataTrove: file ordinati per percorso, il rank r prende i file r, r + tasks, ...
+        ordered = sorted(files)
+        positional = [sum(files[p]["size"] for p in ordered[rank::args.tasks]) for rank in range(args.tasks)]
+        packed = [sum(files[p]["size"] for p in paths) for paths in assignment]
+
+        print("=" * 64)
+        print(f"File: {len(files)} | task: {args.tasks} | documenti: {sum(got.values())}/{sum(expected.values())}")
+        print(f"MB per task, per posizione: {[round(b / 1e6, 2) for b in positional]}")
+        print(f"MB per task, per dimensione: {[round(b / 1e6, 2) for b in packed]}")
+        print(describe_plan(manifest, assignment, args.tasks))
+        record_run(manifest, manifest_path, assignment, args.tasks, elapsed=10.0)
+        print(describe_plan(manifest, assignment, args.tasks).splitlines()[-1] + "  <- dopo un'esecuzione simulata di 10 s")
+        print(f"Differenze: {errors}")
+        print("=" * 64)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
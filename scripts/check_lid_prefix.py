@@ -0,0 +1,169 @@
+"""
+Confronta la LID a prefisso (blocks.filters.PrefixLID) con la LID sul testo intero: accordo delle
+decisioni, differenza dei punteggi e latenza, su tutti i documenti e su quelli lunghi.
+
+comando:
+    python3 scripts/check_lid_prefix.py
+    python3 scripts/check_lid_prefix.py --pattern "dataset/*.jsonl" --prefix-chars 1024 2048 4096 --margin 0.1
+    python3 scripts/check_lid_prefix.py --model-file /percorso/lid.176.bin
+    python3 scripts/check_lid_prefix.py --model-file /percorso/lid.176.ftz
+
+Questo script:
+1. Legge i documenti con JsonlReader e carica il modello fastText di LanguageFilter (--backend),
+   scaricato da DataTrove oppure da --model-file
+2. Calcola la LID sul testo intero di ogni documento, misurando il tempo, come riferimento
+3. Per ogni --prefix-chars ripete la LID con PrefixLID (soglia --threshold, margine --margin) e
+   confronta la decisione di LanguageFilter (punteggio > soglia) e il punteggio con il riferimento
+4. Stampa accordo, differenza media dei punteggi, caratteri valutati e tempi, separando i documenti
+   lunghi (più di LID_PREFIX_GROWTH volte il prefisso)
+5. Effetto a valle: ``language_score`` è anche una feature dei modelli spam (``lang_score``,
+   ``lang_is_ita``) e qualità. Con i modelli di --model-dir fa passare i documenti da feature spam,
+   SpamFilter, DocStatsCsv e ItalianClassification con i punteggi del testo intero e del prefisso e
+   conta i documenti con una decisione finale (tenuto/scartato) diversa. Esce con codice 1 se
+   l'accordo delle decisioni della LID o di quelle finali è sotto --min-agreement
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+from datatrove.pipeline.readers import JsonlReader
+from datatrove.utils.lid import FT176LID, GlotLID
+from loguru import logger
+
+from blocks.filters import LID_PREFIX_GROWTH, ItalianClassification, PrefixLID
+from blocks.spam_classifier.spam_classifier import SpamFilter
+from blocks.spam_classifier.spam_stats import SpamFeatureExtractor, write_spam_features
+from blocks.stats import DocStatsCsv
+from pipeline_factory import QUALITY_THRESHOLD, SPAM_THRESHOLD
+
+
+def timed_predictions(model, docs):
+    results, elapsed = [], []
+    for doc in docs:
+        start = time.perf_counter()
+        results.append(model.predict(doc))
+        elapsed.append(time.perf_counter() - start)
+    return results, elapsed
+
+
+def decision_score(result) -> float:
+    best_lang_pair, lang_pairs = result
+    return max(lang_pairs.values(), default=0.0) if lang_pairs else best_lang_pair[1]
+
+
+def report(label: str, idx, full, full_time, prefix, prefix_time, threshold: float) -> float:
+    if not idx:
+        print(f"  {label}: nessun documento")
+        return 1.0
+    agree = sum((decision_score(full[i]) > threshold) == (decision_score(prefix[i]) > threshold) for i in idx)
+    diff = sum(abs(decision_score(full[i]) - decision_score(prefix[i])) for i in idx) / len(idx)
+    t_full, t_prefix = sum(full_time[i] for i in idx), sum(prefix_time[i] for i in idx)
+    print(
+        f"  {label}: {len(idx)} documenti | accordo decisioni {agree / len(idx):.2%} | "
+        f"|Δ punteggio| medio {diff:.4f} | tempo {t_full * 1000:.0f} ms -> {t_prefix * 1000:.0f} ms "
+        f"({t_full / max(t_prefix, 1e-9):.1f}x)"
+    )
+    return agree / len(idx)
+
+
+class Downstream:
+    """Spam e qualità come nella pipeline, per misurare l'effetto del punteggio LID sulle decisioni finali."""
+
+    def __init__(self, model_dir: str, workdir: str):
+        self.spam_filter = SpamFilter(
+            model_path=os.path.join(model_dir, "spam_lgbm.joblib"), rejected_dir=workdir, threshold=SPAM_THRESHOLD
+        )
+        self.quality_filter = ItalianClassification(
+            model_path=os.path.join(model_dir, "lgbm_quality_model.joblib"), threshold=QUALITY_THRESHOLD
+        )
+        self.extractor = SpamFeatureExtractor(features=self.spam_filter.required_features())
+        self.stats = DocStatsCsv(output_folder=workdir, features=self.quality_filter.required_features())
+
+    def kept(self, docs, results, threshold: float) -> list:
+        """Per ogni documento: tenuto da lingua, spam e qualità con i risultati LID ``results``."""
+        copies = [
+            Document(text=doc.text, id=doc.id, metadata={"language": best[0], "language_score": best[1]})
+            for doc, (best, _) in zip(docs, results)
+        ]
+        kept = [decision_score(result) > threshold for result in results]
+        idx = [i for i, keep in enumerate(kept) if keep]
+        for i in idx:
+            write_spam_features(copies[i].metadata, self.extractor.features_for(copies[i]))
+        for i, result in zip(idx, self.spam_filter.filter_batch([copies[i] for i in idx])):
+            kept[i] = result is True
+        idx = [i for i in idx if kept[i]]
+        for i in idx:
+            self.stats.annotate(copies[i])
+        for i, result in zip(idx, self.quality_filter.filter_batch([copies[i] for i in idx])):
+            kept[i] = result is True
+        return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accordo e latenza della LID a prefisso rispetto al testo intero.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--languages", type=str, nargs="+", default=["it"])
+    parser.add_argument("--backend", type=str, default="ft176", choices=["ft176", "glotlid"])
+    parser.add_argument("--model-file", type=str, default=None, help="Modello fastText locale invece di quello scaricato da DataTrove")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--prefix-chars", type=int, nargs="+", default=[1024, 2048, 4096])
+    parser.add_argument("--margin", type=float, default=0.1)
+    parser.add_argument("--limit", type=int, default=-1)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--model-dir", type=str, default="models", help="Modelli spam e qualità per l'effetto a valle")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    docs = list(JsonlReader(args.data_dir, glob_pattern=args.pattern, limit=args.limit).run())
+    lid = FT176LID(args.languages) if args.backend == "ft176" else GlotLID(args.languages)
+    if args.model_file:
+        from fasttext.FastText import _FastText
+        lid._model = _FastText(args.model_file)
+    lid.predict(docs[0])  # carica il modello fuori dalle misure
+
+    full, full_time = timed_predictions(lid, docs)
+    total_chars = sum(len(doc.text) for doc in docs)
+    print(f"{len(docs)} documenti, {total_chars} caratteri | LID testo intero: {sum(full_time):.2f}s")
+
+    downstream = Downstream(args.model_dir, tempfile.mkdtemp())
+    full_kept = downstream.kept(docs, full, args.threshold)
+    print(f"Testo intero: {sum(full_kept)} documenti tenuti da lingua, spam e qualità")
+
+    worst = 1.0
+    for prefix_chars in args.prefix_chars:
+        prefix_lid = PrefixLID(lid, args.threshold, prefix_chars, args.margin)
+        prefix, prefix_time = timed_predictions(prefix_lid, docs)
+        print(
+            f"Prefisso {prefix_chars} (margine {args.margin}): {prefix_lid.prefix_decided} decisi sul prefisso, "
+            f"{prefix_lid.extended} estensioni, {prefix_lid.scored_chars / total_chars:.1%} dei caratteri valutati"
+        )
+        long_idx = [i for i, doc in enumerate(docs) if len(doc.text) > prefix_chars * LID_PREFIX_GROWTH]
+        worst = min(worst, report("tutti", list(range(len(docs))), full, full_time, prefix, prefix_time, args.threshold))
+        report(f"lunghi (> {prefix_chars * LID_PREFIX_GROWTH} caratteri)", long_idx, full, full_time, prefix, prefix_time, args.threshold)
+        # Solo i documenti con un risultato LID diverso possono cambiare decisione a valle
+        changed = [i for i in range(len(docs)) if prefix[i] != full[i]]
+        prefix_kept = downstream.kept([docs[i] for i in changed], [prefix[i] for i in changed], args.threshold)
+        flipped = sum(keep != full_kept[i] for i, keep in zip(changed, prefix_kept))
+        worst = min(worst, 1 - flipped / len(docs))
+        print(
+            f"  a valle: {len(changed)} documenti con punteggio diverso | {flipped} decisioni finali diverse "
+            f"({1 - flipped / len(docs):.2%} di accordo)"
+        )
+
+    if worst < args.min_agreement:
+        print(f"Accordo minimo {worst:.2%} sotto {args.min_agreement:.2%}.")
+        sys.exit(1)
+    print("Accordo sopra la soglia richiesta.")
+
+
+if __name__ == "__main__":
+    main()
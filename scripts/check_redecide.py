@@ -0,0 +1,210 @@
+"""
+Verifica di src/redecide.py: ridecidere dagli output salvati deve dare gli stessi insiemi di
+documenti di una nuova esecuzione completa della pipeline con le stesse soglie.
+
+comando:
+    python3 scripts/check_redecide.py
+    python3 scripts/check_redecide.py --pattern "dataset/data_0000[01].jsonl" --spam-threshold 0.5 --quality-threshold 0.8
+    python3 scripts/check_redecide.py --filter-order language,quality,spam
+
+Questo script:
+1. Esegue la pipeline di pipeline_factory con le soglie di default in una cartella temporanea;
+   il filtro lingua è sostituito da un punteggio fisso, perché il modello LID non è disponibile offline
+2. Esegue redecide.py con le soglie di default e controlla che tenuti e scartati non cambino (con
+   --filter-order la prima esecuzione usa quell'ordine dei filtri e il confronto è con una
+   pipeline nell'ordine predefinito, perché cambia la cartella dei documenti scartati da più filtri)
+3. Esegue redecide.py con --spam-threshold / --quality-threshold e una nuova pipeline completa con
+   le stesse soglie, e controlla che id, categoria e score di ogni documento coincidano; ripete
+   il controllo passando lo stesso modello spam come --spam-model (score spam ricalcolati)
+4. Con --spam-model controlla che le feature spam lette dal modello vengano dai soli metadata
+   degli output (copie spam_* comprese), uguali a un'estrazione da capo: nessun documento già
+   passato dallo spam viene riletto dal testo
+5. Stampa documenti per categoria e tempi ed esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Aggiungo src/ al path per importare i moduli del progetto
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from datatrove.executor import LocalPipelineExecutor
+from datatrove.pipeline.base import PipelineStep
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.filters import ItalianClassification
+from blocks.redecide import RedecideSpamFilter, ResetDecisions, redecide_inputs
+from blocks.spam_classifier.spam_cascade import is_short_circuited
+from blocks.spam_classifier.spam_stats import extract_spam_features
+from blocks.spam_classifier.spam_classifier import SpamFilter
+from blocks.filter_planner import DEFAULT_FILTER_ORDER
+from pipeline_factory import QUALITY_THRESHOLD, SPAM_THRESHOLD, build_italian_cleaning_pipeline
+
+
+class FixedLanguageScore(PipelineStep):
+    """Al posto di LanguageFilter: tutti i documenti italiani con punteggio 1."""
+
+    name = "Fixed Language Score"
+
+    def run(self, data, rank: int = 0, world_size: int = 1):
+        for doc in data:
+            doc.metadata["language"] = "it"
+            doc.metadata["language_score"] = 1.0
+            yield doc
+
+
+def run_pipeline(data_dir: str, pattern: str, output_dir: str, model_dir: str, spam_threshold: float, quality_threshold: float, filter_order=DEFAULT_FILTER_ORDER) -> float:
+    blocks = build_italian_cleaning_pipeline(
+        data_dir=data_dir,
+        output_dir=output_dir,
+        rejected_dir=os.path.join(output_dir, "rejected"),
+        pattern=pattern,
+        model_path=model_dir,
+        filter_order=filter_order,
+    )
+    blocks[1] = FixedLanguageScore()
+    for block in blocks:
+        if isinstance(block, SpamFilter):
+            block.classifier.threshold = spam_threshold
+        elif isinstance(block, ItalianClassification):
+            block.classifier.threshold = quality_threshold
+    start = time.perf_counter()
+    LocalPipelineExecutor(pipeline=blocks, tasks=1, workers=1, logging_dir=os.path.join(output_dir, "logs")).run()
+    return time.perf_counter() - start
+
+
+def run_redecide(output_dir: str, target_dir: str, model_dir: str, spam_threshold: float, quality_threshold: float, extra: tuple = ()) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable, os.path.join(SRC_DIR, "redecide.py"),
+            "--output-dir", output_dir,
+            "--target-dir", target_dir,
+            "--model-path", model_dir,
+            "--spam-threshold", str(spam_threshold),
+            "--quality-threshold", str(quality_threshold),
+            "--workers", "2",
+            *extra,
+        ],
+        check=True,
+        capture_output=True,
+        cwd=os.path.dirname(output_dir),
+    )
+    return time.perf_counter() - start
+
+
+def decisions(output_dir: str) -> dict:
+    """id -> (categoria, spam_pred_score, quality_score) per tutti gli output ridecidibili."""
+    result = {}
+    for category, paths in redecide_inputs(output_dir, os.path.join(output_dir, "rejected")).items():
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    doc = json.loads(line)
+                    metadata = doc.get("metadata", {})
+                    result[doc["id"]] = (category, metadata.get("spam_pred_score"), metadata.get("quality_score"))
+    return result
+
+
+def spam_view_diffs(output_dir: str, model_dir: str) -> tuple:
+    """
+    Feature spam viste dal modello con --spam-model (RedecideSpamFilter._spam_view) confrontate con
+    un'estrazione da capo: (feature diverse, documenti valutati, documenti riletti dal testo).
+    """
+    spam_filter = RedecideSpamFilter(
+        model_path=os.path.join(model_dir, "spam_lgbm.joblib"),
+        rejected_dir=os.path.join(output_dir, "unused"),
+        rescore=True,
+    )
+    mismatched, scored = set(), 0
+    docs = ResetDecisions().run(JsonlReader(data_folder=output_dir, glob_pattern="**/*.jsonl").run())
+    for doc in docs:
+        if is_short_circuited(doc) or "spam_pred_score" not in doc.metadata:
+            continue
+        scored += 1
+        view = spam_filter._spam_view(doc).metadata
+        fresh = extract_spam_features(doc, spam_filter.required)
+        mismatched.update(name for name in spam_filter.required if view.get(name) != fresh.get(name))
+    return mismatched, scored, spam_filter.stats["spam_features_extracted"].total
+
+
+def compare(name: str, expected: dict, got: dict) -> int:
+    diffs = [doc_id for doc_id in expected.keys() | got.keys() if expected.get(doc_id) != got.get(doc_id)]
+    for doc_id in sorted(diffs)[:5]:
+        print(f"[DIFF] {name} {doc_id}: {expected.get(doc_id)} != {got.get(doc_id)}")
+    return len(diffs)
+
+
+def by_category(result: dict) -> dict:
+    counts = {}
+    for category, _, _ in result.values():
+        counts[category] = counts.get(category, 0) + 1
+    return dict(sorted(counts.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica della ridecisione dagli output salvati.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--pattern", default="train/*.jsonl")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--spam-threshold", type=float, default=0.5)
+    parser.add_argument("--quality-threshold", type=float, default=0.8)
+    parser.add_argument("--filter-order", default=",".join(DEFAULT_FILTER_ORDER), help="Ordine dei filtri della prima esecuzione")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    data_dir, model_dir = os.path.abspath(args.data_dir), os.path.abspath(args.model_dir)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = os.path.join(tmp, "previous")
+        full = os.path.join(tmp, "full")
+        filter_order = tuple(args.filter_order.split(","))
+        t_previous = run_pipeline(data_dir, args.pattern, previous, model_dir, SPAM_THRESHOLD, QUALITY_THRESHOLD, filter_order)
+        reference = previous
+        if filter_order != DEFAULT_FILTER_ORDER:
+            reference = os.path.join(tmp, "default_order")
+            run_pipeline(data_dir, args.pattern, reference, model_dir, SPAM_THRESHOLD, QUALITY_THRESHOLD)
+
+        same = os.path.join(tmp, "same")
+        run_redecide(previous, same, model_dir, SPAM_THRESHOLD, QUALITY_THRESHOLD)
+        errors = compare("soglie invariate", decisions(reference), decisions(same))
+
+        redecided = os.path.join(tmp, "redecided")
+        t_redecide = run_redecide(previous, redecided, model_dir, args.spam_threshold, args.quality_threshold)
+        t_full = run_pipeline(data_dir, args.pattern, full, model_dir, args.spam_threshold, args.quality_threshold)
+        expected, got = decisions(full), decisions(redecided)
+        errors += compare("nuove soglie", expected, got)
+
+        # Stesso modello passato come nuovo: le feature spam sovrascritte vengono ricalcolate
+        rescored = os.path.join(tmp, "rescored")
+        spam_model = os.path.join(model_dir, "spam_lgbm.joblib")
+        t_rescore = run_redecide(previous, rescored, model_dir, args.spam_threshold, args.quality_threshold, ("--spam-model", spam_model))
+        got_rescored = decisions(rescored)
+        errors += compare("nuove soglie, --spam-model", expected, got_rescored)
+        before = decisions(reference)
+        mismatched, scored, extracted = spam_view_diffs(previous, model_dir)
+        if mismatched or extracted:
+            errors += 1
+            print(f"[DIFF] --spam-model: feature diverse {sorted(mismatched)}, {extracted} documenti riletti dal testo")
+
+    print("=" * 64)
+    print(f"Soglie {SPAM_THRESHOLD}/{QUALITY_THRESHOLD}: {by_category(before)} | pipeline {t_previous:.1f} s")
+    print(f"Soglie {args.spam_threshold}/{args.quality_threshold}, pipeline completa: {by_category(expected)} | {t_full:.1f} s")
+    print(f"Soglie {args.spam_threshold}/{args.quality_threshold}, redecide.py:       {by_category(got)} | {t_redecide:.1f} s (processo separato, avvio incluso)")
+    print(f"Soglie {args.spam_threshold}/{args.quality_threshold}, con --spam-model:  {by_category(got_rescored)} | {t_rescore:.1f} s (processo separato, avvio incluso)")
+    print(f"--spam-model: feature spam di {scored} documenti lette dai metadata, uguali a un'estrazione da capo")
+    print(f"Differenze: {errors}")
+    print("=" * 64)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Verifica la lettura a blocchi dei documenti lunghi: il riassunto di DocStatsCsv
+(blocks.streaming_stats) e le feature spam di SpamFeatureExtractor (summarize_spam_streaming)
+identici al calcolo sul testo intero, memoria massima dei due percorsi su un documento da
+diversi MB e memoria massima (RSS) dell'intera pipeline.
+
+comando:
+    python3 scripts/check_streaming_stats.py
+    python3 scripts/check_streaming_stats.py --pattern "dataset/*.jsonl" --limit 300 --chunks 1 7 256 65536 --mb 8
+    python3 scripts/check_streaming_stats.py --pipeline-docs 2000 --big-docs 3 --spam-cascade
+
+Questo script:
+1. Calcola le 52 statistiche di --limit documenti dell'input, più testi sintetici con "\\r\\n",
+   sequenze di "\\n", separatori Unicode e caratteri fuori dal BMP, sia sul testo intero sia a
+   blocchi con ogni dimensione di --chunks, e controlla che valori e tipi coincidano
+2. Costruisce un documento da --mb MB concatenando l'input e misura con tracemalloc memoria
+   massima e tempo dei due percorsi, controllando che le feature coincidano
+3. Ripete il documento grande con --max-vocabulary piccolo e stampa quali feature cambiano (solo
+   quelle del vocabolario possono cambiare)
+4. Ripete i passi 1-3 per tutte le feature spam, con language/language_score nei metadata, e
+   controlla che nessun nodo del piano a blocchi legga l'analisi condivisa
+5. Esegue in un processo separato la pipeline di pipeline_factory (filtro lingua sostituito da un
+   punteggio fisso, perché il modello LID non è disponibile offline) su --pipeline-docs documenti
+   più --big-docs documenti da --mb MB, con e senza lettura a blocchi, e stampa la memoria massima
+   (RSS) del processo e i documenti tenuti, che devono coincidere.
+   Esce con codice 1 se ci sono differenze inattese
+"""
+
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.data import Document
+from datatrove.executor import LocalPipelineExecutor
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks import text_analysis
+from blocks.spam_classifier import spam_cascade
+from blocks.spam_classifier.spam_stats import SPAM_FEATURE_GRAPH, SPAM_STREAMING_NODES, SpamFeatureExtractor
+from blocks.stats import DocStatsCsv
+from pipeline_factory import build_italian_cleaning_pipeline
+
+# Le sole feature che dipendono dal vocabolario limitato
+VOCABULARY_FEATURES = {"vocabulary_size", "unique_word_count", "unique_word_ratio", "repeated_word_count", "repeated_word_ratio", "most_common_word_freq"}
+SPAM_VOCABULARY_FEATURES = {"unique_word_count", "unique_word_ratio"}
+SPAM_METADATA = {"language": "it", "language_score": 0.87}
+
+EDGE_TEXTS = [
+    "riga uno\r\nriga due\r\n\r\nparagrafo\r\rfine",
+    "a\n\n\nb\n\n \n\nc\n",
+    "\n\nInizio con righe vuote e parole   spaziate\t\tda tab\n\n\n\n",
+    "separatori unicode e\x85altri\x0bdi\x0criga\x1cfine\x1d\x1e",
+    "emoji 😀😀😀 fuori dal BMP 𝔘𝔫𝔦𝔠𝔬𝔡𝔢 e accenti àèéìòù ÀÈÉ",
+    "PAROLA parola Parola pArOlA 123 4-5 ...!!! ??",
+    "x",
+    " ",
+]
+
+
+class FixedLanguageFilter(BaseFilter):
+    """Al posto di LanguageFilter: tutti i documenti italiani con punteggio 1."""
+
+    name = "Fixed Language Score"
+
+    def filter(self, doc) -> bool:
+        doc.metadata["language"] = "it"
+        doc.metadata["language_score"] = 1.0
+        return True
+
+
+def diff_stats(a: dict, b: dict) -> list:
+    return [k for k in a if a[k] != b.get(k) or type(a[k]) is not type(b.get(k))]
+
+
+def extract(extractor, doc: Document) -> dict:
+    if isinstance(extractor, SpamFeatureExtractor):
+        doc.metadata = dict(SPAM_METADATA)
+        return extractor.features_for(doc)
+    return extractor.extract_stats(doc)
+
+
+def measure(extractor, text: str):
+    text_analysis.clear_analysis_cache()
+    doc = Document(text=text, id="big")
+    tracemalloc.start()
+    start = time.perf_counter()
+    stats = extract(extractor, doc)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    text_analysis.clear_analysis_cache()
+    return stats, peak, elapsed
+
+
+def check_extractor(label: str, make, vocabulary_features: set, texts: list, big: str, args) -> int:
+    """Passi 1-3 per un estrattore: ``make(**kwargs)`` lo costruisce con i parametri di streaming."""
+    full = make(streaming_min_chars=float("inf"))
+    errors = 0
+    for chunk in args.chunks:
+        streamed = make(streaming_min_chars=0, streaming_chunk_chars=chunk)
+        bad = 0
+        for i, text in enumerate(texts):
+            keys = diff_stats(extract(full, Document(text=text, id=str(i))), extract(streamed, Document(text=text, id=str(i))))
+            if keys:
+                bad += 1
+                if bad <= 3:
+                    print(f"[DIFF] {label}, blocchi da {chunk}, testo {i}: {keys}")
+        errors += bad
+        print(f"[{'OK' if not bad else 'DIFF'}] {label}, blocchi da {chunk} caratteri: {len(texts) - bad}/{len(texts)} testi identici")
+
+    full_stats, full_peak, full_time = measure(full, big)
+    stream_stats, stream_peak, stream_time = measure(make(streaming_min_chars=0), big)
+    keys = diff_stats(full_stats, stream_stats)
+    errors += bool(keys)
+    print(
+        f"[{'OK' if not keys else 'DIFF'}] {label}, documento da {len(big)} caratteri: memoria massima "
+        f"{full_peak / 2**20:.1f} MB -> {stream_peak / 2**20:.1f} MB, tempo {full_time:.2f}s -> {stream_time:.2f}s"
+        + (f" | differenze: {keys}" if keys else "")
+    )
+
+    capped_stats, capped_peak, _ = measure(make(streaming_min_chars=0, max_vocabulary=args.max_vocabulary), big)
+    keys = diff_stats(full_stats, capped_stats)
+    unexpected = set(keys) - vocabulary_features
+    errors += bool(unexpected)
+    print(
+        f"[{'OK' if not unexpected else 'DIFF'}] {label}, vocabolario limitato a {args.max_vocabulary}: memoria {capped_peak / 2**20:.1f} MB, "
+        f"feature cambiate: " + ", ".join(f"{k} {full_stats[k]} -> {capped_stats[k]}" for k in keys)
+    )
+    return errors
+
+
+def peak_rss_kb() -> int:
+    """
+    RSS massimo del processo in KB. Su Linux VmHWM, che riparte da zero con exec: ru_maxrss di un
+    processo figlio parte invece dal picco del padre al momento del fork.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_pipeline(args) -> None:
+    """Processo figlio del passo 5: esegue la pipeline e stampa RSS massimo e documenti tenuti."""
+    logger.remove()
+    blocks = build_italian_cleaning_pipeline(
+        data_dir=args.pipeline_input,
+        output_dir=args.pipeline_output,
+        rejected_dir=os.path.join(args.pipeline_output, "rejected"),
+        pattern="*.jsonl",
+        model_path=os.path.abspath(args.model_dir),
+        spam_cascade=args.spam_cascade,
+    )
+    blocks[1] = FixedLanguageFilter()
+    if args.pipeline_run == "full":
+        # Percorso precedente: anche i documenti lunghi passano dall'analisi condivisa
+        text_analysis.STREAMING_MIN_CHARS = float("inf")
+        spam_cascade.STREAMING_MIN_CHARS = float("inf")
+        for step in blocks:
+            if hasattr(step, "streaming_min_chars"):
+                step.streaming_min_chars = float("inf")
+    LocalPipelineExecutor(pipeline=blocks, tasks=1, workers=1, logging_dir=os.path.join(args.pipeline_output, "logs")).run()
+    kept = 0
+    for path in glob.glob(os.path.join(args.pipeline_output, "italiano_pulito_*.jsonl")):
+        with open(path, "rb") as f:
+            kept += sum(1 for _ in f)
+    print(json.dumps({"maxrss_kb": peak_rss_kb(), "kept": kept}))
+
+
+def check_pipeline_rss(texts: list, big: str, args) -> int:
+    """Passo 5: RSS massimo dell'intera pipeline con e senza lettura a blocchi dei documenti lunghi."""
+    docs = (texts * (args.pipeline_docs // len(texts) + 1))[: args.pipeline_docs]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "input")
+        os.makedirs(input_dir)
+        with open(os.path.join(input_dir, "docs.jsonl"), "w", encoding="utf-8") as f:
+            step = max(1, len(docs) // (args.big_docs + 1))
+            for i, text in enumerate(docs):
+                f.write(json.dumps({"id": str(i), "text": text}) + "\n")
+                if args.big_docs and i % step == step - 1 and i // step < args.big_docs:
+                    f.write(json.dumps({"id": f"big-{i}", "text": big}) + "\n")
+        for mode in ("full", "streamed"):
+            command = [
+                sys.executable, os.path.abspath(__file__), "--pipeline-run", mode,
+                "--pipeline-input", input_dir, "--pipeline-output", os.path.join(tmp, mode),
+                "--model-dir", args.model_dir,
+            ] + (["--spam-cascade"] if args.spam_cascade else [])
+            start = time.perf_counter()
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            results[mode] = dict(json.loads(output.strip().splitlines()[-1]), seconds=time.perf_counter() - start)
+    full, streamed = results["full"], results["streamed"]
+    same = full["kept"] == streamed["kept"]
+    print(
+        f"[{'OK' if same else 'DIFF'}] pipeline su {len(docs)} documenti + {args.big_docs} da {len(big)} caratteri: "
+        f"RSS massimo {full['maxrss_kb'] / 1024:.0f} MB -> {streamed['maxrss_kb'] / 1024:.0f} MB, "
+        f"tempo {full['seconds']:.1f}s -> {streamed['seconds']:.1f}s, documenti tenuti {full['kept']} / {streamed['kept']}"
+    )
+    return 0 if same else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica delle statistiche calcolate a blocchi.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/*.jsonl")
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1, 7, 256, 65536])
+    parser.add_argument("--mb", type=float, default=8.0, help="Dimensione del documento grande in MB")
+    parser.add_argument("--max-vocabulary", type=int, default=5000, help="Vocabolario limitato per l'ultimo controllo")
+    parser.add_argument("--model-dir", type=str, default="models")
+    parser.add_argument("--pipeline-docs", type=int, default=2000, help="Documenti normali della pipeline del passo 5 (0 = salta)")
+    parser.add_argument("--big-docs", type=int, default=3, help="Documenti da --mb MB nella pipeline del passo 5")
+    parser.add_argument("--spam-cascade", action="store_true")
+    # Usati solo dal processo figlio del passo 5
+    parser.add_argument("--pipeline-run", choices=["full", "streamed"], help=argparse.SUPPRESS)
+    parser.add_argument("--pipeline-input", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--pipeline-output", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.pipeline_run:
+        run_pipeline(args)
+        return
+
+    out = "/tmp/check_streaming_stats"
+    texts = [doc.text for doc in JsonlReader(args.data_dir, glob_pattern=args.pattern, limit=args.limit).run()] + EDGE_TEXTS
+    big = ""
+    while len(big.encode("utf-8")) < args.mb * 1024 * 1024:
+        big += "\n\n".join(texts)
+
+    errors = check_extractor(
+        "statistiche",
+        lambda **kwargs: DocStatsCsv(output_folder=out, **kwargs),
+        VOCABULARY_FEATURES, texts, big, args,
+    )
+    errors += check_extractor("feature spam", SpamFeatureExtractor, SPAM_VOCABULARY_FEATURES, texts, big, args)
+    streaming_plan = SPAM_FEATURE_GRAPH.plan(provided=SPAM_STREAMING_NODES)
+    readers = [name for name in streaming_plan.computed if "_analysis" in SPAM_FEATURE_GRAPH.dependencies(name)]
+    errors += bool(readers)
+    print(f"[{'OK' if not readers else 'DIFF'}] nodi del piano a blocchi che leggono l'analisi: {readers or 'nessuno'}")
+
+    if args.pipeline_docs:
+        errors += check_pipeline_rss(texts, big, args)
+
+    print("Nessuna differenza." if not errors else f"{errors} differenze.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
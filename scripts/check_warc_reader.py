@@ -0,0 +1,264 @@
+"""
+Verifica la lettura diretta di WARC/WET locali (blocks.warc.LocalWarcReader) su file di prova
+costruiti dai documenti di un JSONL.
+
+comando:
+    python3 scripts/check_warc_reader.py
+    python3 scripts/check_warc_reader.py --pattern "dataset/data_00000.jsonl" --limit 300 --files 3
+
+Questo script:
+1. Costruisce in una cartella temporanea --files file ``.warc.gz`` (un membro gzip per record,
+   come Common Crawl) con warcinfo, request, response HTML (UTF-8, latin-1 dichiarato
+   nell'intestazione o nel ``<meta>``, Transfer-Encoding chunked, script e stili da togliere,
+   pagine senza ``</head>`` o senza ``</head>`` e ``<body>``),
+   risposte non HTML e metadata, più i ``.wet.gz`` corrispondenti, una copia non compressa e una
+   copia troncata a metà
+2. Legge ogni formato con LocalWarcReader e confronta id, url e testo con i documenti di partenza
+   (il file troncato deve restituire i record completi prima del taglio)
+3. Legge i file in parallelo con LocalPipelineExecutor (un task per file) e controlla che ogni
+   documento sia scritto una sola volta, poi esegue la pipeline di pipeline_factory con
+   input_format="warc" (il filtro lingua è sostituito da un punteggio fisso, perché il modello LID
+   non è disponibile offline)
+4. Stampa il tempo della lettura diretta e quello della conversione in JSONL seguita dalla
+   lettura del JSONL. Esce con codice 1 se c'è anche una sola differenza
+"""
+
+import argparse
+import glob
+import gzip
+import html
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.executor import LocalPipelineExecutor
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from datatrove.pipeline.readers import JsonlReader
+from datatrove.pipeline.writers import JsonlWriter
+from loguru import logger
+
+from blocks.warc import LocalWarcReader
+from pipeline_factory import build_italian_cleaning_pipeline
+
+_SPACES = re.compile(r"\s+")
+
+
+class FixedLanguageFilter(BaseFilter):
+    """Al posto di LanguageFilter: tutti i documenti italiani con punteggio 1."""
+
+    name = "Fixed Language Score"
+
+    def filter(self, doc) -> bool:
+        doc.metadata["language"] = "it"
+        doc.metadata["language_score"] = 1.0
+        return True
+
+
+def warc_record(warc_type: str, key: str, url: str, payload: bytes, extra: dict = None) -> bytes:
+    headers = {
+        "WARC-Type": warc_type,
+        "WARC-Record-ID": f"<urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, warc_type + key)}>",
+        "WARC-Date": "2023-12-05T14:08:36Z",
+        "WARC-Target-URI": url,
+        **(extra or {}),
+        "Content-Length": str(len(payload)),
+    }
+    head = "WARC/1.0\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return head.encode("utf-8") + b"\r\n" + payload + b"\r\n\r\n"
+
+
+def http_response(body: bytes, content_type: str, chunked: bool = False) -> bytes:
+    headers = ["HTTP/1.1 200 OK", f"Content-Type: {content_type}", "Server: test"]
+    if chunked:
+        headers.append("Transfer-Encoding: chunked")
+        parts = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+        body = b"".join(f"{len(part):x}\r\n".encode() + part + b"\r\n" for part in parts) + b"0\r\n\r\n"
+    return "\r\n".join(headers).encode("ascii") + b"\r\n\r\n" + body
+
+
+def page(text: str, meta_charset: str = None, head_end: str = "</head><body>") -> str:
+    """Pagina HTML del testo; ``head_end`` separa intestazione e corpo (in HTML5 entrambi i tag sono facoltativi)."""
+    meta = f'<meta charset="{meta_charset}">' if meta_charset else ""
+    paragraphs = "".join(f"<p>{html.escape(line)}</p>\n" for line in text.split("\n"))
+    return (
+        f"<!DOCTYPE html><html><head>{meta}<title>Titolo</title><style>p {{ color: red }}</style>{head_end}"
+        f"<script>var x = '<p>non testo</p>';</script><div>{paragraphs}</div></body></html>"
+    )
+
+
+def expected_text(text: str) -> str:
+    lines = (_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def build_fixture(docs: list, folder: str, files: int) -> dict:
+    """Scrive i file WARC e WET di prova e restituisce ``{formato: {id record: (url, testo)}}``."""
+    expected = {"warc": {}, "wet": {}}
+    for n in range(files):
+        warc = [gzip.compress(warc_record("warcinfo", f"info{n}", "", b"software: check_warc_reader\r\n"))]
+        wet = [gzip.compress(warc_record("warcinfo", f"wetinfo{n}", "", b"software: check_warc_reader\r\n"))]
+        for i, doc in enumerate(docs[n::files]):
+            key, url, text = str(doc["id"]), f"https://example.it/{n}/{i}", doc["text"]
+            try:
+                latin = text.encode("iso-8859-1")
+            except UnicodeEncodeError:
+                latin = None
+            if latin is not None and i % 7 == 0:
+                body, content_type = page(text).encode("iso-8859-1"), "text/html; charset=ISO-8859-1"
+            elif latin is not None and i % 11 == 0:
+                body, content_type = page(text, meta_charset="iso-8859-1").encode("iso-8859-1"), "text/html"
+            elif i % 5 == 0:
+                # Senza </head>, e una volta su due anche senza <body>
+                head_end = "<body>" if i % 10 == 0 else ""
+                body, content_type = page(text, head_end=head_end).encode("utf-8"), "text/html; charset=utf-8"
+            else:
+                body, content_type = page(text).encode("utf-8"), "text/html; charset=utf-8"
+            records = [
+                warc_record("request", key, url, b"GET / HTTP/1.1\r\nHost: example.it\r\n\r\n"),
+                warc_record("response", key, url, http_response(body, content_type, chunked=i % 13 == 0)),
+                warc_record("metadata", key, url, b"fetchTimeMs: 120\r\n"),
+            ]
+            if i % 20 == 0:
+                records.append(warc_record("response", key + "img", url + ".jpg", http_response(b"\xff\xd8\xff\xe0" * 64, "image/jpeg")))
+            warc.extend(gzip.compress(record) for record in records)
+            response_id = f"<urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, 'response' + key)}>"
+            expected["warc"][response_id] = (url, expected_text(text))
+
+            wet.append(gzip.compress(warc_record("conversion", key, url, text.encode("utf-8"), {"Content-Type": "text/plain"})))
+            conversion_id = f"<urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, 'conversion' + key)}>"
+            expected["wet"][conversion_id] = (url, text.strip())
+        for name, members in ((f"CC-TEST-{n:05d}.warc.gz", warc), (f"CC-TEST-{n:05d}.warc.wet.gz", wet)):
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(b"".join(members))
+    return expected
+
+
+def read(folder: str, pattern: str) -> dict:
+    reader = LocalWarcReader(folder, glob_pattern=pattern)
+    return {doc.id: (doc.metadata["url"], doc.text) for doc in reader.run()}
+
+
+def compare(label: str, got: dict, expected: dict) -> int:
+    missing, extra = expected.keys() - got.keys(), got.keys() - expected.keys()
+    different = [key for key in got.keys() & expected.keys() if got[key] != expected[key]]
+    errors = len(missing) + len(extra) + len(different)
+    print(
+        f"[{'OK' if not errors else 'DIFF'}] {label}: {len(got)} documenti "
+        f"(mancanti {len(missing)}, in più {len(extra)}, diversi {len(different)})"
+    )
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica della lettura diretta di WARC/WET locali.")
+    parser.add_argument("--data-dir", type=str, default="data")
+    parser.add_argument("--pattern", type=str, default="dataset/data_00000.jsonl")
+    parser.add_argument("--model-dir", type=str, default="models")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--files", type=int, default=4)
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    docs = [
+        {"id": doc.id, "text": doc.text}
+        for doc in JsonlReader(args.data_dir, glob_pattern=args.pattern, limit=args.limit).run()
+    ]
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        warc_dir = os.path.join(tmp, "warc")
+        os.makedirs(warc_dir)
+        expected = build_fixture(docs, warc_dir, args.files)
+        first = sorted(glob.glob(os.path.join(warc_dir, "*.warc.gz")))[0]
+        plain_dir, truncated_dir = os.path.join(tmp, "plain"), os.path.join(tmp, "truncated")
+        os.makedirs(plain_dir)
+        os.makedirs(truncated_dir)
+        with gzip.open(first, "rb") as src, open(os.path.join(plain_dir, "CC-TEST.warc"), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        with open(first, "rb") as src, open(os.path.join(truncated_dir, "CC-TEST.warc.gz"), "wb") as dst:
+            dst.write(src.read()[: os.path.getsize(first) // 2])
+        size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(warc_dir, "*.gz")))
+        print(f"File di prova: {args.files} WARC e {args.files} WET da {len(docs)} documenti ({size / 1e6:.1f} MB)")
+
+        # 1. Ogni formato letto da un solo task
+        warc_docs = read(warc_dir, "*.warc.gz")
+        errors += compare("WARC gzip", warc_docs, expected["warc"])
+        errors += compare("WET gzip", read(warc_dir, "*.wet.gz"), expected["wet"])
+        plain = read(plain_dir, "*.warc")
+        errors += compare("WARC non compresso", plain, {key: expected["warc"][key] for key in plain.keys() & expected["warc"].keys()})
+        errors += not plain
+        truncated = read(truncated_dir, "*.warc.gz")
+        truncated_ok = 0 < len(truncated) < len(plain) and all(expected["warc"].get(key) == value for key, value in truncated.items())
+        errors += not truncated_ok
+        print(f"[{'OK' if truncated_ok else 'DIFF'}] WARC troncato: {len(truncated)} record completi su {len(plain)}")
+
+        # 2. Un task per file su più worker
+        parallel_dir = os.path.join(tmp, "parallel")
+        LocalPipelineExecutor(
+            pipeline=[LocalWarcReader(warc_dir, glob_pattern="*.warc.gz"), JsonlWriter(parallel_dir, compression=None)],
+            tasks=args.files,
+            workers=min(args.files, 4),
+            logging_dir=os.path.join(tmp, "logs", "parallel"),
+        ).run()
+        written = Counter()
+        for path in glob.glob(os.path.join(parallel_dir, "*.jsonl")):
+            with open(path, encoding="utf-8") as f:
+                written.update(json.loads(line)["id"] for line in f)
+        parallel_ok = set(written) == set(expected["warc"]) and max(written.values()) == 1
+        errors += not parallel_ok
+        print(f"[{'OK' if parallel_ok else 'DIFF'}] {args.files} task in parallelo: {sum(written.values())} documenti scritti, {len(written)} distinti")
+
+        # 3. Pipeline completa con input WARC
+        output_dir = os.path.join(tmp, "pipeline")
+        blocks = build_italian_cleaning_pipeline(
+            data_dir=warc_dir,
+            output_dir=output_dir,
+            rejected_dir=os.path.join(output_dir, "rejected"),
+            pattern="*.warc.gz",
+            model_path=os.path.abspath(args.model_dir),
+            input_format="warc",
+        )
+        blocks[1] = FixedLanguageFilter()
+        LocalPipelineExecutor(pipeline=blocks, tasks=args.files, workers=1, logging_dir=os.path.join(tmp, "logs", "pipeline")).run()
+        counts = {}
+        for label, pattern in (("tenuti", "italiano_pulito_*.jsonl"), ("scartati", os.path.join("rejected", "*", "*.jsonl"))):
+            counts[label] = 0
+            for path in glob.glob(os.path.join(output_dir, pattern)):
+                with open(path, encoding="utf-8") as f:
+                    counts[label] += sum(1 for _ in f)
+        pipeline_ok = counts["tenuti"] + counts["scartati"] == len(expected["warc"])
+        errors += not pipeline_ok
+        print(f"[{'OK' if pipeline_ok else 'DIFF'}] pipeline con input WARC: {counts['tenuti']} tenuti, {counts['scartati']} scartati")
+
+        # 4. Lettura diretta contro conversione in JSONL + lettura del JSONL
+        start = time.perf_counter()
+        read(warc_dir, "*.warc.gz")
+        direct = time.perf_counter() - start
+        start = time.perf_counter()
+        jsonl_path = os.path.join(tmp, "converted", "converted.jsonl")
+        os.makedirs(os.path.dirname(jsonl_path))
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for doc in LocalWarcReader(warc_dir, glob_pattern="*.warc.gz").run():
+                f.write(json.dumps({"id": doc.id, "text": doc.text, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+        converted = sum(1 for _ in JsonlReader(os.path.dirname(jsonl_path)).run())
+        two_pass = time.perf_counter() - start
+        print(
+            f"Lettura diretta: {direct:.2f}s | conversione in JSONL + lettura: {two_pass:.2f}s "
+            f"({os.path.getsize(jsonl_path) / 1e6:.1f} MB scritti e riletti, {converted} documenti)"
+        )
+
+    print("Nessuna differenza." if not errors else f"{errors} differenze.")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
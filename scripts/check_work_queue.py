@@ -0,0 +1,110 @@
+"""
+Verifica della coda di lavoro condivisa (blocks.work_queue) con più processi in parallelo.
+
+comando:
+    python3 scripts/check_work_queue.py
+    python3 scripts/check_work_queue.py --pattern "dataset/*.jsonl" --workers 4 --unit-kb 256
+
+Questo script:
+1. Crea una coda di lavoro sull'input con unità piccole (--unit-kb), così i file vengono divisi
+2. Avvia --workers processi, ognuno con un WorkQueueJsonlReader e un proprio rank; il rank 0
+   simula un worker lento (--slow-ms di attesa per documento)
+3. Controlla che l'unione dei documenti letti coincida con quella di JsonlReader, senza documenti
+   persi né duplicati, e che ogni unità sia stata presa da un solo rank
+4. Stampa unità e documenti per rank (il worker lento ne prende meno) ed esce con codice 1 se
+   c'è anche una sola differenza
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from datatrove.pipeline.readers import JsonlReader
+from loguru import logger
+
+from blocks.work_queue import WorkQueueJsonlReader, prepare_work_queue
+
+
+def doc_key(doc) -> tuple:
+    return doc.id, doc.text, json.dumps(doc.metadata, sort_keys=True, default=str)
+
+
+def worker(data_dir: str, pattern: str, queue_dir: str, rank: int, slow_ms: float, results) -> None:
+    logger.remove()
+    reader = WorkQueueJsonlReader(data_folder=data_dir, queue_dir=queue_dir, glob_pattern=pattern)
+    docs = []
+    for doc in reader.run(rank=rank):
+        if slow_ms:
+            time.sleep(slow_ms / 1000)
+        docs.append(doc_key(doc))
+    results.put((rank, docs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica della coda di lavoro condivisa.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--pattern", default="train/*.jsonl")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--unit-kb", type=int, default=64)
+    parser.add_argument("--slow-ms", type=float, default=5.0, help="Attesa per documento del rank 0")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    expected = Counter(doc_key(doc) for doc in JsonlReader(data_folder=args.data_dir, glob_pattern=args.pattern).run())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_dir = os.path.join(tmp, "work_queue")
+        queue = prepare_work_queue(args.data_dir, args.pattern, queue_dir, unit_bytes=args.unit_kb * 1024)
+        results = mp.Queue()
+        processes = [
+            mp.Process(
+                target=worker,
+                args=(args.data_dir, args.pattern, queue_dir, rank, args.slow_ms if rank == 0 else 0.0, results),
+            )
+            for rank in range(args.workers)
+        ]
+        start = time.perf_counter()
+        for p in processes:
+            p.start()
+        by_rank = dict(results.get() for _ in processes)
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        n_units = len(queue.units)
+        with open(queue.claims_path, encoding="utf-8") as f:
+            claims = [json.loads(line) for line in f]
+
+    got = Counter(doc for docs in by_rank.values() for doc in docs)
+    units_per_rank = Counter(claim["rank"] for claim in claims)
+    claimed_units = Counter(claim["unit"] for claim in claims)
+    errors = 0
+    if got != expected:
+        errors += 1
+        print(f"[DIFF] {sum((expected - got).values())} documenti persi, {sum((got - expected).values())} in più")
+    if sorted(claimed_units) != list(range(n_units)) or max(claimed_units.values(), default=1) > 1:
+        errors += 1
+        print("[DIFF] unità non prese o prese più volte")
+
+    print("=" * 64)
+    print(f"Unità: {n_units} | documenti: {sum(got.values())}/{sum(expected.values())} | {elapsed:.2f} s")
+    for rank in sorted(by_rank):
+        note = " (lento)" if rank == 0 and args.slow_ms else ""
+        print(f"rank {rank}{note}: {units_per_rank[rank]} unità, {len(by_rank[rank])} documenti")
+    print(f"Differenze: {errors}")
+    print("=" * 64)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
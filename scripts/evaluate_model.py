@@ -258,7 +258,7 @@ def main():
             label_column="label",
         )
         X_scaled = pd.DataFrame(
-            classifier.scaler.transform(X),
+            classifier.scale_features(X),
             columns=classifier.feature_names,
             index=X.index,
         )
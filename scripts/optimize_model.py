@@ -0,0 +1,69 @@
+"""
+Script per ottimizzare un artifact LightGBM piegando lo StandardScaler nelle soglie degli alberi.
+
+comando:
+    python3 scripts/optimize_model.py --model models/spam_lgbm.joblib --output models/spam_lgbm_folded.joblib
+    python3 scripts/optimize_model.py --model models/lgbm_quality_model.joblib --csv data/splits/doc_stats_test.csv
+
+Questo script:
+1. Carica l'artifact (modello + scaler) salvato da QualityClassifier o SpamClassifier
+2. Riscrive le soglie di ogni split nello spazio delle feature grezze e rimuove lo scaler
+3. Verifica che predict_proba coincida con l'originale (su un CSV di feature o su righe sintetiche)
+4. Salva il nuovo artifact, caricabile senza modifiche da QualityClassifier, ItalianClassification e SpamFilter
+"""
+
+import argparse
+import os
+import sys
+import warnings
+
+import joblib
+import pandas as pd
+
+warnings.filterwarnings(
+    "ignore",
+    message="X does not have valid feature names.*",
+    category=UserWarning,
+)
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from blocks.model_optimization import fold_artifact, prediction_diff, synthetic_feature_frame
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Piega lo scaler nelle soglie di un modello LightGBM.")
+    parser.add_argument("--model", required=True, help="Artifact .joblib da ottimizzare")
+    parser.add_argument("--output", default=None, help="Artifact ottimizzato (default: <model>_folded.joblib)")
+    parser.add_argument("--csv", default=None, help="CSV di feature per la verifica (default: righe sintetiche)")
+    parser.add_argument("--n-synthetic", type=int, default=20000, help="Righe sintetiche se --csv non è indicato")
+    parser.add_argument("--atol", type=float, default=1e-12, help="Differenza massima ammessa su predict_proba")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + "_folded.joblib"
+
+    artifact = joblib.load(args.model)
+    folded = fold_artifact(artifact)
+
+    if args.csv:
+        X = pd.read_csv(args.csv)[list(artifact["feature_names"])]
+        X = X.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        source = args.csv
+    else:
+        X = synthetic_feature_frame(artifact, n_rows=args.n_synthetic)
+        source = f"{len(X)} righe sintetiche"
+
+    diff = prediction_diff(artifact, folded, X)
+    print(f"Verifica su {source}: max |Δproba| = {diff.max():.3g} | righe oltre atol = {int((diff > args.atol).sum())}")
+    if diff.max() > args.atol:
+        print(f"[ERRORE] Il modello ottimizzato diverge dall'originale oltre atol={args.atol}: artifact non salvato")
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    joblib.dump(folded, output)
+    print(f"[OK] Artifact senza scaler salvato in: {output}")
+
+
+if __name__ == "__main__":
+    main()
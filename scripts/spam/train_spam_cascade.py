@@ -0,0 +1,167 @@
+"""
+Addestra e valuta il primo livello della cascata spam (SpamCascade).
+
+comando:
+    python3 scripts/spam/train_spam_cascade.py
+    python3 scripts/spam/train_spam_cascade.py --max-disagreement 0.002 --output models/spam_cascade.joblib
+
+Questo script:
+1. Legge i documenti di training (web + spam etichettati) e calcola per ognuno la decisione del
+   percorso completo (extract_spam_features + SpamFilter) e le feature economiche della cascata
+2. Addestra la regressione logistica sui documenti che superano il gate e sceglie la soglia ham
+   più alta compatibile con --max-disagreement
+3. Valuta la cascata sui set etichettati di data/spam (testi già visti in training esclusi):
+   quota di documenti decisi in anticipo, accordo con il percorso completo, accuratezza sulla
+   label gold di percorso completo e cascata, tempi
+4. Salva il modello in --output
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings(
+    "ignore",
+    message="X does not have valid feature names.*",
+    category=UserWarning,
+)
+
+# Aggiungo src/ al path per importare i moduli del progetto
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from datatrove.data import Document
+
+from blocks.spam_classifier.spam_cascade import (
+    CHEAP_FEATURE_NAMES,
+    SpamCascadeModel,
+    cheap_spam_features,
+    passes_cheap_gate,
+)
+from blocks.spam_classifier.spam_classifier import SpamFilter
+from blocks.spam_classifier.spam_stats import extract_spam_features
+
+
+def load_documents(patterns: list[str]) -> dict[str, list[Document]]:
+    """Legge i JSONL come JsonlReader: i campi diversi da id/text finiscono nei metadata."""
+    by_file: dict[str, list[Document]] = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            docs = []
+            with open(path, encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    metadata = record.pop("metadata", None) or {}
+                    text = record.pop("text", "")
+                    doc_id = record.pop("id", f"{path}/{i}")
+                    docs.append(Document(text=text, id=doc_id, metadata={**metadata, **record}))
+            by_file[path] = docs
+    return by_file
+
+
+def full_path(spam_filter: SpamFilter, docs: list[Document], batch_size: int) -> tuple[np.ndarray, float]:
+    """Decisione del percorso completo (True = scartato) e tempo impiegato."""
+    start = time.perf_counter()
+    for doc in docs:
+        doc.metadata.update(extract_spam_features(doc))
+    rejected = []
+    for i in range(0, len(docs), batch_size):
+        rejected.extend(result is not True for result in spam_filter.filter_batch(docs[i:i + batch_size]))
+    return np.array(rejected, dtype=bool), time.perf_counter() - start
+
+
+def cheap_path(docs: list[Document]) -> tuple[np.ndarray, np.ndarray, float]:
+    """Matrice delle feature economiche, maschera del gate e tempo impiegato."""
+    start = time.perf_counter()
+    features = [cheap_spam_features(doc.text) for doc in docs]
+    elapsed = time.perf_counter() - start
+    X = np.array([[f[name] for name in CHEAP_FEATURE_NAMES] for f in features], dtype=np.float64)
+    gate = np.array([passes_cheap_gate(f) for f in features], dtype=bool)
+    return X.reshape(len(docs), len(CHEAP_FEATURE_NAMES)), gate, elapsed
+
+
+def short_circuit_mask(model: SpamCascadeModel, X: np.ndarray, gate: np.ndarray) -> np.ndarray:
+    """Documenti che la cascata decide ham senza passare dal percorso completo."""
+    short = np.zeros(len(X), dtype=bool)
+    for i in np.flatnonzero(gate):
+        short[i] = model.is_confident_ham(dict(zip(CHEAP_FEATURE_NAMES, X[i])))[0]
+    return short
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Addestra e valuta la cascata spam.")
+    parser.add_argument("--spam-model", default="models/spam_lgbm.joblib")
+    parser.add_argument(
+        "--train-files",
+        nargs="+",
+        default=["data/train/*.jsonl", "data/dataset/*.jsonl", "data/spam/train/*.jsonl"],
+    )
+    parser.add_argument("--eval-files", nargs="+", default=["data/spam/*.jsonl"])
+    parser.add_argument(
+        "--max-disagreement",
+        type=float,
+        default=0.0,
+        help="Quota massima di documenti decisi ham dalla cascata ma scartati dal percorso completo",
+    )
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--output", default="models/spam_cascade.joblib")
+    args = parser.parse_args()
+
+    spam_filter = SpamFilter(model_path=args.spam_model, rejected_dir=tempfile.mkdtemp())
+
+    train_docs = [doc for docs in load_documents(args.train_files).values() for doc in docs]
+    X, gate, _ = cheap_path(train_docs)
+    rejected, _ = full_path(spam_filter, train_docs, args.batch_size)
+    print(
+        f"Training: {len(train_docs)} documenti | gate {gate.mean():.1%} | "
+        f"scartati dal percorso completo nel gate: {int(rejected[gate].sum())}"
+    )
+
+    model = SpamCascadeModel.fit(X, rejected, gate, max_disagreement=args.max_disagreement)
+    short = short_circuit_mask(model, X, gate)
+    print(
+        f"Soglia ham {model.ham_threshold:.4f} | short-circuit {short.mean():.1%} | "
+        f"disaccordi con il percorso completo: {int((short & rejected).sum())}"
+    )
+
+    seen = {doc.text for doc in train_docs}
+    print("\n" + "=" * 100)
+    print(
+        f"{'file':<34}{'docs':>6}{'short':>8}{'accordo':>9}{'acc full':>10}{'acc casc':>10}"
+        f"{'full s':>9}{'casc s':>9}{'speedup':>9}"
+    )
+    print("-" * 100)
+    for path, docs in load_documents(args.eval_files).items():
+        docs = [doc for doc in docs if doc.text not in seen]
+        if not docs:
+            continue
+        X_eval, gate_eval, cheap_s = cheap_path(docs)
+        short_eval = short_circuit_mask(model, X_eval, gate_eval)
+        rejected_eval, full_s = full_path(spam_filter, docs, args.batch_size)
+        cascade_rejected = rejected_eval & ~short_eval
+        # Tempo della cascata: feature economiche per tutti + percorso completo solo sui documenti non decisi
+        cascade_s = cheap_s + full_s * (1.0 - short_eval.mean())
+
+        gold = np.array([doc.metadata.get("spam_label_gold") == "spam" for doc in docs], dtype=bool)
+        print(
+            f"{os.path.basename(path):<34}{len(docs):>6}{short_eval.mean():>8.1%}"
+            f"{(cascade_rejected == rejected_eval).mean():>9.2%}"
+            f"{(rejected_eval == gold).mean():>10.2%}{(cascade_rejected == gold).mean():>10.2%}"
+            f"{full_s:>9.2f}{cascade_s:>9.2f}{full_s / cascade_s:>8.2f}x"
+        )
+    print("=" * 100)
+
+    model.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
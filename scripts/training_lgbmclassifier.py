@@ -1,3 +1,5 @@
+import argparse
+import json
 import sys
 import os
 
@@ -6,20 +8,35 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from src.blocks.classifiers import QualityClassifier
+from src.blocks.feature_cost import DEFAULT_AUC_BUDGET, FeatureCostModel
 from sklearn.model_selection import train_test_split
 import pandas as pd
 
 """
 Avviare come:
 python3 scripts/training_lgbmclassifier.py
+python3 scripts/training_lgbmclassifier.py --cost-aware --auc-budget 0.002
 
 Questo script:
 1. Effettua lo slit del dataset in train (70%), val (15%), test (15%)
 2. Allena il modello su train
 3. Valuta su val
 4. Salva tutte e 3 le parti per usi futuri (es. per valutazione performance del modello)
+5. Con --cost-aware misura il costo di ogni statistica su un campione di documenti, toglie quelle
+   costose e poco importanti finché la ROC-AUC media sui fold del training non perde più di
+   --auc-budget, riaddestra sulle feature scelte e salva il report, con la perdita sulla
+   validazione, in evaluation/quality_cost_selection.json
 """
 
+parser = argparse.ArgumentParser(description="Training del classificatore di qualità.")
+parser.add_argument("--cost-aware", action="store_true", help="Selezione delle feature per costo di estrazione")
+parser.add_argument("--auc-budget", type=float, default=DEFAULT_AUC_BUDGET, help="Perdita massima di ROC-AUC accettata")
+parser.add_argument("--cost-data-dir", type=str, default=os.path.join(project_root, "data"), help="Cartella del campione per il costo")
+parser.add_argument("--cost-pattern", type=str, default="dataset/*.jsonl", help="Glob dei file JSONL del campione")
+parser.add_argument("--cost-docs", type=int, default=500, help="Documenti del campione per il costo")
+parser.add_argument("--cost-report", type=str, default=os.path.join(project_root, "evaluation", "quality_cost_selection.json"))
+args = parser.parse_args()
+
 # Percorsi
 csv_path = os.path.join(project_root, "output", "feature", "doc_stats_per_file.csv")
 if not os.path.exists(csv_path):
@@ -78,13 +95,32 @@ print(f"Validation: {val_csv}")
 print(f"Test: {test_csv}")
 
 # 4. Allenare il modello sul training set
+cost_model = None
+if args.cost_aware:
+    import tempfile
+    from datatrove.pipeline.readers import JsonlReader
+    from src.blocks.stats import STATS_FEATURE_GRAPH, DocStatsCsv
+
+    sample = list(JsonlReader(args.cost_data_dir, glob_pattern=args.cost_pattern, limit=args.cost_docs).run())
+    print(f"\nMisura del costo delle statistiche su {len(sample)} documenti...")
+    cost_model = FeatureCostModel.measure(
+        STATS_FEATURE_GRAPH, sample, DocStatsCsv(output_folder=tempfile.mkdtemp()).feature_inputs
+    )
+
 print("\nAddestramento del modello...")
 result = QualityClassifier.train_from_csv(
     csv_path=train_csv,
     validation_csv_path=val_csv,
     threshold=validation_threshold,
     random_state=random_state,
+    cost_model=cost_model,
+    auc_budget=args.auc_budget,
 )
+if result.get("cost_selection"):
+    os.makedirs(os.path.dirname(args.cost_report), exist_ok=True)
+    with open(args.cost_report, "w", encoding="utf-8") as f:
+        json.dump(result["cost_selection"], f, indent=2, ensure_ascii=False)
+    print(f"Report selezione per costo: {args.cost_report}")
 # scrivo metadata utili in futuro
 result["training_metadata"] = {
     "source_csv": os.path.abspath(csv_path),
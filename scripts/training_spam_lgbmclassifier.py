@@ -1,5 +1,6 @@
 from __future__ import annotations
 import argparse
+import json
 import os
 import sys
 import warnings
@@ -12,7 +13,9 @@ warnings.filterwarnings(
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from src.blocks.spam_classifier.spam_classifier import SpamClassifier
+from src.blocks.feature_cost import DEFAULT_AUC_BUDGET, FeatureCostModel
+from src.blocks.spam_classifier.spam_classifier import STRONG_EVIDENCE_FEATURES, SpamClassifier
+from src.blocks.spam_classifier.spam_stats import SPAM_FEATURE_GRAPH, spam_feature_inputs
 
 
 def main() -> None:
@@ -78,12 +81,58 @@ def main() -> None:
         default="evaluation/spam",
         help="Cartella dove salvare predizioni ed errori del test split.",
     )
+    # Selezione delle feature per costo di estrazione: il costo di ogni feature viene misurato su
+    # un campione di documenti e le feature costose e poco importanti vengono tolte entro il budget.
+    parser.add_argument(
+        "--cost-aware",
+        action="store_true",
+        help="Toglie le feature costose e poco importanti entro --auc-budget e riaddestra.",
+    )
+    parser.add_argument(
+        "--auc-budget",
+        type=float,
+        default=DEFAULT_AUC_BUDGET,
+        help="Perdita massima di ROC-AUC accettata dalla selezione per costo.",
+    )
+    parser.add_argument(
+        "--cost-data-dir",
+        default="data",
+        help="Cartella dei documenti su cui misurare il costo delle feature.",
+    )
+    parser.add_argument(
+        "--cost-pattern",
+        default="dataset/*.jsonl",
+        help="Glob dei file JSONL del campione per il costo delle feature.",
+    )
+    parser.add_argument(
+        "--cost-docs",
+        type=int,
+        default=500,
+        help="Documenti del campione per il costo delle feature.",
+    )
+    parser.add_argument(
+        "--cost-report",
+        default=None,
+        help="JSON del report costo/ROC-AUC (default: <errors-output-dir>/spam_cost_selection.json).",
+    )
 
-
-
-    
     args = parser.parse_args()
 
+    cost_model = None
+    if args.cost_aware:
+        from datatrove.pipeline.readers import JsonlReader
+
+        sample = list(JsonlReader(args.cost_data_dir, glob_pattern=args.cost_pattern, limit=args.cost_docs).run())
+        print(f"⏱️  Misura del costo delle feature su {len(sample)} documenti...")
+        # Le feature delle regole di evidenza forte vengono calcolate comunque da SpamFilter; il costo
+        # si misura sul piano completo, con l'analisi condivisa anche per i documenti lunghi
+        cost_model = FeatureCostModel.measure(
+            SPAM_FEATURE_GRAPH,
+            sample,
+            lambda doc: spam_feature_inputs(doc, streaming_min_chars=float("inf")),
+            fixed=STRONG_EVIDENCE_FEATURES,
+        )
+
     print(f"🚀 Avvio training su: {args.csv_path}")
     
     # Addestra il modello a partire dal CSV delle feature e restituisce modello, scaler, feature usate, metriche e file di analisi.
@@ -95,8 +144,17 @@ def main() -> None:
             test_size=args.test_size,
             random_state=args.random_state,
             errors_output_dir=args.errors_output_dir,
+            cost_model=cost_model,
+            auc_budget=args.auc_budget,
         )
 
+        if result.get("cost_selection"):
+            report_path = args.cost_report or os.path.join(args.errors_output_dir, "spam_cost_selection.json")
+            os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(result["cost_selection"], f, indent=2, ensure_ascii=False)
+            print(f"📄 Report selezione per costo: {report_path}")
+
         # Crea la directory del modello se non esiste e salva l'artifact joblib.
         os.makedirs(os.path.dirname(args.model_path), exist_ok=True)
         
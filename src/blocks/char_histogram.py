@@ -0,0 +1,213 @@
+"""
+Istogramma dei code point di un testo, calcolato in un solo passaggio con NumPy.
+
+Il testo viene visto come array di code point (buffer ASCII, Latin-1 o UTF-32) e contato
+con ``np.bincount``. Ogni code point distinto viene poi classificato con una tabella di
+maschere di bit precalcolata (spazio, cifra, maiuscola, vocale, punteggiatura...), quindi
+tutte le feature "per classe di carattere" di DocStatsCsv e delle feature spam si ricavano
+dall'istogramma senza ripassare sul testo. Le classi usano gli stessi metodi ``str``
+(``isspace``, ``isalnum``, ...) dei calcoli originali, quindi i conteggi sono identici.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .spam_classifier.spam_keywords import ACCENTED_CHARS
+
+VOWELS = "aeiouàèéìòù"
+STATS_PUNCTUATION = '.,;:!?()[]""\'\''
+SPECIAL_CHARS = "@#$%^&*+="
+
+# Una classe per bit. Le classi spam_* seguono la catena di if/elif di _basic_char_stats:
+# cifra, poi maiuscola, poi spazio, poi punteggiatura
+CHAR_CLASSES: Tuple[str, ...] = (
+    "whitespace",
+    "non_alnum",
+    "non_alnum_non_space",
+    "digit",
+    "upper",
+    "lower",
+    "alpha",
+    "consonant",
+    "punctuation",
+    "special",
+    "accented",
+    "spam_upper",
+    "spam_space",
+    "spam_punct",
+)
+_SHIFTS = np.arange(len(CHAR_CLASSES), dtype=np.uint32)
+
+# Sotto questa soglia la tabella è precalcolata; gli altri code point vengono classificati
+# alla prima occorrenza e memorizzati
+_TABLE_SIZE = 256
+
+
+def _classify(c: str) -> Tuple[int, int]:
+    """Maschera delle classi del carattere e numero di vocali in ``c.lower()`` (come in ``text.lower()``)."""
+    is_space = c.isspace()
+    is_alnum = c.isalnum()
+    is_digit = c.isdigit()
+    is_upper = c.isupper()
+    is_alpha = c.isalpha()
+    lowered = c.lower()
+    flags = {
+        "whitespace": is_space,
+        "non_alnum": not is_alnum,
+        "non_alnum_non_space": not is_alnum and not is_space,
+        "digit": is_digit,
+        "upper": is_upper,
+        "lower": c.islower(),
+        "alpha": is_alpha,
+        "consonant": is_alpha and lowered not in VOWELS,
+        "punctuation": c in STATS_PUNCTUATION,
+        "special": c in SPECIAL_CHARS,
+        "accented": lowered in ACCENTED_CHARS,
+        "spam_upper": not is_digit and is_upper,
+        "spam_space": not is_digit and not is_upper and is_space,
+        "spam_punct": not is_digit and not is_upper and not is_space and not is_alnum,
+    }
+    mask = sum(1 << bit for bit, name in enumerate(CHAR_CLASSES) if flags[name])
+    return mask, sum(1 for x in lowered if x in VOWELS)
+
+
+_MASKS = np.zeros(_TABLE_SIZE, dtype=np.uint32)
+_VOWEL_COUNTS = np.zeros(_TABLE_SIZE, dtype=np.int64)
+for _cp in range(_TABLE_SIZE):
+    _MASKS[_cp], _VOWEL_COUNTS[_cp] = _classify(chr(_cp))
+_EXTRA: Dict[int, Tuple[int, int]] = {}
+
+
+def _lookup(codepoints: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Maschere e vocali per un array di code point distinti."""
+    if len(codepoints) == 0 or int(codepoints[-1]) < _TABLE_SIZE:
+        return _MASKS[codepoints], _VOWEL_COUNTS[codepoints]
+    masks = np.empty(len(codepoints), dtype=np.uint32)
+    vowels = np.empty(len(codepoints), dtype=np.int64)
+    for i, cp in enumerate(codepoints.tolist()):
+        if cp < _TABLE_SIZE:
+            masks[i], vowels[i] = _MASKS[cp], _VOWEL_COUNTS[cp]
+            continue
+        entry = _EXTRA.get(cp)
+        if entry is None:
+            entry = _EXTRA[cp] = _classify(chr(cp))
+        masks[i], vowels[i] = entry
+    return masks, vowels
+
+
+def _codepoint_counts(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Code point distinti (ordinati) e relative occorrenze."""
+    if text.isascii():
+        # Percorso veloce: un byte per carattere e istogramma a 128 posizioni
+        counts = np.bincount(np.frombuffer(text.encode("ascii"), dtype=np.uint8), minlength=128)
+        codepoints = np.flatnonzero(counts)
+        return codepoints, counts[codepoints]
+    try:
+        buffer = np.frombuffer(text.encode("latin-1"), dtype=np.uint8)
+        counts = np.bincount(buffer, minlength=_TABLE_SIZE)
+        codepoints = np.flatnonzero(counts)
+        return codepoints, counts[codepoints]
+    except UnicodeEncodeError:
+        pass
+    # surrogatepass: i surrogati isolati (possibili nei JSON) restano code point validi
+    buffer = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    low = buffer < _TABLE_SIZE
+    low_counts = np.bincount(buffer[low], minlength=_TABLE_SIZE)
+    low_cps = np.flatnonzero(low_counts)
+    high_cps, high_counts = np.unique(buffer[~low], return_counts=True)
+    return (
+        np.concatenate([low_cps, high_cps.astype(low_cps.dtype)]),
+        np.concatenate([low_counts[low_cps], high_counts]),
+    )
+
+
+class CharHistogram:
+    """
+    Occorrenze dei caratteri di un testo e conteggi per classe.
+    ``class_counts`` somma le occorrenze per ogni bit di CHAR_CLASSES con un prodotto
+    matrice-vettore sui soli caratteri distinti.
+    """
+
+    __slots__ = ("text", "length", "codepoints", "counts", "_count_map", "_class_counts")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.codepoints, self.counts = _codepoint_counts(text) if text else (
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.intp),
+        )
+        self._count_map = None
+        self._class_counts = None
+
+    def count(self, c: str) -> int:
+        """Equivalente a ``text.count(c)`` per un singolo carattere."""
+        if self._count_map is None:
+            self._count_map = dict(zip(map(chr, self.codepoints.tolist()), self.counts.tolist()))
+        return self._count_map.get(c, 0)
+
+    def class_counts(self) -> Dict[str, int]:
+        if self._class_counts is None:
+            masks, vowels = _lookup(self.codepoints)
+            bits = (masks[:, None] >> _SHIFTS) & 1
+            totals = self.counts @ bits.astype(np.int64) if len(masks) else np.zeros(len(CHAR_CLASSES), dtype=np.int64)
+            self._class_counts = dict(zip(CHAR_CLASSES, totals.tolist()))
+            self._class_counts["vowel"] = int(self.counts @ vowels) if len(masks) else 0
+        return self._class_counts
+
+    def ordered_counts(self) -> List[int]:
+        """Occorrenze nell'ordine di prima comparsa dei caratteri, lo stesso di ``Counter(text).values()``."""
+        first = [self.text.find(chr(cp)) for cp in self.codepoints.tolist()]
+        return self.counts[np.argsort(first, kind="stable")].tolist()
+
+    def entropy(self) -> float:
+        """
+        Entropia di Shannon dei caratteri. Somma i termini nell'ordine di prima comparsa,
+        come il calcolo su ``Counter(text)``, così anche l'arrotondamento è identico.
+        """
+        if not self.length:
+            return 0.0
+        text_len = self.length
+        return -sum((count / text_len) * math.log2(count / text_len) for count in self.ordered_counts())
+
+
+class StreamingCharHistogram(CharHistogram):
+    """
+    CharHistogram costruito a blocchi (``update``), senza tenere il testo: la memoria è quella di
+    un blocco più un contatore per carattere distinto. Le occorrenze sono tenute nell'ordine di
+    prima comparsa, quindi ``entropy`` somma i termini nello stesso ordine ed è identica a quella
+    calcolata sul testo intero. ``finish`` va chiamato dopo l'ultimo blocco.
+    """
+
+    __slots__ = ("_ordered",)
+
+    def __init__(self):
+        super().__init__("")
+        self._ordered: Dict[int, int] = {}
+
+    def update(self, chunk: str) -> None:
+        if not chunk:
+            return
+        codepoints, counts = _codepoint_counts(chunk)
+        ordered = self._ordered
+        new = [cp for cp in codepoints.tolist() if cp not in ordered]
+        for cp in sorted(new, key=lambda cp: chunk.find(chr(cp))):
+            ordered[cp] = 0
+        for cp, count in zip(codepoints.tolist(), counts.tolist()):
+            ordered[cp] += count
+        self.length += len(chunk)
+
+    def finish(self) -> "StreamingCharHistogram":
+        codepoints = sorted(self._ordered)
+        self.codepoints = np.array(codepoints, dtype=np.int64)
+        self.counts = np.array([self._ordered[cp] for cp in codepoints], dtype=np.int64)
+        self._count_map = None
+        self._class_counts = None
+        return self
+
+    def ordered_counts(self) -> List[int]:
+        return list(self._ordered.values())
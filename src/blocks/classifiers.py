@@ -40,7 +40,18 @@ from datetime import datetime
 import json
 
 from datatrove.pipeline.base import PipelineStep
-from datatrove.data import DocumentsPipeline
+from datatrove.data import Document, DocumentsPipeline
+from datatrove.utils.batching import batched
+
+from .feature_cost import (
+    DEFAULT_AUC_BUDGET,
+    FeatureCostModel,
+    format_cost_report,
+    inner_selection,
+    record_test_check,
+    select_features_by_cost,
+)
+from .tree_predictor import TreeEnsemblePredictor
 
 logger = logging.getLogger(__name__)
 
@@ -105,6 +116,17 @@ DEFAULT_FEATURE_NAMES: List[str] = [
 
 LABEL_MAP = {"bad": 0, "good": 1}
 
+# Dimensione di default dei batch di inferenza e tipo della matrice di feature.
+# Con batch di 1 documento il costo è dominato dall'overhead di pandas/sklearn per chiamata,
+# non dagli alberi: raccogliere più documenti ammortizza questo costo (vedi README, "Prestazioni").
+DEFAULT_BATCH_SIZE = 512
+FEATURE_DTYPE = np.float32
+
+# Backend di inferenza: "lightgbm" usa il wrapper sklearn di LightGBM, "numpy" il predittore
+# ad array piatti di blocks.tree_predictor (stesse probabilità, nessuna chiamata a sklearn/pandas)
+MODEL_BACKENDS = ("lightgbm", "numpy")
+DEFAULT_MODEL_BACKEND = "lightgbm"
+
 
 class QualityClassifier(PipelineStep):
     """
@@ -119,10 +141,16 @@ class QualityClassifier(PipelineStep):
         Percorso al modello serializzato (.joblib) da caricare per l'inferenza.
     feature_names : list[str] | None
         Nomi delle feature da leggere da doc.metadata.
-        Se ``None`` usa ``DEFAULT_FEATURE_NAMES``.
+        Se ``None`` usa i ``feature_names`` dell'artifact (``DEFAULT_FEATURE_NAMES`` se assenti).
     threshold : float
         Soglia di probabilità per la classe "good" (default 0.5).
         Documenti con probabilità >= threshold → "good", altrimenti → "bad".
+    batch_size : int
+        Numero di documenti raccolti prima di eseguire scaler e modello.
+        Ogni batch produce una sola matrice di feature, una sola ``transform``
+        e una sola ``predict_proba`` (default ``DEFAULT_BATCH_SIZE``).
+    backend : str
+        ``"lightgbm"`` (default) oppure ``"numpy"`` per usare ``TreeEnsemblePredictor``.
     """
 
     name = "Quality Classifier"
@@ -133,17 +161,24 @@ class QualityClassifier(PipelineStep):
         model_path: str,
         feature_names: Optional[List[str]] = None,
         threshold: float = 0.65,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        backend: str = DEFAULT_MODEL_BACKEND,
     ):
         super().__init__()
+        if backend not in MODEL_BACKENDS:
+            raise ValueError(f"Backend '{backend}' non valido. Ammessi: {MODEL_BACKENDS}")
         # Percorso al modello salvato
         self.model_path = model_path
         # Soglia di confidenza, ovvero
         self.threshold = threshold
+        # Numero di documenti valutati insieme in run()
+        self.batch_size = max(1, int(batch_size))
 
         # Carica modello e scaler dal file .joblib
         artifact = joblib.load(self.model_path)
         self.model: lgb.LGBMClassifier = artifact["model"]
-        self.scaler: StandardScaler = artifact["scaler"]
+        # None se l'artifact è stato ottimizzato con lo scaler piegato nelle soglie degli alberi
+        self.scaler: Optional[StandardScaler] = artifact.get("scaler")
         self._feature_names_train: List[str] = artifact["feature_names"]
         self.model_name: str = artifact.get(
             "model_name",
@@ -156,44 +191,38 @@ class QualityClassifier(PipelineStep):
         )
         self.feature_names = feature_names or self._feature_names_train or DEFAULT_FEATURE_NAMES
 
-        logger.info("Modello caricato da %s", self.model_path)
+        # Con il backend numpy lo scaler viene piegato nelle soglie del predittore
+        self.backend = backend
+        self.predictor: Optional[TreeEnsemblePredictor] = (
+            TreeEnsemblePredictor.from_artifact(artifact) if backend == "numpy" else None
+        )
+
+        logger.info("Modello caricato da %s (backend %s)", self.model_path, self.backend)
 
     # -----------------------------------------------------------------
-    # Pipeline step: inferenza documento per documento
+    # Pipeline step: inferenza a batch
     # -----------------------------------------------------------------
     def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1):
-        """Classifica ogni documento e produce il risultato nei metadata."""
-        # I documenti vengono processati uno alla volta (alta efficienza in memoria)
-        for doc in data:
-            features = self._extract_features(doc)
-            if features is None:
-                # Se mancano feature, segna come "bad" e continua
-                doc.metadata["quality_label"] = "bad"
-                doc.metadata["quality_score"] = 0.0
-                logger.warning(
-                    "Feature mancanti per doc %s – classificato come bad", doc.id
-                )
-                yield doc
-                continue
-
-            # X = np.array(features).reshape(1, -1)
-
-            # Creo un DataFrame con i nomi delle features scelte in fase di progettazione come colonne e 
-            # riempo le righe con i valori associati al doc processato 
-            X = pd.DataFrame([features], columns = self.feature_names) # riga da rimuovere se si vuole usare np.array
-            # Applico lo stesso scaler usato in fase di training per mantenere la coerenza
-            X_scaled = self.scaler.transform(X)
-            X_scaled = pd.DataFrame(X_scaled, columns = self.feature_names) # riga d arimuovere se si vuole usare np.array
-
-            # Calcolo predizione con il modello e seleziono l'etichetta in base alla soglia scelta 
-            proba = self.model.predict_proba(X_scaled)[0]  # [P(bad), P(good)]
-            score_good = float(proba[1])
-            label = "good" if score_good >= self.threshold else "bad"
-
-            doc.metadata["quality_label"] = label
-            doc.metadata["quality_score"] = round(score_good, 4)
+        """Classifica i documenti a batch e produce il risultato nei metadata."""
+        # I documenti vengono raccolti in batch di self.batch_size: la memoria resta limitata
+        # al batch corrente, ma scaler e modello vengono invocati una sola volta per batch
+        for batch in batched(data, self.batch_size):
+            scores, valid = self.predict_batch(batch)
+            for doc, score_good, is_valid in zip(batch, scores, valid):
+                if not is_valid:
+                    # Se mancano feature, segna come "bad" e continua
+                    doc.metadata["quality_label"] = "bad"
+                    doc.metadata["quality_score"] = 0.0
+                    logger.warning(
+                        "Feature mancanti per doc %s – classificato come bad", doc.id
+                    )
+                    yield doc
+                    continue
 
-            yield doc
+                score_good = float(score_good)
+                doc.metadata["quality_label"] = "good" if score_good >= self.threshold else "bad"
+                doc.metadata["quality_score"] = round(score_good, 4)
+                yield doc
 
 
     def _extract_features(self, doc) -> Optional[List[float]]:
@@ -204,6 +233,58 @@ class QualityClassifier(PipelineStep):
             logger.debug("Impossibile estrarre le feature: %s", e)
             return None
 
+    def _build_feature_matrix(self, docs: List[Document]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Costruisce una matrice contigua (n_docs x n_feature) di tipo ``FEATURE_DTYPE``.
+
+        Restituisce anche una maschera booleana dei documenti validi: le righe dei documenti
+        con feature mancanti restano a zero e non vengono passate al modello.
+        """
+        X = np.zeros((len(docs), len(self.feature_names)), dtype=FEATURE_DTYPE)
+        valid = np.ones(len(docs), dtype=bool)
+        for i, doc in enumerate(docs):
+            features = self._extract_features(doc)
+            if features is None:
+                valid[i] = False
+                continue
+            X[i] = features
+        return X, valid
+
+    def predict_scores(self, X: np.ndarray) -> np.ndarray:
+        """
+        Calcola P(good) per ogni riga della matrice di feature.
+        Un solo DataFrame (richiesto dallo scaler addestrato con i nomi delle colonne),
+        una sola ``transform`` e una sola ``predict_proba`` per l'intera matrice.
+        """
+        if len(X) == 0:
+            return np.empty(0, dtype=float)
+        if self.predictor is not None:
+            return self.predictor.predict_proba(X)[:, 1]
+        if self.scaler is None:
+            # Artifact con scaler piegato nelle soglie (blocks.model_optimization): feature grezze
+            return self.model.predict_proba(X)[:, 1]
+        X_scaled = self.scaler.transform(pd.DataFrame(X, columns=self.feature_names, copy=False))
+        return self.model.predict_proba(X_scaled)[:, 1]
+
+    def scale_features(self, X: pd.DataFrame) -> np.ndarray | pd.DataFrame:
+        """Applica lo scaler di training; con un artifact ottimizzato senza scaler restituisce X invariato."""
+        if self.scaler is None:
+            return X
+        return self.scaler.transform(X)
+
+    def predict_batch(self, docs: List[Document]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Restituisce gli score P(good) e la maschera dei documenti con feature valide.
+        Ai documenti non validi viene assegnato score 0.0.
+        """
+        X, valid = self._build_feature_matrix(docs)
+        scores = np.zeros(len(docs), dtype=float)
+        if valid.all():
+            scores = self.predict_scores(X)
+        elif valid.any():
+            scores[valid] = self.predict_scores(X[valid])
+        return scores, valid
+
     # METODI STATICI UTILI DURANTE IL TRAINING
     @staticmethod
     def _load_labeled_dataset(
@@ -271,6 +352,18 @@ class QualityClassifier(PipelineStep):
             summary[f"{metric_name}_std"] = float(values.std(ddof=0))
         return summary
 
+    @staticmethod
+    def _new_model(n_estimators: int, learning_rate: float, random_state: int) -> lgb.LGBMClassifier:
+        """Modello LightGBM usato da train_from_csv (anche per i riaddestramenti della selezione per costo)."""
+        return lgb.LGBMClassifier(
+            objective="binary",
+            n_estimators=n_estimators,
+            learning_rate=learning_rate,
+            max_depth=-1,
+            random_state=random_state,
+            verbose=-1,
+        )
+
     # Genera la lista di modelli con cui confrontare le prestazioni del modello scelto (cross-validation)
     @staticmethod
     def _build_candidate_models(random_state: int = 42) -> Dict[str, Dict[str, Any]]:
@@ -507,6 +600,8 @@ class QualityClassifier(PipelineStep):
         learning_rate: float = 0.05,
         threshold: float = 0.65,
         random_state: int = 42,
+        cost_model: Optional[FeatureCostModel] = None,
+        auc_budget: float = DEFAULT_AUC_BUDGET,
     ) -> dict:
         """
         Addestra un modello LightGBM binario a partire da un CSV.
@@ -519,6 +614,12 @@ class QualityClassifier(PipelineStep):
 
         Restituisce un dizionario con modello, scaler, metriche e
         importanza delle feature.
+
+        Con ``cost_model`` (blocks.feature_cost, misurato su STATS_FEATURE_GRAPH) dopo il training
+        completo vengono tolte le statistiche costose e poco importanti finché la ROC-AUC media su
+        fold delle sole righe di training non perde più di ``auc_budget``; il modello
+        restituito è riaddestrato sulle feature scelte e il report, con il controllo del budget
+        sulla validazione, finisce in ``cost_selection``.
         """
         # 1. Caricamento dati
         X, y, feat_names = QualityClassifier._load_labeled_dataset(
@@ -617,14 +718,7 @@ class QualityClassifier(PipelineStep):
 
         # 4. Training 
         # creo il modello binario
-        model = lgb.LGBMClassifier(
-            objective="binary",
-            n_estimators=n_estimators,
-            learning_rate=learning_rate,
-            max_depth=-1,
-            random_state=random_state,
-            verbose=-1,
-        )
+        model = QualityClassifier._new_model(n_estimators, learning_rate, random_state)
         # Chiamata che effettua l'apprendimento sui dati di training
         model.fit(X_train_scaled, y_train)
 
@@ -686,6 +780,40 @@ class QualityClassifier(PipelineStep):
         print("\nFeature Importance:")
         print(importance_df.to_string(index=False))
 
+        # 7. Selezione delle feature per costo di estrazione (opzionale)
+        if cost_model is not None:
+            # la selezione vede solo le righe di training: la validazione resta per il controllo finale
+            evaluate, selection_importance = inner_selection(
+                X_train[feat_names],
+                y_train,
+                lambda: QualityClassifier._new_model(n_estimators, learning_rate, random_state),
+                random_state=random_state,
+            )
+
+            print("\nSelezione delle feature per costo di estrazione...")
+            selection = select_features_by_cost(
+                feature_names=feat_names,
+                importance=selection_importance,
+                cost_model=cost_model,
+                evaluate=evaluate,
+                auc_budget=auc_budget,
+            )
+            result = QualityClassifier.train_from_csv(
+                csv_path=csv_path,
+                feature_names=selection["selected_features"],
+                label_column=label_column,
+                validation_csv_path=validation_csv_path,
+                test_size=test_size,
+                n_estimators=n_estimators,
+                learning_rate=learning_rate,
+                threshold=threshold,
+                random_state=random_state,
+            )
+            record_test_check(selection, metrics["roc_auc"], result["validation_metrics"]["roc_auc"])
+            print(format_cost_report(selection))
+            result["cost_selection"] = selection
+            return result
+
         return {
             "model": model,
             "scaler": scaler,
@@ -754,6 +882,7 @@ class QualityClassifier(PipelineStep):
                 "training_metadata",
                 training_result.get("split_metadata", {}),
             ),
+            "cost_selection": training_result.get("cost_selection"),
         }
         # comando per salvare il modello addestrato
         joblib.dump(artifact, output_path)
@@ -0,0 +1,256 @@
+"""
+Deduplicazione esatta e MinHash-LSH prima di LID ed estrazione delle feature.
+
+Le shard di Common Crawl contengono molte copie esatte o quasi uguali della stessa pagina, e
+ognuna passerebbe da LID, feature spam, statistiche e modelli. La deduplicazione avviene in due fasi:
+
+1. ``prepare_dedup`` legge l'input con ByteRangeJsonlReader (ogni rank una parte contigua del
+   flusso, quindi l'ordine rank/posizione è l'ordine dell'input per qualsiasi numero di task) e
+   ogni rank scrive il proprio indice ``signatures/<rank>.npz``: id, digest, chiavi delle bande
+   MinHash e lunghezza del testo di ogni documento;
+2. ``merge_dedup_index`` unisce gli indici: documenti con lo stesso digest (duplicati esatti) o
+   con almeno una banda uguale (quasi duplicati, LSH) finiscono nello stesso cluster, di cui
+   resta solo il primo documento in ordine di input. Le decisioni vanno in ``decisions.json``.
+
+Nella pipeline ``DedupFilter`` segue il reader e manda i duplicati in ``rejected/0_dedup``.
+La dimensione del cluster viene salvata in ``dedup_cluster_size``: ``minhash_cluster_size`` è
+già presente in alcuni dataset (FineWeb) e ha un altro significato, quindi non viene toccato.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from datatrove.data import Document, DocumentsPipeline
+from datatrove.pipeline.base import PipelineStep
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from datatrove.pipeline.writers import JsonlWriter
+from datatrove.utils.hashing import HashConfig, create_hash_func
+from datatrove.utils.logging import logger
+from datatrove.utils.text import TextNormConfig, ngrams, simplify_text
+
+from .feature_store import doc_digest
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+@dataclass
+class DedupConfig:
+    """
+    Parametri MinHash: shingle di ``n_grams`` parole, ``num_buckets`` bande da ``hashes_per_bucket``
+    hash. Con 14 x 8 (i default di DataTrove) due documenti con Jaccard 0.75 finiscono nello
+    stesso cluster con probabilità ~0.9, con Jaccard 0.5 con probabilità ~0.05.
+    """
+
+    n_grams: int = 5
+    num_buckets: int = 14
+    hashes_per_bucket: int = 8
+    seed: int = 1
+
+
+class MinhashSigner:
+    """Shingle del testo semplificato (come in DataTrove) e chiavi a 64 bit delle bande della firma."""
+
+    def __init__(self, config: DedupConfig):
+        self.config = config
+        # sha1 perché xxhash, il default di DataTrove, è una dipendenza opzionale
+        self._hash = create_hash_func(HashConfig(precision=64, hash_fc="sha1"))
+        self._norm = TextNormConfig()
+        num_hashes = config.num_buckets * config.hashes_per_bucket
+        gen = np.random.RandomState(config.seed)
+        self._a = gen.randint(1, _MERSENNE_PRIME, dtype=np.uint64, size=(1, num_hashes))
+        self._b = gen.randint(0, _MERSENNE_PRIME, dtype=np.uint64, size=(1, num_hashes))
+
+    def shingles(self, text: str) -> np.ndarray:
+        words = simplify_text(text, self._norm).split()
+        grams = [" ".join(g) for g in ngrams(words, self.config.n_grams)] if len(words) >= self.config.n_grams else [" ".join(words)]
+        return np.fromiter((self._hash(g) for g in grams), dtype=np.uint64, count=len(grams)).reshape((-1, 1))
+
+    def band_keys(self, text: str) -> np.ndarray:
+        """Una chiave per banda: hash dei valori minimi della banda (``num_buckets`` uint64)."""
+        signature = np.min((self.shingles(text) * self._a + self._b) % _MERSENNE_PRIME, axis=0)
+        bands = signature.reshape(self.config.num_buckets, self.config.hashes_per_bucket)
+        return np.array(
+            [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "little") for band in bands],
+            dtype=np.uint64,
+        )
+
+
+class DedupSignatureWriter(PipelineStep):
+    """Prima fase: scrive l'indice del rank (id, digest, bande, caratteri) in ``index_dir/signatures``."""
+
+    name = "🫂 Dedup signatures"
+    type = "🫂 - DEDUP"
+
+    def __init__(self, index_dir: str, config: Optional[DedupConfig] = None):
+        super().__init__()
+        self.index_dir = index_dir
+        self.config = config or DedupConfig()
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1) -> DocumentsPipeline:
+        signer = MinhashSigner(self.config)
+        ids, digests, bands, chars = [], [], [], []
+        for doc in data:
+            with self.track_time():
+                ids.append(doc.id)
+                digests.append(doc_digest(doc) or "")
+                bands.append(signer.band_keys(doc.text))
+                chars.append(len(doc.text))
+            self.stat_update("signatures")
+            yield doc
+        folder = os.path.join(self.index_dir, "signatures")
+        os.makedirs(folder, exist_ok=True)
+        np.savez(
+            os.path.join(folder, f"{rank:05d}.npz"),
+            ids=np.array(ids, dtype=str),
+            digests=np.array(digests, dtype=str),
+            bands=np.array(bands, dtype=np.uint64).reshape(-1, self.config.num_buckets),
+            chars=np.array(chars, dtype=np.int64),
+        )
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def _union(parent: np.ndarray, i: int, j: int) -> None:
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        # La radice è sempre il documento che viene prima nell'input
+        parent[max(ri, rj)] = min(ri, rj)
+
+
+def merge_dedup_index(index_dir: str) -> Dict[str, float]:
+    """
+    Seconda fase: unisce gli indici dei rank (in ordine di rank, cioè di input), costruisce i
+    cluster e scrive ``decisions.json`` con ``id -> [dimensione cluster, id tenuto, motivo]``
+    per i documenti dei cluster con più di un elemento. Ritorna un riepilogo dei conteggi.
+    """
+    parts = [np.load(path) for path in sorted(glob.glob(os.path.join(index_dir, "signatures", "*.npz")))]
+    ids = np.concatenate([p["ids"] for p in parts]) if parts else np.array([], dtype=str)
+    digests = np.concatenate([p["digests"] for p in parts]) if parts else np.array([], dtype=str)
+    bands = np.concatenate([p["bands"] for p in parts]) if parts else np.zeros((0, 1), dtype=np.uint64)
+    chars = np.concatenate([p["chars"] for p in parts]) if parts else np.array([], dtype=np.int64)
+    n = len(ids)
+    parent = np.arange(n)
+    if len(set(ids.tolist())) != n:
+        # DedupFilter riconosce i documenti per id: vale la decisione della prima occorrenza
+        logger.warning("Dedup: id non univoci nell'input, i documenti con lo stesso id ricevono la stessa decisione")
+
+    first_by_digest: Dict[str, int] = {}
+    for i, digest in enumerate(digests.tolist()):
+        if digest:
+            j = first_by_digest.setdefault(digest, i)
+            if j != i:
+                _union(parent, j, i)
+    for band in range(bands.shape[1]):
+        keys = bands[:, band]
+        order = np.argsort(keys, kind="stable")
+        same = np.flatnonzero(keys[order][1:] == keys[order][:-1])
+        for k in same:
+            _union(parent, int(order[k]), int(order[k + 1]))
+
+    roots = np.array([_find(parent, i) for i in range(n)], dtype=np.int64)
+    sizes = np.bincount(roots, minlength=n)
+    decisions = {}
+    summary = {"documents": n, "exact": 0, "near": 0, "total_chars": int(chars.sum()), "duplicate_chars": 0}
+    for i in np.flatnonzero(sizes[roots] > 1):
+        root = int(roots[i])
+        if i == root:
+            decisions.setdefault(str(ids[i]), [int(sizes[root]), None, None])
+            continue
+        reason = "exact_duplicate" if digests[i] and digests[i] == digests[root] else "near_duplicate"
+        if decisions.setdefault(str(ids[i]), [int(sizes[root]), str(ids[root]), reason])[1] is None:
+            continue
+        summary["exact" if reason == "exact_duplicate" else "near"] += 1
+        summary["duplicate_chars"] += int(chars[i])
+
+    with open(os.path.join(index_dir, "decisions.json"), "w", encoding="utf-8") as f:
+        json.dump(decisions, f)
+    return summary
+
+
+def prepare_dedup(
+    data_dir: str,
+    pattern: str,
+    index_dir: str,
+    workers: int = 1,
+    tasks: Optional[int] = None,
+    config: Optional[DedupConfig] = None,
+) -> Dict[str, float]:
+    """
+    Esegue le due fasi prima della pipeline principale (``tasks`` intervalli di byte, default uno
+    per worker) e stampa quanto lavoro viene risparmiato. Le decisioni non dipendono da ``tasks``.
+    """
+    from datatrove.executor import LocalPipelineExecutor
+
+    from .readers import ByteRangeJsonlReader
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    LocalPipelineExecutor(
+        pipeline=[ByteRangeJsonlReader(data_folder=data_dir, glob_pattern=pattern), DedupSignatureWriter(index_dir, config)],
+        tasks=tasks or workers,
+        workers=workers,
+        logging_dir=os.path.join(index_dir, "logs"),
+    ).run()
+    summary = merge_dedup_index(index_dir)
+    duplicates = summary["exact"] + summary["near"]
+    print(
+        f"[OK] Dedup: {summary['exact']} duplicati esatti e {summary['near']} quasi duplicati su {summary['documents']} documenti. "
+        f"LID, feature spam, statistiche e modelli saltano {duplicates} documenti "
+        f"({summary['duplicate_chars'] / max(1, summary['total_chars']):.1%} dei caratteri)"
+    )
+    return summary
+
+
+class DedupFilter(BaseFilter):
+    """
+    Filtro che applica ``decisions.json``: i duplicati vanno in ``rejected/0_dedup`` con
+    ``duplicate_of`` (id del documento tenuto) e motivo ``exact_duplicate`` / ``near_duplicate``.
+    Le statistiche ``saved_docs`` / ``saved_chars`` misurano il lavoro evitato ai blocchi successivi.
+    """
+
+    name = "🫂 Dedup Filter"
+
+    def __init__(self, index_dir: str, rejected_dir: str):
+        super().__init__(
+            exclusion_writer=JsonlWriter(
+                output_folder=os.path.join(rejected_dir, "0_dedup"),
+                output_filename="duplicati_${rank}.jsonl",
+                compression=None,
+            )
+        )
+        self.index_dir = index_dir
+        self._decisions: Optional[dict] = None
+
+    @property
+    def decisions(self) -> dict:
+        if self._decisions is None:
+            with open(os.path.join(self.index_dir, "decisions.json"), encoding="utf-8") as f:
+                self._decisions = json.load(f)
+        return self._decisions
+
+    def filter(self, doc: Document) -> bool | tuple[bool, str]:
+        entry = self.decisions.get(doc.id)
+        if entry is None:
+            return True
+        cluster_size, kept_id, reason = entry
+        doc.metadata["dedup_cluster_size"] = cluster_size
+        if kept_id is None:
+            return True
+        doc.metadata["duplicate_of"] = kept_id
+        self.stat_update("saved_docs")
+        self.stat_update("saved_chars", value=len(doc.text))
+        return False, reason
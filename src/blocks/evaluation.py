@@ -37,7 +37,7 @@ def evaluate_model(
     
     # Scaling (coerente con lo scaler usato durante il training)
     X_scaled = pd.DataFrame(
-        classifier.scaler.transform(X),
+        classifier.scale_features(X),
         columns=classifier.feature_names,
         index=X.index,
     )
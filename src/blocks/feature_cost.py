@@ -0,0 +1,320 @@
+"""
+Costo di estrazione delle feature e selezione delle feature in base a costo e importanza.
+
+``FeatureCostModel.measure`` valuta l'intero grafo (blocks.feature_graph) su un campione di
+documenti e registra i secondi per documento spesi in ogni nodo, primitive interne comprese. Il
+costo di un insieme di feature è la somma dei nodi del suo piano: togliere una feature fa
+risparmiare il suo nodo e le primitive che nessun'altra feature rimasta usa. L'analisi condivisa
+del documento (blocks.text_analysis) è calcolata in modo pigro, quindi il suo costo finisce sul
+primo nodo che la legge: per questo la stima viene confermata con ``measured_cost``, che
+cronometra davvero il piano ridotto sullo stesso campione.
+
+``select_features_by_cost`` toglie in modo greedy i gruppi di feature con il miglior rapporto
+risparmio / importanza (permutation importance del modello addestrato) finché la ROC-AUC di
+validazione non scende di più di ``auc_budget`` rispetto al modello con tutte le feature. È usata
+da ``train_from_csv`` di QualityClassifier e SpamClassifier quando ricevono un ``cost_model``:
+la selezione gira su fold delle sole righe di training (``inner_selection``) e il
+budget viene poi controllato sullo split di test o validazione, mai visto dalla selezione
+(``record_test_check``).
+"""
+
+from __future__ import annotations
+
+import gc
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from datatrove.data import Document
+from datatrove.utils.logging import logger
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+
+from . import text_analysis
+from .feature_graph import FeatureGraph
+
+# Budget predefinito di ROC-AUC che si accetta di perdere per estrarre meno feature
+DEFAULT_AUC_BUDGET = 0.002
+# Importanza minima nel rapporto risparmio / importanza: le feature con importanza nulla o
+# negativa vengono provate per prime, ordinate per risparmio
+IMPORTANCE_FLOOR = 1e-6
+# Fold delle righe di training su cui vengono valutati i gruppi durante la selezione
+SELECTION_FOLDS = 5
+
+
+class FeatureCostModel:
+    """
+    Secondi per documento spesi in ogni nodo di un grafo di feature, misurati su un campione.
+    ``fixed`` sono le feature calcolate comunque (per esempio quelle delle regole di evidenza forte
+    di SpamFilter): il loro costo non si risparmia togliendole dal modello.
+    """
+
+    def __init__(
+        self,
+        graph: FeatureGraph,
+        node_costs: Dict[str, float],
+        fixed: Iterable[str] = (),
+        docs: Optional[Sequence[Document]] = None,
+        make_inputs: Optional[Callable[[Document], Optional[Dict[str, Any]]]] = None,
+    ):
+        self.graph = graph
+        self.node_costs = node_costs
+        self._known = set(graph.features)
+        self.fixed = [f for f in fixed if f in self._known]
+        self.docs = docs
+        self.make_inputs = make_inputs
+
+    @classmethod
+    def measure(
+        cls,
+        graph: FeatureGraph,
+        docs: Sequence[Document],
+        make_inputs: Callable[[Document], Optional[Dict[str, Any]]],
+        fixed: Iterable[str] = (),
+        repeat: int = 3,
+    ) -> "FeatureCostModel":
+        """
+        Misura il costo di ogni nodo valutando il piano completo su ``docs`` (migliore di ``repeat``
+        ripetizioni per nodo). ``make_inputs`` costruisce gli ingressi del grafo per un documento,
+        None se il documento non viene estratto (testo vuoto).
+        """
+        if not docs:
+            raise ValueError("Serve almeno un documento per misurare il costo delle feature")
+        plan = graph.plan()
+        best: Dict[str, float] = {}
+        for _ in range(max(1, repeat)):
+            timings: Dict[str, float] = {}
+            copies = text_analysis.fresh_documents(docs)
+            gc.collect()
+            for doc in copies:
+                inputs = make_inputs(doc)
+                if inputs is not None:
+                    plan.evaluate_timed(inputs, timings)
+            for name, seconds in timings.items():
+                best[name] = min(best.get(name, seconds), seconds)
+        node_costs = {name: seconds / len(docs) for name, seconds in best.items()}
+        return cls(graph, node_costs, fixed=fixed, docs=docs, make_inputs=make_inputs)
+
+    def _targets(self, features: Iterable[str]) -> List[str]:
+        # Le colonne che il grafo non calcola (language_score, doc_id, ...) non costano nulla qui
+        return [f for f in features if f in self._known] + self.fixed
+
+    def computed(self, features: Iterable[str]) -> List[str]:
+        """Nodi calcolati per estrarre ``features`` (più quelle fisse)."""
+        return self.graph.plan(self._targets(features)).computed
+
+    def cost(self, features: Iterable[str]) -> float:
+        """Costo stimato, in secondi per documento, dell'estrazione di ``features``."""
+        return sum(self.node_costs.get(name, 0.0) for name in self.computed(features))
+
+    def measured_cost(self, features: Iterable[str], repeat: int = 3) -> float:
+        """Costo misurato, in secondi per documento: il piano ridotto cronometrato sul campione."""
+        if not self.docs or self.make_inputs is None:
+            raise ValueError("measured_cost richiede il campione usato da FeatureCostModel.measure")
+        plan = self.graph.plan(self._targets(features))
+        best = float("inf")
+        for _ in range(max(1, repeat)):
+            copies = text_analysis.fresh_documents(self.docs)
+            gc.collect()
+            start = time.perf_counter()
+            for doc in copies:
+                inputs = self.make_inputs(doc)
+                if inputs is not None:
+                    plan.evaluate(inputs)
+            best = min(best, time.perf_counter() - start)
+        return best / len(self.docs)
+
+
+def _docs_per_sec(seconds_per_doc: float) -> float:
+    return 1.0 / seconds_per_doc if seconds_per_doc > 0 else float("inf")
+
+
+def _candidate_groups(cost_model: FeatureCostModel, kept: List[str]) -> List[tuple]:
+    """
+    Gruppi di feature da togliere insieme: per ogni nodo del piano, le feature rimaste che lo
+    usano. Una primitiva condivisa (per esempio gli URL) si risparmia solo togliendo tutte le
+    feature che la leggono; ogni feature è anche un gruppo da sola.
+    """
+    closures = {f: set(cost_model.graph.plan([f]).computed) for f in kept if f in cost_model._known}
+    groups = {}
+    for node in cost_model.computed(kept):
+        users = tuple(f for f in kept if node in closures.get(f, ()))
+        if users:
+            groups[frozenset(users)] = users
+    return list(groups.values())
+
+
+def select_features_by_cost(
+    feature_names: List[str],
+    importance: Dict[str, float],
+    cost_model: FeatureCostModel,
+    evaluate: Callable[[List[str]], float],
+    auc_budget: float = DEFAULT_AUC_BUDGET,
+    baseline_auc: Optional[float] = None,
+    min_features: int = 2,
+    measure: bool = True,
+) -> Dict[str, Any]:
+    """
+    Toglie in modo greedy le feature costose e poco importanti finché la perdita di ROC-AUC resta
+    entro ``auc_budget``. ``evaluate(features)`` riaddestra il modello su ``features`` e restituisce
+    la ROC-AUC di validazione; ``importance`` è la permutation importance del modello completo.
+
+    A ogni passo i gruppi (vedi ``_candidate_groups``) con risparmio stimato positivo sono ordinati
+    per risparmio / importanza; si prova il primo non ancora scartato: se la perdita rispetto al
+    modello completo supera il budget il gruppo viene scartato, altrimenti le sue feature vengono
+    tolte. Restituisce il report con le feature scelte, i passi provati e i documenti/secondo
+    stimati (e misurati, con ``measure``) prima e dopo.
+    """
+    kept = list(feature_names)
+    if baseline_auc is None:
+        baseline_auc = float(evaluate(kept))
+    current_auc = baseline_auc
+    rejected = set()
+    steps: List[Dict[str, Any]] = []
+
+    while True:
+        current_cost = cost_model.cost(kept)
+        candidates = []
+        for group in _candidate_groups(cost_model, kept):
+            if frozenset(group) in rejected or len(kept) - len(group) < min_features:
+                continue
+            remaining = [f for f in kept if f not in group]
+            saving = current_cost - cost_model.cost(remaining)
+            if saving <= 0:
+                continue
+            value = max(sum(importance.get(f, 0.0) for f in group), IMPORTANCE_FLOOR)
+            candidates.append((saving / value, saving, group, remaining))
+        if not candidates:
+            break
+
+        _, saving, group, remaining = max(candidates, key=lambda c: (c[0], c[1]))
+        auc = float(evaluate(remaining))
+        loss = baseline_auc - auc
+        accepted = loss <= auc_budget
+        steps.append({
+            "features": list(group),
+            "saving_ms_per_doc": round(saving * 1000, 4),
+            "importance": round(sum(importance.get(f, 0.0) for f in group), 6),
+            "roc_auc": round(auc, 6),
+            "auc_loss": round(loss, 6),
+            "accepted": accepted,
+        })
+        logger.info(
+            f"Selezione per costo: {'tolte' if accepted else 'tenute'} {list(group)} "
+            f"(risparmio {saving * 1000:.3f} ms/doc, ROC-AUC {auc:.4f}, perdita {loss:.4f})"
+        )
+        if accepted:
+            kept = remaining
+            current_auc = auc
+        else:
+            rejected.add(frozenset(group))
+
+    baseline_cost = cost_model.cost(feature_names)
+    final_cost = cost_model.cost(kept)
+    report: Dict[str, Any] = {
+        "auc_budget": auc_budget,
+        "baseline_features": len(feature_names),
+        "selected_features": kept,
+        "dropped_features": [f for f in feature_names if f not in kept],
+        "baseline_roc_auc": round(baseline_auc, 6),
+        "selected_roc_auc": round(current_auc, 6),
+        "auc_loss": round(baseline_auc - current_auc, 6),
+        "estimated_docs_per_sec": {
+            "baseline": round(_docs_per_sec(baseline_cost), 1),
+            "selected": round(_docs_per_sec(final_cost), 1),
+            "speedup": round(baseline_cost / final_cost, 3) if final_cost > 0 else None,
+        },
+        "steps": steps,
+    }
+    if measure and cost_model.docs:
+        measured_baseline = cost_model.measured_cost(feature_names)
+        measured_final = cost_model.measured_cost(kept)
+        report["measured_docs_per_sec"] = {
+            "baseline": round(_docs_per_sec(measured_baseline), 1),
+            "selected": round(_docs_per_sec(measured_final), 1),
+            "speedup": round(measured_baseline / measured_final, 3) if measured_final > 0 else None,
+            "sample_docs": len(cost_model.docs),
+        }
+    return report
+
+
+def inner_selection(
+    X_train: pd.DataFrame,
+    y_train,
+    new_model: Callable[[], Any],
+    random_state: int = 42,
+    folds: int = SELECTION_FOLDS,
+) -> Tuple[Callable[[List[str]], float], Dict[str, float]]:
+    """
+    Prepara ``select_features_by_cost`` su fold stratificati delle sole righe di training.
+    Restituisce ``evaluate(features)``, la ROC-AUC media sui fold di modelli ``new_model()``
+    addestrati sul resto delle righe con le sole ``features``, e la permutation importance media
+    sui fold dei modelli con tutte le feature.
+    """
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state).split(X_train, y_train))
+
+    def fit(features: List[str], fit_idx, sel_idx):
+        X_fit, X_sel = X_train.iloc[fit_idx][features], X_train.iloc[sel_idx][features]
+        scaler = StandardScaler().fit(X_fit)
+        model = new_model()
+        model.fit(pd.DataFrame(scaler.transform(X_fit), columns=features), y_train.iloc[fit_idx])
+        return model, pd.DataFrame(scaler.transform(X_sel), columns=features), y_train.iloc[sel_idx]
+
+    def evaluate(features: List[str]) -> float:
+        aucs = []
+        for fit_idx, sel_idx in splits:
+            model, X_sel, y_sel = fit(features, fit_idx, sel_idx)
+            aucs.append(roc_auc_score(y_sel, model.predict_proba(X_sel)[:, 1]))
+        return float(np.mean(aucs))
+
+    features = list(X_train.columns)
+    importance = np.zeros(len(features))
+    for fit_idx, sel_idx in splits:
+        model, X_sel, y_sel = fit(features, fit_idx, sel_idx)
+        perm = permutation_importance(model, X_sel, y_sel, n_repeats=5, random_state=random_state, n_jobs=1)
+        importance += perm.importances_mean / len(splits)
+    return evaluate, dict(zip(features, importance))
+
+
+def record_test_check(report: Dict[str, Any], baseline_auc: float, selected_auc: float) -> None:
+    """
+    Aggiunge al report la ROC-AUC del modello completo e di quello riaddestrato sulle feature
+    scelte misurate sullo split di test o validazione, che la selezione non ha visto.
+    """
+    loss = baseline_auc - selected_auc
+    report["test_roc_auc"] = {
+        "baseline": round(baseline_auc, 6),
+        "selected": round(selected_auc, 6),
+        "auc_loss": round(loss, 6),
+        "within_budget": loss <= report["auc_budget"],
+    }
+
+
+def format_cost_report(report: Dict[str, Any]) -> str:
+    """Riepilogo leggibile del report di ``select_features_by_cost``."""
+    est = report["estimated_docs_per_sec"]
+    lines = [
+        f"Feature: {report['baseline_features']} -> {len(report['selected_features'])} "
+        f"(budget ROC-AUC {report['auc_budget']})",
+        f"ROC-AUC media sui fold di selezione: {report['baseline_roc_auc']:.4f} -> {report['selected_roc_auc']:.4f} "
+        f"(perdita {report['auc_loss']:.4f})",
+        f"Documenti/secondo stimati: {est['baseline']} -> {est['selected']} ({est['speedup']}x)",
+    ]
+    test = report.get("test_roc_auc")
+    if test:
+        lines.append(
+            f"ROC-AUC sullo split di test: {test['baseline']:.4f} -> {test['selected']:.4f} "
+            f"(perdita {test['auc_loss']:.4f}, {'entro' if test['within_budget'] else 'oltre'} il budget)"
+        )
+    measured = report.get("measured_docs_per_sec")
+    if measured:
+        lines.append(
+            f"Documenti/secondo misurati su {measured['sample_docs']} documenti: "
+            f"{measured['baseline']} -> {measured['selected']} ({measured['speedup']}x)"
+        )
+    if report["dropped_features"]:
+        lines.append(f"Feature tolte: {', '.join(report['dropped_features'])}")
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+Grafo delle dipendenze tra feature, per calcolare solo quelle lette da modelli e regole.
+
+extract_spam_features e DocStatsCsv.extract_stats sono descritti come nodi ``nome -> (dipendenze,
+funzione)``: le dipendenze sono altre feature, primitive interne (nomi con ``_``, per esempio gli
+URL o i conteggi delle keyword, che non finiscono nei metadata) o gli ingressi del calcolo
+(testo, metadata, analisi del documento). ``FeatureGraph.plan`` riceve le feature richieste
+(i ``feature_names`` degli artifact joblib più quelle delle regole di SpamFilter), aggiunge i
+loro prerequisiti e le ordina una volta sola; ``FeaturePlan.evaluate`` calcola poi per ogni
+documento solo i nodi del piano. Con ``targets=None`` il piano comprende tutte le feature, nello
+stesso ordine di sempre: è la modalità usata per scrivere i CSV di addestramento. Con ``provided``
+alcune primitive vengono fornite dal chiamante insieme agli ingressi (per esempio i conteggi dei
+documenti lunghi letti a blocchi) e il piano non calcola né loro né i nodi che servivano solo a loro.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from datatrove.utils.logging import logger
+
+NodeFunc = Callable[[Dict[str, Any]], Any]
+
+
+class FeaturePlan:
+    """Nodi da calcolare, in ordine topologico, e feature da restituire (``outputs``)."""
+
+    def __init__(self, steps: List[Tuple[str, NodeFunc]], outputs: List[str]):
+        self.steps = steps
+        self.outputs = outputs
+
+    @property
+    def computed(self) -> List[str]:
+        """Nomi di tutti i nodi calcolati, primitive interne comprese."""
+        return [name for name, _ in self.steps]
+
+    def evaluate(self, inputs: Dict[str, Any], keep: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Calcola il piano a partire dagli ingressi e restituisce le feature di ``outputs``, più i
+        nodi ``keep`` (per esempio le primitive da salvare, vedi ``FeatureGraph.split``).
+        """
+        values = dict(inputs)
+        for name, func in self.steps:
+            values[name] = func(values)
+        return {name: values[name] for name in (*self.outputs, *keep)}
+
+    def evaluate_timed(self, inputs: Dict[str, Any], timings: Dict[str, float]) -> Dict[str, Any]:
+        """Come ``evaluate``, sommando in ``timings`` i secondi spesi in ogni nodo (blocks.feature_cost)."""
+        values = dict(inputs)
+        for name, func in self.steps:
+            start = time.perf_counter()
+            values[name] = func(values)
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return {name: values[name] for name in self.outputs}
+
+
+class FeatureGraph:
+    """
+    Nodi ``nome -> (dipendenze, funzione)``; la funzione riceve il dizionario dei valori già
+    calcolati (ingressi compresi). Le feature pubbliche sono i nodi senza ``_`` iniziale, nell'ordine
+    di registrazione; ``inputs`` sono i nomi forniti dal chiamante a ogni valutazione.
+    """
+
+    def __init__(self, inputs: Iterable[str]):
+        self.inputs = frozenset(inputs)
+        self._nodes: Dict[str, Tuple[Tuple[str, ...], NodeFunc]] = {}
+        self._plans: Dict[Tuple[Optional[Tuple[str, ...]], FrozenSet[str]], FeaturePlan] = {}
+
+    def add(self, name: str, deps: Sequence[str], func: NodeFunc) -> None:
+        unknown = [d for d in deps if d not in self._nodes and d not in self.inputs]
+        if unknown:
+            # I nodi vanno registrati dopo le loro dipendenze: il grafo resta aciclico per costruzione
+            raise ValueError(f"Nodo '{name}': dipendenze non registrate {unknown}")
+        self._nodes[name] = (tuple(deps), func)
+        self._plans.clear()
+
+    @property
+    def features(self) -> List[str]:
+        return [name for name in self._nodes if not name.startswith("_")]
+
+    @property
+    def primitives(self) -> List[str]:
+        return [name for name in self._nodes if name.startswith("_")]
+
+    def dependencies(self, name: str) -> Tuple[str, ...]:
+        return self._nodes[name][0]
+
+    def plan(self, targets: Optional[Iterable[str]] = None, provided: Iterable[str] = ()) -> FeaturePlan:
+        """
+        Piano per le feature ``targets`` (None = tutte). I nomi che il grafo non calcola vengono
+        ignorati con un avviso: i classificatori li leggono dai metadata, con 0.0 se mancano.
+        I nodi ``provided`` vengono trattati come ingressi: ``evaluate`` li riceve già calcolati.
+        """
+        key = None if targets is None else tuple(sorted(set(targets)))
+        provided = frozenset(provided)
+        plan = self._plans.get((key, provided))
+        if plan is not None:
+            return plan
+        if key is None:
+            outputs = self.features
+        else:
+            missing = [t for t in key if t not in self._nodes or t.startswith("_")]
+            if missing:
+                logger.warning(f"Feature non calcolate dal grafo, lette dai metadata se presenti: {missing}")
+            wanted = set(key)
+            outputs = [name for name in self.features if name in wanted]
+        needed = set()
+        stack = list(outputs)
+        while stack:
+            name = stack.pop()
+            if name in needed or name in self.inputs or name in provided:
+                continue
+            needed.add(name)
+            stack.extend(self._nodes[name][0])
+        # L'ordine di registrazione è già topologico (vedi add)
+        steps = [(name, func) for name, (_, func) in self._nodes.items() if name in needed]
+        plan = self._plans[key, provided] = FeaturePlan(steps, outputs)
+        return plan
+
+    def split(self, plan: FeaturePlan, inputs: Iterable[str]) -> Tuple[List[str], FeaturePlan]:
+        """
+        Divide ``plan`` tra i nodi che dipendono dagli ingressi ``inputs`` (per esempio i metadata)
+        e quelli che non ne dipendono. Ritorna i nodi indipendenti da conservare, cioè le feature
+        di ``outputs`` e le primitive lette dai nodi dipendenti, e il piano che ricalcola i nodi
+        dipendenti a partire da questi e da ``inputs``: ``rest.evaluate({**inputs, **conservati})``
+        dà le stesse feature di ``plan.evaluate``.
+        """
+        inputs = set(inputs)
+        dependent = set()
+        for name, _ in plan.steps:
+            deps = self._nodes[name][0]
+            if any(d in inputs or d in dependent for d in deps):
+                other = [d for d in deps if d in self.inputs and d not in inputs]
+                if other:
+                    raise ValueError(f"Nodo '{name}': dipende da {sorted(inputs)} e dagli ingressi {other}, va diviso")
+                dependent.add(name)
+        read = {d for name in dependent for d in self._nodes[name][0]}
+        kept = [
+            name for name, _ in plan.steps
+            if name not in dependent and (name in plan.outputs or name in read)
+        ]
+        rest = FeaturePlan([(name, func) for name, func in plan.steps if name in dependent], plan.outputs)
+        return kept, rest
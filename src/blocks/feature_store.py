@@ -0,0 +1,199 @@
+"""
+Archivio persistente delle feature, indicizzato per digest del documento.
+
+I record dell'input hanno un campo ``digest`` (``sha1:...``): le feature che dipendono solo dal
+testo (DocStatsCsv, extract_spam_features, punteggio LID) possono quindi essere calcolate una
+volta e riusate dalle esecuzioni successive sullo stesso corpus, per esempio per provare un
+nuovo modello o una nuova soglia. Le feature sono salvate in un database SQLite (un file, con
+accessi concorrenti gestiti da SQLite stesso) come righe compatte ``float64``: una tabella per
+blocco, con l'elenco delle colonne e il tipo delle righe registrati a parte; se cambiano la
+tabella viene ricreata, così non si riusano feature calcolate da una versione diversa
+dell'estrattore.
+
+I valori interi vengono ripristinati come ``int`` (maschera per riga), le stringhe vanno nel
+campo ``extra`` in JSON. Le feature ``float`` tornano identiche, quindi un'esecuzione che legge
+l'archivio dà le stesse feature di una che le calcola. Il numero di righe per tabella è limitato
+da ``max_rows``: alla chiusura vengono eliminate quelle usate meno di recente.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from datatrove.utils.logging import logger
+
+STORE_DTYPE = np.float64
+# Righe massime per tabella prima dell'evizione (~500 byte per riga di 60 feature)
+DEFAULT_MAX_ROWS = 2_000_000
+# Operazioni accumulate prima di scriverle nel database
+FLUSH_EVERY = 512
+
+
+def doc_digest(doc) -> Optional[str]:
+    """
+    Chiave del documento nell'archivio: il campo ``digest`` dei metadata, se presente; altrimenti
+    lo SHA-1 del testo nello stesso formato (``sha1:`` + base32), per i record senza digest.
+    """
+    metadata = getattr(doc, "metadata", None) or {}
+    digest = metadata.get("digest")
+    if isinstance(digest, str) and digest:
+        return digest
+    text = getattr(doc, "text", None)
+    if not isinstance(text, str):
+        return None
+    return "sha1:" + base64.b32encode(hashlib.sha1(text.encode("utf-8")).digest()).decode("ascii")
+
+
+def subset_table(table: str, columns: List[str], all_columns: List[str]) -> str:
+    """
+    Tabella per un sottoinsieme di colonne (estrazione ridotta alle feature dei modelli): un nome
+    diverso per ogni sottoinsieme, così non ricrea né svuota la tabella completa.
+    """
+    if list(columns) == list(all_columns):
+        return table
+    return f"{table}_{hashlib.sha1(json.dumps(list(columns)).encode('utf-8')).hexdigest()[:8]}"
+
+
+class FeatureStore:
+    """
+    Tabella ``table`` del database ``path`` con le colonne numeriche ``columns``.
+    La connessione viene aperta al primo accesso, quindi l'oggetto si può passare ai worker
+    dell'executor. ``hits`` e ``misses`` contano le letture trovate e non trovate.
+    """
+
+    def __init__(self, path: str, table: str, columns: List[str], max_rows: int = DEFAULT_MAX_ROWS):
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending_rows: list = []
+        self._pending_touch: list = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_pending_rows"], state["_pending_touch"] = [], []
+        return state
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TABLE IF NOT EXISTS feature_tables (name TEXT PRIMARY KEY, columns TEXT NOT NULL)")
+            row = conn.execute("SELECT columns FROM feature_tables WHERE name = ?", (self.table,)).fetchone()
+            # Le tabelle registrate come semplice elenco di colonne sono quelle float32 precedenti
+            layout = {"columns": self.columns, "dtype": np.dtype(STORE_DTYPE).name}
+            if row is None or json.loads(row[0]) != layout:
+                if row is not None:
+                    logger.info(f"Feature store: colonne di '{self.table}' cambiate, tabella ricreata")
+                conn.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+                conn.execute(
+                    f'CREATE TABLE "{self.table}" (digest TEXT PRIMARY KEY, vec BLOB NOT NULL, '
+                    f"int_mask BLOB NOT NULL, extra TEXT, last_used REAL NOT NULL)"
+                )
+                conn.execute(f'CREATE INDEX "{self.table}_last_used" ON "{self.table}" (last_used)')
+                conn.execute(
+                    "INSERT OR REPLACE INTO feature_tables (name, columns) VALUES (?, ?)",
+                    (self.table, json.dumps(layout)),
+                )
+            conn.execute("COMMIT")
+            self._conn = conn
+        return self._conn
+
+    def get(self, digest: Optional[str]) -> Optional[Dict]:
+        """Feature salvate per ``digest`` (colonne numeriche più eventuali stringhe), oppure None."""
+        if digest is None:
+            self.misses += 1
+            return None
+        row = self.conn.execute(
+            f'SELECT vec, int_mask, extra FROM "{self.table}" WHERE digest = ?', (digest,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._pending_touch.append(digest)
+        if len(self._pending_touch) >= FLUSH_EVERY:
+            self.flush()
+        vec, int_mask, extra = row
+        values = np.frombuffer(vec, dtype=STORE_DTYPE).tolist()
+        is_int = np.unpackbits(np.frombuffer(int_mask, dtype=np.uint8), count=len(values)).astype(bool)
+        features = {
+            name: int(value) if integer else value
+            for name, value, integer in zip(self.columns, values, is_int)
+        }
+        if extra:
+            features.update(json.loads(extra))
+        return features
+
+    def put(self, digest: Optional[str], features: Dict) -> None:
+        """Salva le colonne di ``features``: i valori stringa fuori da ``columns`` vanno in ``extra``."""
+        if digest is None:
+            return
+        values = [features[name] for name in self.columns]
+        vec = np.asarray(values, dtype=STORE_DTYPE).tobytes()
+        int_mask = np.packbits([isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values]).tobytes()
+        extra = {k: v for k, v in features.items() if isinstance(v, str) and k not in self.columns}
+        self._pending_rows.append((digest, vec, int_mask, json.dumps(extra) if extra else None, time.time()))
+        if len(self._pending_rows) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending_rows and not self._pending_touch:
+            return
+        conn = self.conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            f'INSERT OR REPLACE INTO "{self.table}" (digest, vec, int_mask, extra, last_used) VALUES (?, ?, ?, ?, ?)',
+            self._pending_rows,
+        )
+        conn.executemany(
+            f'UPDATE "{self.table}" SET last_used = ? WHERE digest = ?',
+            [(now, digest) for digest in self._pending_touch],
+        )
+        conn.execute("COMMIT")
+        self._pending_rows, self._pending_touch = [], []
+
+    def evict(self) -> int:
+        """Elimina le righe usate meno di recente oltre ``max_rows``; ritorna quante ne ha eliminate."""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        excess = conn.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                f'DELETE FROM "{self.table}" WHERE digest IN '
+                f'(SELECT digest FROM "{self.table}" ORDER BY last_used LIMIT ?)',
+                (excess,),
+            )
+        conn.execute("COMMIT")
+        return max(0, excess)
+
+    def close(self) -> None:
+        """Scrive le operazioni in sospeso, applica il limite di righe e chiude la connessione."""
+        if self._conn is None and not self._pending_rows:
+            return
+        self.flush()
+        evicted = self.evict()
+        total = self.hits + self.misses
+        logger.info(
+            f"Feature store '{self.table}': {self.hits} hit, {self.misses} miss "
+            f"({self.hits / total if total else 0:.1%}), {evicted} righe eliminate"
+        )
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,303 @@
+"""
+Ordine dei filtri lingua, spam e qualità scelto in base a costo e selettività misurati.
+
+build_italian_cleaning_pipeline applica di default lingua -> spam -> qualità, ma l'ordine più
+economico dipende dal corpus: se la qualità scarta molti più documenti dello spam a una frazione
+del costo conviene metterla prima. ``FilterPlanner`` riceve i tre filtri come ``FilterStage``
+(gli step di ognuno, le chiavi dei metadata che legge da altri filtri e quelle che scrive) e:
+
+1. ``measure`` fa passare un campione di documenti da ogni filtro senza scartarli e registra i
+   secondi per documento e quali documenti passerebbero. Spam e qualità usano l'analisi condivisa
+   del documento (blocks.text_analysis): il costo viene misurato sia a freddo sia con l'analisi
+   già calcolata dall'altro filtro ("caldo");
+2. ``plan`` valuta ogni ordine che rispetta le dipendenze (un filtro che legge una chiave scritta
+   da un altro va dopo di lui: la qualità legge ``language_score`` dalla LID) con il costo
+   atteso ``sum_k costo_k * documenti che arrivano al filtro k``, calcolato esattamente sui
+   documenti del campione, e sceglie il minimo;
+3. ``compare_with_run`` confronta la previsione con le statistiche DataTrove dell'esecuzione vera.
+
+Spam e qualità scrivono otto chiavi con lo stesso nome (``digit_ratio``, ``url_density``, ...):
+nell'ordine predefinito vince la statistica di DocStatsCsv, e redecide.py lo presuppone. Quando un
+ordine mette la qualità prima dello spam il piano aggiunge dopo lo spam lo step ``restore`` della
+qualità (DocStatsRestore), che riscrive i valori delle statistiche: documenti tenuti e metadata
+restano gli stessi dell'ordine predefinito, cambia solo la cartella degli scarti di un documento
+rifiutato da più filtri (quello che lo vede per primo).
+"""
+
+from __future__ import annotations
+
+import gc
+import itertools
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from datatrove.data import Document
+from datatrove.pipeline.base import PipelineStep
+from datatrove.pipeline.filters.base_filter import BaseFilter
+from datatrove.utils.batching import batched
+from datatrove.utils.logging import logger
+from datatrove.utils.typeshelper import StatHints
+
+from . import text_analysis
+
+DEFAULT_FILTER_ORDER = ("language", "spam", "quality")
+# Documenti valutati insieme nella misura "a caldo": l'analisi condivisa deve restare in cache
+# tra il filtro che la calcola e quello misurato
+_WARM_CHUNK = text_analysis.ANALYSIS_CACHE_SIZE // 2
+
+
+class FilterStage:
+    """
+    Un filtro della pipeline come gruppo di step (per lo spam: cascata, estrattore e SpamFilter).
+    ``reads`` sono le chiavi dei metadata scritte da altri filtri, ``writes`` quelle che il filtro
+    scrive; ``shares_analysis`` indica che il filtro usa l'analisi condivisa del documento;
+    ``restore`` è lo step che riscrive le sue chiavi se un filtro successivo le sovrascrive.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        steps: List[PipelineStep],
+        reads: Iterable[str] = (),
+        writes: Iterable[str] = (),
+        shares_analysis: bool = False,
+        restore: Optional[PipelineStep] = None,
+    ):
+        self.name = name
+        self.steps = steps
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.shares_analysis = shares_analysis
+        self.restore = restore
+
+
+def _keep(result) -> bool:
+    return bool(result[0]) if isinstance(result, tuple) else bool(result)
+
+
+def _run_stage(stage: FilterStage, docs: List[Document]) -> np.ndarray:
+    """Fa passare tutti i documenti dagli step del filtro, senza scartarli: maschera di chi passa."""
+    passed = np.ones(len(docs), dtype=bool)
+    for step in stage.steps:
+        if isinstance(step, BaseFilter):
+            results = []
+            for batch in batched(docs, step.batch_size):
+                results.extend(step.filter_batch(batch))
+            passed &= np.array([_keep(r) for r in results], dtype=bool)
+        else:
+            deque(step.run(iter(docs)), maxlen=0)
+    return passed
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 4)
+
+
+class FilterPlanner:
+    """Dipendenze tra i filtri, misura sul campione e scelta dell'ordine di costo atteso minimo."""
+
+    def __init__(self, stages: Dict[str, FilterStage], default_order: Sequence[str] = DEFAULT_FILTER_ORDER):
+        self.stages = stages
+        self.default_order = tuple(default_order)
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        """Per ogni filtro, i filtri che devono precederlo perché ne legge le chiavi."""
+        return {
+            name: [other for other, dep in self.stages.items() if other != name and stage.reads & dep.writes]
+            for name, stage in self.stages.items()
+        }
+
+    def valid_orders(self) -> List[tuple]:
+        deps = self.dependencies()
+        return [
+            order for order in itertools.permutations(self.default_order)
+            if all(order.index(dep) < order.index(name) for name in order for dep in deps[name])
+        ]
+
+    def restores(self, order: Sequence[str]) -> Dict[str, List[str]]:
+        """
+        Per ogni filtro, i filtri il cui ``restore`` va eseguito subito dopo: chi nell'ordine
+        predefinito scrive per ultimo una chiave comune deve avere l'ultima parola anche qui.
+        """
+        result: Dict[str, List[str]] = {}
+        for a, b in itertools.combinations(self.default_order, 2):
+            # Nell'ordine predefinito b segue a e i suoi valori restano nei metadata
+            if self.stages[a].writes & self.stages[b].writes and order.index(a) > order.index(b):
+                if self.stages[b].restore is None:
+                    raise ValueError(f"Il filtro '{b}' non può seguire '{a}': chiavi comuni senza restore")
+                result.setdefault(a, []).append(b)
+        return result
+
+    def measure(self, docs: Sequence[Document], repeat: int = 3) -> Dict[str, Any]:
+        """
+        Secondi per documento (migliore di ``repeat`` ripetizioni) e maschera dei documenti che
+        passano ogni filtro. I filtri sono misurati nell'ordine predefinito e le chiavi lette dagli
+        altri (``language_score``) vengono copiate nei documenti del campione per i successivi.
+        """
+        if not docs:
+            raise ValueError("Serve almeno un documento per misurare i filtri")
+        base = text_analysis.fresh_documents(docs)
+        reads = set().union(*(stage.reads for stage in self.stages.values()))
+        measured: Dict[str, Any] = {}
+        for name in self.default_order:
+            stage = self.stages[name]
+            best, passed, copies = float("inf"), None, None
+            for _ in range(max(1, repeat)):
+                copies = text_analysis.fresh_documents(base)
+                gc.collect()
+                start = time.perf_counter()
+                passed = _run_stage(stage, copies)
+                best = min(best, time.perf_counter() - start)
+            for doc, copy in zip(base, copies):
+                doc.metadata.update({k: copy.metadata[k] for k in reads & stage.writes if k in copy.metadata})
+            measured[name] = {"cold": best / len(docs), "passed": passed}
+
+        sharing = [name for name in self.default_order if self.stages[name].shares_analysis]
+        for name in sharing:
+            others = [self.stages[o] for o in sharing if o != name]
+            stage = self.stages[name]
+            if others:
+                measured[name]["warm"] = self._warm(base, others, [stage], repeat)
+            if stage.restore is not None:
+                restore = FilterStage(f"{name}_restore", [stage.restore])
+                measured[name]["restore"] = self._warm(base, [self.stages[o] for o in sharing], [restore], repeat)
+        return {"sample_docs": len(docs), "stages": measured}
+
+    @staticmethod
+    def _warm(base: List[Document], before: List[FilterStage], timed: List[FilterStage], repeat: int) -> float:
+        """Secondi per documento di ``timed`` con l'analisi condivisa già calcolata dai filtri ``before``."""
+        best = float("inf")
+        for _ in range(max(1, repeat)):
+            copies = text_analysis.fresh_documents(base)
+            text_analysis.set_analysis_window(_WARM_CHUNK)
+            gc.collect()
+            elapsed = 0.0
+            for chunk in batched(copies, _WARM_CHUNK):
+                for stage in before:
+                    _run_stage(stage, chunk)
+                start = time.perf_counter()
+                for stage in timed:
+                    _run_stage(stage, chunk)
+                elapsed += time.perf_counter() - start
+            best = min(best, elapsed)
+        return best / len(base)
+
+    def predict(self, order: Sequence[str], measured: Dict[str, Any]) -> Dict[str, Any]:
+        """Costo atteso di ``order`` in secondi per documento e quota di documenti che arriva a ogni filtro."""
+        stages = measured["stages"]
+        n = measured["sample_docs"]
+        restores = self.restores(order)
+        reach = np.ones(n, dtype=bool)
+        total, warm, reached = 0.0, False, {}
+        for name in order:
+            cost = stages[name].get("warm", stages[name]["cold"]) if warm else stages[name]["cold"]
+            reached[name] = float(reach.sum()) / n
+            total += reach.sum() * cost
+            reach &= stages[name]["passed"]
+            for restored in restores.get(name, []):
+                total += reach.sum() * stages[restored]["restore"]
+            warm = warm or self.stages[name].shares_analysis
+        return {"order": list(order), "seconds_per_doc": total / n, "reached": reached, "restores": restores}
+
+    def plan(self, measured: Dict[str, Any]) -> Dict[str, Any]:
+        """Report con il costo previsto di ogni ordine valido e l'ordine di costo minimo."""
+        predictions = sorted((self.predict(order, measured) for order in self.valid_orders()), key=lambda p: p["seconds_per_doc"])
+        best = predictions[0]
+        default = self.predict(self.default_order, measured)
+        return {
+            "sample_docs": measured["sample_docs"],
+            "stages": {
+                name: {
+                    "cold_ms_per_doc": _ms(stage["cold"]),
+                    "warm_ms_per_doc": _ms(stage.get("warm")),
+                    "restore_ms_per_doc": _ms(stage.get("restore")),
+                    "rejection_rate": round(1.0 - float(stage["passed"].mean()), 4),
+                }
+                for name, stage in measured["stages"].items()
+            },
+            "dependencies": self.dependencies(),
+            "orders": [
+                {
+                    "order": p["order"],
+                    "predicted_ms_per_doc": _ms(p["seconds_per_doc"]),
+                    "reached": {k: round(v, 4) for k, v in p["reached"].items()},
+                    "restores": p["restores"],
+                }
+                for p in predictions
+            ],
+            "default_order": list(self.default_order),
+            "best_order": best["order"],
+            "predicted_ms_per_doc": {"default": _ms(default["seconds_per_doc"]), "best": _ms(best["seconds_per_doc"])},
+            "predicted_saving": round(1.0 - best["seconds_per_doc"] / default["seconds_per_doc"], 4) if default["seconds_per_doc"] > 0 else 0.0,
+        }
+
+    def compare_with_run(self, report: Dict[str, Any], order: Sequence[str], pipeline: Sequence[PipelineStep], stats) -> Optional[Dict[str, Any]]:
+        """
+        Costo e documenti per filtro dell'esecuzione vera (``stats`` di LocalPipelineExecutor.run,
+        allineate agli step di ``pipeline``) accanto alla previsione per ``order``. Il costo
+        dell'ordine predefinito non è stato misurato: il risparmio "misurato" usa i costi per
+        documento di questa esecuzione con le quote di documenti del campione.
+        """
+        by_name = {}
+        for step, step_stats in zip([s for s in pipeline if hasattr(s, "stats")], stats.stats):
+            by_name[step.name] = step_stats
+        actual: Dict[str, Dict[str, float]] = {}
+        for name in order:
+            stage = self.stages[name]
+            steps = list(stage.steps) + ([stage.restore] if stage.restore is not None else [])
+            found = [by_name[s.name] for s in steps if s.name in by_name]
+            if not found or stage.steps[-1].name not in by_name:
+                logger.warning(f"Ordine dei filtri: step del filtro '{name}' non trovati nelle statistiche, confronto saltato")
+                return None
+            docs_in = by_name[stage.steps[-1].name][StatHints.total].total
+            seconds = sum(s.time_stats.total for s in found)
+            actual[name] = {"docs": docs_in, "seconds": seconds}
+
+        first = actual[order[0]]["docs"]
+        if not first:
+            return None
+        actual_cost = sum(a["seconds"] for a in actual.values()) / first
+        per_doc = {name: a["seconds"] / a["docs"] if a["docs"] else 0.0 for name, a in actual.items()}
+        default = next((o for o in report["orders"] if o["order"] == list(self.default_order)), None)
+        chosen = next((o for o in report["orders"] if o["order"] == list(order)), None)
+        estimated_default = sum(per_doc[name] * default["reached"][name] for name in self.default_order) if default else None
+        result = {
+            "order": list(order),
+            "input_docs": first,
+            "reached": {name: round(a["docs"] / first, 4) for name, a in actual.items()},
+            "predicted_ms_per_doc": chosen["predicted_ms_per_doc"] if chosen else None,
+            "actual_ms_per_doc": _ms(actual_cost),
+            "predicted_saving": round(1.0 - chosen["predicted_ms_per_doc"] / report["predicted_ms_per_doc"]["default"], 4) if chosen else None,
+            "actual_saving": round(1.0 - actual_cost / estimated_default, 4) if estimated_default else None,
+        }
+        logger.info(format_run_comparison(result))
+        return result
+
+
+def format_filter_plan(report: Dict[str, Any]) -> str:
+    """Riepilogo leggibile del report di ``FilterPlanner.plan``."""
+    lines = [f"Ordine dei filtri su {report['sample_docs']} documenti campione:"]
+    for name, stage in report["stages"].items():
+        warm = f", a caldo {stage['warm_ms_per_doc']}" if stage["warm_ms_per_doc"] is not None else ""
+        lines.append(f"  {name}: {stage['cold_ms_per_doc']} ms/doc{warm}, scarta il {stage['rejection_rate']:.1%}")
+    for option in report["orders"]:
+        lines.append(f"  {' -> '.join(option['order'])}: {option['predicted_ms_per_doc']} ms/doc previsti")
+    lines.append(
+        f"Ordine migliore: {' -> '.join(report['best_order'])} "
+        f"(risparmio previsto {report['predicted_saving']:.1%} sull'ordine predefinito)"
+    )
+    return "\n".join(lines)
+
+
+def format_run_comparison(result: Dict[str, Any]) -> str:
+    """Riepilogo di ``FilterPlanner.compare_with_run``."""
+    reached = ", ".join(f"{name} {share:.1%}" for name, share in result["reached"].items())
+    saving = "n/d" if result["actual_saving"] is None else f"{result['actual_saving']:.1%}"
+    predicted_saving = "n/d" if result["predicted_saving"] is None else f"{result['predicted_saving']:.1%}"
+    return (
+        f"Ordine {' -> '.join(result['order'])} su {result['input_docs']} documenti: "
+        f"{result['predicted_ms_per_doc']} ms/doc previsti, {result['actual_ms_per_doc']} misurati; "
+        f"risparmio previsto {predicted_saving}, misurato {saving}; documenti arrivati ai filtri: {reached}"
+    )
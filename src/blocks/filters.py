@@ -6,27 +6,181 @@ from typing import List, Tuple
 from datatrove.data import Document, DocumentsPipeline
 from datatrove.pipeline.writers.disk_base import DiskWriter
 
-from blocks.classifiers import QualityClassifier, DEFAULT_FEATURE_NAMES
+from blocks.classifiers import QualityClassifier, DEFAULT_BATCH_SIZE, DEFAULT_MODEL_BACKEND, FEATURE_DTYPE
+from blocks.feature_store import DEFAULT_MAX_ROWS, FeatureStore, doc_digest
 
-import pandas as pd
+import numpy as np
 
-def get_language_filter(rejected_dir: str, threshold: float = 0.65, languages = "it"):
+# LID a prefisso: caratteri valutati per primi, margine attorno alla soglia entro cui si allunga
+# il prefisso e fattore di crescita del prefisso a ogni estensione
+DEFAULT_LID_PREFIX_CHARS = 2048
+DEFAULT_LID_PREFIX_MARGIN = 0.1
+LID_PREFIX_GROWTH = 4
+
+
+class PrefixLID:
+    """
+    Modello LID che valuta prima i primi ``prefix_chars`` caratteri del documento (tagliati a fine
+    parola) e passa a un prefisso ``LID_PREFIX_GROWTH`` volte più lungo, fino al testo intero,
+    solo se il punteggio usato dal filtro è a meno di ``margin`` dalla soglia. I documenti più
+    corti del prefisso vengono valutati interi, esattamente come dal modello originale.
+    Stessa interfaccia ``predict`` dei modelli di DataTrove; i contatori ``prefix_decided``,
+    ``extended``, ``scored_chars`` e ``total_chars`` misurano quanto testo è stato risparmiato.
+    """
+
+    def __init__(self, model, threshold: float, prefix_chars: int = DEFAULT_LID_PREFIX_CHARS, margin: float = DEFAULT_LID_PREFIX_MARGIN):
+        self.model = model
+        self.languages = model.languages
+        self.threshold = threshold
+        self.prefix_chars = prefix_chars
+        self.margin = margin
+        self.prefix_decided = 0
+        self.extended = 0
+        self.scored_chars = 0
+        self.total_chars = 0
+
+    @property
+    def table_suffix(self) -> str:
+        """
+        Suffisso della tabella dell'archivio delle feature: i punteggi dipendono dal prefisso, dal
+        margine e dalla soglia, che decide dove il prefisso viene allungato.
+        """
+        return f"_prefix{self.prefix_chars}_t{self.threshold:g}_m{self.margin:g}"
+
+    def _decision_score(self, best_lang_pair, lang_pairs) -> float:
+        # Lo stesso punteggio confrontato con la soglia da LanguageFilter.filter
+        return max(lang_pairs.values(), default=0.0) if self.languages else best_lang_pair[1]
+
+    def predict(self, doc: Document):
+        text = doc.text
+        self.total_chars += len(text)
+        size = self.prefix_chars
+        while size < len(text):
+            cut = text.rfind(" ", size // 2, size)
+            prefix = text[: cut if cut > 0 else size]
+            self.scored_chars += len(prefix)
+            best_lang_pair, lang_pairs = self.model.predict(Document(text=prefix, id=doc.id))
+            if abs(self._decision_score(best_lang_pair, lang_pairs) - self.threshold) > self.margin:
+                self.prefix_decided += 1
+                return best_lang_pair, lang_pairs
+            self.extended += 1
+            size *= LID_PREFIX_GROWTH
+        self.scored_chars += len(text)
+        return self.model.predict(doc)
+
+
+class CachedLID:
+    """
+    Modello LID che prima di predire cerca il risultato nell'archivio delle feature per digest
+    (blocks.feature_store): punteggio della lingua migliore, punteggi delle lingue richieste e
+    codice della lingua migliore. Stessa interfaccia ``predict`` dei modelli di DataTrove.
+    """
+
+    def __init__(self, model, store: FeatureStore):
+        self.model = model
+        self.store = store
+        self.languages = model.languages
+
+    def predict(self, doc: Document):
+        digest = doc_digest(doc)
+        stored = self.store.get(digest)
+        if stored is not None:
+            lang_pairs = {lang: stored[f"{lang}_score"] for lang in self.languages}
+            return (stored["language"], stored["language_score"]), lang_pairs
+        best_lang_pair, lang_pairs = self.model.predict(doc)
+        self.store.put(digest, {
+            "language_score": best_lang_pair[1],
+            **{f"{lang}_score": score for lang, score in lang_pairs.items()},
+            "language": best_lang_pair[0],
+        })
+        return best_lang_pair, lang_pairs
+
+
+class CachedLanguageFilter(LanguageFilter):
+    """
+    LanguageFilter con il modello avvolto in ``CachedLID``: alla seconda esecuzione sullo stesso
+    corpus fastText non viene più chiamato. Servono lingue esplicite, perché l'archivio salva
+    solo i punteggi di quelle lingue.
+    """
+
+    def __init__(self, feature_store: str, feature_store_max_rows: int = DEFAULT_MAX_ROWS, **kwargs):
+        super().__init__(**kwargs)
+        if not self.languages:
+            raise ValueError("CachedLanguageFilter richiede una lista di lingue")
+        columns = ["language_score", *(f"{lang}_score" for lang in self.languages)]
+        table = f"lid_{self.backend}_{'_'.join(self.languages)}{getattr(self.model, 'table_suffix', '')}"
+        self.model = CachedLID(self.model, FeatureStore(feature_store, table, columns, feature_store_max_rows))
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1) -> DocumentsPipeline:
+        yield from super().run(data, rank, world_size)
+        store = self.model.store
+        self.stat_update("feature_store_hit", value=store.hits)
+        self.stat_update("feature_store_miss", value=store.misses)
+        store.close()
+
+
+class PrefixLanguageFilter(LanguageFilter):
+    """
+    LanguageFilter con il modello avvolto in ``PrefixLID``: i documenti lunghi vengono decisi sui
+    primi ``prefix_chars`` caratteri quando il punteggio è lontano dalla soglia. ``language_score``
+    è quindi il punteggio del prefisso usato per decidere. Le statistiche ``lid_prefix_decided`` e
+    ``lid_extended`` contano i documenti decisi su un prefisso e le estensioni, ``lid_scored_chars``
+    / ``lid_total_chars`` il testo passato al modello rispetto a quello dei documenti.
+    """
+
+    name = "🌍 Language ID (prefisso)"
+
+    def __init__(self, prefix_chars: int = DEFAULT_LID_PREFIX_CHARS, prefix_margin: float = DEFAULT_LID_PREFIX_MARGIN, **kwargs):
+        super().__init__(**kwargs)
+        self.model = PrefixLID(self.model, self.language_threshold, prefix_chars, prefix_margin)
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1) -> DocumentsPipeline:
+        yield from super().run(data, rank, world_size)
+        # Con l'archivio delle feature PrefixLID è avvolto da CachedLID
+        model = self.model.model if isinstance(self.model, CachedLID) else self.model
+        self.stat_update("lid_prefix_decided", value=model.prefix_decided)
+        self.stat_update("lid_extended", value=model.extended)
+        self.stat_update("lid_scored_chars", value=model.scored_chars)
+        self.stat_update("lid_total_chars", value=model.total_chars)
+
+
+class CachedPrefixLanguageFilter(CachedLanguageFilter, PrefixLanguageFilter):
+    """LID a prefisso con i punteggi riusati dall'archivio delle feature (tabella separata)."""
+
+    name = "🌍 Language ID (prefisso)"
+
+
+def get_language_filter(
+    rejected_dir: str,
+    threshold: float = 0.65,
+    languages = "it",
+    feature_store: str | None = None,
+    feature_store_max_rows: int = DEFAULT_MAX_ROWS,
+    prefix_chars: int | None = None,
+    prefix_margin: float = DEFAULT_LID_PREFIX_MARGIN,
+):
     """
     Inizializza il filtro per la lingua italiana.
     
     Parametri:
     - rejected_dir: Cartella dove salvare i testi non in italiano.
     - threshold: Soglia di confidenza del modello fasttext (0.65 consigliata e impostata di default).
+    - feature_store: Database dell'archivio delle feature; se indicato i punteggi LID vengono riusati per digest.
+    - prefix_chars: Se indicato, LID a prefisso (PrefixLID): i documenti lunghi vengono valutati sui
+      primi prefix_chars caratteri e il prefisso si allunga solo se il punteggio è entro prefix_margin dalla soglia.
     """
-    return LanguageFilter(
-        languages=languages,
-        language_threshold=threshold,
-        exclusion_writer=JsonlWriter(
-            output_folder=os.path.join(rejected_dir, "1_language"),
-            output_filename="non_italiano_${rank}.jsonl",
-            compression=None
-        )
+    exclusion_writer = JsonlWriter(
+        output_folder=os.path.join(rejected_dir, "1_language"),
+        output_filename="non_italiano_${rank}.jsonl",
+        compression=None
     )
+    kwargs = dict(languages=languages, language_threshold=threshold, exclusion_writer=exclusion_writer)
+    if prefix_chars:
+        kwargs.update(prefix_chars=prefix_chars, prefix_margin=prefix_margin)
+    if feature_store:
+        filter_cls = CachedPrefixLanguageFilter if prefix_chars else CachedLanguageFilter
+        return filter_cls(feature_store, feature_store_max_rows, **kwargs)
+    return (PrefixLanguageFilter if prefix_chars else LanguageFilter)(**kwargs)
 
 #Implementato ma non più usato
 class CustomItalianFilter(BaseFilter):
@@ -65,6 +219,10 @@ class ItalianClassification(BaseFilter):
     quindi verranno scritti dal writer finale in output.
     I documenti ``bad`` vengono invece scartati e scritti dal writer di esclusione
     nella directory ``rejected``.
+
+    Con ``batch_size > 1`` DataTrove passa a ``filter_batch`` gruppi di documenti:
+    per ogni gruppo viene costruita una sola matrice di feature e il modello viene
+    invocato una sola volta. ``backend="numpy"`` usa il predittore di ``blocks.tree_predictor``.
     """
 
     def __init__(
@@ -74,9 +232,10 @@ class ItalianClassification(BaseFilter):
             output_folder: str | None = None,
             output_filename:str = "quality_rejectd_${rank}.jsonl",
             exclusion_writer: DiskWriter | None = None,
-            feature_names: List[str] = DEFAULT_FEATURE_NAMES,
+            feature_names: List[str] | None = None,
             threshold: float = 0.65,
-            batch_size: int = 1,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            backend: str = DEFAULT_MODEL_BACKEND,
     ):
         # Creo la directory dove verranno scritti e quindi salvati i file rigettati in fase di filtraggio attraverso ItalianClassification
         if exclusion_writer is None and (rejected_dir and output_folder):
@@ -92,36 +251,48 @@ class ItalianClassification(BaseFilter):
         self.classifier = QualityClassifier(
             model_path= model_path,
             feature_names= feature_names,
-            threshold= threshold
+            threshold= threshold,
+            batch_size= batch_size,
+            backend= backend,
         )
 
+    def required_features(self) -> List[str]:
+        """Statistiche lette dal modello: DocStatsCsv può calcolare solo queste (language_score arriva dalla LID)."""
+        return [name for name in self.classifier.feature_names if name != "language_score"]
+
     # Sovrascrivo la funzione filter ereditata dalla classe padre
     def filter(self, doc: Document) -> bool | Tuple[bool, str]:
-        features = self.classifier._extract_features(doc)
-        if features is None:
-            doc.metadata["quality_label"] = "bad"
-            doc.metadata["quality_score"] = 0.0
-            return False, "quality_missing_features"
-        
-        score_good, label = self._predict(features)
-        doc.metadata["quality_label"] = label
-        doc.metadata["quality_score"] = round(score_good, 4)
-
-        if label == "good":
-            return True
-        return False, "quality_bad"
-
-    # Sovrascrivo la funzione filter_batch ereditata dalla classe padre
+        return self.filter_batch([doc])[0]
+
+    # Sovrascrivo la funzione filter_batch ereditata dalla classe padre:
+    # una sola predizione vettoriale per l'intero batch
     def filter_batch(self, batch: List[Document]) -> List[bool | Tuple[bool, str]]:
-        return [self.filter(doc) for doc in batch]
+        scores, valid = self.classifier.predict_batch(batch)
+        return self.decide_batch(batch, scores, valid)
+
+    # Decisioni e metadata a partire da score già calcolati
+    def decide_batch(self, batch: List[Document], scores: np.ndarray, valid: np.ndarray) -> List[bool | Tuple[bool, str]]:
+        results = []
+        for doc, score_good, is_valid in zip(batch, scores, valid):
+            if not is_valid:
+                doc.metadata["quality_label"] = "bad"
+                doc.metadata["quality_score"] = 0.0
+                results.append((False, "quality_missing_features"))
+                continue
+
+            score_good = float(score_good)
+            label = self._label(score_good)
+            doc.metadata["quality_label"] = label
+            doc.metadata["quality_score"] = round(score_good, 4)
+            results.append(True if label == "good" else (False, "quality_bad"))
+        return results
     
     # Definisco la funzione _predict che calcola il punteggio di qualità del documento associato alle features passate come argomento 
     # e assegna l'etichetta "good" se il punteggio supera la soglia definita nell'istanza del classificatore
     def _predict(self, features: List[float]) -> Tuple[float, str]:
-        x = pd.DataFrame([features], columns=self.classifier.feature_names) 
-        x_scaled = self.classifier.scaler.transform(x)
-        x_scaled = pd.DataFrame(x_scaled, columns=self.classifier.feature_names) 
-        proba = self.classifier.model.predict_proba(x_scaled)[0]
-        score_good = float(proba[1])
-        label = "good" if score_good >= self.classifier.threshold else "bad"
-        return score_good, label
\ No newline at end of file
+        X = np.asarray([features], dtype=FEATURE_DTYPE)
+        score_good = float(self.classifier.predict_scores(X)[0])
+        return score_good, self._label(score_good)
+
+    def _label(self, score_good: float) -> str:
+        return "good" if score_good >= self.classifier.threshold else "bad"
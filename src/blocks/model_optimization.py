@@ -0,0 +1,193 @@
+"""
+Ottimizzazione degli artifact LightGBM salvati da QualityClassifier e SpamClassifier.
+
+Gli artifact contengono un ``StandardScaler`` accanto al modello: in inferenza ogni chiamata
+paga ``scaler.transform`` e la ricostruzione del DataFrame. Gli split di un albero confrontano
+solo una feature con una soglia e lo scaling è monotono, quindi lo scaler può essere "piegato"
+nelle soglie: ``(x - mean) / scale <= t`` equivale a ``x <= T`` per una opportuna soglia ``T``
+nello spazio delle feature grezze. L'artifact risultante predice direttamente sulle feature
+grezze e ha ``scaler = None``.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import lightgbm as lgb
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+# Bit di decision_type nel model string di LightGBM: bit 0 = split categorico,
+# bit 2-3 = tipo di valore mancante (0 = None, 1 = Zero, 2 = NaN)
+_CATEGORICAL_MASK = 1
+_MISSING_TYPE_SHIFT = 2
+
+_FEATURE_INFO_RE = re.compile(r"^\[(.+):(.+)\]$")
+
+
+def scaler_params(scaler: StandardScaler, n_features: int) -> tuple[np.ndarray, np.ndarray]:
+    """Restituisce (mean, scale) dello scaler, con i valori neutri se with_mean/with_std sono disattivati."""
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    mean = np.zeros(n_features) if mean is None or not scaler.with_mean else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None or not scaler.with_std else np.asarray(scale, dtype=np.float64)
+    if len(mean) != n_features or len(scale) != n_features:
+        raise ValueError(
+            f"Lo scaler ha {len(mean)} feature, il modello {n_features}: impossibile piegarlo nelle soglie"
+        )
+    return mean, scale
+
+
+def raw_thresholds(thresholds: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """
+    Converte soglie dello spazio scalato in soglie sulle feature grezze.
+
+    Per ogni soglia ``t`` cerca il più grande double ``T`` tale che
+    ``(T - mean) / scale <= t`` calcolato in float64 come fa ``StandardScaler.transform``.
+    Poiché sottrazione e divisione in virgola mobile sono monotone, ``x <= T`` vale esattamente
+    per gli stessi ``x`` per cui vale lo split originale: il risultato non dipende da tolleranze.
+    """
+    t = np.asarray(thresholds, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    def holds(x: np.ndarray) -> np.ndarray:
+        return (x - mean) / scale <= t
+
+    T = t * scale + mean
+    # Partendo dall'approssimazione algebrica, scendo finché lo split è vero...
+    bad = ~holds(T)
+    while bad.any():
+        T[bad] = np.nextafter(T[bad], -np.inf)
+        bad = ~holds(T)
+    # ...e salgo finché anche il double successivo soddisfa lo split
+    up = np.nextafter(T, np.inf)
+    grow = holds(up) & np.isfinite(up)
+    while grow.any():
+        T[grow] = up[grow]
+        up = np.nextafter(T, np.inf)
+        grow = holds(up) & np.isfinite(up)
+    return T
+
+
+def _fold_feature_infos(line: str, mean: np.ndarray, scale: np.ndarray) -> str:
+    """Riporta nello spazio grezzo gli intervalli [min:max] informativi di feature_infos."""
+    infos = line[len("feature_infos="):].split(" ")
+    out = []
+    for i, info in enumerate(infos):
+        match = _FEATURE_INFO_RE.match(info)
+        if match is None:
+            out.append(info)
+            continue
+        lo = float(match.group(1)) * scale[i] + mean[i]
+        hi = float(match.group(2)) * scale[i] + mean[i]
+        out.append(f"[{lo!r}:{hi!r}]")
+    return "feature_infos=" + " ".join(out)
+
+
+def fold_scaler_into_booster(booster: lgb.Booster, scaler: StandardScaler) -> lgb.Booster:
+    """
+    Restituisce un nuovo Booster equivalente a ``booster`` applicato a ``scaler.transform(X)``,
+    ma che lavora sulle feature grezze.
+
+    Sono supportati solo split numerici senza gestione dei mancanti (``missing_type=None``),
+    che è il caso degli artifact del progetto: con split categorici o valori mancanti
+    "zero"/NaN la semantica dello zero nello spazio scalato non si conserva e viene sollevato ValueError.
+    """
+    model_str = booster.model_to_string()
+    n_features = booster.num_feature()
+
+    scaler_names = getattr(scaler, "feature_names_in_", None)
+    if scaler_names is not None and list(scaler_names) != booster.feature_name():
+        raise ValueError("Le feature dello scaler non coincidono con quelle del modello")
+    mean, scale = scaler_params(scaler, n_features)
+
+    lines = model_str.split("\n")
+    split_feature: Optional[np.ndarray] = None
+    for i, line in enumerate(lines):
+        if line.startswith("feature_infos="):
+            lines[i] = _fold_feature_infos(line, mean, scale)
+        elif line.startswith("split_feature="):
+            split_feature = np.array(line[len("split_feature="):].split(" "), dtype=np.int64)
+        elif line.startswith("decision_type="):
+            decision_type = np.array(line[len("decision_type="):].split(" "), dtype=np.int64)
+            if (decision_type & _CATEGORICAL_MASK).any():
+                raise ValueError("Split categorici non supportati dal folding dello scaler")
+            if ((decision_type >> _MISSING_TYPE_SHIFT) & 3).any():
+                raise ValueError("Split con gestione dei valori mancanti non supportati dal folding dello scaler")
+        elif line.startswith("threshold="):
+            if split_feature is None:
+                raise ValueError("Model string LightGBM inatteso: threshold prima di split_feature")
+            t = np.array(line[len("threshold="):].split(" "), dtype=np.float64)
+            T = raw_thresholds(t, mean[split_feature], scale[split_feature])
+            lines[i] = "threshold=" + " ".join(repr(float(v)) for v in T)
+        elif line.startswith("Tree="):
+            split_feature = None
+
+    # tree_sizes indica la lunghezza in byte di ogni albero: le nuove soglie la cambiano,
+    # senza la riga LightGBM legge gli alberi in sequenza
+    lines = [line for line in lines if not line.startswith("tree_sizes=")]
+    return lgb.Booster(model_str="\n".join(lines))
+
+
+def fold_scaler_into_model(model: lgb.LGBMClassifier, scaler: StandardScaler) -> lgb.LGBMClassifier:
+    """Copia del classificatore sklearn con il Booster piegato (stessa API predict/predict_proba)."""
+    folded = copy.deepcopy(model)
+    folded._Booster = fold_scaler_into_booster(model.booster_, scaler)
+    return folded
+
+
+def fold_artifact(artifact: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Riscrive un artifact {model, scaler, feature_names, ...} in un artifact senza scaler.
+    Le altre chiavi vengono mantenute; in ``scaler_folding`` restano media e scala originali
+    per tracciabilità.
+    """
+    scaler = artifact.get("scaler")
+    if scaler is None:
+        raise ValueError("L'artifact non contiene uno scaler da piegare (già ottimizzato?)")
+
+    folded = dict(artifact)
+    folded["model"] = fold_scaler_into_model(artifact["model"], scaler)
+    folded["scaler"] = None
+    folded["scaler_folded"] = True
+    folded["scaler_folding"] = {
+        "mean": np.asarray(getattr(scaler, "mean_", []), dtype=np.float64).tolist(),
+        "scale": np.asarray(getattr(scaler, "scale_", []), dtype=np.float64).tolist(),
+    }
+    return folded
+
+
+def prediction_diff(
+    artifact: Dict[str, Any],
+    folded: Dict[str, Any],
+    X: pd.DataFrame,
+) -> np.ndarray:
+    """Differenza assoluta tra predict_proba dell'artifact originale (con scaler) e di quello piegato."""
+    feature_names: List[str] = list(artifact["feature_names"])
+    X = X[feature_names].astype(np.float64)
+    X_scaled = pd.DataFrame(artifact["scaler"].transform(X), columns=feature_names, index=X.index)
+    original = artifact["model"].predict_proba(X_scaled)[:, 1]
+    optimized = folded["model"].predict_proba(X)[:, 1]
+    return np.abs(original - optimized)
+
+
+def synthetic_feature_frame(artifact: Dict[str, Any], n_rows: int = 20000, seed: int = 42) -> pd.DataFrame:
+    """
+    Genera righe di verifica quando non è disponibile un CSV di feature: valori gaussiani
+    attorno a media/scala dello scaler, metà arrotondati all'intero come i conteggi reali.
+    """
+    scaler = artifact["scaler"]
+    feature_names = list(artifact["feature_names"])
+    mean, scale = scaler_params(scaler, len(feature_names))
+    rng = np.random.default_rng(seed)
+    X = rng.normal(mean, scale, size=(n_rows, len(feature_names)))
+    X[: n_rows // 2] = np.round(X[: n_rows // 2])
+    return pd.DataFrame(X, columns=feature_names)
@@ -1,14 +1,185 @@
 import os
+from typing import List, Optional, Tuple
+
 from datatrove.pipeline.readers import JsonlReader
+from datatrove.utils.logging import logger
+
+# Estensioni dei file compressi: non si può saltare a un byte arbitrario, quindi vengono letti interi
+COMPRESSED_EXTENSIONS = (".gz", ".zst", ".zstd", ".bz2", ".xz", ".lz4")
+
+# Blocco usato per contare le righe che precedono l'inizio di un intervallo
+_COUNT_CHUNK = 1 << 20
+
+ByteRange = Tuple[str, int, int]
+
+
+def is_splittable(filepath: str, compression: Optional[str] = "infer") -> bool:
+    """True se si può leggere il file a partire da un byte qualsiasi (file non compresso)."""
+    if compression not in ("infer", None):
+        return False
+    return compression is None or not filepath.endswith(COMPRESSED_EXTENSIONS)
+
+
+def count_newlines(f, nbytes: int) -> int:
+    """Legge ``nbytes`` dal file binario ``f`` a blocchi e conta gli "a capo"."""
+    newlines = 0
+    remaining = nbytes
+    while remaining > 0:
+        chunk = f.read(min(_COUNT_CHUNK, remaining))
+        if not chunk:
+            break
+        newlines += chunk.count(b"\n")
+        remaining -= len(chunk)
+    return newlines
 
-def get_jsonl_reader(data_dir: str, pattern: str):
+
+class ByteRangeJsonlReader(JsonlReader):
+    """
+    JsonlReader che divide l'input in intervalli di byte invece che in file, così il numero di
+    task può superare il numero di file (es. un solo shard da leggere con 14 worker).
+
+    I file vengono visti come un unico flusso di byte diviso in ``world_size`` parti uguali; ogni
+    rank legge le porzioni di file che cadono nella sua parte. Una riga appartiene all'intervallo
+    che contiene il suo primo byte: chi inizia a metà riga la salta e chi arriva alla fine
+    dell'intervallo completa l'ultima riga, quindi nessun documento va perso o viene letto due
+    volte. Gli id di default (``path/numero_riga``) restano quelli di JsonlReader, perché le righe
+    prima dell'intervallo vengono contate. I file compressi non sono divisibili e vengono letti
+    interi dal rank in cui cade il loro primo byte.
+    """
+
+    name = "🐿 Jsonl (byte range)"
+
+    def plan_ranges(self, rank: int, world_size: int) -> List[ByteRange]:
+        """Porzioni ``(file, inizio, fine)`` assegnate al rank; deterministico, uguale su tutti i rank."""
+        files = self.data_folder.list_files(recursive=self.recursive, glob_pattern=self.glob_pattern)
+        sizes = [self.data_folder.size(path) for path in files]
+        total = sum(sizes)
+        low, high = total * rank // world_size, total * (rank + 1) // world_size
+
+        ranges = []
+        offset = 0
+        for path, size in zip(files, sizes):
+            if size > 0:
+                if not is_splittable(path, self.compression):
+                    if low <= offset < high:
+                        ranges.append((path, 0, size))
+                else:
+                    start, end = max(low, offset), min(high, offset + size)
+                    if start < end:
+                        ranges.append((path, start - offset, end - offset))
+            offset += size
+        return ranges
+
+    def read_range(self, filepath: str, start: int, end: int, lines_before: Optional[int] = None):
+        """
+        Documenti delle righe di ``filepath`` il cui primo byte cade in ``[start, end)``.
+        ``lines_before`` è il numero di "a capo" prima di ``start``, se già noto; altrimenti
+        viene contato rileggendo il file dall'inizio.
+        """
+        import orjson
+        from orjson import JSONDecodeError
+
+        if not is_splittable(filepath, self.compression):
+            yield from self.read_file(filepath)
+            return
+
+        with self.data_folder.open(filepath, "rb") as f:
+            if lines_before is None:
+                lines_before = count_newlines(f, start)
+            li = lines_before
+            position = start
+            if start > 0:
+                f.seek(start - 1)
+                # Se il byte precedente non è un "a capo" la riga corrente è iniziata prima:
+                # appartiene all'intervallo precedente
+                if f.read(1) != b"\n":
+                    position += len(f.readline())
+                    li += 1
+            while position < end:
+                line = f.readline()
+                if not line:
+                    break
+                position += len(line)
+                with self.track_time():
+                    try:
+                        data = orjson.loads(line)
+                        document = self.get_document_from_dict(data, filepath, li)
+                    except (EOFError, JSONDecodeError) as e:
+                        logger.warning(f"Error when reading `{filepath}` at line {li}: {e}")
+                        document = None
+                li += 1
+                if document:
+                    yield document
+
+    def run(self, data=None, rank: int = 0, world_size: int = 1):
+        if data:
+            yield from data
+        ranges = self.plan_ranges(rank, world_size)
+        if not ranges:
+            logger.warning(f"No byte ranges on {self.data_folder.path} for {rank=}")
+        read = 0
+        for filepath, start, end in ranges:
+            self.stat_update("input_ranges")
+            logger.info(f"Reading {filepath} bytes [{start}, {end})")
+            for document in self.read_range(filepath, start, end):
+                if self.limit != -1 and read >= self.limit:
+                    return
+                self.update_doc_stats(document)
+                read += 1
+                yield document
+
+
+class AssignedFilesJsonlReader(JsonlReader):
+    """
+    JsonlReader con i file già divisi tra i task: il rank legge ``assignment[rank]``
+    (percorsi relativi a ``data_folder``), per esempio i gruppi bilanciati per byte costruiti da
+    utils.input_manifest.pack_files. Non rielenca la cartella a ogni task.
+    """
+
+    name = "🐿 Jsonl (manifest)"
+
+    def __init__(self, data_folder, assignment: List[List[str]], **kwargs):
+        super().__init__(data_folder, **kwargs)
+        self.assignment = assignment
+
+    def run(self, data=None, rank: int = 0, world_size: int = 1):
+        if data:
+            yield from data
+        if world_size != len(self.assignment):
+            raise ValueError(f"Assegnazione per {len(self.assignment)} task, ma l'executor ne usa {world_size}")
+        files_shard = self.assignment[rank]
+        if not files_shard:
+            logger.warning(f"No files assigned to {rank=}")
+        for doc in self.read_files_shard(files_shard):
+            self.update_doc_stats(doc)
+            yield doc
+
+
+def get_jsonl_reader(
+    data_dir: str,
+    pattern: str,
+    byte_ranges: bool = False,
+    work_queue_dir: Optional[str] = None,
+    file_assignment: Optional[List[List[str]]] = None,
+):
     """
     Inizializza il lettore per file JSONL.
-    
+
     Legge i dati dalla cartella specificata cercando il pattern dei file.
     Predefinito: rp_normalized.jsonl (il tuo dataset da 11k).
+    Con byte_ranges=True i file vengono divisi in intervalli di byte allineati alle righe
+    (ByteRangeJsonlReader), così ogni task legge una parte dell'input anche se i file sono pochi.
+    Con work_queue_dir i task prendono le unità di input dalla coda condivisa creata con
+    blocks.work_queue.prepare_work_queue (WorkQueueJsonlReader).
+    Con file_assignment ogni task legge il proprio gruppo di file (AssignedFilesJsonlReader).
     """
-    return JsonlReader(
+    if file_assignment is not None:
+        return AssignedFilesJsonlReader(data_folder=data_dir, assignment=file_assignment, glob_pattern=pattern)
+    if work_queue_dir is not None:
+        from .work_queue import WorkQueueJsonlReader
+        return WorkQueueJsonlReader(data_folder=data_dir, queue_dir=work_queue_dir, glob_pattern=pattern)
+    reader_cls = ByteRangeJsonlReader if byte_ranges else JsonlReader
+    return reader_cls(
         data_folder=data_dir,
         glob_pattern=pattern
-    )
\ No newline at end of file
+    )
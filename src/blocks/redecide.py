@@ -0,0 +1,202 @@
+"""
+Blocchi per ridecidere spam e qualità sugli output di un'esecuzione precedente.
+
+I documenti tenuti (``italiano_pulito_*.jsonl``) e quelli scartati da spam e qualità
+(``rejected/2_spam``, ``rejected/3_quality``) hanno già nei metadata ``spam_pred_score``, le
+feature spam, le statistiche di DocStatsCsv e ``language_score``: basta cancellare le vecchie
+decisioni e farli ripassare dai filtri con nuove soglie o nuovi modelli.
+
+Nove statistiche di DocStatsCsv hanno lo stesso nome di una feature spam (``word_count``,
+``digit_ratio``, ...) e nei metadata dei documenti arrivati a DocStatsCsv l'hanno sovrascritta:
+SpamFeatureExtractor ne salva quindi anche una copia ``spam_*`` (SHARED_FEATURE_COLUMNS), da cui
+un nuovo modello spam rilegge le feature senza toccare il testo. Se mancano feature (output di
+una versione precedente o feature che il modello precedente non leggeva) RedecideSpamFilter si
+ferma con un errore invece di ricalcolarle. Fanno eccezione i documenti che non sono mai
+arrivati a un filtro: gli scarti dello spam che ora passano non hanno le statistiche, che
+vengono prese dall'archivio o calcolate solo per loro, e gli scarti della qualità valutata prima
+dello spam non hanno le feature spam.
+Gli scarti della lingua (``rejected/1_language``) non dipendono da queste soglie.
+
+Con un ordine dei filtri diverso (blocks.filter_planner) la qualità può venire prima dello spam:
+gli scarti della qualità non hanno ``spam_pred_score`` e vengono valutati dal modello spam, gli
+scarti dello spam hanno le statistiche ma con le chiavi comuni sovrascritte dalle feature spam,
+e ResetDecisions le toglie perché FillQualityFeatures le ricalcoli.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from datatrove.data import Document, DocumentsPipeline
+from datatrove.pipeline.base import PipelineStep
+
+from .classifiers import DEFAULT_FEATURE_NAMES
+from .feature_store import DEFAULT_MAX_ROWS
+from .spam_classifier.spam_cascade import is_short_circuited
+from .spam_classifier.spam_classifier import SpamFilter
+from .spam_classifier.spam_stats import (
+    FEATURE_COLUMNS,
+    SHARED_FEATURE_COLUMNS,
+    SPAM_COPY_PREFIX,
+    SpamFeatureExtractor,
+    write_spam_features,
+)
+from .stats import STATS_MARKER_KEY, DocStatsCsv
+
+# Metadata scritti da SpamFilter, ItalianClassification e dall'exclusion writer di DataTrove.
+# spam_pred_score resta: è lo score da cui riparte RedecideSpamFilter con il modello invariato
+SPAM_DECISION_KEYS = (
+    "spam_pred_label",
+    "spam_strong_evidence",
+    "spam_reject_reason",
+    "spam_uncertain_reason",
+)
+QUALITY_DECISION_KEYS = ("quality_label", "quality_score", "filter_reason")
+
+# Statistiche di DocStatsCsv con lo stesso nome di una feature spam
+SHARED_FEATURE_KEYS = tuple(name for name in DEFAULT_FEATURE_NAMES if name in FEATURE_COLUMNS)
+
+# Cartelle degli scarti che vengono ridecisi; le altre vengono copiate così come sono
+REDECIDED_REJECTED = ("2_spam", "3_quality")
+
+
+def redecide_inputs(output_dir: str, rejected_dir: str, kept_pattern: str = "italiano_pulito_*.jsonl") -> Dict[str, List[str]]:
+    """File JSONL da ridecidere: documenti tenuti e scarti di spam e qualità, per categoria."""
+    inputs = {"kept": sorted(glob.glob(os.path.join(output_dir, kept_pattern)))}
+    for folder in REDECIDED_REJECTED:
+        inputs[folder] = sorted(glob.glob(os.path.join(rejected_dir, folder, "*.jsonl")))
+    return inputs
+
+
+class ResetDecisions(PipelineStep):
+    """
+    Cancella dai metadata le decisioni dell'esecuzione precedente, lasciando le feature. I documenti
+    decisi ham da SpamCascade non hanno feature spam: la loro decisione spam resta quella della cascata.
+    Un documento scartato dallo spam dopo essere passato dalla qualità (qualità prima dello spam)
+    perde anche le statistiche sovrascritte dalle feature spam (SHARED_FEATURE_KEYS).
+    """
+
+    name = "Reset Decisions"
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1) -> DocumentsPipeline:
+        for doc in data:
+            keys = QUALITY_DECISION_KEYS if is_short_circuited(doc) else SPAM_DECISION_KEYS + QUALITY_DECISION_KEYS
+            if "spam_reject_reason" in doc.metadata and "quality_label" in doc.metadata:
+                keys += SHARED_FEATURE_KEYS
+            for key in keys:
+                doc.metadata.pop(key, None)
+            yield doc
+
+
+class FillQualityFeatures(PipelineStep):
+    """
+    Aggiunge le statistiche di DocStatsCsv ai documenti che non le hanno (gli scarti dello spam).
+    ``features`` sono le statistiche lette dal modello qualità
+    (``ItalianClassification.required_features()``); con ``None`` quelle di
+    ``DEFAULT_FEATURE_NAMES``. Con ``feature_store`` vengono cercate prima nell'archivio per
+    digest; il CSV delle statistiche non viene riscritto.
+    """
+
+    name = "Fill Quality Features"
+
+    def __init__(self, feature_dir: str, features: Optional[List[str]] = None, feature_store: Optional[str] = None, feature_store_max_rows: int = DEFAULT_MAX_ROWS):
+        super().__init__()
+        self.required = list(features) if features is not None else [name for name in DEFAULT_FEATURE_NAMES if name != "language_score"]
+        self.extractor = DocStatsCsv(
+            output_folder=feature_dir,
+            groups_to_compute=["summary"],
+            feature_store=feature_store,
+            feature_store_max_rows=feature_store_max_rows,
+            features=self.required,
+        )
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1) -> DocumentsPipeline:
+        for doc in data:
+            if all(name in doc.metadata for name in self.required):
+                self.stat_update("stored")
+            else:
+                self.stat_update("filled")
+                with self.track_time():
+                    doc.metadata.update(self.extractor.cached_stats(doc))
+                    doc.metadata[STATS_MARKER_KEY] = True
+            yield doc
+        if self.extractor.feature_store is not None:
+            self.extractor.feature_store.close()
+
+
+class RedecideSpamFilter(SpamFilter):
+    """
+    SpamFilter per documenti già classificati. Con ``rescore=False`` (stesso modello) usa lo
+    ``spam_pred_score`` salvato e riapplica soltanto soglia e regole di evidenza forte; con
+    ``rescore=True`` ricalcola lo score con il modello sulle feature spam dei metadata, con le
+    copie ``spam_*`` al posto delle statistiche di DocStatsCsv con lo stesso nome. Se al modello
+    manca una feature solleva ValueError. I documenti senza score salvato (scartati dalla qualità
+    prima dello spam) non hanno feature spam: vengono prese dall'archivio (``feature_store``) o
+    calcolate, e valutate dal modello anche con ``rescore=False``.
+    """
+
+    name = "Spam Filter (redecide)"
+
+    def __init__(self, *args, rescore: bool = False, feature_store: Optional[str] = None, feature_store_max_rows: int = DEFAULT_MAX_ROWS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rescore = rescore
+        # Solo le feature lette dal nuovo modello e dalle regole (blocks.feature_graph)
+        self.required = self.required_features()
+        self.spam_features = SpamFeatureExtractor(
+            feature_store=feature_store,
+            feature_store_max_rows=feature_store_max_rows,
+            features=self.required,
+        )
+
+    def score_batch(self, docs: List[Document]):
+        # Documenti mai passati dallo spam (scartati dalla qualità prima dello spam): senza score salvato
+        unscored = [i for i, doc in enumerate(docs) if "spam_pred_score" not in doc.metadata]
+        if self.rescore:
+            views = [self._spam_view(doc) for doc in docs]
+            scores, valid = self.classifier.predict_batch(views)
+        else:
+            scores = np.array([float(doc.metadata.get("spam_pred_score", 0.0)) for doc in docs], dtype=float)
+            valid = np.ones(len(docs), dtype=bool)
+            views = {i: self._spam_view(docs[i]) for i in unscored}
+            if unscored:
+                scores[unscored], valid[unscored] = self.classifier.predict_batch([views[i] for i in unscored])
+        if unscored:
+            self.stat_update("spam_unscored", value=len(unscored))
+        # Le regole di evidenza forte leggono le feature spam dai metadata: come nell'ordine
+        # predefinito le statistiche con lo stesso nome restano quelle di DocStatsCsv
+        for i in unscored:
+            docs[i].metadata.update({k: v for k, v in views[i].metadata.items() if k not in SHARED_FEATURE_KEYS})
+        return scores, valid
+
+    def _spam_view(self, doc: Document) -> Document:
+        metadata = dict(doc.metadata)
+        if "spam_pred_score" not in metadata:
+            # Mai arrivato allo spam: le feature non sono mai state calcolate
+            self.stat_update("spam_features_extracted")
+            write_spam_features(metadata, self.spam_features.features_for(doc))
+            return Document(text=doc.text, id=doc.id, metadata=metadata)
+        # Il documento è passato da DocStatsCsv: le chiavi comuni sono statistiche, le feature spam
+        # sono nelle copie
+        passed_stats = STATS_MARKER_KEY in metadata
+        for name in SHARED_FEATURE_COLUMNS:
+            copy = SPAM_COPY_PREFIX + name
+            if copy in metadata:
+                metadata[name] = metadata[copy]
+            elif passed_stats:
+                metadata.pop(name, None)
+        missing = [name for name in self.required if name not in metadata]
+        if missing:
+            raise ValueError(
+                f"Documento {doc.id}: feature spam {missing} assenti dai metadata. Il nuovo modello "
+                f"legge feature non salvate dall'esecuzione precedente: rieseguire la pipeline "
+                f"(con --all-features per salvarle tutte)"
+            )
+        return Document(text=doc.text, id=doc.id, metadata=metadata)
+
+    def run(self, data, rank: int = 0, world_size: int = 1):
+        yield from super().run(data, rank, world_size)
+        if self.spam_features.feature_store is not None:
+            self.spam_features.feature_store.close()
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import joblib
+import numpy as np
+
+from datatrove.data import DocumentsPipeline
+from datatrove.pipeline.base import PipelineStep
+
+from .spam_keywords import (
+    ACCOUNT_TERMS,
+    AMOUNT_RE,
+    CTA_TERMS,
+    EMAIL_RE,
+    HAM_BUSINESS_TERMS,
+    ITALIAN_STOPWORDS_MINI,
+    MONEY_TERMS,
+    SECURITY_TERMS,
+    SPAM_TERMS,
+    URGENCY_TERMS,
+    URL_RE,
+    normalize_for_matching,
+)
+from ..text_analysis import STREAMING_MIN_CHARS, AnalyzedDocument, SharedAnalysisUser, analyze_document
+
+logger = logging.getLogger(__name__)
+
+# Chiave dei metadata con l'esito della cascata: i documenti "short_circuit" sono stati
+# decisi ham dal modello leggero e saltano SpamFeatureExtractor e SpamFilter
+CASCADE_KEY = "spam_cascade"
+CASCADE_SHORT_CIRCUIT = "short_circuit"
+CASCADE_FULL = "full"
+
+DEFAULT_CASCADE_MODEL = "spam_cascade.joblib"
+
+# Sotto questa quota di stopword il testo non è considerato prosa "normale"
+MIN_STOPWORD_RATIO = 0.2
+
+
+def _normalized_terms(terms: Iterable[str]) -> Counter:
+    """
+    Normalizza i termini come count_term_matches, mantenendo la molteplicità dei termini che
+    diventano uguali (es. "identità"/"identita"), che count_term_matches conta due volte.
+    I termini che diventano vuoti (€, $) vengono scartati: contano solo su testi senza parole.
+    """
+    return Counter(t for t in (normalize_for_matching(term) for term in terms) if t)
+
+
+_CTA = _normalized_terms(CTA_TERMS)
+_MONEY = _normalized_terms(MONEY_TERMS)
+_URGENCY = _normalized_terms(URGENCY_TERMS)
+_ACCOUNT = _normalized_terms(ACCOUNT_TERMS)
+_SECURITY = _normalized_terms(SECURITY_TERMS)
+_SPAM = _normalized_terms(SPAM_TERMS)
+_HAM = _normalized_terms(HAM_BUSINESS_TERMS)
+_STOPWORDS = frozenset(_normalized_terms(ITALIAN_STOPWORDS_MINI))
+_MAX_TERM_WORDS = max(len(t.split()) for t in (_SPAM | _HAM))
+
+CHEAP_FEATURE_NAMES: List[str] = [
+    "log_char_count",
+    "url_count",
+    "email_count",
+    "amount_count",
+    "cta_hits",
+    "money_hits",
+    "urgency_hits",
+    "account_hits",
+    "security_hits",
+    "spam_hits",
+    "ham_hits",
+    "stopword_ratio",
+    "uppercase_ratio",
+    "digit_ratio",
+    "exclamation_ratio",
+]
+
+
+def _term_ngrams(tokens: List[str]) -> Counter:
+    """
+    Occorrenze di tutti gli n-grammi di token fino alla lunghezza del termine più lungo.
+    Sul testo normalizzato un termine compare come " termine " esattamente quando è uno di questi
+    n-grammi; str.count non conta le occorrenze sovrapposte, quindi questi conteggi sono un limite
+    superiore di quelli di count_term_matches.
+    """
+    grams = Counter(tokens)
+    for n in range(2, _MAX_TERM_WORDS + 1):
+        grams.update(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return grams
+
+
+def _group_hits(group: Counter, grams: Counter) -> float:
+    return float(sum(mult * grams[term] for term, mult in group.items() if term in grams))
+
+
+def cheap_spam_features(text: str, analysis: Optional[AnalyzedDocument] = None) -> Dict[str, float]:
+    """
+    Feature O(n) per il primo livello della cascata: una sola normalizzazione, il conteggio
+    degli n-grammi e tre regex. I conteggi lessicali non sono mai inferiori a quelli di keyword_bundle.
+    Testo normalizzato e conteggi dei caratteri restano nell'analisi condivisa del documento,
+    quindi i documenti che proseguono nel percorso completo non li ricalcolano.
+    """
+    analysis = analysis or AnalyzedDocument(text)
+    text = analysis.text
+    char_count = len(text)
+    tokens = analysis.normalized.split()
+    grams = _term_ngrams(tokens)
+    n_tokens = len(tokens)
+    chars = analysis.char_classes
+
+    return {
+        "log_char_count": math.log1p(char_count),
+        "url_count": float(len(analysis.findall(URL_RE))),
+        "email_count": float(len(analysis.findall(EMAIL_RE))),
+        "amount_count": float(len(analysis.findall(AMOUNT_RE))),
+        "cta_hits": _group_hits(_CTA, grams),
+        "money_hits": _group_hits(_MONEY, grams),
+        "urgency_hits": _group_hits(_URGENCY, grams),
+        "account_hits": _group_hits(_ACCOUNT, grams),
+        "security_hits": _group_hits(_SECURITY, grams),
+        "spam_hits": _group_hits(_SPAM, grams),
+        "ham_hits": _group_hits(_HAM, grams),
+        "stopword_ratio": (sum(1 for t in tokens if t in _STOPWORDS) / n_tokens) if n_tokens else 0.0,
+        "uppercase_ratio": (chars["upper"] / char_count) if char_count else 0.0,
+        "digit_ratio": (chars["digit"] / char_count) if char_count else 0.0,
+        "exclamation_ratio": (analysis.count_char("!") / char_count) if char_count else 0.0,
+    }
+
+
+def passes_cheap_gate(features: Dict[str, float]) -> bool:
+    """
+    Condizioni necessarie per decidere ham senza il percorso completo.
+
+    Escludono ogni regola di SpamFilter._strong_evidence_mask che non dipende dallo score
+    del modello: nessun URL (TLD sospetti, shortener, CTA/urgenza/brand/consegna + link),
+    niente denaro insieme a CTA, niente account insieme a sicurezza, meno di 4 keyword spam
+    se sono presenti CTA, urgenza o denaro. In più il testo deve essere prosa, con una quota
+    minima di stopword. Resta solo la regola sullo score >= 0.90, coperta dal modello leggero.
+    """
+    if features["stopword_ratio"] < MIN_STOPWORD_RATIO or features["url_count"] > 0:
+        return False
+    has_money = features["money_hits"] > 0 or features["amount_count"] > 0
+    has_cta = features["cta_hits"] > 0
+    if has_money and has_cta:
+        return False
+    if features["account_hits"] > 0 and features["security_hits"] > 0:
+        return False
+    if features["spam_hits"] >= 4 and (has_cta or has_money or features["urgency_hits"] > 0):
+        return False
+    return True
+
+
+class SpamCascadeModel:
+    """
+    Modello lineare minimo (regressione logistica) sulle feature economiche.
+
+    Stima la probabilità che il percorso completo (extract_spam_features + SpamFilter) scarti
+    il documento. I coefficienti sono già riportati sulla scala delle feature grezze, quindi
+    lo score è un prodotto scalare e una sigmoide, senza sklearn in inferenza.
+    """
+
+    def __init__(
+        self,
+        coef: np.ndarray,
+        intercept: float,
+        ham_threshold: float,
+        feature_names: Optional[List[str]] = None,
+        training_metadata: Optional[dict] = None,
+    ):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.ham_threshold = float(ham_threshold)
+        self.feature_names = list(feature_names or CHEAP_FEATURE_NAMES)
+        self.training_metadata = training_metadata or {}
+
+    @classmethod
+    def load(cls, path: str) -> "SpamCascadeModel":
+        artifact = joblib.load(path)
+        return cls(
+            coef=artifact["coef"],
+            intercept=artifact["intercept"],
+            ham_threshold=artifact["ham_threshold"],
+            feature_names=artifact.get("feature_names"),
+            training_metadata=artifact.get("training_metadata"),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump(
+            {
+                "coef": self.coef,
+                "intercept": self.intercept,
+                "ham_threshold": self.ham_threshold,
+                "feature_names": self.feature_names,
+                "model_name": "spam_cascade_logreg",
+                "training_metadata": self.training_metadata,
+            },
+            path,
+        )
+        print(f"[OK] Modello cascata salvato in: {path}")
+
+    def reject_probability(self, features: Dict[str, float]) -> float:
+        x = np.fromiter((features[name] for name in self.feature_names), dtype=np.float64, count=len(self.feature_names))
+        return float(1.0 / (1.0 + math.exp(-(float(self.coef @ x) + self.intercept))))
+
+    def is_confident_ham(self, features: Dict[str, float]) -> tuple[bool, float]:
+        """Restituisce (short-circuit, probabilità di scarto stimata)."""
+        if not passes_cheap_gate(features):
+            return False, float("nan")
+        p = self.reject_probability(features)
+        return p < self.ham_threshold, p
+
+    @staticmethod
+    def fit(
+        X: np.ndarray,
+        rejected: np.ndarray,
+        gate: np.ndarray,
+        max_disagreement: float = 0.0,
+        random_state: int = 42,
+    ) -> "SpamCascadeModel":
+        """
+        Addestra la regressione logistica sui documenti che superano il gate e sceglie la soglia.
+
+        Target: 1 se il percorso completo scarta il documento. La soglia ham è la più alta per cui,
+        tra i documenti del gate con score sotto soglia, la quota scartata dal percorso completo
+        non supera ``max_disagreement``.
+        """
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+
+        X_gate = X[gate]
+        y_gate = rejected[gate].astype(int)
+        if len(X_gate) == 0 or y_gate.min() == y_gate.max():
+            raise ValueError("Servono documenti del gate sia scartati sia mantenuti dal percorso completo")
+
+        scaler = StandardScaler().fit(X_gate)
+        lr = LogisticRegression(class_weight="balanced", max_iter=1000, random_state=random_state)
+        lr.fit(scaler.transform(X_gate), y_gate)
+
+        # Coefficienti sulla scala grezza: w·(x - m)/s + b = (w/s)·x + (b - w·m/s)
+        coef = lr.coef_[0] / scaler.scale_
+        intercept = float(lr.intercept_[0] - np.sum(lr.coef_[0] * scaler.mean_ / scaler.scale_))
+
+        z = X_gate @ coef + intercept
+        p = 1.0 / (1.0 + np.exp(-z))
+        order = np.argsort(p, kind="stable")
+        p_sorted, y_sorted = p[order], y_gate[order]
+        # Per ogni prefisso (soglia subito sopra p_sorted[k]) quota di scartati tra i short-circuit
+        rejected_cum = np.cumsum(y_sorted)
+        counts = np.arange(1, len(y_sorted) + 1)
+        ok = rejected_cum <= max_disagreement * counts
+        # Prefisso più lungo che rispetta il vincolo e non spezza score uguali
+        valid = ok & np.append(p_sorted[1:] > p_sorted[:-1], True)
+        if valid.any():
+            k = int(np.flatnonzero(valid).max())
+            ham_threshold = float(np.nextafter(p_sorted[k], np.inf))
+        else:
+            ham_threshold = 0.0
+
+        return SpamCascadeModel(
+            coef=coef,
+            intercept=intercept,
+            ham_threshold=ham_threshold,
+            training_metadata={
+                "n_gate": int(len(X_gate)),
+                "n_gate_rejected": int(y_gate.sum()),
+                "max_disagreement": float(max_disagreement),
+            },
+        )
+
+
+class SpamCascade(SharedAnalysisUser, PipelineStep):
+    """
+    Primo livello della cascata spam, da inserire prima di SpamFeatureExtractor.
+    Calcola poche feature O(n) e, se il modello leggero è sicuro che il documento sia ham,
+    lo marca come short-circuit: estrazione completa delle feature e SpamFilter vengono saltati.
+    Gli altri documenti proseguono invariati nel percorso completo, come quelli da almeno
+    STREAMING_MIN_CHARS caratteri: le feature leggere costruirebbero token e n-grammi dell'intero
+    testo, mentre SpamFeatureExtractor li legge a blocchi.
+    """
+    name = "Spam Cascade"
+
+    def __init__(self, model_path: str):
+        super().__init__()
+        self.model_path = model_path
+        self.model = SpamCascadeModel.load(model_path)
+
+    def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1):
+        self.open_analysis_window()
+        for doc in data:
+            if doc.metadata is None:
+                doc.metadata = {}
+            if len(doc.text or "") >= STREAMING_MIN_CHARS:
+                doc.metadata[CASCADE_KEY] = CASCADE_FULL
+                self.stat_update("full_path_streamed")
+                yield doc
+                continue
+            with self.track_time():
+                features = cheap_spam_features(doc.text, analyze_document(doc))
+                short_circuit, p = self.model.is_confident_ham(features)
+                self.done_with_analysis(doc)
+            if short_circuit:
+                doc.metadata[CASCADE_KEY] = CASCADE_SHORT_CIRCUIT
+                doc.metadata["spam_cascade_score"] = round(p, 6)
+                doc.metadata["spam_pred_label"] = "ham"
+                self.stat_update("short_circuit")
+            else:
+                doc.metadata[CASCADE_KEY] = CASCADE_FULL
+                self.stat_update("full_path")
+            yield doc
+        self.close_analysis_window()
+
+
+def is_short_circuited(doc) -> bool:
+    metadata = getattr(doc, "metadata", None) or {}
+    return metadata.get(CASCADE_KEY) == CASCADE_SHORT_CIRCUIT
@@ -15,10 +15,22 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 
 from datatrove.pipeline.base import PipelineStep
-from datatrove.data import DocumentsPipeline
+from datatrove.data import Document, DocumentsPipeline
 from datatrove.pipeline.filters.base_filter import BaseFilter
 from datatrove.pipeline.writers import JsonlWriter
-
+from datatrove.utils.batching import batched
+
+from ..classifiers import DEFAULT_BATCH_SIZE, DEFAULT_MODEL_BACKEND, MODEL_BACKENDS
+from ..feature_cost import (
+    DEFAULT_AUC_BUDGET,
+    FeatureCostModel,
+    format_cost_report,
+    inner_selection,
+    record_test_check,
+    select_features_by_cost,
+)
+from ..tree_predictor import TreeEnsemblePredictor
+from .spam_cascade import is_short_circuited
 from .spam_stats import FEATURE_COLUMNS
 
 logger = logging.getLogger(__name__)
@@ -61,6 +73,7 @@ EXCLUDED_TRAINING_FEATURES = {
     "language",
     "lang_score",
     "minhash_cluster_size",
+    "dedup_cluster_size",
     "lang_is_ita",
 
     # feat costanti
@@ -101,6 +114,27 @@ DEFAULT_FEATURE_NAMES: List[str] = [
     c for c in FEATURE_COLUMNS if c not in EXCLUDED_TRAINING_FEATURES
 ]
 
+# Metadata letti dalle regole di evidenza forte di SpamFilter (l'ordine definisce le colonne
+# della matrice usata da SpamFilter._strong_evidence_mask). Alcune non sono feature del modello.
+STRONG_EVIDENCE_FEATURES: List[str] = [
+    "url_count_text",
+    "suspicious_tld_count",
+    "shortener_url_count",
+    "spam_keyword_hits",
+    "cta_keyword_hits",
+    "urgency_keyword_hits",
+    "money_keyword_hits",
+    "account_keyword_hits",
+    "security_keyword_hits",
+    "delivery_keyword_hits",
+    "brand_keyword_hits",
+    "cta_plus_url_score",
+    "urgency_cta_url_combo",
+    "money_cta_combo",
+    "ham_business_hits",
+    "ham_strength_score",
+]
+
 
 class SpamClassifier(PipelineStep):
     """
@@ -115,14 +149,20 @@ class SpamClassifier(PipelineStep):
         model_path: str,
         feature_names: Optional[List[str]] = None,
         threshold: Optional[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        backend: str = DEFAULT_MODEL_BACKEND,
     ):
         super().__init__()
+        if backend not in MODEL_BACKENDS:
+            raise ValueError(f"Backend '{backend}' non valido. Ammessi: {MODEL_BACKENDS}")
         self.model_path = model_path
+        self.batch_size = max(1, int(batch_size))
         
         artifact = joblib.load(self.model_path)
         
         self.model: lgb.LGBMClassifier = artifact["model"]
-        self.scaler: StandardScaler = artifact["scaler"]
+        # None se l'artifact è stato ottimizzato con lo scaler piegato nelle soglie degli alberi
+        self.scaler: Optional[StandardScaler] = artifact.get("scaler")
         self._feature_names_train: List[str] = artifact.get("feature_names", DEFAULT_FEATURE_NAMES)
 
         # Se non viene passata una soglia esplicita, usa quella salvata nell'artifact del modello; 
@@ -132,11 +172,18 @@ class SpamClassifier(PipelineStep):
 
         self.feature_names = feature_names or self._feature_names_train
 
+        # Backend "numpy": predittore ad array piatti con lo scaler già piegato nelle soglie
+        self.backend = backend
+        self.predictor: Optional[TreeEnsemblePredictor] = (
+            TreeEnsemblePredictor.from_artifact(artifact) if backend == "numpy" else None
+        )
+
         logger.info(
-            "Spam model caricato da %s | feature=%d | threshold=%.3f",
+            "Spam model caricato da %s | feature=%d | threshold=%.3f | backend=%s",
             self.model_path,
             len(self.feature_names),
             self.threshold,
+            self.backend,
         )
 
     def _extract_features(self, doc) -> Optional[List[float]]:
@@ -155,53 +202,76 @@ class SpamClassifier(PipelineStep):
             return None
 
     def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1):
-        for doc in data:
-            feats = self._extract_features(doc)
-            if feats is None:
-                doc.metadata["spam_pred_label"] = "ham"
-                doc.metadata["spam_pred_score"] = 0.0
+        for batch in batched(data, self.batch_size):
+            scores, valid = self.predict_batch(batch)
+            for doc, spam_score, is_valid in zip(batch, scores, valid):
+                if not is_valid:
+                    doc.metadata["spam_pred_label"] = "ham"
+                    doc.metadata["spam_pred_score"] = 0.0
+                    yield doc
+                    continue
+
+                spam_score = float(spam_score)
+                doc.metadata["spam_pred_label"] = self._label(spam_score)
+                doc.metadata["spam_pred_score"] = round(spam_score, 6)
                 yield doc
-                continue
-
-            X = pd.DataFrame(
-                [feats],
-                columns=self.feature_names,
-            )
-            
-            Xs = pd.DataFrame(
-                self.scaler.transform(X),
-                columns=self.feature_names,
-                index=X.index,
-            )
-            
-            proba = self.model.predict_proba(Xs)[0]
-            spam_score = float(proba[1])
-            pred_label = "spam" if spam_score >= self.threshold else "ham"
 
+    def _label(self, spam_score: float) -> str:
+        return "spam" if spam_score >= self.threshold else "ham"
 
-            doc.metadata["spam_pred_label"] = pred_label
-            doc.metadata["spam_pred_score"] = round(spam_score, 6)
-            yield doc
-
-    def _predict_from_features(self, feats: List[float]) -> Tuple[str, float]:
-        X = pd.DataFrame(
-            [feats],
-            columns=self.feature_names,
-        )
-
+    def _build_feature_matrix(self, docs: List[Document]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Costruisce la matrice (n_docs x n_feature) in float64, lo stesso tipo del DataFrame a riga singola
+        usato da predict_doc, così gli score restano identici bit per bit.
+        Restituisce anche la maschera dei documenti con feature convertibili: le altre righe restano a zero.
+        """
+        X = np.zeros((len(docs), len(self.feature_names)), dtype=np.float64)
+        valid = np.ones(len(docs), dtype=bool)
+        for i, doc in enumerate(docs):
+            feats = self._extract_features(doc)
+            if feats is None:
+                valid[i] = False
+                continue
+            X[i] = feats
+        return X, valid
+
+    def predict_scores(self, X: np.ndarray) -> np.ndarray:
+        """Calcola P(spam) per ogni riga con una sola transform e una sola predict_proba."""
+        if len(X) == 0:
+            return np.empty(0, dtype=float)
+        if self.predictor is not None:
+            return self.predictor.predict_proba(X)[:, 1]
+        if self.scaler is None:
+            # Artifact con scaler piegato nelle soglie (blocks.model_optimization): feature grezze
+            return self.model.predict_proba(X)[:, 1]
         Xs = pd.DataFrame(
-            self.scaler.transform(X),
+            self.scaler.transform(pd.DataFrame(X, columns=self.feature_names, copy=False)),
             columns=self.feature_names,
-            index=X.index,
         )
+        return self.model.predict_proba(Xs)[:, 1]
 
-        proba = self.model.predict_proba(Xs)[0]
-        spam_score = float(proba[1])
-        pred_label = "spam" if spam_score >= self.threshold else "ham"
-
-        return pred_label, spam_score
+    def scale_features(self, X: pd.DataFrame) -> np.ndarray | pd.DataFrame:
+        """Applica lo scaler di training; con un artifact ottimizzato senza scaler restituisce X invariato."""
+        if self.scaler is None:
+            return X
+        return self.scaler.transform(X)
 
+    def predict_batch(self, docs: List[Document]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Restituisce gli score P(spam) del batch e la maschera dei documenti validi.
+        Ai documenti con feature non numeriche viene assegnato score 0.0 (trattati come ham).
+        """
+        X, valid = self._build_feature_matrix(docs)
+        scores = np.zeros(len(docs), dtype=float)
+        if valid.all():
+            scores = self.predict_scores(X)
+        elif valid.any():
+            scores[valid] = self.predict_scores(X[valid])
+        return scores, valid
 
+    def _predict_from_features(self, feats: List[float]) -> Tuple[str, float]:
+        spam_score = float(self.predict_scores(np.asarray([feats], dtype=np.float64))[0])
+        return self._label(spam_score), spam_score
 
     def predict_doc(self, doc) -> Tuple[str, float]:
         feats = self._extract_features(doc)
@@ -210,6 +280,24 @@ class SpamClassifier(PipelineStep):
         return self._predict_from_features(feats)
     
     
+    @staticmethod
+    def _new_model(n_estimators: int, learning_rate: float, random_state: int) -> lgb.LGBMClassifier:
+        """Modello LightGBM usato da train_from_csv (anche per i riaddestramenti della selezione per costo)."""
+        return lgb.LGBMClassifier(
+            objective="binary",
+            n_estimators=n_estimators,
+            learning_rate=learning_rate,
+            num_leaves=15,
+            min_child_samples=10,
+            subsample=0.9,
+            colsample_bytree=0.9,
+            reg_alpha=0.2,
+            reg_lambda=0.2,
+            random_state=random_state,
+            class_weight="balanced",
+            verbosity=-1,
+        )
+
     @staticmethod
     def _resolve_label_column(df: pd.DataFrame, label_column: Optional[str] = None) -> str:
         """
@@ -281,6 +369,8 @@ class SpamClassifier(PipelineStep):
         random_state: int = 42,
         threshold: float = 0.6,   
         errors_output_dir: Optional[str] = None, 
+        cost_model: Optional[FeatureCostModel] = None,
+        auc_budget: float = DEFAULT_AUC_BUDGET,
 
     ) -> dict:
         
@@ -288,6 +378,10 @@ class SpamClassifier(PipelineStep):
         Addestra il modello spam/ham a partire dal CSV delle feature.
         La funzione risolve la colonna label, seleziona le feature ammesse, rimuove colonne costanti, 
         esegue lo split train/test, addestra LightGBM e salva file di analisi sugli errori di classificazione.
+        Con ``cost_model`` (blocks.feature_cost, misurato su SPAM_FEATURE_GRAPH con le feature delle
+        regole di evidenza forte come fisse) toglie poi le feature costose e poco importanti finché la
+        ROC-AUC media su fold delle sole righe di training non perde più di ``auc_budget``, e
+        riaddestra sulle feature scelte; il budget viene poi controllato sul test split.
         """
         df = pd.read_csv(csv_path)
 
@@ -319,6 +413,7 @@ class SpamClassifier(PipelineStep):
             "language",
             "language_score",
             "minhash_cluster_size",
+            "dedup_cluster_size",
         }
 
         bad_used = [c for c in feat_names if c in forbidden_features]
@@ -396,20 +491,7 @@ class SpamClassifier(PipelineStep):
         ) 
 
 
-        model = lgb.LGBMClassifier(
-            objective="binary",
-            n_estimators=n_estimators,
-            learning_rate=learning_rate,
-            num_leaves=15,
-            min_child_samples=10,
-            subsample=0.9,
-            colsample_bytree=0.9,
-            reg_alpha=0.2,
-            reg_lambda=0.2,
-            random_state=random_state,
-            class_weight="balanced",
-            verbosity=-1,
-        )
+        model = SpamClassifier._new_model(n_estimators, learning_rate, random_state)
         model.fit(X_train_s, y_train)
         
         y_prob = model.predict_proba(X_test_s)[:, 1]
@@ -523,6 +605,40 @@ class SpamClassifier(PipelineStep):
         print("\nTop feature importance:")
         print(importances.to_string(index=False))
 
+        if cost_model is not None and auc is not None:
+            # La selezione vede solo le righe di training: il test split resta per il controllo finale
+            evaluate, selection_importance = inner_selection(
+                X_train[feat_names],
+                y_train,
+                lambda: SpamClassifier._new_model(n_estimators, learning_rate, random_state),
+                random_state=random_state,
+            )
+
+            print("\nSelezione delle feature per costo di estrazione...")
+            selection = select_features_by_cost(
+                feature_names=feat_names,
+                importance=selection_importance,
+                cost_model=cost_model,
+                evaluate=evaluate,
+                auc_budget=auc_budget,
+            )
+            # Stesso split (stesse righe e stesso seed): errori e predizioni vengono riscritti per il modello ridotto
+            result = SpamClassifier.train_from_csv(
+                csv_path=csv_path,
+                feature_names=selection["selected_features"],
+                label_column=label_column,
+                test_size=test_size,
+                n_estimators=n_estimators,
+                learning_rate=learning_rate,
+                random_state=random_state,
+                threshold=threshold,
+                errors_output_dir=errors_output_dir,
+            )
+            record_test_check(selection, auc, result["roc_auc"])
+            print(format_cost_report(selection))
+            result["cost_selection"] = selection
+            return result
+
         return {
             "model": model,
             "scaler": scaler,
@@ -574,6 +690,7 @@ class SpamClassifier(PipelineStep):
             "threshold": float(result.get("threshold", 0.5)),
             "model_name": result.get("model_name", "spam_lgbm"),
             "training_metadata": result.get("training_metadata", {}),
+            "cost_selection": result.get("cost_selection"),
 
         }
         joblib.dump(artifact, output_path)
@@ -593,10 +710,14 @@ class SpamFilter(BaseFilter):
         model_path: str,
         rejected_dir: str,
         threshold: Optional[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        backend: str = DEFAULT_MODEL_BACKEND,
     ):
         self.classifier = SpamClassifier(
             model_path=model_path,
             threshold=threshold,
+            batch_size=batch_size,
+            backend=backend,
         )
 
         exclusion_writer = JsonlWriter(
@@ -605,9 +726,16 @@ class SpamFilter(BaseFilter):
             compression=None,
         )
 
-        super().__init__(exclusion_writer=exclusion_writer)
+        super().__init__(exclusion_writer=exclusion_writer, batch_size=batch_size)
+
+
+    def required_features(self) -> List[str]:
+        """
+        Feature spam lette da questo filtro: quelle del modello (``feature_names`` dell'artifact)
+        più quelle delle regole di evidenza forte. SpamFeatureExtractor può calcolare solo queste.
+        """
+        return list(dict.fromkeys(self.classifier.feature_names + STRONG_EVIDENCE_FEATURES))
 
-      
     def _has_strong_spam_evidence(self, metadata: dict, spam_score: float) -> bool:
         """
         Verifica la presenza di evidenze forti prima di scartare un documento.
@@ -616,82 +744,93 @@ class SpamFilter(BaseFilter):
         shortener, CTA, urgenza, denaro, phishing o combinazioni tra brand e link. 
         Questa scelta riduce il rischio di falsi positivi.
         """ 
-        url_count = float(metadata.get("url_count_text", 0.0))
-        suspicious_tld_count = float(metadata.get("suspicious_tld_count", 0.0))
-        shortener_url_count = float(metadata.get("shortener_url_count", 0.0))
-
-        spam_keyword_hits = float(metadata.get("spam_keyword_hits", 0.0))
-        cta_keyword_hits = float(metadata.get("cta_keyword_hits", 0.0))
-        urgency_keyword_hits = float(metadata.get("urgency_keyword_hits", 0.0))
-        money_keyword_hits = float(metadata.get("money_keyword_hits", 0.0))
-        account_keyword_hits = float(metadata.get("account_keyword_hits", 0.0))
-        security_keyword_hits = float(metadata.get("security_keyword_hits", 0.0))
-        delivery_keyword_hits = float(metadata.get("delivery_keyword_hits", 0.0))
-        brand_keyword_hits = float(metadata.get("brand_keyword_hits", 0.0))
-
-        cta_plus_url_score = float(metadata.get("cta_plus_url_score", 0.0))
-        urgency_cta_url_combo = float(metadata.get("urgency_cta_url_combo", 0.0))
-        money_cta_combo = float(metadata.get("money_cta_combo", 0.0))
-
-        ham_business_hits = float(metadata.get("ham_business_hits", 0.0))
-        ham_strength_score = float(metadata.get("ham_strength_score", 0.0))
-
-        if suspicious_tld_count > 0:
-            return True
-
-        if shortener_url_count > 0 and cta_keyword_hits > 0:
-            return True
-
-        if cta_plus_url_score > 0:
-            return True
-
-        if urgency_cta_url_combo > 0:
-            return True
-
-        if money_cta_combo > 0:
-            return True
-
-        if account_keyword_hits > 0 and security_keyword_hits > 0:
-            return True
-
-        if delivery_keyword_hits > 0 and url_count > 0:
-            return True
-
-        if brand_keyword_hits > 0 and url_count > 0 and cta_keyword_hits > 0:
-            return True
-
-        if spam_keyword_hits >= 4 and (cta_keyword_hits > 0 or urgency_keyword_hits > 0 or money_keyword_hits > 0):
-            return True
-
-        if spam_score >= 0.90 and ham_business_hits == 0 and ham_strength_score == 0:
-            return True
-
-        return False
+        return bool(self._strong_evidence_mask([metadata], np.array([spam_score], dtype=float))[0])
 
+    @staticmethod
+    def _strong_evidence_mask(metadata_list: List[dict], spam_scores: np.ndarray) -> np.ndarray:
+        """
+        Valuta le regole di evidenza forte su un intero batch come maschere booleane NumPy.
+        Ogni regola è una condizione su una colonna di STRONG_EVIDENCE_FEATURES; un documento
+        ha evidenza forte se almeno una regola è vera.
+        """
+        E = np.array(
+            [[float(md.get(f, 0.0)) for f in STRONG_EVIDENCE_FEATURES] for md in metadata_list],
+            dtype=np.float64,
+        ).reshape(len(metadata_list), len(STRONG_EVIDENCE_FEATURES))
+        c = dict(zip(STRONG_EVIDENCE_FEATURES, E.T))
+
+        has_url = c["url_count_text"] > 0
+        has_cta = c["cta_keyword_hits"] > 0
+
+        mask = c["suspicious_tld_count"] > 0
+        mask |= (c["shortener_url_count"] > 0) & has_cta
+        mask |= c["cta_plus_url_score"] > 0
+        mask |= c["urgency_cta_url_combo"] > 0
+        mask |= c["money_cta_combo"] > 0
+        mask |= (c["account_keyword_hits"] > 0) & (c["security_keyword_hits"] > 0)
+        mask |= (c["delivery_keyword_hits"] > 0) & has_url
+        mask |= (c["brand_keyword_hits"] > 0) & has_url & has_cta
+        mask |= (c["spam_keyword_hits"] >= 4) & (
+            has_cta | (c["urgency_keyword_hits"] > 0) | (c["money_keyword_hits"] > 0)
+        )
+        mask |= (spam_scores >= 0.90) & (c["ham_business_hits"] == 0) & (c["ham_strength_score"] == 0)
+        return mask
 
-    
     def filter(self, doc):
         """
         Applica la decisione finale di filtro. Se il modello predice spam e sono presenti evidenze forti, il documento viene scartato. 
         Se il punteggio è alto ma le evidenze sono deboli, il documento viene mantenuto nella pipeline e marcato come caso incerto nei metadata, lasciando la valutazione finale ai blocchi successivi.
         """
-        if getattr(doc, "metadata", None) is None:
-            doc.metadata = {}
-    
-        pred_label, spam_score = self.classifier.predict_doc(doc)
-    
-        doc.metadata["spam_pred_label"] = pred_label
-        doc.metadata["spam_pred_score"] = round(float(spam_score), 6)
-    
-        if pred_label == "spam":
-            strong_evidence = self._has_strong_spam_evidence(doc.metadata, spam_score)
-            doc.metadata["spam_strong_evidence"] = strong_evidence
-    
+        return self.filter_batch([doc])[0]
+
+    def score_batch(self, docs: List[Document]) -> Tuple[np.ndarray, np.ndarray]:
+        """Score P(spam) e maschera dei documenti validi; sovrascrivibile per usare score già calcolati."""
+        return self.classifier.predict_batch(docs)
+
+    def filter_batch(self, batch: List[Document]) -> List[bool | Tuple[bool, str]]:
+        """
+        Versione a batch di filter: una sola predict_proba per il batch e regole di evidenza forte
+        valutate come maschere sui soli documenti predetti spam. Decisioni e metadata coincidono con filter.
+        I documenti già decisi ham da SpamCascade vengono mantenuti senza passare dal modello.
+        """
+        for doc in batch:
+            if getattr(doc, "metadata", None) is None:
+                doc.metadata = {}
+
+        results: List[bool | Tuple[bool, str]] = [True] * len(batch)
+        full_idx = [i for i, doc in enumerate(batch) if not is_short_circuited(doc)]
+        if not full_idx:
+            return results
+        docs = [batch[i] for i in full_idx]
+
+        scores, valid = self.score_batch(docs)
+        for i, result in zip(full_idx, self.decide_batch(docs, scores, valid)):
+            results[i] = result
+        return results
+
+    def decide_batch(self, docs: List[Document], scores: np.ndarray, valid: np.ndarray) -> List[bool | Tuple[bool, str]]:
+        """
+        Decisioni e metadata per documenti già valutati dal modello (nessuno deciso dalla cascata),
+        usata da filter_batch.
+        """
+        results: List[bool | Tuple[bool, str]] = [True] * len(docs)
+        is_spam = valid & (scores >= self.classifier.threshold)
+
+        for doc, spam_score, spam in zip(docs, scores, is_spam):
+            doc.metadata["spam_pred_label"] = "spam" if spam else "ham"
+            doc.metadata["spam_pred_score"] = round(float(spam_score), 6)
+
+        spam_idx = np.flatnonzero(is_spam)
+        if len(spam_idx) == 0:
+            return results
+
+        strong = self._strong_evidence_mask([docs[i].metadata for i in spam_idx], scores[spam_idx])
+        for i, strong_evidence in zip(spam_idx, strong):
+            metadata = docs[i].metadata
+            metadata["spam_strong_evidence"] = bool(strong_evidence)
             if strong_evidence:
-                doc.metadata["spam_reject_reason"] = "spam_detected"
-                return False, "spam_detected"
-    
-            doc.metadata["spam_uncertain_reason"] = "high_score_but_weak_spam_evidence"
-            return True
-    
-        return True
+                metadata["spam_reject_reason"] = "spam_detected"
+                results[i] = (False, "spam_detected")
+            else:
+                metadata["spam_uncertain_reason"] = "high_score_but_weak_spam_evidence"
+        return results
@@ -508,7 +508,7 @@ def evaluate_spam_model(
     )
 
     X_scaled = pd.DataFrame(
-        classifier.scaler.transform(X),
+        classifier.scale_features(X),
         columns=feature_names,
         index=X.index,
     )
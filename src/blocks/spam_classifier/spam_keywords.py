@@ -3,8 +3,15 @@ from __future__ import annotations
 
 import re
 import unicodedata
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, Iterable, Pattern, Sequence, Set
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Mapping, Optional, Pattern, Sequence, Set, Tuple
+
+import ahocorasick
+
+if TYPE_CHECKING:
+    from ..text_analysis import AnalyzedDocument
 
 
 # Dizionari utilizzati per il calcolo delle feature spam
@@ -218,6 +225,26 @@ SPAM_TERMS: Set[str] = set().union(
     ACTION_PHRASE_TERMS,
 )
 
+# Categorie di termini contate insieme dal KeywordMatcher condiviso (una sola scansione del testo)
+TERM_CATEGORIES: Dict[str, Set[str]] = {
+    "spam": SPAM_TERMS,
+    "urgency": URGENCY_TERMS,
+    "money": MONEY_TERMS,
+    "cta": CTA_TERMS,
+    "account": ACCOUNT_TERMS,
+    "security": SECURITY_TERMS,
+    "delivery": DELIVERY_TERMS,
+    "brand": BRAND_TERMS,
+    "unsubscribe": UNSUBSCRIBE_TERMS,
+    "promo_code": PROMO_CODE_TERMS,
+    "ham_business": HAM_BUSINESS_TERMS,
+    "ham_formal": HAM_FORMAL_TERMS,
+    "ham_admin_doc": HAM_ADMIN_DOC_TERMS,
+    "ham_technical_business": HAM_TECHNICAL_BUSINESS_TERMS,
+    "action_phrase": ACTION_PHRASE_TERMS,
+    "safe_security_ham": SAFE_SECURITY_HAM_TERMS,
+}
+
 SUSPICIOUS_TLDS: Set[str] = {
     ".xyz", ".top", ".click", ".live", ".shop", ".loan", ".buzz",
     ".win", ".cf", ".tk", ".ml", ".ga",
@@ -320,16 +347,177 @@ def normalize_url(url: str) -> str:
     return cleaned
 
 
+# Caratteri che restano nel testo normalizzato per il matching; tutto il resto diventa spazio
+_MATCHING_DROP_RE: Pattern[str] = re.compile(r"[^0-9a-zA-ZÀ-ÖØ-öø-ÿ]+")
+
+
+def _matching_form(c: str) -> str:
+    """Forma normalizzata di un singolo carattere: minuscolo, NFKD senza segni combinanti, solo caratteri ammessi."""
+    decomposed = unicodedata.normalize("NFKD", c.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _MATCHING_DROP_RE.sub(" ", stripped)
+
+
+class _MatchingTable(dict):
+    """Tabella per ``str.translate``: i primi 256 code point sono precalcolati, gli altri al primo uso."""
+
+    def __missing__(self, codepoint: int) -> str:
+        form = self[codepoint] = _matching_form(chr(codepoint))
+        return form
+
+
+_MATCHING_TABLE = _MatchingTable((cp, _matching_form(chr(cp))) for cp in range(256))
+
+
 def normalize_for_matching(text: str) -> str:
     """
     Normalizza il testo per rendere più robusto il matching delle keyword.
+
+    Minuscolo, NFKD senza segni combinanti, apostrofi e caratteri non alfanumerici sostituiti
+    da spazi, spazi compressi. Tutti i passaggi agiscono carattere per carattere (i segni
+    combinanti riordinati da NFKD vengono comunque scartati), quindi sono precalcolati in una
+    tabella e il testo si normalizza con un solo ``str.translate``.
     """
-    normalized = normalize_text(text)
-    normalized = normalized.replace("'", " ")
-    normalized = re.sub(r"[^0-9a-zA-ZÀ-ÖØ-öø-ÿ]+", " ", normalized, flags=re.UNICODE)
-    return re.sub(r"\s+", " ", normalized).strip()
+    if not text:
+        return ""
+    return " ".join(text.translate(_MATCHING_TABLE).split())
+
+
+
+def matching_text(normalized_text: str) -> str:
+    """Testo normalizzato con uno spazio ai bordi, su cui i termini vengono cercati come parole intere."""
+    return f" {normalize_for_matching(normalized_text)} "
+
+
+class KeywordMatcher:
+    """
+    Automa di Aho-Corasick che conta in una sola passata i termini di più categorie.
+
+    Ogni termine diventa il candidato ``" " + normalize_for_matching(term) + " "`` e il testo
+    viene preparato con matching_text, quindi un match corrisponde sempre a parole intere.
+    Il conteggio replica ``padded.count(candidate)`` sommato sui termini: per ogni candidato
+    si accettano solo occorrenze che non si sovrappongono alla precedente accettata (come
+    ``str.count``) e un candidato prodotto da più termini della stessa categoria conta una
+    volta per termine (es. "identità" e "identita").
+    """
+
+    def __init__(self, categories: Mapping[str, Iterable[str]]):
+        self.categories: Tuple[str, ...] = tuple(categories)
+        weights: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        for cat_id, terms in enumerate(categories.values()):
+            for term in set(terms):
+                weights[f" {normalize_for_matching(term)} "][cat_id] += 1
+
+        self._weights = []
+        self._masks = []
+        self._automaton = ahocorasick.Automaton()
+        for pattern_id, (candidate, by_category) in enumerate(weights.items()):
+            self._weights.append(tuple(by_category.items()))
+            self._masks.append(sum(1 << cat_id for cat_id in by_category))
+            self._automaton.add_word(candidate, (pattern_id, len(candidate)))
+        self._automaton.make_automaton()
+        self.max_length = max(map(len, weights), default=0)
+
+    def pattern_hits(self, padded: str) -> Dict[int, int]:
+        """Occorrenze non sovrapposte di ciascun candidato, come ``padded.count(candidate)``."""
+        hits: Dict[int, int] = {}
+        next_start: Dict[int, int] = {}
+        # iter restituisce i match per posizione finale crescente, quindi per ogni candidato
+        # anche per posizione iniziale crescente
+        for end, (pattern_id, length) in self._automaton.iter(padded):
+            start = end - length + 1
+            if start >= next_start.get(pattern_id, 0):
+                hits[pattern_id] = hits.get(pattern_id, 0) + 1
+                next_start[pattern_id] = end + 1
+        return hits
+
+    def category_counts(self, hits: Dict[int, int]) -> Dict[str, int]:
+        """Conteggi per categoria dalle occorrenze per candidato di ``pattern_hits``."""
+        totals = [0] * len(self.categories)
+        for pattern_id, n in hits.items():
+            for cat_id, weight in self._weights[pattern_id]:
+                totals[cat_id] += n * weight
+        return dict(zip(self.categories, totals))
+
+    def count(self, padded: str) -> Dict[str, int]:
+        """Conteggi per categoria sul testo preparato con matching_text."""
+        return self.category_counts(self.pattern_hits(padded))
+
+    def stream(self) -> "KeywordStream":
+        """Conteggio dello stesso testo preparato fornito a pezzi (``KeywordStream``)."""
+        return KeywordStream(self)
+
+    def presence_mask(self, padded: str) -> int:
+        """Maschera con il bit ``i`` acceso se la categoria ``i`` ha almeno un termine nel testo."""
+        mask = 0
+        for _, (pattern_id, _) in self._automaton.iter(padded):
+            mask |= self._masks[pattern_id]
+        return mask
+
+
+class KeywordStream:
+    """
+    ``KeywordMatcher.count`` su un testo preparato letto a pezzi (``feed``), con memoria pari a un
+    pezzo più il candidato più lungo. Ogni pezzo viene cercato insieme agli ultimi caratteri del
+    precedente, così si trovano anche i termini a cavallo tra due pezzi; si contano solo i match
+    che finiscono nel pezzo nuovo, con le posizioni del testo intero, quindi i conteggi sono
+    identici a quelli di ``count`` sul testo concatenato.
+    """
+
+    def __init__(self, matcher: KeywordMatcher):
+        self.matcher = matcher
+        self.tail = ""
+        # Posizione nel testo intero del primo carattere di ``tail``
+        self.offset = 0
+        self.hits: Dict[int, int] = {}
+        self.next_start: Dict[int, int] = {}
+
+    def feed(self, piece: str) -> None:
+        window = self.tail + piece
+        new_from = len(self.tail)
+        hits, next_start, offset = self.hits, self.next_start, self.offset
+        for end, (pattern_id, length) in self.matcher._automaton.iter(window):
+            if end < new_from:
+                continue
+            start = offset + end - length + 1
+            if start >= next_start.get(pattern_id, 0):
+                hits[pattern_id] = hits.get(pattern_id, 0) + 1
+                next_start[pattern_id] = offset + end + 1
+        keep = min(len(window), max(0, self.matcher.max_length - 1))
+        self.tail = window[len(window) - keep:]
+        self.offset += len(window) - keep
+
+    def counts(self) -> Dict[str, int]:
+        return self.matcher.category_counts(self.hits)
+
+
+@lru_cache(maxsize=None)
+def keyword_matcher() -> KeywordMatcher:
+    """Automa condiviso di tutte le categorie di TERM_CATEGORIES, costruito al primo uso."""
+    return KeywordMatcher(TERM_CATEGORIES)
+
+
+@lru_cache(maxsize=None)
+def _term_set_matcher(terms: frozenset[str]) -> KeywordMatcher:
+    return KeywordMatcher({"terms": terms})
+
+
+def count_matching_terms(padded: str, terms: Iterable[str]) -> int:
+    """Come count_term_matches, su un testo già preparato con matching_text."""
+    return _term_set_matcher(frozenset(terms)).count(padded)["terms"]
 
 
+def count_keyword_categories(padded: str) -> Dict[str, int]:
+    """Conteggi di tutte le categorie di TERM_CATEGORIES con una sola scansione del testo preparato."""
+    return keyword_matcher().count(padded)
+
+
+def _keyword_counts(text: str, analysis: Optional["AnalyzedDocument"]) -> Dict[str, int]:
+    """Conteggi per categoria del documento: dall'analisi condivisa se c'è, altrimenti normalizzando il testo una volta."""
+    if analysis is not None:
+        return analysis.keyword_counts
+    return count_keyword_categories(matching_text(normalize_for_matching(text)))
+
 
 def count_term_matches(normalized_text: str, terms: Iterable[str]) -> int:
     """
@@ -338,31 +526,28 @@ def count_term_matches(normalized_text: str, terms: Iterable[str]) -> int:
     Il testo e i termini vengono normalizzati prima del confronto, così da rendere il matching più robusto rispetto a 
     maiuscole, accenti, apostrofi, punteggiatura e spazi multipli.
     """
-    total = 0
-    padded = f" {normalize_for_matching(normalized_text)} "
-    for term in terms:
-        candidate = f" {normalize_for_matching(term)} "
-        total += padded.count(candidate)
-    return total
+    return count_matching_terms(matching_text(normalized_text), terms)
 
 
-def keyword_bundle(text: str) -> KeywordBundle:
+def keyword_bundle(text: str, analysis: Optional["AnalyzedDocument"] = None) -> KeywordBundle:
     """
     Conta le keyword spam e ham/business presenti nel testo.
     La funzione raggruppa i segnali lessicali in categorie funzionali, successivamente usate dal feature extractor e dal filtro spam.
+    Tutte le categorie vengono contate in una sola passata dal KeywordMatcher condiviso;
+    con ``analysis`` i conteggi vengono presi dall'analisi condivisa del documento.
     """
-    normalized = normalize_for_matching(text)
+    counts = _keyword_counts(text, analysis)
     return KeywordBundle(
-        spam_keywords=count_term_matches(normalized, SPAM_TERMS),
-        urgency_keywords=count_term_matches(normalized, URGENCY_TERMS),
-        money_keywords=count_term_matches(normalized, MONEY_TERMS),
-        cta_keywords=count_term_matches(normalized, CTA_TERMS),
-        account_keywords=count_term_matches(normalized, ACCOUNT_TERMS),
-        security_keywords=count_term_matches(normalized, SECURITY_TERMS),
-        delivery_keywords=count_term_matches(normalized, DELIVERY_TERMS),
-        brand_keywords=count_term_matches(normalized, BRAND_TERMS),
-        unsubscribe_keywords=count_term_matches(normalized, UNSUBSCRIBE_TERMS),
-        promo_code_keywords=count_term_matches(normalized, PROMO_CODE_TERMS),
+        spam_keywords=counts["spam"],
+        urgency_keywords=counts["urgency"],
+        money_keywords=counts["money"],
+        cta_keywords=counts["cta"],
+        account_keywords=counts["account"],
+        security_keywords=counts["security"],
+        delivery_keywords=counts["delivery"],
+        brand_keywords=counts["brand"],
+        unsubscribe_keywords=counts["unsubscribe"],
+        promo_code_keywords=counts["promo_code"],
     )
 
 def regex_count(pattern: Pattern[str], text: str) -> int:
@@ -408,92 +593,117 @@ def extract_domain(url: str) -> str:
     return cleaned.split("/", 1)[0].split(":", 1)[0]
 
 def count_uppercase_tokens(text: str) -> int:
+    return _count_uppercase_tokens(extract_tokens(text))
+
+def _count_uppercase_tokens(tokens: Iterable[str]) -> int:
     total = 0
-    for m in WORD_RE.finditer(text):
-        tok = m.group(0)
+    for tok in tokens:
         letters = [c for c in tok if c.isalpha()]
         if len(letters) >= 2 and tok.upper() == tok and tok.lower() != tok:
             total += 1
     return total
 
 def count_short_lines(text: str, max_len: int = 40) -> int:
-    return sum(1 for line in text.splitlines() if line.strip() and len(line.strip()) <= max_len)
+    return _count_short_lines(text.splitlines(), max_len)
+
+def _count_short_lines(lines: Iterable[str], max_len: int = 40) -> int:
+    return sum(1 for line in lines if line.strip() and len(line.strip()) <= max_len)
 
 def count_short_tokens(text: str, max_len: int = 2) -> int:
+    return _count_short_tokens(extract_tokens(text), max_len)
+
+def _count_short_tokens(tokens: Iterable[str], max_len: int = 2) -> int:
     total = 0
-    for tok in extract_tokens(text):
+    for tok in tokens:
         if tok.isalnum() and 2 <= len(tok) <= max_len:
             total += 1
     return total
 
-def count_cta_url_cooccurrence(text: str) -> int:
-    total = 0
-    for chunk in re.split(r"[\n.!?]+", text):
+# Segnali per frase usati dalle feature di co-occorrenza. I primi quattro bit seguono l'ordine
+# delle categorie di _chunk_matcher, così la maschera dell'automa si usa senza conversioni
+CHUNK_CTA = 1 << 0
+CHUNK_BRAND = 1 << 1
+CHUNK_URGENCY = 1 << 2
+CHUNK_MONEY = 1 << 3
+CHUNK_URL = 1 << 4
+CHUNK_AMOUNT = 1 << 5
+
+CHUNK_SPLIT_RE: Pattern[str] = re.compile(r"[\n.!?]+")
+# URL_RE trova un URL solo se nel testo c'è un punto oppure "http(s):/"
+_URL_HINT_RE: Pattern[str] = re.compile(r"https?:/", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _chunk_matcher() -> KeywordMatcher:
+    return KeywordMatcher({"cta": CTA_TERMS, "brand": BRAND_TERMS, "urgency": URGENCY_TERMS, "money": MONEY_TERMS})
+
+
+def chunk_signal_masks(text: str) -> list[int]:
+    """
+    Divide il testo in frasi (come ``re.split(r"[\n.!?]+")``) e restituisce per ogni frase non
+    vuota una maschera di bit CHUNK_*: URL, CTA, brand, urgenza, termini di denaro e importi.
+    Ogni frase viene normalizzata e scansionata una sola volta per tutte le categorie; le
+    regex di URL e importi girano solo sulle frasi che possono contenerne uno.
+    """
+    masks = []
+    matcher = _chunk_matcher()
+    for chunk in CHUNK_SPLIT_RE.split(text):
         if not chunk.strip():
             continue
-        normalized = normalize_for_matching(chunk)
-        if extract_urls(chunk) and count_term_matches(normalized, CTA_TERMS) > 0:
-            total += 1
-    return total 
+        mask = matcher.presence_mask(matching_text(normalize_for_matching(chunk)))
+        if ("." in chunk or _URL_HINT_RE.search(chunk)) and extract_urls(chunk):
+            mask |= CHUNK_URL
+        if AMOUNT_RE.search(chunk):
+            mask |= CHUNK_AMOUNT
+        masks.append(mask)
+    return masks
+
+
+def combo_counts(masks: Iterable[int]) -> Dict[str, int]:
+    """Le quattro feature di co-occorrenza per frase, ricavate dalle maschere di chunk_signal_masks."""
+    counts = {"cta_plus_url_score": 0, "brand_plus_link_score": 0, "urgency_cta_url_combo": 0, "money_cta_combo": 0}
+    for mask in masks:
+        if mask & CHUNK_URL:
+            if mask & CHUNK_CTA:
+                counts["cta_plus_url_score"] += 1
+                if mask & CHUNK_URGENCY:
+                    counts["urgency_cta_url_combo"] += 1
+            if mask & CHUNK_BRAND:
+                counts["brand_plus_link_score"] += 1
+        if mask & CHUNK_CTA and mask & (CHUNK_MONEY | CHUNK_AMOUNT):
+            counts["money_cta_combo"] += 1
+    return counts
+
+
+def count_cta_url_cooccurrence(text: str) -> int:
+    return combo_counts(chunk_signal_masks(text))["cta_plus_url_score"]
 
 def count_brand_url_cooccurrence(text: str) -> int:
-    total = 0
-    for chunk in re.split(r"[\n.!?]+", text):
-        if not chunk.strip():
-            continue
-        normalized = normalize_for_matching(chunk)
-        if extract_urls(chunk) and count_term_matches(normalized, BRAND_TERMS) > 0:
-            total += 1
-    return total 
+    return combo_counts(chunk_signal_masks(text))["brand_plus_link_score"]
 
 def count_urgency_cta_url_combo(text: str) -> int:
-    total = 0
-    for chunk in re.split(r"[\n.!?]+", text):
-        if not chunk.strip():
-            continue
-        normalized = normalize_for_matching(chunk)
-        if (
-           extract_urls(chunk)
-           and count_term_matches(normalized, URGENCY_TERMS) > 0
-           and count_term_matches(normalized, CTA_TERMS) > 0
-        ):
-            total += 1
-    return total
+    return combo_counts(chunk_signal_masks(text))["urgency_cta_url_combo"]
 
 def count_money_cta_combo(text: str) -> int:
-    total = 0
-    for chunk in re.split(r"[\n.!?]+", text):
-        if not chunk.strip():
-            continue
-        normalized = normalize_for_matching(chunk)
-        has_money = count_term_matches(normalized, MONEY_TERMS) > 0 or regex_count(AMOUNT_RE, chunk) > 0
-        has_cta = count_term_matches(normalized, CTA_TERMS) > 0
-        if has_money and has_cta:
-            total += 1
-    return total
+    return combo_counts(chunk_signal_masks(text))["money_cta_combo"]
 
-def count_ham_business_terms(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, HAM_BUSINESS_TERMS)
+def count_ham_business_terms(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["ham_business"]
 
-def count_ham_formal_terms(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, HAM_FORMAL_TERMS)
+def count_ham_formal_terms(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["ham_formal"]
 
-def count_ham_admin_doc_terms(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, HAM_ADMIN_DOC_TERMS)
+def count_ham_admin_doc_terms(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["ham_admin_doc"]
 
-def count_ham_technical_business_terms(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, HAM_TECHNICAL_BUSINESS_TERMS)
+def count_ham_technical_business_terms(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["ham_technical_business"]
 
 def count_business_signature_hits(text: str) -> int:
     return regex_count(BUSINESS_SIGNATURE_RE, text)
 
-def count_action_phrases(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, ACTION_PHRASE_TERMS)
+def count_action_phrases(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["action_phrase"]
 
 def count_promo_symbols(text: str) -> int:
     return sum(text.count(sym) for sym in PROMO_SYMBOLS)
@@ -501,22 +711,26 @@ def count_promo_symbols(text: str) -> int:
 def count_digit_runs(text: str) -> int:
     return len(re.findall(r"\b\d{4,}\b", text))
 
-def count_safe_security_ham_terms(text: str) -> int:
-    normalized = normalize_for_matching(text)
-    return count_term_matches(normalized, SAFE_SECURITY_HAM_TERMS)
+def count_safe_security_ham_terms(text: str, analysis: Optional["AnalyzedDocument"] = None) -> int:
+    return _keyword_counts(text, analysis)["safe_security_ham"]
 
 
 
-def quick_pattern_counts(text: str) -> Dict[str, int]:
+def quick_pattern_counts(text: str, analysis: Optional["AnalyzedDocument"] = None) -> Dict[str, int]:
     """
     Estrae pattern strutturali rilevanti per il rilevamento spam.
 
     La funzione calcola conteggi relativi a URL, email, domini, TLD sospetti, shortener, importi economici, 
     codici promozionali, CTA e combinazioni tra link, urgenza, denaro e brand. 
     Include anche segnali ham/business utili a ridurre i falsi positivi.
+    Con ``analysis`` token, righe, URL, email e testo normalizzato vengono presi dall'analisi condivisa.
     """
-    emails = list(extract_emails(text))
-    urls = list(extract_urls(text))
+    if analysis is None:
+        from ..text_analysis import AnalyzedDocument
+        analysis = AnalyzedDocument(text)
+    emails = analysis.emails
+    urls = analysis.urls
+    keywords = analysis.keyword_counts
     domains = []
     for u in urls:
         d = extract_domain(u)
@@ -533,24 +747,21 @@ def quick_pattern_counts(text: str) -> Dict[str, int]:
         "email_count": len(emails),
         "amount_pattern_count": regex_count(AMOUNT_RE, text),
         "promo_code_pattern_count": regex_count(PROMO_CODE_RE, text),
-        "short_line_count": count_short_lines(text),
-        "short_token_count": count_short_tokens(text),
+        "short_line_count": _count_short_lines(analysis.lines),
+        "short_token_count": _count_short_tokens(analysis.tokens),
         "suspicious_tld_count": count_suspicious_tlds(urls),
         "shortener_url_count": count_shortener_urls(urls),
-        "cta_plus_url_score": count_cta_url_cooccurrence(text),
-        "brand_plus_link_score": count_brand_url_cooccurrence(text),
-        "urgency_cta_url_combo": count_urgency_cta_url_combo(text),
-        "money_cta_combo": count_money_cta_combo(text),     
+        **combo_counts(analysis.chunk_signals),
         
-        "ham_business_hits": count_ham_business_terms(text),
-        "ham_formal_hits": count_ham_formal_terms(text),
-        "ham_admin_doc_hits": count_ham_admin_doc_terms(text),
-        "ham_technical_business_hits": count_ham_technical_business_terms(text),
+        "ham_business_hits": keywords["ham_business"],
+        "ham_formal_hits": keywords["ham_formal"],
+        "ham_admin_doc_hits": keywords["ham_admin_doc"],
+        "ham_technical_business_hits": keywords["ham_technical_business"],
         "business_signature_hits": count_business_signature_hits(text),     
         
-        "action_phrase_count": count_action_phrases(text),
-        "promo_symbol_count": count_promo_symbols(text),
-        "uppercase_token_count": count_uppercase_tokens(text),
+        "action_phrase_count": keywords["action_phrase"],
+        "promo_symbol_count": sum(analysis.count_char(sym) for sym in PROMO_SYMBOLS),
+        "uppercase_token_count": _count_uppercase_tokens(analysis.tokens),
         "digit_run_count": count_digit_runs(text),
-        "safe_security_ham_hits": count_safe_security_ham_terms(text),
+        "safe_security_ham_hits": keywords["safe_security_ham"],
 }
@@ -1,20 +1,44 @@
 from __future__ import annotations
 import csv
 import os
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import re
 from datatrove.pipeline.base import PipelineStep
 from datatrove.data import DocumentsPipeline
 
 
 from .spam_keywords import (
-    keyword_bundle,
-    quick_pattern_counts,
+    AMOUNT_RE,
+    PROMO_CODE_RE,
+    PROMO_SYMBOLS,
     ITALIAN_STOPWORDS_MINI,
     ITALIAN_COMMON_WORDS,
-    ACCENTED_CHARS,
+    _count_short_lines,
+    _count_short_tokens,
+    _count_uppercase_tokens,
+    chunk_signal_masks,
+    combo_counts,
+    count_business_signature_hits,
+    count_digit_runs,
+    count_shortener_urls,
+    count_suspicious_tlds,
+    extract_domain,
+    extract_emails,
     extract_tokens,
+    extract_urls,
+    keyword_matcher,
+    matching_text,
+    normalize_for_matching,
+    regex_count,
 )
+from .spam_cascade import CASCADE_KEY, CASCADE_SHORT_CIRCUIT
+from ..char_histogram import CharHistogram, StreamingCharHistogram
+from ..feature_graph import FeatureGraph, FeaturePlan, NodeFunc
+from ..feature_store import DEFAULT_MAX_ROWS, FeatureStore, doc_digest, subset_table
+from ..stats import STATS_FEATURE_NAMES
+from ..streaming_stats import MAX_VOCABULARY, STREAMING_CHUNK_CHARS, iter_line_blocks
+from ..text_analysis import STREAMING_MIN_CHARS, AnalyzedDocument, SharedAnalysisUser, analyze_document
 
 def _safe_text(value) -> str:
     """
@@ -47,12 +71,17 @@ def _extract_spam_label(metadata: dict) -> str:
             return label
     return ""
 
-def _basic_char_stats(text: str) -> Dict[str, float]:
+def _basic_char_stats(text: str, analysis: Optional[AnalyzedDocument] = None) -> Dict[str, float]:
     """
     Calcola statistiche di base sui caratteri del testo.
     Lunghezza, cifre, maiuscole, punteggiatura e spazi.
     """
-    char_count = len(text)
+    analysis = analysis or AnalyzedDocument(text)
+    return _char_stats(len(text), analysis.char_histogram)
+
+
+def _char_stats(char_count: int, histogram: CharHistogram) -> Dict[str, float]:
+    """Statistiche di _basic_char_stats dall'istogramma dei caratteri (anche costruito a blocchi)."""
     if char_count == 0:
         return {
             "char_count": 0.0,
@@ -67,32 +96,11 @@ def _basic_char_stats(text: str) -> Dict[str, float]:
             "currency_symbol_count": 0.0,
         }
 
-    digit_count = 0
-    upper_count = 0
-    punct_count = 0
-    space_count = 0
-    exclamation_count = 0
-    question_count = 0
-    newline_count = 0
-    currency_symbol_count = 0
-
-    for c in text:
-        if c.isdigit():
-            digit_count += 1
-        elif c.isupper():
-            upper_count += 1
-        elif c.isspace():
-            space_count += 1
-            if c == "\n":
-                newline_count += 1
-        elif not c.isalnum():
-            punct_count += 1
-            if c == "!":
-                exclamation_count += 1
-            elif c == "?":
-                question_count += 1
-            elif c in {"€", "$"}:
-                currency_symbol_count += 1
+    classes = histogram.class_counts()
+    digit_count = classes["digit"]
+    upper_count = classes["spam_upper"]
+    punct_count = classes["spam_punct"]
+    space_count = classes["spam_space"]
 
     return {
         "char_count": float(char_count),
@@ -101,10 +109,10 @@ def _basic_char_stats(text: str) -> Dict[str, float]:
         "uppercase_ratio": upper_count / char_count,
         "punctuation_ratio": punct_count / char_count,
         "whitespace_ratio": space_count / char_count,
-        "exclamation_count": float(exclamation_count),
-        "question_count": float(question_count),
-        "newline_count": float(newline_count),
-        "currency_symbol_count": float(currency_symbol_count),
+        "exclamation_count": float(histogram.count("!")),
+        "question_count": float(histogram.count("?")),
+        "newline_count": float(histogram.count("\n")),
+        "currency_symbol_count": float(histogram.count("€") + histogram.count("$")),
     }
 
 def _clip01(x: float) -> float:
@@ -117,51 +125,104 @@ def _sentence_chunks(text: str) -> list[str]:
     chunks = re.split(r"[.!?\n\r;:]+", text)
     return [c.strip() for c in chunks if c.strip()]
 
-def compute_custom_lang_score(text: str, metadata: dict | None = None) -> float:
+def compute_custom_lang_score(
+    text: str,
+    metadata: dict | None = None,
+    analysis: Optional[AnalyzedDocument] = None,
+) -> float:
     """
     Calcola uno score linguistico custom per stimare la qualità del testo italiano.
 
     Lo score combina segnali come rapporto di caratteri alfabetici, presenza di stopword italiane, parole comuni, 
     lunghezza media dei token, struttura delle frasi e penalità per eccesso di cifre, punteggiatura o token molto brevi.
     """
-    metadata = metadata or {}
-    text = _safe_text(text).strip()
+    return combine_lang_score(lang_text_terms(text, analysis), metadata)
+
 
+@dataclass
+class LangCounts:
+    """
+    Conteggi del testo (senza spazi ai bordi) da cui ``lang_text_terms`` calcola lo score: si
+    sommano blocco per blocco, quindi valgono anche per i documenti letti a blocchi.
+    """
+
+    total_chars: int = 0
+    alpha_chars: int = 0
+    digit_chars: int = 0
+    punct_chars: int = 0
+    accented_chars: int = 0
+    token_count: int = 0
+    long_tokens: int = 0
+    short_tokens: int = 0
+    token_length_sum: int = 0
+    stopword_hits: int = 0
+    common_word_hits: int = 0
+    chunk_count: int = 0
+    chunk_length_sum: int = 0
+
+    def add_tokens(self, tokens_lower: List[str]) -> None:
+        self.token_count += len(tokens_lower)
+        self.long_tokens += sum(len(t) >= 4 for t in tokens_lower)
+        self.short_tokens += sum(len(t) <= 2 for t in tokens_lower)
+        self.token_length_sum += sum(len(t) for t in tokens_lower)
+        self.stopword_hits += sum(t in ITALIAN_STOPWORDS_MINI for t in tokens_lower)
+        self.common_word_hits += sum(t in ITALIAN_COMMON_WORDS for t in tokens_lower)
+
+    def add_chunks(self, text: str) -> None:
+        chunks = _sentence_chunks(text)
+        self.chunk_count += len(chunks)
+        self.chunk_length_sum += sum(len(c) for c in chunks)
+
+    def add_chars(self, classes: Dict[str, int]) -> None:
+        self.alpha_chars += classes["alpha"]
+        self.digit_chars += classes["digit"]
+        self.punct_chars += classes["non_alnum_non_space"]
+        self.accented_chars += classes["accented"]
+
+
+def lang_text_counts(text: str, analysis: Optional[AnalyzedDocument] = None) -> LangCounts:
+    """Conteggi di LangCounts per il testo intero, dall'analisi condivisa se c'è."""
+    counts = LangCounts()
+    text = _safe_text(text).strip()
     if not text:
-        return 0.0
+        return counts
+    # I caratteri rimossi da strip() sono spazi: token e conteggi coincidono con quelli del testo intero
+    analysis = analysis or AnalyzedDocument(text)
+    counts.total_chars = len(text)
+    counts.add_chars(analysis.char_classes)
+    counts.add_tokens(analysis.tokens_lower)
+    counts.add_chunks(text)
+    return counts
 
-    tokens = _tokenize_lang_words(text)
-    if not tokens:
-        return 0.0
 
-    total_chars = len(text)
-    alpha_chars = sum(ch.isalpha() for ch in text)
-    digit_chars = sum(ch.isdigit() for ch in text)
-    punct_chars = sum((not ch.isalnum()) and (not ch.isspace()) for ch in text)
-    accented_count = sum(ch.lower() in ACCENTED_CHARS for ch in text)
+def lang_text_terms(text: str, analysis: Optional[AnalyzedDocument] = None) -> Tuple[int, float, float]:
+    """
+    Parte di ``compute_custom_lang_score`` che dipende solo dal testo: ``(valido, score, penalità)``,
+    con valido = 0 per i testi senza token. Viene salvata nell'archivio delle feature, mentre il
+    punteggio LID dei metadata si aggiunge a ogni esecuzione (``combine_lang_score``).
+    """
+    return lang_terms_from_counts(lang_text_counts(text, analysis))
 
-    token_count = len(tokens)
-    long_tokens = sum(len(t) >= 4 for t in tokens)
-    short_tokens = sum(len(t) <= 2 for t in tokens)
-    avg_word_len = sum(len(t) for t in tokens) / token_count
 
-    stopword_hits = sum(t in ITALIAN_STOPWORDS_MINI for t in tokens)
-    common_word_hits = sum(t in ITALIAN_COMMON_WORDS for t in tokens)
+def lang_terms_from_counts(counts: LangCounts) -> Tuple[int, float, float]:
+    """``lang_text_terms`` a partire dai conteggi del testo."""
+    if not counts.total_chars or not counts.token_count:
+        return 0, 0.0, 0.0
 
-    stopword_ratio = _safe_div(stopword_hits, token_count)
-    common_word_ratio = _safe_div(common_word_hits, token_count)
-    alpha_ratio = _safe_div(alpha_chars, total_chars)
-    digit_ratio = _safe_div(digit_chars, total_chars)
-    punct_ratio = _safe_div(punct_chars, total_chars)
-    accented_ratio = _safe_div(accented_count, total_chars)
-    long_token_ratio = _safe_div(long_tokens, token_count)
-    short_token_ratio = _safe_div(short_tokens, token_count)
+    total_chars = counts.total_chars
+    token_count = counts.token_count
+    avg_word_len = counts.token_length_sum / token_count
 
-    chunks = _sentence_chunks(text)
-    avg_chunk_len = sum(len(c) for c in chunks) / len(chunks) if chunks else len(text)
+    stopword_ratio = _safe_div(counts.stopword_hits, token_count)
+    common_word_ratio = _safe_div(counts.common_word_hits, token_count)
+    alpha_ratio = _safe_div(counts.alpha_chars, total_chars)
+    digit_ratio = _safe_div(counts.digit_chars, total_chars)
+    punct_ratio = _safe_div(counts.punct_chars, total_chars)
+    accented_ratio = _safe_div(counts.accented_chars, total_chars)
+    long_token_ratio = _safe_div(counts.long_tokens, token_count)
+    short_token_ratio = _safe_div(counts.short_tokens, token_count)
 
-    raw_lang_score = _safe_float(metadata.get("language_score"), 0.0)
-    raw_lang_score = _clip01(raw_lang_score)
+    avg_chunk_len = counts.chunk_length_sum / counts.chunk_count if counts.chunk_count else total_chars
 
     score = 0.0
     score += 0.22 * _clip01(alpha_ratio / 0.75)
@@ -191,244 +252,370 @@ def compute_custom_lang_score(text: str, metadata: dict | None = None) -> float:
     score += 0.08 * _clip01(chunk_score)
 
     score += 0.04 * _clip01(accented_ratio / 0.01)
-    score += 0.06 * raw_lang_score
 
     penalty = 0.0
     penalty += 0.10 * _clip01(digit_ratio / 0.20)
     penalty += 0.08 * _clip01(punct_ratio / 0.22)
     penalty += 0.06 * _clip01(short_token_ratio / 0.45)
 
-    final_score = score - penalty
-    final_score = 0.15 + (0.75 * _clip01(final_score))
-
-    return round(_clip01(final_score), 4)
+    return 1, score, penalty
 
 
+def combine_lang_score(terms: Tuple[int, float, float], metadata: dict | None = None) -> float:
+    """Score linguistico finale dai termini del testo (``lang_text_terms``) e dal punteggio LID dei metadata."""
+    valid, score, penalty = terms
+    if not valid:
+        return 0.0
+    metadata = metadata or {}
 
-def extract_spam_features(doc) -> Dict[str, float | str]:
-    """
-    Calcola le feature spam associate a un singolo documento.
-    L'obiettivo è rappresentare sia l'intento spam sia eventuali segnali di legittimità del documento.
-    """
-    text = _safe_text(getattr(doc, "text", ""))
-    metadata = getattr(doc, "metadata", {}) or {}
+    raw_lang_score = _safe_float(metadata.get("language_score"), 0.0)
+    raw_lang_score = _clip01(raw_lang_score)
+    score += 0.06 * raw_lang_score
 
-    basic = _basic_char_stats(text)
+    final_score = score - penalty
+    final_score = 0.15 + (0.75 * _clip01(final_score))
 
-    tokens = extract_tokens(text)
-    tokens_lower = [tok.lower() for tok in tokens]
+    return round(_clip01(final_score), 4)
 
-    word_count = len(tokens)
-    unique_word_count = len(set(tokens_lower))
-    avg_word_length = (
-        sum(len(tok) for tok in tokens) / word_count if word_count else 0.0
-    )
 
-    kw = keyword_bundle(text)
-    pat = quick_pattern_counts(text)
 
-    ham_business_hits = float(pat["ham_business_hits"])
-    ham_formal_hits = float(pat["ham_formal_hits"])
-    ham_admin_doc_hits = float(pat["ham_admin_doc_hits"])
-    ham_technical_business_hits = float(pat["ham_technical_business_hits"])
-    business_signature_hits = float(pat["business_signature_hits"])
+# --- Grafo delle feature spam (blocks.feature_graph) ---
+# Ingressi: il documento, il suo testo, i metadata e l'analisi condivisa. I nodi con "_" sono
+# primitive interne; le feature sono registrate nell'ordine del dizionario di extract_spam_features.
+SPAM_FEATURE_GRAPH = FeatureGraph(inputs=("_doc", "_text", "_metadata", "_analysis"))
+_add = SPAM_FEATURE_GRAPH.add
 
-    spam_keyword_hits = float(kw.spam_keywords)
-    cta_keyword_hits = float(kw.cta_keywords)
+_add("_basic", ["_text", "_analysis"], lambda v: _basic_char_stats(v["_text"], v["_analysis"]))
+_add("_tokens", ["_analysis"], lambda v: v["_analysis"].tokens)
+_add("_word_count", ["_tokens"], lambda v: len(v["_tokens"]))
+_add("_unique_word_count", ["_analysis"], lambda v: len(set(v["_analysis"].tokens_lower)))
+_add("_keywords", ["_analysis"], lambda v: v["_analysis"].keyword_counts)
+_add("_urls", ["_analysis"], lambda v: v["_analysis"].urls)
+_add("_combos", ["_analysis"], lambda v: combo_counts(v["_analysis"].chunk_signals))
+_add("_promo_symbols", ["_analysis"], lambda v: sum(v["_analysis"].count_char(sym) for sym in PROMO_SYMBOLS))
+_add("_uppercase_tokens", ["_tokens"], lambda v: _count_uppercase_tokens(v["_tokens"]))
+_add("_short_tokens", ["_tokens"], lambda v: _count_short_tokens(v["_tokens"]))
+_add("_token_length_sum", ["_tokens"], lambda v: sum(len(tok) for tok in v["_tokens"]))
+_add("_email_count", ["_analysis"], lambda v: len(v["_analysis"].emails))
+_add("_short_lines", ["_analysis"], lambda v: _count_short_lines(v["_analysis"].lines))
+_add("_digit_runs", ["_text"], lambda v: count_digit_runs(v["_text"]))
+_add("_label", ["_metadata"], lambda v: _extract_spam_label(v["_metadata"]))
 
-    money_keyword_hits = float(kw.money_keywords)
-    urgency_keyword_hits = float(kw.urgency_keywords)
 
-    spam_keyword_density = _safe_div(spam_keyword_hits, float(word_count))
-    cta_keyword_density = _safe_div(cta_keyword_hits, float(word_count))
-    money_keyword_density = _safe_div(money_keyword_hits, float(word_count))
-    urgency_keyword_density = _safe_div(urgency_keyword_hits, float(word_count))
-    ham_business_density = _safe_div(ham_business_hits, float(word_count))
+def _has(name: str, other: str) -> NodeFunc:
+    """1.0 se entrambe le categorie di keyword sono presenti."""
+    return lambda v: 1.0 if (v["_keywords"][name] > 0 and v["_keywords"][other] > 0) else 0.0
 
 
-    ham_to_spam_keyword_ratio = (
-        (ham_business_hits + 1.0) / (spam_keyword_hits + 1.0)
-    )
+def _domains(urls) -> set:
+    return {d for d in (extract_domain(u) for u in urls) if d}
 
-    ham_to_cta_ratio = (
-        (ham_business_hits + 1.0) / (cta_keyword_hits + 1.0)
-    )
 
-    ham_strength_score = float(
-        ham_formal_hits +
-        ham_admin_doc_hits +
-        ham_technical_business_hits +
-        business_signature_hits
+def _noise_score(v) -> float:
+    word_count = v["_word_count"]
+    avg_word_length = v["avg_word_length"]
+    noise_score = 0.0
+    if v["lang_score"] < 0.35:
+        noise_score += 1.0
+    if v["punctuation_ratio"] > 0.18:
+        noise_score += 1.0
+    if v["digit_ratio"] > 0.20:
+        noise_score += 1.0
+    if word_count > 0 and (v["short_token_count"] / word_count) > 0.35:
+        noise_score += 1.0
+    if avg_word_length < 3.0 or avg_word_length > 12.0:
+        noise_score += 1.0
+    return min(noise_score, 5.0)
+
+
+def _spam_intent_score(v) -> float:
+    combos, kw = v["_combos"], v["_keywords"]
+    return float(
+        (1.5 * float(combos["cta_plus_url_score"])) +
+        (2.0 * float(combos["urgency_cta_url_combo"])) +
+        (1.5 * float(combos["money_cta_combo"])) +
+        (1.5 * v["suspicious_tld_count"]) +
+        (1.0 * v["shortener_url_count"]) +
+        (1.0 * float(kw["account"] > 0 and kw["security"] > 0)) +
+        (1.0 * float(kw["delivery"] > 0 and len(v["_urls"]) > 0))
     )
 
-    ham_strength_to_spam_ratio = (
-        (ham_strength_score + 1.0) / (spam_keyword_hits + 1.0)
-    ) 
 
-    lang = _safe_text(metadata.get("language")).lower()
-    lang_score = compute_custom_lang_score(text,metadata)
+_add("doc_id", ["_doc", "_metadata"], lambda v: _safe_text(getattr(v["_doc"], "id", "")) or _safe_text(v["_metadata"].get("id")))
+_add("target_label", ["_label"], lambda v: v["_label"])
+_add("spam_target_label", ["_label"], lambda v: v["_label"])
+_add("char_count", ["_basic"], lambda v: v["_basic"]["char_count"])
+_add("word_count", ["_word_count"], lambda v: float(v["_word_count"]))
+_add("unique_word_count", ["_unique_word_count"], lambda v: float(v["_unique_word_count"]))
+_add("unique_word_ratio", ["_unique_word_count", "_word_count"], lambda v: (v["_unique_word_count"] / v["_word_count"]) if v["_word_count"] else 0.0)
+_add("avg_word_length", ["_token_length_sum", "_word_count"], lambda v: v["_token_length_sum"] / v["_word_count"] if v["_word_count"] else 0.0)
+for _name in (
+    "digit_count", "digit_ratio", "uppercase_ratio", "punctuation_ratio", "whitespace_ratio",
+    "exclamation_count", "question_count", "newline_count", "currency_symbol_count",
+):
+    _add(_name, ["_basic"], lambda v, _name=_name: v["_basic"][_name])
+_add("url_count_text", ["_urls"], lambda v: float(len(v["_urls"])))
+_add("unique_url_count_text", ["_urls"], lambda v: float(len({u.lower() for u in v["_urls"]})))
+_add("unique_domain_count_text", ["_urls"], lambda v: float(len(_domains(v["_urls"]))))
+_add("email_count_text", ["_email_count"], lambda v: float(v["_email_count"]))
+_add("url_density", ["url_count_text", "_word_count"], lambda v: (v["url_count_text"] / v["_word_count"]) if v["_word_count"] else 0.0)
+_add("email_density", ["email_count_text", "_word_count"], lambda v: (v["email_count_text"] / v["_word_count"]) if v["_word_count"] else 0.0)
+_add("amount_pattern_count", ["_text"], lambda v: float(regex_count(AMOUNT_RE, v["_text"])))
+_add("promo_code_pattern_count", ["_text"], lambda v: float(regex_count(PROMO_CODE_RE, v["_text"])))
+_add("action_phrase_count", ["_keywords"], lambda v: float(v["_keywords"]["action_phrase"]))
+_add("promo_symbol_count", ["_promo_symbols"], lambda v: float(v["_promo_symbols"]))
+_add("uppercase_token_count", ["_uppercase_tokens"], lambda v: float(v["_uppercase_tokens"]))
+_add("short_line_count", ["_short_lines"], lambda v: float(v["_short_lines"]))
+_add("short_token_count", ["_short_tokens"], lambda v: float(v["_short_tokens"]))
+
+for _name, _category in (
+    ("ham_business_hits", "ham_business"),
+    ("ham_formal_hits", "ham_formal"),
+    ("ham_admin_doc_hits", "ham_admin_doc"),
+    ("ham_technical_business_hits", "ham_technical_business"),
+):
+    _add(_name, ["_keywords"], lambda v, _category=_category: float(v["_keywords"][_category]))
+_add("business_signature_hits", ["_text"], lambda v: float(count_business_signature_hits(v["_text"])))
+_add("digit_run_count", ["_digit_runs"], lambda v: float(v["_digit_runs"]))
+
+# Combinazioni di segnali: spesso catturano pattern spam meglio dei singoli conteggi isolati
+_add("has_link_and_cta", ["_urls", "_keywords"], lambda v: 1.0 if (len(v["_urls"]) > 0 and v["_keywords"]["action_phrase"] > 0) else 0.0)
+_add("has_urgency_and_cta", ["_keywords"], _has("urgency", "action_phrase"))
+_add("has_brand_and_link", ["_keywords", "_urls"], lambda v: 1.0 if (v["_keywords"]["brand"] > 0 and len(v["_urls"]) > 0) else 0.0)
+_add("has_money_and_cta", ["_keywords"], _has("money", "action_phrase"))
+_add("has_account_and_security", ["_keywords"], _has("account", "security"))
+_add("has_delivery_and_link", ["_keywords", "_urls"], lambda v: 1.0 if (v["_keywords"]["delivery"] > 0 and len(v["_urls"]) > 0) else 0.0)
+_add("symbol_pressure_score", ["_promo_symbols", "_uppercase_tokens", "_digit_runs"], lambda v: float(v["_promo_symbols"] + v["_uppercase_tokens"] + v["_digit_runs"]))
+_add("has_ham_and_no_url", ["ham_business_hits", "_urls"], lambda v: 1.0 if (v["ham_business_hits"] > 0 and len(v["_urls"]) == 0) else 0.0)
+_add("has_formal_and_no_cta", ["ham_formal_hits", "_keywords"], lambda v: 1.0 if (v["ham_formal_hits"] > 0 and v["_keywords"]["cta"] == 0) else 0.0)
+_add("has_admin_doc_and_no_url", ["ham_admin_doc_hits", "_urls"], lambda v: 1.0 if (v["ham_admin_doc_hits"] > 0 and len(v["_urls"]) == 0) else 0.0)
+_add("has_technical_business_and_no_cta", ["ham_technical_business_hits", "_keywords"], lambda v: 1.0 if (v["ham_technical_business_hits"] > 0 and v["_keywords"]["cta"] == 0) else 0.0)
+_add("has_signature_and_no_cta", ["business_signature_hits", "_keywords"], lambda v: 1.0 if (v["business_signature_hits"] > 0 and v["_keywords"]["cta"] == 0) else 0.0)
+
+_add("suspicious_tld_count", ["_urls"], lambda v: float(count_suspicious_tlds(v["_urls"])))
+_add("shortener_url_count", ["_urls"], lambda v: float(count_shortener_urls(v["_urls"])))
+for _name in ("cta_plus_url_score", "brand_plus_link_score", "urgency_cta_url_combo", "money_cta_combo"):
+    _add(_name, ["_combos"], lambda v, _name=_name: float(v["_combos"][_name]))
+for _name, _category in (
+    ("spam_keyword_hits", "spam"),
+    ("urgency_keyword_hits", "urgency"),
+    ("money_keyword_hits", "money"),
+    ("cta_keyword_hits", "cta"),
+    ("account_keyword_hits", "account"),
+    ("security_keyword_hits", "security"),
+    ("delivery_keyword_hits", "delivery"),
+    ("brand_keyword_hits", "brand"),
+    ("unsubscribe_keyword_hits", "unsubscribe"),
+    ("promo_keyword_hits", "promo_code"),
+):
+    _add(_name, ["_keywords"], lambda v, _category=_category: float(v["_keywords"][_category]))
+_add("_lang_terms", ["_text", "_analysis"], lambda v: lang_text_terms(v["_text"], v["_analysis"]))
+for _i, _name in enumerate(("_lang_valid", "_lang_text_score", "_lang_penalty")):
+    _add(_name, ["_lang_terms"], lambda v, _i=_i: v["_lang_terms"][_i])
+_add(
+    "lang_score",
+    ["_lang_valid", "_lang_text_score", "_lang_penalty", "_metadata"],
+    lambda v: combine_lang_score((v["_lang_valid"], v["_lang_text_score"], v["_lang_penalty"]), v["_metadata"]),
+)
+_add("lang_is_ita", ["_metadata"], lambda v: 1.0 if _safe_text(v["_metadata"].get("language")).lower() in {"ita", "it", "italian"} else 0.0)
+_add("ham_to_spam_keyword_ratio", ["ham_business_hits", "spam_keyword_hits"], lambda v: (v["ham_business_hits"] + 1.0) / (v["spam_keyword_hits"] + 1.0))
+_add("ham_to_cta_ratio", ["ham_business_hits", "cta_keyword_hits"], lambda v: (v["ham_business_hits"] + 1.0) / (v["cta_keyword_hits"] + 1.0))
+_add(
+    "_ham_strength",
+    ["ham_formal_hits", "ham_admin_doc_hits", "ham_technical_business_hits", "business_signature_hits"],
+    lambda v: float(v["ham_formal_hits"] + v["ham_admin_doc_hits"] + v["ham_technical_business_hits"] + v["business_signature_hits"]),
+)
+_add("ham_strength_to_spam_ratio", ["_ham_strength", "spam_keyword_hits"], lambda v: (v["_ham_strength"] + 1.0) / (v["spam_keyword_hits"] + 1.0))
+_add("ham_strength_score", ["_ham_strength"], lambda v: v["_ham_strength"])
+_add("noise_score", ["_word_count", "avg_word_length", "lang_score", "punctuation_ratio", "digit_ratio", "short_token_count"], _noise_score)
+_add(
+    "spam_intent_score",
+    ["_combos", "_keywords", "_urls", "suspicious_tld_count", "shortener_url_count"],
+    _spam_intent_score,
+)
+_add("noise_without_spam_intent", ["noise_score", "spam_intent_score"], lambda v: 1.0 if v["noise_score"] >= 2.0 and v["spam_intent_score"] == 0.0 else 0.0)
+_add("promo_symbol_count_clip", ["_promo_symbols"], lambda v: float(min(v["_promo_symbols"], 3)))
+_add("exclamation_count_clip", ["exclamation_count"], lambda v: float(min(v["exclamation_count"], 5)))
+_add("digit_run_count_clip", ["_digit_runs"], lambda v: float(min(v["_digit_runs"], 3)))
+_add("uppercase_token_count_clip", ["_uppercase_tokens"], lambda v: float(min(v["_uppercase_tokens"], 5)))
+_add("safe_security_ham_hits", ["_keywords"], lambda v: float(v["_keywords"]["safe_security_ham"]))
+_add("safe_security_to_spam_ratio", ["safe_security_ham_hits", "spam_keyword_hits"], lambda v: (v["safe_security_ham_hits"] + 1.0) / (v["spam_keyword_hits"] + 1.0))
+for _name, _hits in (
+    ("spam_keyword_density", "spam_keyword_hits"),
+    ("cta_keyword_density", "cta_keyword_hits"),
+    ("money_keyword_density", "money_keyword_hits"),
+    ("urgency_keyword_density", "urgency_keyword_hits"),
+    ("ham_business_density", "ham_business_hits"),
+):
+    _add(_name, [_hits, "_word_count"], lambda v, _hits=_hits: _safe_div(v[_hits], float(v["_word_count"])))
+
+
+# Primitive che i documenti lunghi ricevono già calcolate da summarize_spam_streaming al posto
+# dell'analisi condivisa: sono tutte quelle lette dai nodi che usano token, righe o l'analisi
+SPAM_STREAMING_NODES = (
+    "_basic",
+    "_word_count",
+    "_token_length_sum",
+    "_unique_word_count",
+    "_uppercase_tokens",
+    "_short_tokens",
+    "_keywords",
+    "_urls",
+    "_email_count",
+    "_combos",
+    "_promo_symbols",
+    "_digit_runs",
+    "_short_lines",
+    "_lang_terms",
+)
 
-    noise_score = 0.0
 
-    if lang_score < 0.35:
-        noise_score += 1.0
+class _SpamStreamingSummarizer:
+    """Stato delle primitive di SPAM_STREAMING_NODES tra un blocco e l'altro."""
+
+    def __init__(self, max_vocabulary: int):
+        self.max_vocabulary = max_vocabulary
+        self.chars = StreamingCharHistogram()
+        self.vocabulary: set = set()
+        self.overflow_words = 0
+        self.word_count = self.token_length_sum = self.uppercase_tokens = self.short_tokens = 0
+        self.keywords = keyword_matcher().stream()
+        self.keywords.feed(" ")
+        self.keyword_separator = ""
+        self.urls: List[str] = []
+        self.email_count = self.digit_runs = self.short_lines = 0
+        self.combos: Dict[str, int] = combo_counts(())
+        self.lang = LangCounts()
+        # Inizio del primo carattere non di spazio e fine dell'ultimo, per la lunghezza di text.strip()
+        self.offset = 0
+        self.text_start: Optional[int] = None
+        self.text_end = 0
+
+    def update(self, block: str) -> None:
+        self.chars.update(block)
+        stripped = block.lstrip()
+        if stripped:
+            if self.text_start is None:
+                self.text_start = self.offset + len(block) - len(stripped)
+            self.text_end = self.offset + len(block.rstrip())
+        self.offset += len(block)
+
+        tokens = extract_tokens(block)
+        tokens_lower = [tok.lower() for tok in tokens]
+        self.word_count += len(tokens)
+        self.token_length_sum += sum(len(tok) for tok in tokens)
+        self.uppercase_tokens += _count_uppercase_tokens(tokens)
+        self.short_tokens += _count_short_tokens(tokens)
+        vocabulary = self.vocabulary
+        for tok in tokens_lower:
+            if tok in vocabulary:
+                continue
+            if len(vocabulary) < self.max_vocabulary:
+                vocabulary.add(tok)
+            else:
+                self.overflow_words += 1
+        self.lang.add_tokens(tokens_lower)
+        self.lang.add_chunks(block)
+
+        # Il testo preparato del documento è " " + i testi normalizzati non vuoti dei blocchi,
+        # separati da uno spazio, + " ": i blocchi finiscono con "\n", che diventa uno spazio.
+        # Un testo vuoto dà "  ", in cui si trovano i termini che normalizzati restano vuoti
+        normalized = matching_text(normalize_for_matching(block))[1:-1]
+        if normalized:
+            self.keywords.feed(self.keyword_separator + normalized)
+            self.keyword_separator = " "
+
+        self.urls.extend(extract_urls(block))
+        self.email_count += len(extract_emails(block))
+        for name, n in combo_counts(chunk_signal_masks(block)).items():
+            self.combos[name] += n
+        self.digit_runs += count_digit_runs(block)
+        self.short_lines += _count_short_lines(block.splitlines())
+
+    def finish(self) -> Dict[str, Any]:
+        self.keywords.feed(" ")
+        chars = self.chars.finish()
+        lang = self.lang
+        if self.text_start is not None:
+            lang.total_chars = self.text_end - self.text_start
+            lang.add_chars(chars.class_counts())
+        return {
+            "_basic": _char_stats(chars.length, chars),
+            "_word_count": self.word_count,
+            "_token_length_sum": self.token_length_sum,
+            "_unique_word_count": len(self.vocabulary) + self.overflow_words,
+            "_uppercase_tokens": self.uppercase_tokens,
+            "_short_tokens": self.short_tokens,
+            "_keywords": self.keywords.counts(),
+            "_urls": self.urls,
+            "_email_count": self.email_count,
+            "_combos": self.combos,
+            "_promo_symbols": sum(chars.count(sym) for sym in PROMO_SYMBOLS),
+            "_digit_runs": self.digit_runs,
+            "_short_lines": self.short_lines,
+            "_lang_terms": lang_terms_from_counts(lang),
+        }
 
-    if basic["punctuation_ratio"] > 0.18:
-        noise_score += 1.0
 
-    if basic["digit_ratio"] > 0.20:
-        noise_score += 1.0
+def summarize_spam_streaming(
+    text: str,
+    chunk_chars: int = STREAMING_CHUNK_CHARS,
+    max_vocabulary: int = MAX_VOCABULARY,
+) -> Dict[str, Any]:
+    """
+    Primitive di SPAM_STREAMING_NODES calcolate leggendo il testo a blocchi di circa
+    ``chunk_chars`` caratteri chiusi su un ``\\n`` (streaming_stats.iter_line_blocks), senza liste
+    di token o righe del testo intero: la memoria è O(blocco + riga più lunga + vocabolario + URL).
+    Token, URL, email, righe e frasi non attraversano mai un "a capo", quindi tutti i valori sono
+    identici a quelli dell'analisi del testo intero; le keyword, che possono attraversarlo, sono
+    contate da KeywordStream. Solo ``_unique_word_count`` diventa un limite superiore quando le
+    parole distinte superano ``max_vocabulary``.
+    """
+    summarizer = _SpamStreamingSummarizer(max_vocabulary)
+    for block in iter_line_blocks(text, chunk_chars):
+        summarizer.update(block)
+    return summarizer.finish()
 
-    if word_count > 0 and (float(pat["short_token_count"]) / word_count) > 0.35:
-        noise_score += 1.0
 
-    if avg_word_length < 3.0 or avg_word_length > 12.0:
-        noise_score += 1.0
+def extract_spam_features(doc, features: Optional[Iterable[str]] = None) -> Dict[str, float | str]:
+    """
+    Calcola le feature spam associate a un singolo documento.
+    L'obiettivo è rappresentare sia l'intento spam sia eventuali segnali di legittimità del documento.
+    Con ``features`` vengono calcolate solo quelle feature e i loro prerequisiti (SPAM_FEATURE_GRAPH);
+    con None tutte, per i CSV di addestramento.
+    """
+    inputs = spam_feature_inputs(doc)
+    return spam_feature_plan(features, inputs).evaluate(inputs)
 
-    noise_score = min(noise_score, 5.0)
 
-    spam_intent_score = float(
-        (1.5 * float(pat["cta_plus_url_score"])) +
-        (2.0 * float(pat["urgency_cta_url_combo"])) +
-        (1.5 * float(pat["money_cta_combo"])) +
-        (1.5 * float(pat["suspicious_tld_count"])) +
-        (1.0 * float(pat["shortener_url_count"])) +
-        (1.0 * float(kw.account_keywords > 0 and kw.security_keywords > 0)) +
-        (1.0 * float(kw.delivery_keywords > 0 and pat["url_count"] > 0))
-    )
+def spam_feature_inputs(
+    doc,
+    streaming_min_chars: float = STREAMING_MIN_CHARS,
+    streaming_chunk_chars: int = STREAMING_CHUNK_CHARS,
+    max_vocabulary: int = MAX_VOCABULARY,
+) -> Dict[str, Any]:
+    """
+    Ingressi di SPAM_FEATURE_GRAPH per un documento (usati anche da blocks.feature_cost). Dai
+    ``streaming_min_chars`` caratteri in su niente analisi condivisa (``_analysis`` è None): le
+    primitive di SPAM_STREAMING_NODES vengono da summarize_spam_streaming.
+    """
+    text = _safe_text(getattr(doc, "text", ""))
+    inputs = {
+        "_doc": doc,
+        "_text": text,
+        "_metadata": getattr(doc, "metadata", {}) or {},
+    }
+    if len(text) >= streaming_min_chars:
+        inputs["_analysis"] = None
+        inputs.update(summarize_spam_streaming(text, streaming_chunk_chars, max_vocabulary))
+    else:
+        inputs["_analysis"] = analyze_document(doc)
+    return inputs
 
-    noise_without_spam_intent = 1.0 if noise_score >= 2.0 and spam_intent_score == 0.0 else 0.0
-
-    url_count = float(pat["url_count"])
-    email_count = float(pat["email_count"])
-
-    # Feature booleane derivate da combinazioni di segnali.
-    # Spesso catturano pattern spam meglio dei singoli conteggi isolati.
-    has_link_and_cta = 1.0 if (pat["url_count"] > 0 and pat["action_phrase_count"] > 0) else 0.0
-    has_urgency_and_cta = 1.0 if (kw.urgency_keywords > 0 and pat["action_phrase_count"] > 0) else 0.0
-    has_brand_and_link = 1.0 if (kw.brand_keywords > 0 and pat["url_count"] > 0) else 0.0
-    has_money_and_cta = 1.0 if (kw.money_keywords > 0 and pat["action_phrase_count"] > 0) else 0.0
-    has_account_and_security = 1.0 if (kw.account_keywords > 0 and kw.security_keywords > 0) else 0.0
-    has_delivery_and_link = 1.0 if (kw.delivery_keywords > 0 and pat["url_count"] > 0) else 0.0
-    safe_security_ham_hits = float(pat["safe_security_ham_hits"])
-
-    has_ham_and_no_url = 1.0 if (
-    ham_business_hits > 0 and pat["url_count"] == 0
-    ) else 0.0
-
-    has_formal_and_no_cta = 1.0 if (
-        ham_formal_hits > 0 and cta_keyword_hits == 0
-    ) else 0.0
-
-    has_admin_doc_and_no_url = 1.0 if (
-        ham_admin_doc_hits > 0 and pat["url_count"] == 0
-    ) else 0.0
-
-    has_technical_business_and_no_cta = 1.0 if (
-        ham_technical_business_hits > 0 and cta_keyword_hits == 0
-    ) else 0.0
-
-    has_signature_and_no_cta = 1.0 if (
-        business_signature_hits > 0 and cta_keyword_hits == 0
-    ) else 0.0
-
-    symbol_pressure_score = float(
-        pat["promo_symbol_count"] +
-        pat["uppercase_token_count"] +
-        pat["digit_run_count"]
-    )
 
-    features = {
-        "doc_id": _safe_text(getattr(doc, "id", "")) or _safe_text(metadata.get("id")),
-        "target_label": _extract_spam_label(metadata),
-        "spam_target_label": _extract_spam_label(metadata),
-        "char_count": basic["char_count"],
-        "word_count": float(word_count),
-        "unique_word_count": float(unique_word_count),
-        "unique_word_ratio": (unique_word_count / word_count) if word_count else 0.0,
-        "avg_word_length": avg_word_length,
-        "digit_count": basic["digit_count"],
-        "digit_ratio": basic["digit_ratio"],
-        "uppercase_ratio": basic["uppercase_ratio"],
-        "punctuation_ratio": basic["punctuation_ratio"],
-        "whitespace_ratio": basic["whitespace_ratio"],
-        "exclamation_count": basic["exclamation_count"],
-        "question_count": basic["question_count"],
-        "newline_count": basic["newline_count"],
-        "currency_symbol_count": basic["currency_symbol_count"],
-        "url_count_text": url_count,
-        "unique_url_count_text": float(pat["unique_url_count"]),
-        "unique_domain_count_text": float(pat["unique_domain_count"]),
-        "email_count_text": email_count,
-        "url_density": (url_count / word_count) if word_count else 0.0,
-        "email_density": (email_count / word_count) if word_count else 0.0,
-        "amount_pattern_count": float(pat["amount_pattern_count"]),
-        "promo_code_pattern_count": float(pat["promo_code_pattern_count"]),
-        "action_phrase_count": float(pat["action_phrase_count"]),
-        "promo_symbol_count": float(pat["promo_symbol_count"]),
-        "uppercase_token_count": float(pat["uppercase_token_count"]),
-        "short_line_count": float(pat["short_line_count"]),
-        "short_token_count": float(pat["short_token_count"]),
-
-        "ham_business_hits": ham_business_hits,
-        "ham_formal_hits": ham_formal_hits,
-        "ham_admin_doc_hits": ham_admin_doc_hits,
-        "ham_technical_business_hits": ham_technical_business_hits,
-        "business_signature_hits": business_signature_hits,
-
-        "digit_run_count": float(pat["digit_run_count"]),
-
-        "has_link_and_cta": has_link_and_cta, 
-        "has_urgency_and_cta": has_urgency_and_cta, 
-        "has_brand_and_link": has_brand_and_link, 
-        "has_money_and_cta": has_money_and_cta, 
-        "has_account_and_security": has_account_and_security, 
-        "has_delivery_and_link": has_delivery_and_link, 
-        "symbol_pressure_score": symbol_pressure_score, 
-        "has_ham_and_no_url": has_ham_and_no_url,
-        "has_formal_and_no_cta": has_formal_and_no_cta,
-        "has_admin_doc_and_no_url": has_admin_doc_and_no_url,
-        "has_technical_business_and_no_cta": has_technical_business_and_no_cta,
-        "has_signature_and_no_cta": has_signature_and_no_cta, 
-
-        "suspicious_tld_count": float(pat["suspicious_tld_count"]),
-        "shortener_url_count": float(pat["shortener_url_count"]),
-        "cta_plus_url_score": float(pat["cta_plus_url_score"]),
-        "brand_plus_link_score": float(pat["brand_plus_link_score"]),
-        "urgency_cta_url_combo": float(pat["urgency_cta_url_combo"]),
-        "money_cta_combo": float(pat["money_cta_combo"]),
-        "spam_keyword_hits": float(kw.spam_keywords),
-        "urgency_keyword_hits": float(kw.urgency_keywords),
-        "money_keyword_hits": float(kw.money_keywords),
-        "cta_keyword_hits": float(kw.cta_keywords),
-        "account_keyword_hits": float(kw.account_keywords),
-        "security_keyword_hits": float(kw.security_keywords),
-        "delivery_keyword_hits": float(kw.delivery_keywords),
-        "brand_keyword_hits": float(kw.brand_keywords),
-        "unsubscribe_keyword_hits": float(kw.unsubscribe_keywords),
-        "promo_keyword_hits": float(kw.promo_code_keywords),
-        "lang_score": lang_score,
-        "lang_is_ita": 1.0 if lang in {"ita", "it", "italian"} else 0.0,
-        "ham_to_spam_keyword_ratio": ham_to_spam_keyword_ratio,  
-        "ham_to_cta_ratio": ham_to_cta_ratio,
-        "ham_strength_to_spam_ratio": ham_strength_to_spam_ratio,
-        "ham_strength_score": ham_strength_score,
-        "noise_score": noise_score,
-        "spam_intent_score": spam_intent_score,
-        "noise_without_spam_intent": noise_without_spam_intent, 
-        "promo_symbol_count_clip": float(min(pat["promo_symbol_count"], 3)),
-        "exclamation_count_clip": float(min(basic["exclamation_count"], 5)),
-        "digit_run_count_clip": float(min(pat["digit_run_count"], 3)),
-        "uppercase_token_count_clip": float(min(pat["uppercase_token_count"], 5)),
-        "safe_security_ham_hits": safe_security_ham_hits,
-        "safe_security_to_spam_ratio": (safe_security_ham_hits + 1.0) / (spam_keyword_hits + 1.0),
-        "spam_keyword_density": spam_keyword_density,
-        "cta_keyword_density": cta_keyword_density,
-        "money_keyword_density": money_keyword_density,
-        "urgency_keyword_density": urgency_keyword_density,
-        "ham_business_density": ham_business_density,
-    }
-    return features
+def spam_feature_plan(features: Optional[Iterable[str]], inputs: Dict[str, Any]) -> FeaturePlan:
+    """Piano per gli ingressi di spam_feature_inputs: senza analisi le primitive riassunte sono ingressi."""
+    return SPAM_FEATURE_GRAPH.plan(features, provided=SPAM_STREAMING_NODES if inputs["_analysis"] is None else ())
 
 FEATURE_COLUMNS: List[str] = [
     "doc_id",
@@ -524,21 +711,114 @@ FEATURE_COLUMNS: List[str] = [
 ]
 
 
-class SpamFeatureExtractor(PipelineStep):
+# Colonne dei metadata presenti in ogni output, anche con un elenco ridotto di feature
+_METADATA_COLUMNS = ("doc_id", "target_label", "spam_target_label")
+# Ingressi che non dipendono dal testo: i nodi che li leggono (id, etichette, lang_score,
+# lang_is_ita e i loro derivati come noise_score) non vanno nell'archivio delle feature e vengono
+# ricalcolati a ogni lettura dai valori salvati, così seguono la configurazione LID corrente
+_METADATA_INPUTS = ("_doc", "_metadata")
+# Valori salvati nell'archivio: feature del solo testo e primitive lette dai nodi dei metadata
+STORED_FEATURE_COLUMNS: List[str] = SPAM_FEATURE_GRAPH.split(SPAM_FEATURE_GRAPH.plan(), _METADATA_INPUTS)[0]
+
+
+# Feature spam con lo stesso nome di una statistica di DocStatsCsv, che nei metadata le sovrascrive
+# (word_count, digit_ratio, ...): vengono copiate anche con il prefisso SPAM_COPY_PREFIX, così
+# redecide.py può riusare le feature spam degli output senza ricalcolarle dal testo
+SHARED_FEATURE_COLUMNS = tuple(c for c in FEATURE_COLUMNS if c in STATS_FEATURE_NAMES)
+SPAM_COPY_PREFIX = "spam_"
+
+
+def write_spam_features(metadata: dict, feats: Dict[str, float | str]) -> None:
+    """Copia le feature spam nei metadata, con le copie ``spam_*`` di SHARED_FEATURE_COLUMNS."""
+    metadata.update(feats)
+    for name in SHARED_FEATURE_COLUMNS:
+        if name in feats:
+            metadata[SPAM_COPY_PREFIX + name] = feats[name]
+
+
+class SpamFeatureExtractor(SharedAnalysisUser, PipelineStep):
     """
     Riceve i documenti in streaming, calcola feature lessicali, strutturali e comportamentali 
     utili al riconoscimento dello spam e le salva nei metadata del documento. 
+    Con ``feature_store`` le feature del testo vengono lette dall'archivio per digest
+    (blocks.feature_store) e calcolate solo per i documenti mai visti.
+    Con ``features`` (per esempio SpamFilter.required_features()) vengono calcolate solo quelle
+    feature, i loro prerequisiti e le colonne dei metadata; None = tutte le FEATURE_COLUMNS.
+    I documenti da almeno ``streaming_min_chars`` caratteri vengono letti a blocchi di
+    ``streaming_chunk_chars`` caratteri senza analisi condivisa (summarize_spam_streaming).
     """
     name = "Spam Feature Extractor"
 
+    def __init__(
+        self,
+        feature_store: Optional[str] = None,
+        feature_store_max_rows: int = DEFAULT_MAX_ROWS,
+        features: Optional[Iterable[str]] = None,
+        streaming_min_chars: int = STREAMING_MIN_CHARS,
+        streaming_chunk_chars: int = STREAMING_CHUNK_CHARS,
+        max_vocabulary: int = MAX_VOCABULARY,
+    ):
+        super().__init__()
+        self.features = None if features is None else sorted(set(features) | set(_METADATA_COLUMNS))
+        self.streaming_min_chars = streaming_min_chars
+        self.streaming_chunk_chars = streaming_chunk_chars
+        self.max_vocabulary = max_vocabulary
+        self.plan = SPAM_FEATURE_GRAPH.plan(self.features)
+        self.streaming_plan = SPAM_FEATURE_GRAPH.plan(self.features, provided=SPAM_STREAMING_NODES)
+        self.stored_columns, self.metadata_plan = SPAM_FEATURE_GRAPH.split(self.plan, _METADATA_INPUTS)
+        self.feature_store = (
+            FeatureStore(
+                feature_store,
+                subset_table("spam_features", self.stored_columns, STORED_FEATURE_COLUMNS),
+                self.stored_columns,
+                feature_store_max_rows,
+            )
+            if feature_store else None
+        )
+
+    def features_for(self, doc) -> Dict[str, float | str]:
+        """
+        Feature spam del documento. Con l'archivio i valori del solo testo vengono letti per
+        digest (o calcolati e salvati se mancano), quelli che dipendono dai metadata ricalcolati.
+        """
+        if self.feature_store is None:
+            return self._evaluate(doc)
+        digest = doc_digest(doc)
+        stored = self.feature_store.get(digest)
+        if stored is None:
+            self.stat_update("feature_store_miss")
+            values = self._evaluate(doc, keep=self.stored_columns)
+            self.feature_store.put(digest, {name: values[name] for name in self.stored_columns})
+            return {name: values[name] for name in self.plan.outputs}
+        self.stat_update("feature_store_hit")
+        return self.metadata_plan.evaluate({"_doc": doc, "_metadata": doc.metadata or {}, **stored})
+
+    def _evaluate(self, doc, keep: Iterable[str] = ()) -> Dict[str, Any]:
+        inputs = spam_feature_inputs(doc, self.streaming_min_chars, self.streaming_chunk_chars, self.max_vocabulary)
+        if inputs["_analysis"] is not None:
+            return self.plan.evaluate(inputs, keep=keep)
+        self.stat_update("streamed_docs")
+        if inputs["_unique_word_count"] > self.max_vocabulary:
+            self.stat_update("vocabulary_capped")
+        return self.streaming_plan.evaluate(inputs, keep=keep)
+
     def run(self, data: DocumentsPipeline, rank: int = 0, world_size: int = 1):
+        self.open_analysis_window()
         for doc in data:
-            feats = extract_spam_features(doc)
             if doc.metadata is None:
                 doc.metadata = {}
-            for k, v in feats.items():
-                doc.metadata[k] = v
+            # Documenti già decisi ham dalla cascata (SpamCascade): niente estrazione completa
+            if doc.metadata.get(CASCADE_KEY) == CASCADE_SHORT_CIRCUIT:
+                self.done_with_analysis(doc)
+                yield doc
+                continue
+            with self.track_time():
+                write_spam_features(doc.metadata, self.features_for(doc))
+                self.done_with_analysis(doc)
             yield doc
+        self.close_analysis_window()
+        if self.feature_store is not None:
+            self.feature_store.close()
 
 
 class SpamFeatureCsvWriter(PipelineStep):
@@ -569,6 +849,10 @@ class SpamFeatureCsvWriter(PipelineStep):
 
             for doc in data:
                 metadata = getattr(doc, "metadata", {}) or {}
+                if metadata.get(CASCADE_KEY) == CASCADE_SHORT_CIRCUIT:
+                    # Nessuna feature da scrivere: il documento non è passato dall'estrazione completa
+                    yield doc
+                    continue
                 row = {}
 
                 for col in FEATURE_COLUMNS:
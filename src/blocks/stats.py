@@ -1,14 +1,18 @@
 import re
 import csv
-import math
-from collections import Counter
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from datatrove.data import Document
 from datatrove.io import DataFolderLike
 from datatrove.pipeline.stats.doc_stats import DocStats
 from loguru import logger
 from datatrove.utils.lid import FT176LID
 
+from .char_histogram import CharHistogram
+from .feature_graph import FeatureGraph, NodeFunc
+from .feature_store import DEFAULT_MAX_ROWS, FeatureStore, doc_digest, subset_table
+from .streaming_stats import MAX_VOCABULARY, STREAMING_CHUNK_CHARS, summarize_analysis, summarize_streaming
+from .text_analysis import STREAMING_MIN_CHARS, SharedAnalysisUser, analyze_document
+
 # --- REGEX PRE-COMPILATE ---
 # L'uso di re.compile fuori dal loop di processamento ottimizza le performance,
 # evitando la ricompilazione dell'espressione regolare per ogni documento
@@ -23,6 +27,34 @@ RE_PUNC_SEQ = re.compile(r"[.!?,;:]{2,}")
 RE_ELIPSIS = re.compile(r"\.\.\.|…")
 RE_URL = re.compile(r"https?://[^\s)>\]\"\'\}]*")
 
+# Le regex strutturali e di anomalia qui sopra, contate da count_structural_matches
+STRUCTURAL_REGEXES: Dict[str, re.Pattern] = {
+    "elipsis": RE_ELIPSIS,
+    "bullet": RE_BULLET,
+    "url": RE_URL,
+    "email": RE_EMAIL,
+    "html": RE_HTML,
+    "repeated_char": RE_REPEATED_CHARS,
+    "repeated_seq": RE_REPEATED_SEQ,
+    "spaces": RE_SPACES,
+    "punc_seq": RE_PUNC_SEQ,
+}
+
+
+def count_structural_matches(text: str) -> Dict[str, int]:
+    """
+    Numero di match di ogni regex di STRUCTURAL_REGEXES, identico a ``len(RE_xxx.findall(text))``
+    ma con ``finditer``, senza costruire le liste dei match. Ogni regex ha la sua scansione: unire
+    i pattern in lookahead sovrapposti rende quadratiche le sequenze ripetute (``"a" * 50000``).
+    """
+    counts = {}
+    for name, regex in STRUCTURAL_REGEXES.items():
+        n = 0
+        for _ in regex.finditer(text):
+            n += 1
+        counts[name] = n
+    return counts
+
 # Lista di stopword italiane per il calcolo della stopword_ratio.
 # Fondamentale per distinguere testi naturali da liste di parole o contenuti spazzatura.
 
@@ -55,7 +87,222 @@ ITALIAN_STOPWORDS = {
     "avere", "ha", "hanno", "hai", "ho", "avete", "abbiamo" , "po'", "com'", "c'", "d'"
 }
 
-class DocStatsCsv(DocStats):
+# Le 52 feature di DocStatsCsv.extract_stats, nell'ordine in cui vengono calcolate
+STATS_FEATURE_NAMES: List[str] = [
+    "length", "white_space_ratio", "non_alpha_digit_ratio", "digit_ratio", "uppercase_ratio", "elipsis_ratio",
+    "punctuation_ratio", "word_count", "sentence_count", "vocabulary_size", "lowercase_ratio", "vowel_ratio",
+    "consonant_ratio", "avg_word_length", "avg_sentence_length", "quote_ratio", "parenthesis_ratio", "comma_ratio",
+    "period_ratio", "question_mark_ratio", "exclamation_ratio", "colon_ratio", "semicolon_ratio", "stopword_ratio",
+    "line_count", "paragraph_count", "avg_line_length", "avg_paragraph_length", "empty_line_ratio", "bullet_point_count",
+    "bullet_point_ratio", "url_count", "url_density", "email_count", "email_density", "html_tag_count",
+    "html_tag_ratio", "special_char_ratio", "most_common_word_freq", "repeated_word_count", "repeated_word_ratio", "repeated_char_count",
+    "repeated_char_ratio", "repeated_sequence_count", "text_entropy", "unique_word_count", "unique_word_ratio", "all_caps_word_ratio",
+    "all_lowercase_word_ratio", "mixed_case_word_ratio", "consecutive_spaces_count", "consecutive_punctuation_count",
+]
+
+# Chiave dei metadata scritta da DocStatsCsv: il documento ha le statistiche, anche se il modello
+# qualità ne legge solo alcune (blocks.redecide la usa per sapere quali chiavi comuni con le
+# feature spam sono statistiche)
+STATS_MARKER_KEY = "doc_stats"
+
+# --- Grafo delle statistiche (blocks.feature_graph) ---
+# Ingressi: il testo (non vuoto) e il suo riassunto (blocks.streaming_stats). Le feature sono
+# registrate nell'ordine di STATS_FEATURE_NAMES; la scansione delle regex strutturali e i campi
+# del riassunto vengono calcolati solo se qualche feature richiesta li legge.
+STATS_FEATURE_GRAPH = FeatureGraph(inputs=("_text", "_summary"))
+_add = STATS_FEATURE_GRAPH.add
+
+_add("_char_count", ["_text"], lambda v: len(v["_text"]))
+_add("_chars", ["_summary"], lambda v: v["_summary"].chars.class_counts())
+_add("_count", ["_summary"], lambda v: v["_summary"].chars.count)
+# Tutte le regex strutturali e di anomalia, una scansione per regex
+_add("_matches", ["_text"], lambda v: count_structural_matches(v["_text"]))
+_add("_word_count", ["_summary"], lambda v: v["_summary"].word_count)
+
+
+def _char_ratio(char_class: str) -> Tuple[List[str], NodeFunc]:
+    return ["_chars", "_char_count"], lambda v: v["_chars"][char_class] / v["_char_count"]
+
+
+def _count_ratio(*chars: str) -> Tuple[List[str], NodeFunc]:
+    return ["_count", "_char_count"], lambda v: sum(v["_count"](c) for c in chars) / v["_char_count"]
+
+
+def _match_ratio(pattern: str) -> Tuple[List[str], NodeFunc]:
+    return ["_matches", "_char_count"], lambda v: v["_matches"][pattern] / v["_char_count"]
+
+
+def _per_word(field: str) -> Tuple[List[str], NodeFunc]:
+    return ["_summary", "_word_count"], lambda v: getattr(v["_summary"], field) / v["_word_count"] if v["_word_count"] > 0 else 0
+
+
+def _summary_field(field: str) -> Tuple[List[str], NodeFunc]:
+    return ["_summary"], lambda v: getattr(v["_summary"], field)
+
+
+def _match_count(pattern: str) -> Tuple[List[str], NodeFunc]:
+    return ["_matches"], lambda v: v["_matches"][pattern]
+
+
+# 1. BASE: Metriche di composizione dei caratteri
+_add("length", ["_char_count"], lambda v: v["_char_count"])
+_add("white_space_ratio", *_char_ratio("whitespace"))
+_add("non_alpha_digit_ratio", *_char_ratio("non_alnum"))
+_add("digit_ratio", *_char_ratio("digit"))
+_add("uppercase_ratio", *_char_ratio("upper"))
+_add("elipsis_ratio", *_match_ratio("elipsis"))
+_add("punctuation_ratio", *_char_ratio("punctuation"))
+
+# 2. LINGUISTICHE: Analisi sintattica superficiale e stopword
+# L'uso delle vocali accentate è specifico per la lingua italiana.
+_add("word_count", ["_word_count"], lambda v: v["_word_count"])
+_add("sentence_count", ["_count"], lambda v: max(1, v["_count"](".") + v["_count"]("?") + v["_count"]("!")))
+_add("vocabulary_size", *_summary_field("vocabulary_size"))
+_add("lowercase_ratio", *_char_ratio("lower"))
+_add("vowel_ratio", *_char_ratio("vowel"))
+_add("consonant_ratio", *_char_ratio("consonant"))
+_add("avg_word_length", *_per_word("word_length_sum"))
+_add("avg_sentence_length", ["_word_count", "sentence_count"], lambda v: v["_word_count"] / v["sentence_count"])
+_add("quote_ratio", *_count_ratio('"', "'", "«", "»"))
+_add("parenthesis_ratio", *_count_ratio("(", ")"))
+_add("comma_ratio", *_count_ratio(","))
+_add("period_ratio", *_count_ratio("."))
+_add("question_mark_ratio", *_count_ratio("?"))
+_add("exclamation_ratio", *_count_ratio("!"))
+_add("colon_ratio", *_count_ratio(":"))
+_add("semicolon_ratio", *_count_ratio(";"))
+_add("stopword_ratio", *_per_word("stopword_count"))
+
+# 3. STRUTTURALI: Layout del documento e presenza di rumore (HTML, Email, URL)
+_add("line_count", *_summary_field("line_count"))
+_add("paragraph_count", *_summary_field("paragraph_count"))
+_add("avg_line_length", ["_char_count", "line_count"], lambda v: v["_char_count"] / v["line_count"] if v["line_count"] > 0 else 0)
+_add("avg_paragraph_length", ["_char_count", "paragraph_count"], lambda v: v["_char_count"] / v["paragraph_count"] if v["paragraph_count"] else 0)
+_add("empty_line_ratio", ["_summary", "line_count"], lambda v: v["_summary"].empty_line_count / v["line_count"] if v["line_count"] > 0 else 0)
+_add("bullet_point_count", *_match_count("bullet"))
+_add("bullet_point_ratio", *_match_ratio("bullet"))
+_add("url_count", *_match_count("url"))
+_add("url_density", ["_matches", "_word_count"], lambda v: v["_matches"]["url"] / v["_word_count"] if v["_word_count"] > 0 else 0)
+_add("email_count", *_match_count("email"))
+_add("email_density", ["_matches", "_word_count"], lambda v: v["_matches"]["email"] / v["_word_count"] if v["_word_count"] > 0 else 0)
+_add("html_tag_count", *_match_count("html"))
+_add("html_tag_ratio", *_match_ratio("html"))
+_add("special_char_ratio", *_char_ratio("special"))
+
+# 4. ANOMALIA: Identificazione di potenziali testi generati, boilerplate o spam
+_add("most_common_word_freq", *_summary_field("most_common_word_freq"))
+_add("repeated_word_count", *_summary_field("repeated_word_count"))
+_add("repeated_word_ratio", *_per_word("repeated_word_count"))
+_add("repeated_char_count", *_match_count("repeated_char"))
+_add("repeated_char_ratio", *_match_ratio("repeated_char"))
+_add("repeated_sequence_count", *_match_count("repeated_seq"))
+_add("text_entropy", ["_summary"], lambda v: v["_summary"].chars.entropy())
+_add("unique_word_count", *_summary_field("vocabulary_size"))
+_add("unique_word_ratio", *_per_word("vocabulary_size"))
+_add("all_caps_word_ratio", *_per_word("all_caps_word_count"))
+_add("all_lowercase_word_ratio", *_per_word("lowercase_word_count"))
+_add("mixed_case_word_ratio", *_per_word("mixed_case_word_count"))
+_add("consecutive_spaces_count", *_match_count("spaces"))
+_add("consecutive_punctuation_count", *_match_count("punc_seq"))
+
+
+def all_stats(text: str, summary) -> dict:
+    """
+    Le 52 statistiche calcolate direttamente, senza piano: quando servono tutte (modello qualità
+    predefinito, ``--all-features``) è più veloce di ``STATS_FEATURE_GRAPH``. Stessi valori e stesso
+    ordine del piano completo.
+    """
+    chars = summary.chars.class_counts()
+    count = summary.chars.count
+    word_count = summary.word_count
+    char_count = len(text)
+    line_count = summary.line_count
+    paragraph_count = summary.paragraph_count
+    # Regex strutturali e di anomalia (count_structural_matches)
+    matches = count_structural_matches(text)
+    
+    # 1. BASE: Metriche di composizione dei caratteri
+    base = {
+        "length": char_count,
+        "white_space_ratio": chars["whitespace"] / char_count,
+        "non_alpha_digit_ratio": chars["non_alnum"] / char_count,
+        "digit_ratio": chars["digit"] / char_count,
+        "uppercase_ratio": chars["upper"] / char_count,
+        "elipsis_ratio": matches["elipsis"] / char_count,
+        "punctuation_ratio": chars["punctuation"] / char_count,
+    }
+
+    # 2. LINGUISTICHE: Analisi sintattica superficiale e stopword
+    # L'uso delle vocali accentate è specifico per la lingua italiana.
+    periods, questions, exclamations = count('.'), count('?'), count('!')
+    sentence_count = max(1, periods + questions + exclamations)
+    linguistic = {
+        "word_count": word_count,
+        "sentence_count": sentence_count,
+        "vocabulary_size": summary.vocabulary_size,
+        "lowercase_ratio": chars["lower"] / char_count,
+        "vowel_ratio": chars["vowel"] / char_count,
+        "consonant_ratio": chars["consonant"] / char_count,
+        "avg_word_length": summary.word_length_sum / word_count if word_count > 0 else 0,
+        "avg_sentence_length": word_count / sentence_count,
+        "quote_ratio": (count('"') + count("'") + count("«") + count("»")) / char_count,
+        "parenthesis_ratio": (count('(') + count(')')) / char_count,
+        "comma_ratio": count(',') / char_count,
+        "period_ratio": periods / char_count,
+        "question_mark_ratio": questions / char_count,
+        "exclamation_ratio": exclamations / char_count,
+        "colon_ratio": count(':') / char_count,
+        "semicolon_ratio": count(';') / char_count,
+        "stopword_ratio": summary.stopword_count / word_count if word_count > 0 else 0,
+    }
+
+    # 3. STRUTTURALI: Layout del documento e presenza di rumore (HTML, Email, URL)
+    bullet_count = matches["bullet"]
+    url_count = matches["url"]
+    email_count = matches["email"]
+    html_tag_count = matches["html"]
+    structural = {
+        "line_count": line_count,
+        "paragraph_count": paragraph_count,
+        "avg_line_length": char_count / line_count if line_count > 0 else 0,
+        "avg_paragraph_length": char_count / paragraph_count if paragraph_count else 0,
+        "empty_line_ratio": summary.empty_line_count / line_count if line_count > 0 else 0,
+        "bullet_point_count": bullet_count,
+        "bullet_point_ratio": bullet_count / char_count,
+        "url_count": url_count,
+        "url_density": url_count / word_count if word_count > 0 else 0,
+        "email_count": email_count,
+        "email_density": email_count / word_count if word_count > 0 else 0,
+        "html_tag_count": html_tag_count,
+        "html_tag_ratio": html_tag_count / char_count,
+        "special_char_ratio": chars["special"] / char_count,
+    }
+
+    # 4. ANOMALIA: Identificazione di potenziali testi generati, boilerplate o spam
+    unique_words = summary.vocabulary_size
+    repeated_words = summary.repeated_word_count
+    repeated_char_count = matches["repeated_char"]
+    anomaly = {
+        "most_common_word_freq": summary.most_common_word_freq,
+        "repeated_word_count": repeated_words,
+        "repeated_word_ratio": repeated_words / word_count if word_count > 0 else 0,
+        "repeated_char_count": repeated_char_count,
+        "repeated_char_ratio": repeated_char_count / char_count,
+        "repeated_sequence_count": matches["repeated_seq"],
+        "text_entropy": summary.chars.entropy(),
+        "unique_word_count": unique_words,
+        "unique_word_ratio": unique_words / word_count if word_count > 0 else 0,
+        "all_caps_word_ratio": summary.all_caps_word_count / word_count if word_count > 0 else 0,
+        "all_lowercase_word_ratio": summary.lowercase_word_count / word_count if word_count > 0 else 0,
+        "mixed_case_word_ratio": summary.mixed_case_word_count / word_count if word_count > 0 else 0,
+        "consecutive_spaces_count": matches["spaces"],
+        "consecutive_punctuation_count": matches["punc_seq"],
+    }
+
+    return {**base, **linguistic, **structural, **anomaly}
+
+
+class DocStatsCsv(SharedAnalysisUser, DocStats):
 
     """
     Componente della pipeline DataTrove per l'estrazione di feature statistiche avanzate.
@@ -70,6 +317,12 @@ class DocStatsCsv(DocStats):
         output_folder: DataFolderLike,
         csv_filename: str = "doc_stats_per_file.csv",
         languages: str = "it",
+        feature_store: Optional[str] = None,
+        feature_store_max_rows: int = DEFAULT_MAX_ROWS,
+        streaming_min_chars: int = STREAMING_MIN_CHARS,
+        streaming_chunk_chars: int = STREAMING_CHUNK_CHARS,
+        max_vocabulary: int = MAX_VOCABULARY,
+        features: Optional[Iterable[str]] = None,
         **kwargs  #--->accetta i parametri extra come groups_to_compute
     ) -> None:
         # Passiamo i kwargs (incluso groups_to_compute) alla classe base DocStats
@@ -78,6 +331,26 @@ class DocStatsCsv(DocStats):
         self.languages = languages
         self.all_docs_stats = []
         self._lid_model = None
+        # Feature richieste (per esempio ItalianClassification.required_features()): None = tutte le 52
+        self.features = None if features is None else sorted(set(features))
+        self.plan = STATS_FEATURE_GRAPH.plan(self.features)
+        self.feature_names = [name for name in STATS_FEATURE_NAMES if name in set(self.plan.outputs)]
+        # Con tutte le statistiche richieste il piano non salta nulla: calcolo diretto (all_stats)
+        self.direct = len(self.feature_names) == len(STATS_FEATURE_NAMES)
+        # Archivio delle feature per digest (blocks.feature_store): None = sempre ricalcolate
+        self.feature_store = (
+            FeatureStore(
+                feature_store,
+                subset_table("doc_stats", self.feature_names, STATS_FEATURE_NAMES),
+                self.feature_names,
+                feature_store_max_rows,
+            )
+            if feature_store else None
+        )
+        # Documenti molto lunghi: riassunto a blocchi con memoria O(blocco + vocabolario)
+        self.streaming_min_chars = streaming_min_chars
+        self.streaming_chunk_chars = streaming_chunk_chars
+        self.max_vocabulary = max_vocabulary
 
     #variabilizzo
     @property
@@ -90,100 +363,38 @@ class DocStatsCsv(DocStats):
     def _calculate_entropy(self, text: str) -> float:
         """Calcola l'entropia di Shannon a livello di caratteri per misurare la compressione del testo."""
         if not text: return 0.0
-        counts = Counter(text)
-        text_len = len(text)
-        return -sum((count / text_len) * math.log2(count / text_len) for count in counts.values())
+        return CharHistogram(text).entropy()
 
     def extract_stats(self, doc: Document) -> dict:
         """
         Motore di estrazione: trasforma il testo grezzo in un vettore di 52 feature numeriche.
         Le feature sono divise in: Base, Linguistiche, Strutturali e di Anomalia.
+        Con ``features`` vengono calcolate solo quelle e i loro prerequisiti (STATS_FEATURE_GRAPH).
         """
-        text = doc.text
-        if not text or len(text) == 0:
+        inputs = self.feature_inputs(doc)
+        if inputs is None:
             return self._get_empty_stats()
+        if self.direct:
+            return all_stats(inputs["_text"], inputs["_summary"])
+        return self.plan.evaluate(inputs)
 
-        words = text.split()
-        word_count = len(words)
-        char_count = len(text)
-        lines = text.splitlines()
-        line_count = len(lines)
-        paragraphs = [p for p in text.split("\n\n") if p.strip()]
-        
-        # 1. BASE: Metriche di composizione dei caratteri
-        base = {
-            "length": char_count,
-            "white_space_ratio": sum(1 for c in text if c.isspace()) / char_count,
-            "non_alpha_digit_ratio": sum(1 for c in text if not c.isalnum()) / char_count,
-            "digit_ratio": sum(1 for c in text if c.isdigit()) / char_count,
-            "uppercase_ratio": sum(1 for c in text if c.isupper()) / char_count,
-            "elipsis_ratio": len(RE_ELIPSIS.findall(text)) / char_count,
-            "punctuation_ratio": sum(1 for c in text if c in '.,;:!?()[]""\'\'') / char_count,
-        }
-
-        # 2. LINGUISTICHE: Analisi sintattica superficiale e stopword
-        # L'uso delle vocali accentate è specifico per la lingua italiana.
-        periods, questions, exclamations = text.count('.'), text.count('?'), text.count('!')
-        sentence_count = max(1, periods + questions + exclamations)
-        linguistic = {
-            "word_count": word_count,
-            "sentence_count": sentence_count,
-            "vocabulary_size": len(set(w.lower() for w in words)),
-            "lowercase_ratio": sum(1 for c in text if c.islower()) / char_count,
-            "vowel_ratio": sum(1 for c in text.lower() if c in "aeiouàèéìòù") / char_count,
-            "consonant_ratio": sum(1 for c in text if c.isalpha() and c.lower() not in "aeiouàèéìòù") / char_count,
-            "avg_word_length": sum(len(w) for w in words) / word_count if word_count > 0 else 0,
-            "avg_sentence_length": word_count / sentence_count,
-            "quote_ratio": (text.count('"') + text.count("'") + text.count("«") + text.count("»")) / char_count,
-            "parenthesis_ratio": (text.count('(') + text.count(')')) / char_count,
-            "comma_ratio": text.count(',') / char_count,
-            "period_ratio": periods / char_count,
-            "question_mark_ratio": questions / char_count,
-            "exclamation_ratio": exclamations / char_count,
-            "colon_ratio": text.count(':') / char_count,
-            "semicolon_ratio": text.count(';') / char_count,
-            "stopword_ratio": sum(1 for w in words if w.lower() in ITALIAN_STOPWORDS) / word_count if word_count > 0 else 0,
-        }
-
-        # 3. STRUTTURALI: Layout del documento e presenza di rumore (HTML, Email, URL)
-        structural = {
-            "line_count": line_count,
-            "paragraph_count": len(paragraphs),
-            "avg_line_length": char_count / line_count if line_count > 0 else 0,
-            "avg_paragraph_length": char_count / len(paragraphs) if paragraphs else 0,
-            "empty_line_ratio": sum(1 for l in lines if not l.strip()) / line_count if line_count > 0 else 0,
-            "bullet_point_count": len(RE_BULLET.findall(text)),
-            "bullet_point_ratio": len(RE_BULLET.findall(text)) / char_count,
-            "url_count": len(RE_URL.findall(text)),
-            "url_density": len(RE_URL.findall(text)) / word_count if word_count > 0 else 0,
-            "email_count": len(RE_EMAIL.findall(text)),
-            "email_density": len(RE_EMAIL.findall(text)) / word_count if word_count > 0 else 0,
-            "html_tag_count": len(RE_HTML.findall(text)),
-            "html_tag_ratio": len(RE_HTML.findall(text)) / char_count,
-            "special_char_ratio": sum(1 for c in text if c in "@#$%^&*+=") / char_count,
-        }
-
-        # 4. ANOMALIA: Identificazione di potenziali testi generati, boilerplate o spam
-        word_counts = Counter(w.lower() for w in words)
-        unique_words = len(word_counts)
-        anomaly = {
-            "most_common_word_freq": word_counts.most_common(1)[0][1] if word_counts else 0,
-            "repeated_word_count": sum(1 for c in word_counts.values() if c > 1),
-            "repeated_word_ratio": sum(1 for c in word_counts.values() if c > 1) / word_count if word_count > 0 else 0,
-            "repeated_char_count": len(RE_REPEATED_CHARS.findall(text)),
-            "repeated_char_ratio": len(RE_REPEATED_CHARS.findall(text)) / char_count,
-            "repeated_sequence_count": len(RE_REPEATED_SEQ.findall(text)),
-            "text_entropy": self._calculate_entropy(text),
-            "unique_word_count": unique_words,
-            "unique_word_ratio": unique_words / word_count if word_count > 0 else 0,
-            "all_caps_word_ratio": sum(1 for w in words if w.isupper() and len(w) > 1) / word_count if word_count > 0 else 0,
-            "all_lowercase_word_ratio": sum(1 for w in words if w.islower()) / word_count if word_count > 0 else 0,
-            "mixed_case_word_ratio": sum(1 for w in words if any(c.isupper() for c in w) and any(c.islower() for c in w)) / word_count if word_count > 0 else 0,
-            "consecutive_spaces_count": len(RE_SPACES.findall(text)),
-            "consecutive_punctuation_count": len(RE_PUNC_SEQ.findall(text)),
-        }
+    def feature_inputs(self, doc: Document) -> Optional[dict]:
+        """Ingressi di STATS_FEATURE_GRAPH per un documento, None se il testo è vuoto."""
+        text = doc.text
+        if not text or len(text) == 0:
+            return None
 
-        return {**base, **linguistic, **structural, **anomaly}
+        # Token, righe e conteggi dei caratteri vengono dall'analisi condivisa del documento
+        # (blocks.text_analysis), già calcolata se il documento è passato dai blocchi spam; i
+        # documenti molto lunghi vengono invece riassunti a blocchi senza costruire liste
+        if len(text) >= self.streaming_min_chars:
+            summary = summarize_streaming(text, ITALIAN_STOPWORDS, self.streaming_chunk_chars, self.max_vocabulary)
+            self.stat_update("streamed_docs")
+            if summary.vocabulary_capped:
+                self.stat_update("vocabulary_capped")
+        else:
+            summary = summarize_analysis(analyze_document(doc), ITALIAN_STOPWORDS)
+        return {"_text": text, "_summary": summary}
     
     def run(self, data, rank=0, world_size=1):
         """
@@ -196,25 +407,14 @@ class DocStatsCsv(DocStats):
         
         # 2. Apriamo il file in modalità scrittura immediata
         # Usiamo self.output_folder.open per essere compatibili con DataTrove
+        self.open_analysis_window()
         with self.output_folder.open(temp_csv_name, "wt") as f:
             writer = None
             
             for doc in data:
                 with self.track_time():
-                    # Estraiamo le 41 features
-                    doc_features = self.extract_stats(doc)
-                    
-                    # Gestione della Language Identification (LID)
-                    lang_score = doc.metadata.get("language_score")
-                    if lang_score is None:
-                        _, lang_score = self.lid_model.predict(doc)
-                    
-                    row = {
-                        "doc_id": doc.id,
-                        "label": doc.metadata.get("label", "unknown").lower(),
-                        "language_score": lang_score,
-                        **doc_features
-                    }
+                    row = self.annotate(doc)
+                    self.done_with_analysis(doc)
                     
                     # Inizializziamo l'header solo al primo documento
                     if writer is None:
@@ -223,20 +423,78 @@ class DocStatsCsv(DocStats):
                     
                     # Scrittura immediata su disco (flush implicito) per prevenire saturazione RAM
                     writer.writerow(row)
-                    
-                    # Propagazione delle feature nei metadati per eventuali step successivi della pipeline
-                    doc.metadata.update(doc_features)
-                    doc.metadata["language_score"] = lang_score
                 
                 yield doc
         
+        self.close_analysis_window()
+        if self.feature_store is not None:
+            self.feature_store.close()
         logger.info(f"Worker {rank} ha finito di scrivere il suo file parziale.")
 
+    def annotate(self, doc: Document) -> dict:
+        """
+        Calcola le statistiche del documento, le copia nei metadata con ``language_score`` e
+        restituisce la riga del CSV.
+        """
+        # Estraiamo le 52 features (dall'archivio, se il documento è già stato visto)
+        doc_features = self.cached_stats(doc)
+
+        # Gestione della Language Identification (LID)
+        lang_score = doc.metadata.get("language_score")
+        if lang_score is None:
+            _, lang_score = self.lid_model.predict(doc)
+
+        row = {
+            "doc_id": doc.id,
+            "label": doc.metadata.get("label", "unknown").lower(),
+            "language_score": lang_score,
+            **doc_features
+        }
+
+        # Propagazione delle feature nei metadati per eventuali step successivi della pipeline
+        doc.metadata.update(doc_features)
+        doc.metadata["language_score"] = lang_score
+        doc.metadata[STATS_MARKER_KEY] = True
+        return row
+
+    def cached_stats(self, doc: Document) -> dict:
+        """extract_stats passando dall'archivio delle feature, se configurato."""
+        if self.feature_store is None:
+            return self.extract_stats(doc)
+        digest = doc_digest(doc)
+        stats = self.feature_store.get(digest)
+        if stats is not None:
+            self.stat_update("feature_store_hit")
+            return stats
+        self.stat_update("feature_store_miss")
+        stats = self.extract_stats(doc)
+        self.feature_store.put(digest, stats)
+        return stats
+
     def _save_to_csv(self):
         pass
            
 
     def _get_empty_stats(self) -> dict:
-        # Metodo di fallback per doc vuoti (ritorna 0 per tutte le chiavi)
-        keys = ["length", "white_space_ratio", "non_alpha_digit_ratio", "digit_ratio", "uppercase_ratio", "elipsis_ratio", "punctuation_ratio", "word_count", "sentence_count", "vocabulary_size", "lowercase_ratio", "vowel_ratio", "consonant_ratio", "avg_word_length", "avg_sentence_length", "quote_ratio", "parenthesis_ratio", "comma_ratio", "period_ratio", "question_mark_ratio", "exclamation_ratio", "colon_ratio", "semicolon_ratio", "stopword_ratio", "line_count", "paragraph_count", "avg_line_length", "avg_paragraph_length", "empty_line_ratio", "bullet_point_count", "bullet_point_ratio", "url_count", "url_density", "email_count", "email_density", "html_tag_count", "html_tag_ratio", "special_char_ratio", "most_common_word_freq", "repeated_word_count", "repeated_word_ratio", "repeated_char_count", "repeated_char_ratio", "repeated_sequence_count", "text_entropy", "unique_word_count", "unique_word_ratio", "all_caps_word_ratio", "all_lowercase_word_ratio", "mixed_case_word_ratio", "consecutive_spaces_count", "consecutive_punctuation_count"]
-        return {k: 0 for k in keys}
\ No newline at end of file
+        # Metodo di fallback per doc vuoti (ritorna 0 per tutte le chiavi calcolate)
+        return {k: 0 for k in self.feature_names}
+
+
+class DocStatsRestore(DocStatsCsv):
+    """
+    Riscrive nei metadata le statistiche ``features`` dopo un filtro che le ha sovrascritte: con
+    la qualità prima dello spam (blocks.filter_planner) SpamFeatureExtractor scrive le feature
+    spam con lo stesso nome, e i documenti tenuti devono avere i valori di DocStatsCsv come
+    nell'ordine predefinito. Non scrive il CSV.
+    """
+
+    name = "Restore Doc Stats"
+
+    def run(self, data, rank=0, world_size=1):
+        self.open_analysis_window()
+        for doc in data:
+            with self.track_time():
+                doc.metadata.update(self.extract_stats(doc))
+                self.done_with_analysis(doc)
+            yield doc
+        self.close_analysis_window()
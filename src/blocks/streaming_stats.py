@@ -0,0 +1,263 @@
+"""
+Riassunto del testo per le statistiche di DocStatsCsv, anche a memoria limitata.
+
+DocStatsCsv.extract_stats ricava le 52 feature da pochi conteggi: caratteri per classe, parole
+(``str.split``), righe (``str.splitlines``), paragrafi (``split("\\n\\n")``) e frequenze delle
+parole in minuscolo. ``summarize_analysis`` li calcola dalle liste di AnalyzedDocument, come
+sempre, un campo alla volta e solo se qualche feature lo legge; ``summarize_streaming`` li calcola
+leggendo il testo a blocchi di ``chunk_chars`` caratteri e tenendo solo contatori, per le pagine
+da diversi MB in cui liste di parole, righe e paragrafi occuperebbero molte volte la dimensione
+del testo.
+
+I confini tra blocchi sono gestiti esattamente: la parola spezzata a fine blocco passa al blocco
+successivo, un ``\\r`` finale seguito da ``\\n`` conta come un solo "a capo" e le sequenze di
+``\\n`` a cavallo di due blocchi separano i paragrafi come nel testo intero. La memoria massima
+è quindi O(blocco + vocabolario) (più la parola più lunga). Il vocabolario è limitato a
+``max_vocabulary`` parole distinte: oltre il limite le parole mai viste vengono contate come
+distinte ma non memorizzate, quindi ``vocabulary_size`` / ``unique_word_count`` diventano un
+limite superiore e ``repeated_word_count`` un limite inferiore (``vocabulary_capped`` nel
+riassunto). Entro il limite tutte le feature sono identiche a quelle del testo intero.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from collections import Counter
+from functools import cached_property
+from typing import Collection, Iterator, List
+
+from .char_histogram import CharHistogram, StreamingCharHistogram
+from .text_analysis import AnalyzedDocument
+
+# Blocco di testo letto a ogni passo e limite del vocabolario di summarize_streaming
+STREAMING_CHUNK_CHARS = 1 << 16
+MAX_VOCABULARY = 200_000
+
+# Separatori di riga di str.splitlines
+LINE_BREAKS = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+_NEWLINE_RUNS = re.compile(r"(\n+)")
+
+
+@dataclass
+class TextSummary:
+    """Conteggi da cui DocStatsCsv.extract_stats calcola le feature."""
+
+    chars: CharHistogram
+    word_count: int
+    word_length_sum: int
+    stopword_count: int
+    all_caps_word_count: int
+    lowercase_word_count: int
+    mixed_case_word_count: int
+    vocabulary_size: int
+    repeated_word_count: int
+    most_common_word_freq: int
+    line_count: int
+    empty_line_count: int
+    paragraph_count: int
+    vocabulary_capped: bool = False
+
+
+class AnalysisSummary:
+    """
+    Gli stessi campi di TextSummary, calcolati al primo accesso dalle liste (memorizzate) di
+    AnalyzedDocument: il percorso normale. Con l'estrazione ridotta alle feature dei modelli i
+    campi che nessuna feature legge (per esempio righe o paragrafi) non vengono mai calcolati.
+    """
+
+    def __init__(self, analysis: AnalyzedDocument, stopwords: Collection[str]):
+        self.analysis = analysis
+        self.stopwords = stopwords
+        self.chars = analysis.char_histogram
+        self.vocabulary_capped = False
+
+    @cached_property
+    def word_count(self) -> int:
+        return len(self.analysis.words)
+
+    @cached_property
+    def word_length_sum(self) -> int:
+        return sum(len(w) for w in self.analysis.words)
+
+    @cached_property
+    def stopword_count(self) -> int:
+        return sum(1 for w in self.analysis.words_lower if w in self.stopwords)
+
+    @cached_property
+    def all_caps_word_count(self) -> int:
+        return sum(1 for w in self.analysis.words if w.isupper() and len(w) > 1)
+
+    @cached_property
+    def lowercase_word_count(self) -> int:
+        return sum(1 for w in self.analysis.words if w.islower())
+
+    @cached_property
+    def mixed_case_word_count(self) -> int:
+        return sum(1 for w in self.analysis.words if any(c.isupper() for c in w) and any(c.islower() for c in w))
+
+    @cached_property
+    def vocabulary_size(self) -> int:
+        return len(self.analysis.word_counts)
+
+    @cached_property
+    def repeated_word_count(self) -> int:
+        return sum(1 for c in self.analysis.word_counts.values() if c > 1)
+
+    @cached_property
+    def most_common_word_freq(self) -> int:
+        word_counts = self.analysis.word_counts
+        return word_counts.most_common(1)[0][1] if word_counts else 0
+
+    @cached_property
+    def line_count(self) -> int:
+        return len(self.analysis.lines)
+
+    @cached_property
+    def empty_line_count(self) -> int:
+        return sum(1 for l in self.analysis.lines if not l.strip())
+
+    @cached_property
+    def paragraph_count(self) -> int:
+        return len([p for p in self.analysis.text.split("\n\n") if p.strip()])
+
+
+def summarize_analysis(analysis: AnalyzedDocument, stopwords: Collection[str]) -> AnalysisSummary:
+    """Riassunto dalle liste (memorizzate) di AnalyzedDocument, calcolato campo per campo al primo accesso."""
+    return AnalysisSummary(analysis, stopwords)
+
+
+class _StreamingSummarizer:
+    """Stato dei contatori tra un blocco e l'altro."""
+
+    def __init__(self, stopwords: Collection[str], max_vocabulary: int):
+        self.stopwords = stopwords
+        self.max_vocabulary = max_vocabulary
+        self.chars = StreamingCharHistogram()
+        self.word_counts: Counter = Counter()
+        self.overflow_words = 0
+        self.word_count = self.word_length_sum = self.stopword_count = 0
+        self.all_caps = self.lowercase = self.mixed_case = 0
+        self.pending_word = ""
+        # Righe: righe chiuse, righe vuote, riga aperta (e se ha caratteri non di spazio), "\r" finale
+        self.line_count = self.empty_line_count = 0
+        self.line_open = self.line_has_text = self.pending_cr = False
+        # Paragrafi: "\n" consecutivi in sospeso e paragrafo corrente con testo
+        self.paragraph_count = 0
+        self.newline_run = 0
+        self.paragraph_has_text = False
+
+    def add_words(self, words: List[str]) -> None:
+        lowers = [w.lower() for w in words]
+        stopwords = self.stopwords
+        self.word_count += len(words)
+        self.word_length_sum += sum(map(len, words))
+        self.stopword_count += sum(1 for w in lowers if w in stopwords)
+        self.all_caps += sum(1 for w in words if w.isupper() and len(w) > 1)
+        self.lowercase += sum(1 for w in words if w.islower())
+        self.mixed_case += sum(1 for w in words if any(c.isupper() for c in w) and any(c.islower() for c in w))
+        word_counts = self.word_counts
+        if len(word_counts) + len(lowers) <= self.max_vocabulary:
+            word_counts.update(lowers)
+            return
+        for lower in lowers:
+            if lower in word_counts:
+                word_counts[lower] += 1
+            elif len(word_counts) < self.max_vocabulary:
+                word_counts[lower] = 1
+            else:
+                self.overflow_words += 1
+
+    def add_lines(self, chunk: str) -> None:
+        if self.pending_cr and chunk.startswith("\n"):
+            # "\r\n" diviso tra due blocchi: il "\n" chiude la stessa riga
+            chunk = chunk[1:]
+        self.pending_cr = False
+        for piece in chunk.splitlines(keepends=True):
+            has_text = not piece.isspace()
+            if piece[-1] in LINE_BREAKS:
+                self.line_count += 1
+                if not (self.line_has_text or has_text):
+                    self.empty_line_count += 1
+                self.line_open = self.line_has_text = False
+                self.pending_cr = piece[-1] == "\r"
+            else:
+                self.line_open = True
+                self.line_has_text = self.line_has_text or has_text
+
+    def add_paragraphs(self, chunk: str) -> None:
+        for part in _NEWLINE_RUNS.split(chunk):
+            if not part:
+                continue
+            if part[0] == "\n":
+                self.newline_run += len(part)
+                continue
+            if self.newline_run >= 2:
+                self.paragraph_count += self.paragraph_has_text
+                self.paragraph_has_text = False
+            self.newline_run = 0
+            self.paragraph_has_text = self.paragraph_has_text or not part.isspace()
+
+    def update(self, chunk: str) -> None:
+        self.chars.update(chunk)
+        self.add_lines(chunk)
+        self.add_paragraphs(chunk)
+        text = self.pending_word + chunk
+        words = text.split()
+        # Se il blocco non finisce con uno spazio l'ultima parola può continuare nel blocco dopo
+        self.pending_word = words.pop() if words and not text[-1].isspace() else ""
+        self.add_words(words)
+
+    def finish(self) -> TextSummary:
+        if self.pending_word:
+            self.add_words([self.pending_word])
+        if self.line_open:
+            self.line_count += 1
+            self.empty_line_count += not self.line_has_text
+        self.paragraph_count += self.paragraph_has_text
+        word_counts = self.word_counts
+        return TextSummary(
+            chars=self.chars.finish(),
+            word_count=self.word_count,
+            word_length_sum=self.word_length_sum,
+            stopword_count=self.stopword_count,
+            all_caps_word_count=self.all_caps,
+            lowercase_word_count=self.lowercase,
+            mixed_case_word_count=self.mixed_case,
+            vocabulary_size=len(word_counts) + self.overflow_words,
+            repeated_word_count=sum(1 for c in word_counts.values() if c > 1),
+            most_common_word_freq=max(word_counts.values(), default=0),
+            line_count=self.line_count,
+            empty_line_count=self.empty_line_count,
+            paragraph_count=self.paragraph_count,
+            vocabulary_capped=self.overflow_words > 0,
+        )
+
+
+def iter_line_blocks(text: str, chunk_chars: int = STREAMING_CHUNK_CHARS) -> Iterator[str]:
+    """
+    Blocchi consecutivi del testo di circa ``chunk_chars`` caratteri, ognuno chiuso subito dopo un
+    ``\\n`` (tranne l'ultimo): parole, URL, righe e frasi non restano mai a cavallo di due blocchi.
+    Un blocco è lungo al massimo ``chunk_chars`` più la riga più lunga del testo.
+    """
+    start = 0
+    while start < len(text):
+        end = start + chunk_chars
+        if end < len(text):
+            cut = text.find("\n", end - 1)
+            end = len(text) if cut == -1 else cut + 1
+        yield text[start:end]
+        start = end
+
+
+def summarize_streaming(
+    text: str,
+    stopwords: Collection[str],
+    chunk_chars: int = STREAMING_CHUNK_CHARS,
+    max_vocabulary: int = MAX_VOCABULARY,
+) -> TextSummary:
+    """Riassunto del testo letto a blocchi di ``chunk_chars`` caratteri, con memoria O(blocco + vocabolario)."""
+    summarizer = _StreamingSummarizer(stopwords, max_vocabulary)
+    for start in range(0, len(text), chunk_chars):
+        summarizer.update(text[start:start + chunk_chars])
+    return summarizer.finish()
@@ -0,0 +1,250 @@
+"""
+Analisi condivisa del testo di un documento.
+
+DocStatsCsv, SpamFeatureExtractor e SpamCascade ricavano dallo stesso testo token, righe,
+URL, email, conteggi per classe di carattere e testo normalizzato. ``AnalyzedDocument``
+calcola ciascuna di queste primitive al primo accesso e la memorizza, così ogni primitiva
+viene calcolata al massimo una volta per documento anche se la usano più blocchi.
+
+I Document di DataTrove hanno ``slots`` e i metadata finiscono nei writer JSONL, quindi
+l'analisi non viaggia dentro il documento: ``analyze_document`` la conserva in una piccola
+cache LRU per processo, indicizzata sul documento e invalidata se il testo cambia.
+
+Un'analisi completa occupa decine di volte il testo, quindi la cache è limitata sia in documenti
+sia in caratteri di testo. Nella pipeline ``attach_analysis_release`` dimensiona i limiti sui
+documenti "in volo" tra il primo e l'ultimo blocco che usano l'analisi (i batch dei filtri
+intermedi) e fa rilasciare l'analisi all'ultimo blocco, appena ha finito con il documento; i
+documenti scartati prima di arrivarci escono dalla cache per anzianità. I documenti da almeno
+``STREAMING_MIN_CHARS`` caratteri non entrano mai nella cache: DocStatsCsv e SpamFeatureExtractor
+li leggono a blocchi senza costruire l'analisi e SpamCascade li manda al percorso completo.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from functools import cached_property
+from typing import Dict, List, Optional, Pattern, Sequence
+
+from datatrove.data import Document
+
+from .char_histogram import CharHistogram
+from .spam_classifier.spam_keywords import (
+    chunk_signal_masks,
+    count_keyword_categories,
+    extract_emails,
+    extract_tokens,
+    extract_urls,
+    matching_text,
+    normalize_for_matching,
+)
+
+# Limiti predefiniti della cache, in documenti e in caratteri di testo analizzati: coprono un
+# batch di 512 documenti in volo. set_analysis_window li alza per batch più grandi
+ANALYSIS_CACHE_SIZE = 1024
+ANALYSIS_CACHE_CHARS = 4_000_000
+# Caratteri di testo riservati per ogni documento in volo (i documenti medi sono di ~3 KB)
+ANALYSIS_CHARS_PER_DOC = 8192
+# Documenti da almeno tanti caratteri vengono letti a blocchi (blocks.streaming_stats) e la loro
+# analisi, se qualcuno la chiede comunque, non viene memorizzata
+STREAMING_MIN_CHARS = 1_000_000
+
+
+class AnalyzedDocument:
+    """
+    Vista memoizzata del testo di un documento. Ogni proprietà viene calcolata solo al primo
+    accesso; i nomi seguono le due famiglie di tokenizzazione usate nel progetto:
+    ``words`` (``str.split``, DocStatsCsv) e ``tokens`` (``WORD_RE``, feature spam).
+    """
+
+    def __init__(self, text: str):
+        self.text = text if isinstance(text, str) else ""
+        self._regex_matches: Dict[Pattern[str], List] = {}
+
+    # --- Token e righe ---
+
+    @cached_property
+    def words(self) -> List[str]:
+        return self.text.split()
+
+    @cached_property
+    def words_lower(self) -> List[str]:
+        return [w.lower() for w in self.words]
+
+    @cached_property
+    def word_counts(self) -> Counter:
+        return Counter(self.words_lower)
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        return extract_tokens(self.text)
+
+    @cached_property
+    def tokens_lower(self) -> List[str]:
+        return [tok.lower() for tok in self.tokens]
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return self.text.splitlines()
+
+    # --- URL, email e pattern ---
+
+    @cached_property
+    def urls(self) -> List[str]:
+        return list(extract_urls(self.text))
+
+    @cached_property
+    def emails(self) -> List[str]:
+        return list(extract_emails(self.text))
+
+    def findall(self, pattern: Pattern[str]) -> List:
+        """``pattern.findall(text)`` memorizzato per pattern compilato."""
+        matches = self._regex_matches.get(pattern)
+        if matches is None:
+            matches = pattern.findall(self.text)
+            self._regex_matches[pattern] = matches
+        return matches
+
+    # --- Testo normalizzato ---
+
+    @cached_property
+    def normalized(self) -> str:
+        return normalize_for_matching(self.text)
+
+    @cached_property
+    def matching_text(self) -> str:
+        """Testo normalizzato e con spazi ai bordi su cui count_term_matches cerca i termini."""
+        return matching_text(self.normalized)
+
+    @cached_property
+    def keyword_counts(self) -> Dict[str, int]:
+        """Conteggi per categoria di spam_keywords.TERM_CATEGORIES, da una sola scansione di matching_text."""
+        return count_keyword_categories(self.matching_text)
+
+    @cached_property
+    def chunk_signals(self) -> List[int]:
+        """Maschere CHUNK_* per frase (spam_keywords.chunk_signal_masks), base delle feature di co-occorrenza."""
+        return chunk_signal_masks(self.text)
+
+    # --- Caratteri ---
+
+    @cached_property
+    def char_histogram(self) -> CharHistogram:
+        """Istogramma dei code point (blocks.char_histogram), da cui derivano tutti i conteggi per carattere."""
+        return CharHistogram(self.text)
+
+    @property
+    def char_classes(self) -> Dict[str, int]:
+        """Conteggi per classe di carattere (chiavi in char_histogram.CHAR_CLASSES, più ``vowel``)."""
+        return self.char_histogram.class_counts()
+
+    def count_char(self, c: str) -> int:
+        """Equivalente a ``text.count(c)`` per un singolo carattere."""
+        return self.char_histogram.count(c)
+
+
+_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_limits = {"docs": ANALYSIS_CACHE_SIZE, "chars": ANALYSIS_CACHE_CHARS}
+_cached_chars = 0
+
+
+def set_analysis_window(docs: int) -> None:
+    """
+    Dimensiona la cache per ``docs`` documenti in volo tra il primo e l'ultimo blocco che usano
+    l'analisi (mai sotto i limiti predefiniti). Viene chiamata dai blocchi all'inizio di ``run``,
+    quindi vale anche nei processi dei worker.
+    """
+    _limits["docs"] = max(ANALYSIS_CACHE_SIZE, docs)
+    _limits["chars"] = max(ANALYSIS_CACHE_CHARS, docs * ANALYSIS_CHARS_PER_DOC)
+
+
+def _evict(key: int) -> None:
+    global _cached_chars
+    entry = _cache.pop(key, None)
+    if entry is not None:
+        _cached_chars -= len(entry[1])
+
+
+def release_analysis(doc) -> None:
+    """Toglie dalla cache l'analisi del documento: l'ultimo blocco che la usa ha finito."""
+    entry = _cache.get(id(doc))
+    if entry is not None and entry[0] is doc:
+        _evict(id(doc))
+
+
+def clear_analysis_cache() -> None:
+    """Svuota la cache (fine dell'esecuzione, misure a freddo)."""
+    global _cached_chars
+    _cache.clear()
+    _cached_chars = 0
+
+
+def fresh_documents(docs: Sequence[Document]) -> List[Document]:
+    """Copie dei documenti con la cache svuotata, per misurare un'estrazione da capo."""
+    clear_analysis_cache()
+    return [Document(text=doc.text, id=doc.id, metadata=dict(doc.metadata)) for doc in docs]
+
+
+def analyze_document(doc) -> AnalyzedDocument:
+    """
+    Restituisce l'analisi del documento, riusando quella già calcolata da un blocco precedente.
+    La cache tiene un riferimento al documento, quindi ``id(doc)`` non può essere riassegnato
+    finché la voce è presente; se il testo è stato sostituito l'analisi viene ricalcolata.
+    L'analisi dei testi da almeno STREAMING_MIN_CHARS caratteri non viene memorizzata.
+    """
+    global _cached_chars
+    text = getattr(doc, "text", "")
+    key = id(doc)
+    entry = _cache.get(key)
+    if entry is not None and entry[0] is doc and entry[1] is text:
+        _cache.move_to_end(key)
+        return entry[2]
+
+    analysis = AnalyzedDocument(text)
+    _evict(key)
+    if len(analysis.text) >= STREAMING_MIN_CHARS:
+        return analysis
+    _cache[key] = (doc, text, analysis)
+    _cached_chars += len(analysis.text)
+    while len(_cache) > 1 and (len(_cache) > _limits["docs"] or _cached_chars > _limits["chars"]):
+        _evict(next(iter(_cache)))
+    return analysis
+
+
+class SharedAnalysisUser:
+    """
+    Mixin dei blocchi che usano l'analisi condivisa. ``analysis_window`` e ``releases_analysis``
+    vengono assegnati da ``attach_analysis_release``; senza, i blocchi usano i limiti predefiniti
+    e non rilasciano nulla (per esempio quando vengono eseguiti da soli).
+    """
+
+    uses_analysis = True
+    analysis_window: Optional[int] = None
+    releases_analysis = False
+
+    def open_analysis_window(self) -> None:
+        if self.analysis_window:
+            set_analysis_window(self.analysis_window)
+
+    def done_with_analysis(self, doc) -> None:
+        if self.releases_analysis:
+            release_analysis(doc)
+
+    def close_analysis_window(self) -> None:
+        # Fine dell'input: restano solo i documenti scartati prima dell'ultimo blocco
+        if self.releases_analysis:
+            clear_analysis_cache()
+
+
+def attach_analysis_release(steps: Sequence) -> None:
+    """
+    Blocchi della pipeline che usano l'analisi condivisa (``SharedAnalysisUser``): a tutti assegna
+    la finestra dei documenti in volo, 1 più i batch dei blocchi dal primo all'ultimo, e solo
+    all'ultimo il rilascio dell'analisi di ogni documento che lo attraversa.
+    """
+    users = [i for i, step in enumerate(steps) if getattr(step, "uses_analysis", False)]
+    if not users:
+        return
+    window = 1 + sum(max(1, getattr(step, "batch_size", 1) or 1) for step in steps[users[0] : users[-1] + 1])
+    for i in users:
+        steps[i].analysis_window = window
+        steps[i].releases_analysis = i == users[-1]
@@ -0,0 +1,263 @@
+"""
+Predittore NumPy per gli ensemble di alberi LightGBM degli artifact del progetto.
+
+Il booster viene appiattito in array contigui (feature, soglia, figlio sinistro/destro,
+valore delle foglie) e un intero batch viene valutato con un attraversamento vettoriale:
+a ogni passo tutti i documenti scendono di un livello in tutti gli alberi.
+L'inferenza non passa dal wrapper sklearn né da pandas.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .model_optimization import scaler_params, raw_thresholds
+
+logger = logging.getLogger(__name__)
+
+# Costanti di LightGBM (include/LightGBM/tree.h, meta.h)
+_CATEGORICAL_MASK = 1
+_DEFAULT_LEFT_MASK = 2
+_MISSING_ZERO = 1
+_MISSING_NAN = 2
+_ZERO_THRESHOLD = 1e-35
+
+# Righe valutate insieme nell'attraversamento: con blocchi più grandi le matrici
+# (n_alberi x righe) escono dalla cache e i gather diventano molto più lenti
+ROW_CHUNK = 128
+
+
+def _parse_trees(model_str: str) -> tuple[Dict[str, str], List[Dict[str, str]]]:
+    """Divide il model string di LightGBM in intestazione e blocchi ``Tree=``, come coppie chiave=valore."""
+    header: Dict[str, str] = {}
+    trees: List[Dict[str, str]] = []
+    current = header
+    for line in model_str.split("\n"):
+        if line.startswith("Tree="):
+            current = {}
+            trees.append(current)
+            continue
+        if line.startswith("end of trees"):
+            break
+        key, sep, value = line.partition("=")
+        if sep:
+            current[key] = value
+    return header, trees
+
+
+class TreeEnsemblePredictor:
+    """
+    Ensemble di alberi binari appiattito in array NumPy.
+
+    Tutti i nodi (interni e foglie) di tutti gli alberi sono concatenati in ``feature``,
+    ``threshold`` e ``children``: i figli del nodo ``i`` sono ``children[2*i]`` (sinistro,
+    ``x <= soglia``) e ``children[2*i + 1]`` (destro). Le foglie puntano a se stesse e hanno
+    soglia ``+inf``, così l'attraversamento non ha bisogno di maschere: dopo ``depth`` passi ogni
+    documento si trova sulla propria foglia, il cui contributo è in ``node_value``.
+    Gli alberi sono ordinati per profondità decrescente (``order``): al livello ``d`` vengono
+    aggiornati solo i primi ``level_width[d]`` alberi, quelli ancora più profondi di ``d``.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        default_left: np.ndarray,
+        missing_type: np.ndarray,
+        node_value: np.ndarray,
+        roots: np.ndarray,
+        depths: np.ndarray,
+        feature_names: List[str],
+        sigmoid: float = 1.0,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.node_value = node_value
+        self.roots = roots
+        self.depths = depths
+        self.feature_names = feature_names
+        self.n_features = len(feature_names)
+        self.sigmoid = sigmoid
+        self._has_missing = bool(missing_type.any())
+
+        # Alberi più profondi per primi; inverse riporta all'ordine originale per la somma
+        self.order = np.argsort(-depths, kind="stable")
+        self.inverse = np.argsort(self.order, kind="stable")
+        sorted_depths = depths[self.order]
+        max_depth = int(sorted_depths[0]) if len(sorted_depths) else 0
+        self.level_width = [int((sorted_depths > d).sum()) for d in range(max_depth)]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_lightgbm(cls, model: Any, scaler: Optional[Any] = None) -> "TreeEnsemblePredictor":
+        """
+        Costruisce il predittore da un ``LGBMClassifier`` (o ``lgb.Booster``) binario.
+        Se viene passato lo ``StandardScaler`` dell'artifact, le soglie vengono riportate
+        nello spazio delle feature grezze (vedi ``model_optimization.raw_thresholds``) e il
+        predittore lavora direttamente sulle feature non scalate.
+        """
+        booster = model.booster_ if hasattr(model, "booster_") else model
+        header, trees = _parse_trees(booster.model_to_string())
+
+        objective = header.get("objective", "").split(" ")
+        if objective[0] != "binary":
+            raise ValueError(f"Obiettivo LightGBM non supportato: {header.get('objective')}")
+        sigmoid = 1.0
+        for token in objective[1:]:
+            if token.startswith("sigmoid:"):
+                sigmoid = float(token.split(":", 1)[1])
+
+        feature_names = header.get("feature_names", "").split(" ")
+        n_features = int(header["max_feature_idx"]) + 1
+        mean = scale = None
+        if scaler is not None:
+            mean, scale = scaler_params(scaler, n_features)
+
+        feature, threshold, children = [], [], []
+        default_left, missing_type, node_value = [], [], []
+        roots, depths = [], []
+        offset = 0
+        for tree in trees:
+            num_leaves = int(tree["num_leaves"])
+            n_internal = num_leaves - 1
+            n_nodes = n_internal + num_leaves
+            leaves = np.array(tree["leaf_value"].split(" "), dtype=np.float64)
+
+            # Nodi del singolo albero: prima gli interni (0..n_internal-1), poi le foglie
+            t_feature = np.zeros(n_nodes, dtype=np.intp)
+            t_threshold = np.full(n_nodes, np.inf)
+            t_children = np.empty((n_nodes, 2), dtype=np.intp)
+            t_default_left = np.ones(n_nodes, dtype=bool)
+            t_missing = np.zeros(n_nodes, dtype=np.int8)
+            t_value = np.zeros(n_nodes)
+            leaf_ids = np.arange(n_internal, n_nodes)
+            t_children[leaf_ids] = leaf_ids[:, None]
+            t_value[leaf_ids] = leaves
+
+            depth = 0
+            if n_internal > 0:
+                split_feature = np.array(tree["split_feature"].split(" "), dtype=np.intp)
+                thresholds = np.array(tree["threshold"].split(" "), dtype=np.float64)
+                decision_type = np.array(tree["decision_type"].split(" "), dtype=np.int64)
+                if (decision_type & _CATEGORICAL_MASK).any():
+                    raise ValueError("Split categorici non supportati da TreeEnsemblePredictor")
+                if scaler is not None:
+                    if ((decision_type >> 2) & 3).any():
+                        raise ValueError("Split con valori mancanti non compatibili con lo scaler piegato")
+                    thresholds = raw_thresholds(thresholds, mean[split_feature], scale[split_feature])
+
+                # In LightGBM un figlio negativo ~k indica la foglia k
+                lc = np.array(tree["left_child"].split(" "), dtype=np.intp)
+                rc = np.array(tree["right_child"].split(" "), dtype=np.intp)
+                t_children[:n_internal, 0] = np.where(lc >= 0, lc, n_internal + ~lc)
+                t_children[:n_internal, 1] = np.where(rc >= 0, rc, n_internal + ~rc)
+                t_feature[:n_internal] = split_feature
+                t_threshold[:n_internal] = thresholds
+                t_default_left[:n_internal] = (decision_type & _DEFAULT_LEFT_MASK) > 0
+                t_missing[:n_internal] = (decision_type >> 2) & 3
+                depth = _tree_depth(t_children, n_internal)
+
+            feature.append(t_feature)
+            threshold.append(t_threshold)
+            children.append(t_children + offset)
+            default_left.append(t_default_left)
+            missing_type.append(t_missing)
+            node_value.append(t_value)
+            # Un albero con una sola foglia parte direttamente dalla foglia
+            roots.append(offset if n_internal > 0 else offset + n_internal)
+            depths.append(depth)
+            offset += n_nodes
+
+        def cat(parts, dtype):
+            return np.ascontiguousarray(np.concatenate(parts) if parts else np.empty(0), dtype=dtype)
+
+        return cls(
+            feature=cat(feature, np.intp),
+            threshold=cat(threshold, np.float64),
+            children=cat(children, np.intp).reshape(-1),
+            default_left=cat(default_left, bool),
+            missing_type=cat(missing_type, np.int8),
+            node_value=cat(node_value, np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            depths=np.asarray(depths, dtype=np.int64),
+            feature_names=feature_names,
+            sigmoid=sigmoid,
+        )
+
+    @classmethod
+    def from_artifact(cls, artifact: Dict[str, Any]) -> "TreeEnsemblePredictor":
+        """Costruisce il predittore da un artifact {model, scaler, ...}; lo scaler (se presente) viene piegato."""
+        return cls.from_lightgbm(artifact["model"], artifact.get("scaler"))
+
+    def _leaf_nodes(self, X: np.ndarray) -> np.ndarray:
+        """
+        Nodo foglia raggiunto per ogni (albero, documento): matrice (n_trees x n_docs),
+        con gli alberi nell'ordine di ``self.order``.
+        """
+        n = X.shape[0]
+        flat = X.reshape(-1)
+        row_offset = np.arange(n, dtype=np.intp) * X.shape[1]
+        node = np.repeat(self.roots[self.order][:, None], n, axis=1)
+        for width in self.level_width:
+            current = node[:width]
+            values = flat[self.feature[current] + row_offset]
+            if self._has_missing:
+                go_right = ~self._missing_decision(values, current)
+            else:
+                go_right = values > self.threshold[current]
+            node[:width] = self.children[2 * current + go_right]
+        return node
+
+    def _missing_decision(self, values: np.ndarray, current: np.ndarray) -> np.ndarray:
+        """Applica la semantica LightGBM dei valori mancanti (missing_type Zero/NaN → direzione di default)."""
+        missing_type = self.missing_type[current]
+        is_nan = np.isnan(values)
+        # Con missing_type None/Zero un NaN viene trattato come 0
+        values = np.where(is_nan & (missing_type != _MISSING_NAN), 0.0, values)
+        go_left = values <= self.threshold[current]
+        missing = ((missing_type == _MISSING_ZERO) & (np.abs(values) <= _ZERO_THRESHOLD)) | (
+            (missing_type == _MISSING_NAN) & is_nan
+        )
+        return np.where(missing, self.default_left[current], go_left)
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        """Somma dei valori delle foglie (margine) per ogni riga di X."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X deve essere una matrice (n_docs x {self.n_features})")
+        if X.shape[0] == 0:
+            return np.empty(0, dtype=np.float64)
+        if not self._has_missing:
+            # Con missing_type None LightGBM tratta i NaN come 0
+            X = np.nan_to_num(X, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        raw = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], ROW_CHUNK):
+            chunk = X[start:start + ROW_CHUNK]
+            leaf_values = self.node_value[self._leaf_nodes(chunk)][self.inverse]
+            # cumsum somma gli alberi in ordine, come LightGBM: evita gli scarti della somma a coppie di np.sum
+            raw[start:start + ROW_CHUNK] = np.cumsum(leaf_values, axis=0)[-1]
+        return raw
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilità (n_docs x 2) come ``LGBMClassifier.predict_proba``."""
+        p = 1.0 / (1.0 + np.exp(-self.sigmoid * self.predict_raw(X)))
+        return np.column_stack([1.0 - p, p])
+
+
+def _tree_depth(children: np.ndarray, n_internal: int) -> int:
+    """Profondità massima (numero di split dalla radice alla foglia più lontana) di un albero."""
+    depth = np.zeros(len(children), dtype=np.int64)
+    # In LightGBM i figli interni hanno sempre indice maggiore del padre: basta una visita in ordine
+    for i in range(n_internal):
+        depth[children[i]] = depth[i] + 1
+    return int(depth.max())
@@ -0,0 +1,269 @@
+"""
+Lettura diretta di file WARC/WET locali (``.warc.gz``, ``.wet.gz``, anche non compressi), senza
+convertirli prima in JSONL.
+
+I file vengono decompressi in streaming (gzip a più membri, uno per record come in Common
+Crawl) e letti record per record: di ogni record si leggono le intestazioni WARC e poi
+``Content-Length`` byte di contenuto. I record che non servono (warcinfo, request, metadata...)
+vengono scartati a blocchi senza tenerli in memoria. Per ogni record utile:
+
+- ``conversion`` (WET): il contenuto è già testo UTF-8;
+- ``response`` (WARC): vengono lette le intestazioni HTTP, tenute solo le pagine HTML
+  (``text/html``, ``application/xhtml+xml``), decodificate con il charset dichiarato
+  (intestazione o ``<meta>``) e trasformate in testo da ``html_to_text``.
+
+``html_to_text`` usa solo la libreria standard (html.parser): toglie script, stili e ``<head>``
+(anche senza ``</head>``, facoltativo in HTML5) e va a capo sui tag di blocco, senza rimozione del boilerplate, lasciata ai filtri spam e
+qualità. Con ``extract_html=False`` il testo dei record response resta l'HTML, per uno step di
+estrazione di DataTrove (per esempio Trafilatura) prima del filtro lingua.
+
+I file vengono divisi tra i task come in JsonlReader (``files[rank::world_size]``), quindi più
+worker leggono file diversi in parallelo.
+"""
+
+from __future__ import annotations
+
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from datatrove.pipeline.readers.base import BaseDiskReader
+from datatrove.utils.logging import logger
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+DEFAULT_RECORD_TYPES = ("response", "conversion")
+
+# Blocco usato per scartare il contenuto dei record non richiesti
+_SKIP_CHUNK = 1 << 20
+
+# Tag il cui contenuto non è testo della pagina
+_SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "object"}
+# Tag ammessi in <head>: in HTML5 </head> è facoltativo e qualsiasi altro tag apre il corpo
+_HEAD_TAGS = {"base", "link", "meta", "noscript", "script", "style", "template", "title"}
+# Tag che iniziano una nuova riga
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+_SPACES = re.compile(r"\s+")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+WarcHeaders = Dict[str, str]
+
+
+def iter_warc_records(f, record_types: Optional[Sequence[str]] = DEFAULT_RECORD_TYPES) -> Iterator[Tuple[WarcHeaders, bytes]]:
+    """
+    Record del flusso binario ``f`` (già decompresso): ``(intestazioni, contenuto)``, con i nomi
+    delle intestazioni in minuscolo. Con ``record_types`` solo i record di quei tipi
+    (``warc-type``); il contenuto degli altri viene letto e scartato.
+    """
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        # Righe vuote tra un record e l'altro
+        if not line.strip():
+            continue
+        if not line.startswith(b"WARC/"):
+            raise ValueError(f"Record WARC non valido: {line[:40]!r}")
+        headers: WarcHeaders = {}
+        for line in iter(f.readline, b""):
+            if not line.strip():
+                break
+            name, _, value = line.decode("utf-8", errors="replace").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if record_types is None or headers.get("warc-type") in record_types:
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError(f"Record WARC troncato: {len(payload)} byte su {length}")
+            yield headers, payload
+        else:
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(_SKIP_CHUNK, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+
+
+def _dechunk(body: bytes) -> bytes:
+    """Contenuto di una risposta HTTP con ``Transfer-Encoding: chunked``."""
+    parts = []
+    position = 0
+    while position < len(body):
+        end = body.find(b"\r\n", position)
+        if end == -1:
+            break
+        try:
+            size = int(body[position:end].split(b";")[0], 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        parts.append(body[end + 2 : end + 2 + size])
+        position = end + 2 + size + 2
+    return b"".join(parts)
+
+
+def parse_http_response(payload: bytes) -> Tuple[Dict[str, str], bytes]:
+    """Intestazioni HTTP (nomi in minuscolo) e corpo di un record response."""
+    head, separator, body = payload.partition(b"\r\n\r\n")
+    if not separator:
+        head, _, body = payload.partition(b"\n\n")
+    headers = {}
+    for line in head.decode("iso-8859-1").splitlines()[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = _dechunk(body)
+    return headers, body
+
+
+def decode_html(body: bytes, content_type: str = "") -> Optional[str]:
+    """
+    Testo della pagina con il charset dell'intestazione o del ``<meta>``, altrimenti UTF-8 e
+    poi cp1252 (pagine italiane in latin-1). None se nessuna decodifica riesce.
+    """
+    charsets = []
+    _, _, declared = content_type.lower().partition("charset=")
+    if declared:
+        charsets.append(declared.split(";")[0].strip(" \"'"))
+    match = _META_CHARSET.search(body[:4096])
+    if match:
+        charsets.append(match.group(1).decode("ascii", errors="ignore").lower())
+    for charset in (*charsets, "utf-8", "cp1252"):
+        try:
+            return body.decode(charset)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self.current = []
+        self.skip_depth = 0
+        self.in_head = False
+
+    def _newline(self):
+        line = _SPACES.sub(" ", "".join(self.current)).strip()
+        if line:
+            self.lines.append(line)
+        self.current = []
+
+    def _leave_head(self, tag):
+        # Senza </head> l'intestazione finisce con <body> o con il primo tag del corpo
+        if self.in_head and tag not in _HEAD_TAGS:
+            self.in_head = False
+
+    def handle_starttag(self, tag, attrs):
+        self._leave_head(tag)
+        if tag == "head":
+            self.in_head = True
+        elif tag in _SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._newline()
+
+    def handle_startendtag(self, tag, attrs):
+        self._leave_head(tag)
+        if tag in _BLOCK_TAGS:
+            self._newline()
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.in_head = False
+        elif tag in _SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if not self.skip_depth and not self.in_head:
+            self.current.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Testo visibile della pagina, una riga per blocco, spazi compattati."""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    parser._newline()
+    return "\n".join(parser.lines)
+
+
+class LocalWarcReader(BaseDiskReader):
+    """
+    Reader DataTrove per WARC/WET locali: un documento per record response HTML o conversion,
+    con id ``WARC-Record-ID`` e ``url``/``date`` nei metadata. Non richiede warcio: il WarcReader
+    di DataTrove ne ha bisogno e restituisce l'HTML grezzo.
+    """
+
+    name = "🕷 Warc (locale)"
+
+    def __init__(
+        self,
+        data_folder,
+        compression: Optional[str] = "infer",
+        extract_html: bool = True,
+        min_text_chars: int = 1,
+        record_types: Sequence[str] = DEFAULT_RECORD_TYPES,
+        **kwargs,
+    ):
+        super().__init__(data_folder, **kwargs)
+        self.compression = compression
+        self.extract_html = extract_html
+        self.min_text_chars = min_text_chars
+        self.record_types = tuple(record_types)
+
+    def record_to_dict(self, headers: WarcHeaders, payload: bytes) -> Optional[dict]:
+        """Dati del documento di un record, None se il record non contiene una pagina di testo."""
+        if headers.get("warc-type") == "conversion":
+            text = payload.decode("utf-8", errors="replace").strip()
+        else:
+            http_headers, body = parse_http_response(payload)
+            content_type = http_headers.get("content-type", "")
+            mime = headers.get("warc-identified-payload-type") or content_type.split(";")[0].strip().lower()
+            if mime not in HTML_TYPES:
+                self.stat_update("skipped_not_html")
+                return None
+            if http_headers.get("content-encoding", "identity").lower() not in ("identity", ""):
+                self.stat_update("skipped_encoded")
+                return None
+            html = decode_html(body, content_type)
+            if html is None:
+                self.stat_update("skipped_charset")
+                return None
+            text = html_to_text(html) if self.extract_html else html
+        if len(text) < self.min_text_chars:
+            self.stat_update("skipped_empty")
+            return None
+        return {
+            "text": text,
+            "id": headers.get("warc-record-id"),
+            "url": headers.get("warc-target-uri"),
+            "date": headers.get("warc-date"),
+        }
+
+    def read_file(self, filepath: str):
+        with self.data_folder.open(filepath, "rb", compression=self.compression) as f:
+            try:
+                for ri, (headers, payload) in enumerate(iter_warc_records(f, self.record_types)):
+                    self.stat_update("records")
+                    with self.track_time():
+                        data = self.record_to_dict(headers, payload)
+                        document = self.get_document_from_dict(data, filepath, ri) if data else None
+                    if document:
+                        yield document
+            except (ValueError, EOFError, OSError) as e:
+                # File troncato o danneggiato: i record già letti restano validi
+                logger.warning(f"Error when reading `{filepath}`: {e}")
+
+
+def get_warc_reader(data_dir: str, pattern: str, extract_html: bool = True) -> LocalWarcReader:
+    """Reader dei file WARC/WET di ``data_dir`` che corrispondono a ``pattern``."""
+    return LocalWarcReader(data_folder=data_dir, glob_pattern=pattern, extract_html=extract_html)
@@ -0,0 +1,143 @@
+"""
+Coda di lavoro su disco condivisa dai worker della pipeline.
+
+Con l'assegnazione statica di LocalPipelineExecutor ogni rank riceve i suoi file in anticipo:
+se gli shard hanno dimensioni diverse i worker veloci finiscono e restano fermi mentre l'ultimo
+completa il suo shard. Qui l'input viene diviso in unità (file interi o intervalli di byte
+allineati alle righe, vedi ByteRangeJsonlReader) ordinate dalla più grande alla più piccola; ogni
+rank prende un'unità alla volta finché la coda non è vuota. Le prese sono serializzate da un
+lock su file (``fasteners``), quindi funzionano tra processi diversi sulla stessa macchina.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+import fasteners
+from datatrove.io import DataFolderLike, get_datafolder
+from datatrove.utils.logging import logger
+
+from .readers import ByteRangeJsonlReader, count_newlines, is_splittable
+
+# Dimensione massima di un'unità di lavoro: i file più grandi vengono divisi in intervalli di byte
+DEFAULT_UNIT_BYTES = 16 * 1024 * 1024
+
+# (file, inizio, fine, "a capo" prima di inizio)
+WorkUnit = Tuple[str, int, int, int]
+
+
+class WorkQueue:
+    """
+    Coda di unità ``(file, inizio, fine, righe prima)`` in ``queue_dir``: ``units.json`` con l'elenco,
+    ``cursor`` con l'indice della prossima unità da assegnare e ``claims.jsonl`` con chi ha
+    preso cosa. Cursore e log vengono aggiornati solo con il lock acquisito.
+    """
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        self.units_path = os.path.join(queue_dir, "units.json")
+        self.cursor_path = os.path.join(queue_dir, "cursor")
+        self.claims_path = os.path.join(queue_dir, "claims.jsonl")
+        self.lock = fasteners.InterProcessLock(os.path.join(queue_dir, "queue.lock"))
+        self._units: Optional[List[WorkUnit]] = None
+
+    @classmethod
+    def create(cls, queue_dir: str, units: List[WorkUnit]) -> "WorkQueue":
+        """Crea una coda nuova, eliminando quella di un'esecuzione precedente."""
+        shutil.rmtree(queue_dir, ignore_errors=True)
+        os.makedirs(queue_dir)
+        queue = cls(queue_dir)
+        with open(queue.units_path, "w", encoding="utf-8") as f:
+            json.dump([list(unit) for unit in units], f)
+        with open(queue.cursor_path, "w") as f:
+            f.write("0")
+        return queue
+
+    @property
+    def units(self) -> List[WorkUnit]:
+        if self._units is None:
+            with open(self.units_path, encoding="utf-8") as f:
+                self._units = [tuple(unit) for unit in json.load(f)]
+        return self._units
+
+    def claim(self, rank: int) -> Optional[WorkUnit]:
+        """Prossima unità non ancora assegnata, oppure None se la coda è vuota."""
+        with self.lock:
+            with open(self.cursor_path) as f:
+                cursor = int(f.read() or 0)
+            if cursor >= len(self.units):
+                return None
+            tmp_path = f"{self.cursor_path}.{rank}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(cursor + 1))
+            os.replace(tmp_path, self.cursor_path)
+            with open(self.claims_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"unit": cursor, "rank": rank}) + "\n")
+        return self.units[cursor]
+
+
+def build_work_units(data_folder: DataFolderLike, pattern: str, unit_bytes: int = DEFAULT_UNIT_BYTES) -> List[WorkUnit]:
+    """
+    Divide i file di ``pattern`` in unità di al massimo ``unit_bytes`` (i file compressi restano
+    interi) e le ordina dalla più grande: le unità piccole alla fine riempiono i buchi tra i worker.
+    Per i file divisi conta una volta gli "a capo" prima di ogni unità, così i worker non devono
+    rileggere il file dall'inizio per numerare le righe.
+    """
+    folder = get_datafolder(data_folder)
+    units = []
+    for path in folder.list_files(glob_pattern=pattern):
+        size = folder.size(path)
+        if size == 0:
+            continue
+        if not is_splittable(path) or size <= unit_bytes:
+            units.append((path, 0, size, 0))
+            continue
+        n_units = -(-size // unit_bytes)
+        bounds = [size * i // n_units for i in range(n_units + 1)]
+        lines_before = 0
+        with folder.open(path, "rb") as f:
+            for start, end in zip(bounds, bounds[1:]):
+                units.append((path, start, end, lines_before))
+                lines_before += count_newlines(f, end - start)
+    return sorted(units, key=lambda unit: unit[2] - unit[1], reverse=True)
+
+
+class WorkQueueJsonlReader(ByteRangeJsonlReader):
+    """
+    Lettore JSONL che non ha uno shard fisso: a ogni passo prende la prossima unità dalla
+    WorkQueue in ``queue_dir`` e ne legge le righe, finché la coda non si svuota. Ogni rank
+    continua a scrivere i propri file di output (``${rank}``), quindi writer e aggregazione dei
+    CSV non cambiano.
+    """
+
+    name = "🐿 Jsonl (work queue)"
+
+    def __init__(self, data_folder: DataFolderLike, queue_dir: str, **kwargs):
+        super().__init__(data_folder, **kwargs)
+        self.queue_dir = queue_dir
+
+    def run(self, data=None, rank: int = 0, world_size: int = 1):
+        if data:
+            yield from data
+        queue = WorkQueue(self.queue_dir)
+        read = 0
+        while (unit := queue.claim(rank)) is not None:
+            filepath, start, end, lines_before = unit
+            self.stat_update("work_units")
+            logger.info(f"Rank {rank}: reading {filepath} bytes [{start}, {end})")
+            for document in self.read_range(filepath, start, end, lines_before):
+                if self.limit != -1 and read >= self.limit:
+                    return
+                self.update_doc_stats(document)
+                read += 1
+                yield document
+
+
+def prepare_work_queue(data_dir: str, pattern: str, queue_dir: str, unit_bytes: int = DEFAULT_UNIT_BYTES) -> WorkQueue:
+    """Costruisce la coda dell'esecuzione corrente; va chiamata prima di avviare l'executor."""
+    units = build_work_units(data_dir, pattern, unit_bytes)
+    logger.info(f"Coda di lavoro: {len(units)} unità in {queue_dir}")
+    return WorkQueue.create(queue_dir, units)
@@ -2,6 +2,8 @@ import os
 import argparse
 import glob
 
+from utils.input_manifest import update_manifest
+
 def extract_args():
     """Configura i parametri da riga di comando."""
     in_docker = os.path.exists("/app/src")
@@ -22,6 +24,26 @@ def extract_args():
     parser.add_argument("--csv-dir", type=str, default=None, help="Path to csv directory")
     parser.add_argument("--feature-dir", type=str, default=None, help="Path to feature stats")
     parser.add_argument("--model-path", type=str, default=None)
+    parser.add_argument("--batch-size", type=int, default=512, help="Documenti per batch nei classificatori (default: 512)")
+    parser.add_argument("--model-backend", type=str, default="lightgbm", choices=["lightgbm", "numpy"], help="Motore di inferenza dei modelli (default: lightgbm)")
+    parser.add_argument("--spam-cascade", action="store_true", help="Decide ham i documenti ovvi con feature economiche prima del filtro spam completo")
+    parser.add_argument("--byte-ranges", action="store_true", help="Divide i JSONL in intervalli di byte: i task possono essere più dei file (default task: workers)")
+    parser.add_argument("--work-queue", action="store_true", help="I worker prendono unità di input da una coda condivisa finché non è vuota (default task: workers)")
+    parser.add_argument("--work-unit-mb", type=int, default=16, help="Dimensione massima in MB di un'unità della coda di lavoro (default: 16)")
+    parser.add_argument("--manifest", action="store_true", help="Usa il manifest dell'input: file divisi tra i task per dimensione e stima della durata (default task: workers)")
+    parser.add_argument("--feature-store", type=str, default=None, help="Database SQLite dove riusare per digest le feature dei documenti (default: disattivato)")
+    parser.add_argument("--feature-store-max-rows", type=int, default=2_000_000, help="Righe massime per tabella dell'archivio delle feature (default: 2000000)")
+    parser.add_argument("--dedup", action="store_true", help="Scarta duplicati esatti (digest) e quasi duplicati (MinHash-LSH) prima di LID e feature, in rejected/0_dedup")
+    parser.add_argument("--lid-prefix-chars", type=int, default=0, help="LID sui primi N caratteri, allungati solo vicino alla soglia (default: 0, testo intero)")
+    parser.add_argument("--lid-prefix-margin", type=float, default=0.1, help="Distanza dalla soglia LID entro cui il prefisso viene allungato (default: 0.1)")
+    parser.add_argument("--all-features", action="store_true", help="Calcola tutte le feature spam e statistiche e scrive il CSV spam per l'addestramento (default: solo quelle lette dai modelli)")
+    parser.add_argument("--filter-order", type=str, default="language,spam,quality", help="Ordine dei filtri (per esempio language,quality,spam), 'plan' per misurarlo su un campione e proporlo, 'auto' per applicarlo (default: language,spam,quality)")
+    parser.add_argument("--plan-sample-docs", type=int, default=2000, help="Documenti del campione misurato da --filter-order plan/auto (default: 2000)")
+    parser.add_argument("--estimate", action="store_true", help="Stima durata, output e scarti dell'esecuzione su un campione stratificato dell'input, senza eseguirla")
+    parser.add_argument("--estimate-docs", type=int, default=2000, help="Documenti del campione di --estimate (default: 2000)")
+    parser.add_argument("--input-format", type=str, default="jsonl", choices=["jsonl", "warc"], help="Formato dell'input: JSONL o file WARC/WET locali (.warc.gz, .wet.gz) letti in streaming (default: jsonl)")
+    parser.add_argument("--manifest-path", type=str, default=None, help="Path del manifest dell'input (default: OUTPUT_DIR/input_manifest.json)")
+    parser.add_argument("--rescan-input", action="store_true", help="Con --manifest ricontrolla dimensione e mtime di ogni file di input anche se le cartelle non sono cambiate")
     return parser.parse_args()
 
 def get_config():
@@ -37,21 +59,50 @@ def get_config():
     # CONFIGURAZIONE MANUALE 
     # CAMBIA QUESTA VARIABILE: True per dati esterni, False per dati repo
     USE_EXTERNAL_DATA = False
+    # Con input WARC i file .warc.gz/.wet.gz vengono letti direttamente (blocks.warc)
+    INPUT_FORMAT = os.environ.get("INPUT_FORMAT", args.input_format).strip().lower()
 
     if USE_EXTERNAL_DATA:
         DATA_DIR = "/app/external_data"
-        INPUT_SUB_PATTERN = "*.jsonl"
+        INPUT_SUB_PATTERN = "*.gz" if INPUT_FORMAT == "warc" else "*.jsonl"
         print("MODALITÀ IMPOSTATA: DATASET ESTERNO")
     else:
         # modificare per scegliere i percorsi dei dati in input
         DATA_DIR = os.path.join(ROOT_DIR, "data")
         # INPUT_SUB_PATTERN = "dataset/sample_*.jsonl"
-        INPUT_SUB_PATTERN = "train/*.jsonl"
+        INPUT_SUB_PATTERN = "warc/*.gz" if INPUT_FORMAT == "warc" else "train/*.jsonl"
         print("MODALITÀ IMPOSTATA: REPOSITORY")
     # LOGICA DINAMICA TASK
-    full_search_path = os.path.join(DATA_DIR, INPUT_SUB_PATTERN)
-    found_files = glob.glob(full_search_path)
-    num_tasks = args.tasks or len(found_files)
+    # Con gli intervalli di byte ogni task legge una parte dell'input, quindi di default
+    # ce n'è uno per worker anche se i file sono meno dei worker
+    # (come con la coda di lavoro, dove ogni task continua a prendere unità finché ce ne sono)
+    byte_ranges = os.environ.get("BYTE_RANGES", str(args.byte_ranges)).lower() in ("1", "true", "yes")
+    work_queue = os.environ.get("WORK_QUEUE", str(args.work_queue)).lower() in ("1", "true", "yes")
+    manifest = os.environ.get("MANIFEST", str(args.manifest)).lower() in ("1", "true", "yes")
+    max_workers = int(os.environ.get("MAX_WORKERS", args.workers))
+    manifest_path = os.environ.get("MANIFEST_PATH", args.manifest_path or os.path.join(OUTPUT_DIR, "input_manifest.json"))
+    rescan_input = os.environ.get("RESCAN_INPUT", str(args.rescan_input)).lower() in ("1", "true", "yes")
+    # Coda di lavoro e manifest decidono entrambi quali file legge ogni task: insieme la coda
+    # verrebbe creata e poi ignorata dal lettore (blocks.readers.get_jsonl_reader)
+    if work_queue and manifest:
+        raise SystemExit("[ERROR] --work-queue e --manifest non possono essere usati insieme")
+    # Con il manifest l'elenco dei file viene dal manifest, riusato se le cartelle non sono cambiate
+    # (utils.input_manifest): niente glob dell'input a ogni avvio. I WARC non hanno un manifest
+    input_manifest = None
+    if manifest and INPUT_FORMAT != "warc":
+        input_manifest = update_manifest(DATA_DIR, INPUT_SUB_PATTERN, manifest_path, rescan=rescan_input)
+        found_files = list(input_manifest["files"])
+    else:
+        found_files = glob.glob(os.path.join(DATA_DIR, INPUT_SUB_PATTERN))
+    if work_queue:
+        num_tasks = args.tasks or max_workers
+    elif manifest:
+        # I file vengono distribuiti per dimensione: più task dei file lascerebbero task vuoti
+        num_tasks = args.tasks or max(1, min(max_workers, len(found_files)))
+    elif byte_ranges:
+        num_tasks = args.tasks or max(max_workers, len(found_files))
+    else:
+        num_tasks = args.tasks or len(found_files)
 
     
     
@@ -59,22 +110,43 @@ def get_config():
     config = {
         "DATA_DIR": DATA_DIR,
         "INPUT_SUB_PATTERN": INPUT_SUB_PATTERN,
+        "INPUT_FORMAT": INPUT_FORMAT,
         "OUTPUT_DIR": OUTPUT_DIR,
         "REJECTED_DIR": os.environ.get("REJECTED_DIR", args.rejected_dir or os.path.join(OUTPUT_DIR, "rejected")),
         "FEATURE_DIR": os.environ.get("FEATURE_DIR", args.feature_dir or os.path.join(OUTPUT_DIR, "feature")),
         # "CSV_DIR": os.environ.get("CSV_DIR", args.csv_dir or os.path.join(OUTPUT_DIR, "csv")),
         "MODEL_PATH": os.environ.get("MODEL_PATH", os.path.join(ROOT_DIR, "models")),
-        "MAX_WORKERS": int(os.environ.get("MAX_WORKERS", args.workers)),
+        "MAX_WORKERS": max_workers,
         "NUM_TASKS": num_tasks,
+        "BATCH_SIZE": int(os.environ.get("BATCH_SIZE", args.batch_size)),
+        "MODEL_BACKEND": os.environ.get("MODEL_BACKEND", args.model_backend),
+        "SPAM_CASCADE": os.environ.get("SPAM_CASCADE", str(args.spam_cascade)).lower() in ("1", "true", "yes"),
+        "BYTE_RANGES": byte_ranges,
+        "WORK_QUEUE": work_queue,
+        "WORK_UNIT_MB": int(os.environ.get("WORK_UNIT_MB", args.work_unit_mb)),
+        "MANIFEST": manifest,
+        "FEATURE_STORE": os.environ.get("FEATURE_STORE", args.feature_store) or None,
+        "FEATURE_STORE_MAX_ROWS": int(os.environ.get("FEATURE_STORE_MAX_ROWS", args.feature_store_max_rows)),
+        "MANIFEST_PATH": manifest_path,
+        "RESCAN_INPUT": rescan_input,
+        "INPUT_MANIFEST": input_manifest,
+        "DEDUP": os.environ.get("DEDUP", str(args.dedup)).lower() in ("1", "true", "yes"),
+        "LID_PREFIX_CHARS": int(os.environ.get("LID_PREFIX_CHARS", args.lid_prefix_chars)),
+        "LID_PREFIX_MARGIN": float(os.environ.get("LID_PREFIX_MARGIN", args.lid_prefix_margin)),
+        "ALL_FEATURES": os.environ.get("ALL_FEATURES", str(args.all_features)).lower() in ("1", "true", "yes"),
+        "FILTER_ORDER": os.environ.get("FILTER_ORDER", args.filter_order).strip().lower(),
+        "PLAN_SAMPLE_DOCS": int(os.environ.get("PLAN_SAMPLE_DOCS", args.plan_sample_docs)),
+        "ESTIMATE": os.environ.get("ESTIMATE", str(args.estimate)).lower() in ("1", "true", "yes"),
+        "ESTIMATE_DOCS": int(os.environ.get("ESTIMATE_DOCS", args.estimate_docs)),
     }
 
     # 3. Creazione automatica cartelle (gestendo il file del modello)
     for key, path in config.items():
-        if key in ["MAX_WORKERS", "NUM_TASKS"]:
+        if key in ["MAX_WORKERS", "NUM_TASKS", "BATCH_SIZE", "MODEL_BACKEND", "SPAM_CASCADE", "BYTE_RANGES", "WORK_QUEUE", "WORK_UNIT_MB", "MANIFEST", "MANIFEST_PATH", "RESCAN_INPUT", "INPUT_MANIFEST", "FEATURE_STORE", "FEATURE_STORE_MAX_ROWS", "DEDUP", "LID_PREFIX_CHARS", "LID_PREFIX_MARGIN", "ALL_FEATURES", "FILTER_ORDER", "PLAN_SAMPLE_DOCS", "ESTIMATE", "ESTIMATE_DOCS", "INPUT_FORMAT"]:
             continue
         os.makedirs(os.path.dirname(path) if key == "MODEL_PATH" else path, exist_ok=True)
             
-    print(f"Pipeline: {config['MAX_WORKERS']} workers | {config['NUM_TASKS']} tasks.")
+    print(f"Pipeline: {config['MAX_WORKERS']} workers | {config['NUM_TASKS']} tasks | batch {config['BATCH_SIZE']} | backend {config['MODEL_BACKEND']} | cascata spam {'on' if config['SPAM_CASCADE'] else 'off'} | intervalli di byte {'on' if config['BYTE_RANGES'] else 'off'} | coda di lavoro {'on' if config['WORK_QUEUE'] else 'off'} | manifest {'on' if config['MANIFEST'] else 'off'} | archivio feature {config['FEATURE_STORE'] or 'off'} | dedup {'on' if config['DEDUP'] else 'off'} | LID a prefisso {config['LID_PREFIX_CHARS'] or 'off'} | feature {'tutte' if config['ALL_FEATURES'] else 'dei modelli'} | ordine dei filtri {config['FILTER_ORDER']} | stima {'on' if config['ESTIMATE'] else 'off'} | input {config['INPUT_FORMAT']}.")
     # Verifica di sicurezza: il modello esiste?
     if not os.path.exists(config["MODEL_PATH"]):
         print(f"[WARNING] Modello non trovato in: {config['MODEL_PATH']}")
@@ -1,10 +1,20 @@
 from datatrove.executor import LocalPipelineExecutor
 from config_loader import get_config
-from pipeline_factory import build_italian_cleaning_pipeline
+from pipeline_factory import build_italian_cleaning_pipeline, build_filter_stages
 from utils.output_organizer import output_classification
 from datatrove.utils.stats import PipelineStats
 from utils.csv_aggregator import aggregate_rank_csvs
+from blocks.work_queue import prepare_work_queue
+from blocks.dedup import prepare_dedup
+from utils.input_manifest import update_manifest, pack_files, describe_plan, record_run
+from blocks.filter_planner import DEFAULT_FILTER_ORDER, FilterPlanner, format_filter_plan
+from utils.run_estimate import estimate_run, format_estimate, task_bytes
+from blocks.warc import LocalWarcReader
+from datatrove.pipeline.readers import JsonlReader
+import json
 import os
+import tempfile
+import time
 
 
 def main():
@@ -13,6 +23,98 @@ def main():
     """
     # 1. Carica i percorsi dal file config selezionato
     cfg = get_config()
+
+    # 1a. Input WARC/WET: coda di lavoro, manifest e dedup dividono o indicizzano righe JSONL
+    if cfg["INPUT_FORMAT"] == "warc":
+        if cfg["ESTIMATE"]:
+            raise SystemExit("[ERROR] --estimate è disponibile solo con input JSONL")
+        for key in ("WORK_QUEUE", "MANIFEST", "DEDUP"):
+            if cfg[key]:
+                print(f"[WARNING] {key} non disponibile con input WARC: disattivato")
+                cfg[key] = False
+
+    # 1b. Coda di lavoro: le unità di input vengono create prima di avviare i worker
+    work_queue_dir = None
+    if cfg["WORK_QUEUE"] and not cfg["ESTIMATE"]:
+        work_queue_dir = os.path.join(cfg["OUTPUT_DIR"], "work_queue")
+        prepare_work_queue(
+            cfg["DATA_DIR"],
+            cfg["INPUT_SUB_PATTERN"],
+            work_queue_dir,
+            unit_bytes=cfg["WORK_UNIT_MB"] * 1024 * 1024,
+        )
+
+    # 1c. Manifest dell'input (già aggiornato da get_config): file divisi tra i task per dimensione
+    # e stima della durata
+    manifest, file_assignment = None, None
+    if cfg["MANIFEST"]:
+        manifest = cfg["INPUT_MANIFEST"]
+        file_assignment = pack_files(manifest["files"], cfg["NUM_TASKS"])
+        print(describe_plan(manifest, file_assignment, cfg["MAX_WORKERS"]))
+
+    # 1d. Deduplicazione: indice delle firme MinHash di tutto l'input e cluster dei duplicati
+    dedup_dir = None
+    if cfg["DEDUP"] and not cfg["ESTIMATE"]:
+        dedup_dir = os.path.join(cfg["OUTPUT_DIR"], "dedup")
+        prepare_dedup(cfg["DATA_DIR"], cfg["INPUT_SUB_PATTERN"], dedup_dir, workers=cfg["MAX_WORKERS"])
+
+    # 1e. Ordine dei filtri: con plan/auto costo e scarti vengono misurati sui primi documenti dell'input
+    planner, filter_plan = None, None
+    if cfg["FILTER_ORDER"] in ("plan", "auto"):
+        with tempfile.TemporaryDirectory() as tmp:
+            planner = FilterPlanner(build_filter_stages(
+                tmp,
+                os.path.join(tmp, "rejected"),
+                cfg["MODEL_PATH"],
+                batch_size=cfg["BATCH_SIZE"],
+                model_backend=cfg["MODEL_BACKEND"],
+                spam_cascade=cfg["SPAM_CASCADE"],
+                lid_prefix_chars=cfg["LID_PREFIX_CHARS"],
+                lid_prefix_margin=cfg["LID_PREFIX_MARGIN"],
+            ))
+            reader_cls = LocalWarcReader if cfg["INPUT_FORMAT"] == "warc" else JsonlReader
+            sample = list(reader_cls(cfg["DATA_DIR"], glob_pattern=cfg["INPUT_SUB_PATTERN"], limit=cfg["PLAN_SAMPLE_DOCS"]).run())
+            filter_plan = planner.plan(planner.measure(sample))
+        print(format_filter_plan(filter_plan))
+        filter_order = filter_plan["best_order"] if cfg["FILTER_ORDER"] == "auto" else DEFAULT_FILTER_ORDER
+    else:
+        filter_order = tuple(name.strip() for name in cfg["FILTER_ORDER"].split(","))
+
+    # 1f. Stima: il campione attraversa la pipeline in cartelle temporanee, niente esecuzione completa
+    # (coda di lavoro e dedup non vengono preparate, la dedup resta fuori dalla stima)
+    if cfg["ESTIMATE"]:
+        manifest = manifest or update_manifest(cfg["DATA_DIR"], cfg["INPUT_SUB_PATTERN"], cfg["MANIFEST_PATH"], rescan=cfg["RESCAN_INPUT"])
+        mode = "manifest" if cfg["MANIFEST"] else "split" if cfg["BYTE_RANGES"] or cfg["WORK_QUEUE"] else "files"
+        with tempfile.TemporaryDirectory() as tmp:
+            # Senza archivio delle feature: la stima vale per un'esecuzione a freddo
+            estimate_blocks = build_italian_cleaning_pipeline(
+                data_dir=cfg["DATA_DIR"],
+                output_dir=tmp,
+                rejected_dir=os.path.join(tmp, "rejected"),
+                pattern=cfg["INPUT_SUB_PATTERN"],
+                model_path=cfg["MODEL_PATH"],
+                batch_size=cfg["BATCH_SIZE"],
+                model_backend=cfg["MODEL_BACKEND"],
+                spam_cascade=cfg["SPAM_CASCADE"],
+                lid_prefix_chars=cfg["LID_PREFIX_CHARS"],
+                lid_prefix_margin=cfg["LID_PREFIX_MARGIN"],
+                all_features=cfg["ALL_FEATURES"],
+                filter_order=filter_order,
+            )
+            estimate = estimate_run(
+                cfg["DATA_DIR"],
+                manifest["files"],
+                estimate_blocks,
+                tmp,
+                os.path.join(tmp, "rejected"),
+                task_bytes(manifest["files"], cfg["NUM_TASKS"], mode),
+                cfg["MAX_WORKERS"],
+                sample_docs=cfg["ESTIMATE_DOCS"],
+            )
+        print(format_estimate(estimate))
+        with open(os.path.join(cfg["OUTPUT_DIR"], "estimate.json"), "w", encoding="utf-8") as f:
+            json.dump(estimate, f, indent=2)
+        return
   
     # 2. Crea i blocchi (passando i percorsi corretti)
     pipeline_blocks = build_italian_cleaning_pipeline(
@@ -21,6 +123,20 @@ def main():
         rejected_dir=cfg["REJECTED_DIR"],
         pattern=cfg["INPUT_SUB_PATTERN"],
         model_path=cfg["MODEL_PATH"],
+        batch_size=cfg["BATCH_SIZE"],
+        model_backend=cfg["MODEL_BACKEND"],
+        spam_cascade=cfg["SPAM_CASCADE"],
+        byte_ranges=cfg["BYTE_RANGES"],
+        work_queue_dir=work_queue_dir,
+        file_assignment=file_assignment,
+        feature_store=cfg["FEATURE_STORE"],
+        feature_store_max_rows=cfg["FEATURE_STORE_MAX_ROWS"],
+        dedup_dir=dedup_dir,
+        lid_prefix_chars=cfg["LID_PREFIX_CHARS"],
+        lid_prefix_margin=cfg["LID_PREFIX_MARGIN"],
+        all_features=cfg["ALL_FEATURES"],
+        filter_order=filter_order,
+        input_format=cfg["INPUT_FORMAT"],
     )
   
     # 3. Esecuzione
@@ -30,16 +146,24 @@ def main():
         workers=cfg["MAX_WORKERS"]
     )
     # 4. Avvio della pipeline
-    executor.run()
+    start = time.time()
+    stats = executor.run()
+    if manifest is not None:
+        record_run(manifest, cfg["MANIFEST_PATH"], file_assignment, cfg["MAX_WORKERS"], time.time() - start)
+    if filter_plan is not None:
+        # Previsione del piano accanto ai tempi e ai documenti per filtro dell'esecuzione
+        filter_plan["run"] = planner.compare_with_run(filter_plan, filter_order, pipeline_blocks, stats)
+        with open(os.path.join(cfg["OUTPUT_DIR"], "filter_plan.json"), "w", encoding="utf-8") as f:
+            json.dump(filter_plan, f, indent=2)
 
     # 5. Aggregazione csv spam e quality
     feature_dir = cfg["FEATURE_DIR"]
 
 
-    csv_outputs = [
-        ("doc_stats_per_file.csv", "quality"),
-        ("spam_doc_features.csv", "spam"),
-    ]
+    # Il CSV delle feature spam viene scritto solo con tutte le feature (--all-features)
+    csv_outputs = [("doc_stats_per_file.csv", "quality")]
+    if cfg["ALL_FEATURES"]:
+        csv_outputs.append(("spam_doc_features.csv", "spam"))
 
 
     for final_name, label in csv_outputs:
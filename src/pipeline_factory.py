@@ -1,58 +1,147 @@
 import os
 from blocks.readers import get_jsonl_reader
+from blocks.warc import get_warc_reader
 from blocks.writers import get_jsonl_writer
 from blocks.filters import get_language_filter, CustomItalianFilter, ItalianClassification
-from blocks.stats import DocStatsCsv
+from blocks.stats import DocStatsCsv, DocStatsRestore
+from blocks.dedup import DedupFilter
+from blocks.filter_planner import DEFAULT_FILTER_ORDER, FilterPlanner, FilterStage
+from blocks.text_analysis import attach_analysis_release
+from datatrove.utils.logging import logger
 
 from blocks.spam_classifier.spam_classifier import SpamFilter
-from blocks.spam_classifier.spam_stats import SpamFeatureExtractor, SpamFeatureCsvWriter
+from blocks.spam_classifier.spam_cascade import SpamCascade, DEFAULT_CASCADE_MODEL
+from blocks.spam_classifier.spam_stats import SPAM_FEATURE_GRAPH, SpamFeatureExtractor, SpamFeatureCsvWriter
 
-def build_italian_cleaning_pipeline(data_dir, output_dir, rejected_dir, pattern, model_path):
+# Soglie delle decisioni, usate anche da redecide.py per riapplicarle sugli output salvati
+SPAM_THRESHOLD = 0.75
+QUALITY_THRESHOLD = 0.65
+def build_filter_stages(output_dir, rejected_dir, model_path, batch_size=512, model_backend="lightgbm", spam_cascade=False, feature_store=None, feature_store_max_rows=2_000_000, lid_prefix_chars=None, lid_prefix_margin=0.1, all_features=False):
     """
-    Costruisce la pipeline modulare assemblando i blocchetti pre-configurati.
+    I tre filtri della pipeline come FilterStage (blocks.filter_planner): gli step di ognuno, le
+    chiavi dei metadata che legge da altri filtri e quelle che scrive. Usata da
+    build_italian_cleaning_pipeline e, su cartelle temporanee, per misurare l'ordine dei filtri.
     """
-    return [
-        # 1. Lettura
-        get_jsonl_reader(data_dir,  pattern = pattern),
-        
-        # 2. Filtro Lingua (Ora richiamato dal tuo modulo filters)
-        get_language_filter(rejected_dir, threshold=0.75, languages = "it"),
-
-
-        # # 4. SPAM: Estrattore Feature (Necessario al Classifier per "leggere" il testo)
-        # # NON scrive CSV, mette solo i dati nei metadata temporanei
-        SpamFeatureExtractor(),
-
-        # 5. Scrittura CSV feature spam serve per addestrare il modello poi si può togliere
+    language_filter = get_language_filter(rejected_dir, threshold=0.75, languages = "it", feature_store = feature_store, feature_store_max_rows = feature_store_max_rows, prefix_chars = lid_prefix_chars, prefix_margin = lid_prefix_margin)
+    cascade = [SpamCascade(model_path=os.path.join(model_path, DEFAULT_CASCADE_MODEL))] if spam_cascade else []
+    spam_filter = SpamFilter(
+        model_path=os.path.join(model_path, "spam_lgbm.joblib"),
+        rejected_dir=rejected_dir,
+        threshold=SPAM_THRESHOLD, # default se non impostata
+        batch_size=batch_size,
+        backend=model_backend,
+    )
+    quality_filter = ItalianClassification(
+        model_path = os.path.join(model_path, "lgbm_quality_model.joblib"),
+        rejected_dir = rejected_dir,
+        output_folder = output_dir,
+        threshold = QUALITY_THRESHOLD,
+        batch_size = batch_size,
+        backend = model_backend,
+    )
+    spam_csv = [
         SpamFeatureCsvWriter(
            output_folder=os.path.join(output_dir, "feature"), 
            csv_filename="spam_doc_features.csv"
-        ),
+        )
+    ] if all_features else []
+    spam_extractor = SpamFeatureExtractor(
+        feature_store=feature_store,
+        feature_store_max_rows=feature_store_max_rows,
+        features=None if all_features else spam_filter.required_features(),
+    )
+    doc_stats = DocStatsCsv(
+        output_folder=os.path.join(output_dir, "feature"),
+        csv_filename="doc_stats_per_file.csv",
+        groups_to_compute=["summary"],
+        languages="it",
+        feature_store=feature_store,
+        feature_store_max_rows=feature_store_max_rows,
+        features=None if all_features else quality_filter.required_features(),
+    )
 
-        # 6. Filtro spam
-        SpamFilter(
-           model_path=os.path.join(model_path, "spam_lgbm.joblib"),
-           rejected_dir=rejected_dir,
-           threshold=0.75 # default se non impostata
-           ),
-        
-        # 6. Estrazione Statistiche (CSV)
-        DocStatsCsv(
-            output_folder=os.path.join(output_dir, "feature"),
-            csv_filename="doc_stats_per_file.csv",
-            groups_to_compute=["summary"],
-            languages="it",
-        ),
+    # Chiavi lette dai modelli ma non calcolate dal proprio estrattore: vanno scritte da un filtro precedente
+    spam_writes = set(SPAM_FEATURE_GRAPH.plan(spam_extractor.features).outputs)
+    spam_reads = {f for f in spam_filter.required_features() if f not in spam_writes}
+    if "lang_is_ita" in spam_writes:
+        spam_reads.add("language")
+    quality_writes = set(doc_stats.feature_names) | {"language_score"}
+    quality_reads = {f for f in quality_filter.classifier.feature_names if f not in doc_stats.feature_names}
+    shared = [f for f in doc_stats.feature_names if f in spam_writes]
+    return {
+        # 2. Filtro Lingua
+        "language": FilterStage("language", [language_filter], writes={"language", "language_score"}),
 
+        # 3-6. SPAM: cascata opzionale, estrattore feature (con all_features anche il CSV) e filtro
+        "spam": FilterStage("spam", [*cascade, spam_extractor, *spam_csv, spam_filter], reads=spam_reads, writes=spam_writes, shares_analysis=True),
 
-        # 7. Classificazione italiana con QualityClassifier
-        ItalianClassification(
-            model_path = os.path.join(model_path, "lgbm_quality_model.joblib"),
-            rejected_dir = rejected_dir,
-            output_folder = output_dir,
-            threshold = 0.65
+        # 6-7. Statistiche (CSV) e classificazione italiana con QualityClassifier; se la qualità
+        # precede lo spam, DocStatsRestore riscrive le statistiche sovrascritte dalle feature spam
+        "quality": FilterStage(
+            "quality",
+            [doc_stats, quality_filter],
+            reads=quality_reads,
+            writes=quality_writes,
+            shares_analysis=True,
+            restore=DocStatsRestore(output_folder=os.path.join(output_dir, "feature"), groups_to_compute=["summary"], features=shared),
         ),
+    }
+
+
+def build_italian_cleaning_pipeline(data_dir, output_dir, rejected_dir, pattern, model_path, batch_size=512, model_backend="lightgbm", spam_cascade=False, byte_ranges=False, work_queue_dir=None, file_assignment=None, feature_store=None, feature_store_max_rows=2_000_000, dedup_dir=None, lid_prefix_chars=None, lid_prefix_margin=0.1, all_features=False, filter_order=DEFAULT_FILTER_ORDER, stages=None, input_format="jsonl"):
+    """
+    Costruisce la pipeline modulare assemblando i blocchetti pre-configurati.
+    batch_size controlla quanti documenti vengono classificati insieme dai filtri ML,
+    model_backend sceglie il motore di inferenza dei modelli ("lightgbm" o "numpy"),
+    spam_cascade inserisce SpamCascade prima dell'estrazione delle feature spam,
+    byte_ranges divide i JSONL in intervalli di byte tra i task (ByteRangeJsonlReader),
+    work_queue_dir fa leggere ai task le unità della coda di lavoro condivisa (WorkQueueJsonlReader),
+    file_assignment (una lista di file per task) fa leggere a ogni task il proprio gruppo (AssignedFilesJsonlReader),
+    feature_store è il database in cui LID, feature spam e statistiche vengono riusate per digest (blocks.feature_store),
+    dedup_dir è l'indice creato da blocks.dedup.prepare_dedup: DedupFilter scarta i duplicati prima di LID e feature,
+    lid_prefix_chars attiva la LID a prefisso (PrefixLID), allungato solo entro lid_prefix_margin dalla soglia,
+    all_features calcola tutte le feature spam e statistiche e scrive il CSV spam per l'addestramento;
+    altrimenti vengono calcolate solo quelle lette dai modelli e dalle regole di SpamFilter (blocks.feature_graph),
+    filter_order è l'ordine dei filtri "language", "spam" e "quality" (blocks.filter_planner);
+    stages sono i filtri già costruiti da build_filter_stages con le stesse cartelle (per esempio
+    quelli usati da FilterPlanner.compare_with_run), None = costruiti qui,
+    input_format "warc" legge file WARC/WET locali in streaming (blocks.warc.LocalWarcReader) al posto dei JSONL
+    (senza byte_ranges, work_queue_dir e file_assignment, che dividono righe JSONL).
+    """
+    if input_format == "warc" and (byte_ranges or work_queue_dir or file_assignment):
+        logger.warning("Intervalli di byte, coda di lavoro e manifest non disponibili con input WARC: ogni task legge file interi")
+    if input_format == "warc":
+        reader = get_warc_reader(data_dir, pattern)
+    else:
+        reader = get_jsonl_reader(data_dir,  pattern = pattern, byte_ranges = byte_ranges, work_queue_dir = work_queue_dir, file_assignment = file_assignment)
+    dedup = [DedupFilter(index_dir=dedup_dir, rejected_dir=rejected_dir)] if dedup_dir else []
+    if stages is None:
+        stages = build_filter_stages(output_dir, rejected_dir, model_path, batch_size=batch_size, model_backend=model_backend, spam_cascade=spam_cascade, feature_store=feature_store, feature_store_max_rows=feature_store_max_rows, lid_prefix_chars=lid_prefix_chars, lid_prefix_margin=lid_prefix_margin, all_features=all_features)
+    filter_order = tuple(filter_order)
+    if filter_order not in FilterPlanner(stages).valid_orders():
+        raise ValueError(f"Ordine dei filtri non valido: {filter_order} (la qualità legge language_score dalla lingua)")
+    if filter_order != DEFAULT_FILTER_ORDER and all_features:
+        logger.warning("Ordine dei filtri non disponibile con all_features: uso lingua -> spam -> qualità")
+        filter_order = DEFAULT_FILTER_ORDER
+
+    # Filtri nell'ordine richiesto, con le statistiche riscritte se lo spam segue la qualità
+    filters = []
+    restores = FilterPlanner(stages).restores(filter_order)
+    for name in filter_order:
+        filters.extend(stages[name].steps)
+        filters.extend(stages[restored].restore for restored in restores.get(name, []))
+    # L'ultimo blocco che usa l'analisi condivisa la rilascia appena ha finito con il documento
+    attach_analysis_release(filters)
+    return [
+        # 1. Lettura (JSONL o WARC/WET)
+        reader,
+
+        # 1b. Duplicati esatti e quasi duplicati: non arrivano a LID, feature e modelli
+        *dedup,
+
+        # 2-7. Lingua, spam e qualità (build_filter_stages) nell'ordine scelto
+        *filters,
 
         # 7. Scrittura Finale
         get_jsonl_writer(output_dir)
-    ]
\ No newline at end of file
+    ]
@@ -0,0 +1,133 @@
+"""
+Ridecide spam e qualità sugli output di un'esecuzione precedente, senza rifare LID ed estrazione
+delle feature.
+
+comando:
+    python3 src/redecide.py --spam-threshold 0.85 --quality-threshold 0.6
+    python3 src/redecide.py --quality-model models/nuovo_modello.joblib --target-dir output/redecided_v2
+
+Questo script:
+1. Legge i documenti tenuti e gli scarti di spam e qualità di --output-dir / --rejected-dir
+   (con le feature già nei metadata) e li divide tra i task per dimensione
+2. Cancella le vecchie decisioni e li fa ripassare dal filtro spam (score salvati, oppure
+   ricalcolati con --spam-model) e da ItalianClassification con le nuove soglie e/o i nuovi
+   modelli; agli scarti dello spam che ora passano vengono aggiunte le statistiche
+   (dall'archivio delle feature, se indicato, altrimenti calcolate)
+3. Scrive i nuovi insiemi di tenuti e scartati in --target-dir, in parallelo su --workers, e
+   copia gli scarti della lingua, che non dipendono da queste soglie
+4. Stampa il numero di documenti per categoria prima e dopo
+"""
+
+import argparse
+import os
+import shutil
+
+from datatrove.executor import LocalPipelineExecutor
+
+from blocks.filters import ItalianClassification
+from blocks.readers import get_jsonl_reader
+from blocks.redecide import REDECIDED_REJECTED, FillQualityFeatures, RedecideSpamFilter, ResetDecisions, redecide_inputs
+from blocks.writers import get_jsonl_writer
+from pipeline_factory import QUALITY_THRESHOLD, SPAM_THRESHOLD
+from utils.input_manifest import pack_files
+
+
+def count_docs(paths) -> int:
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            total += sum(1 for line in f if line.strip())
+    return total
+
+
+def extract_args():
+    in_docker = os.path.exists("/app/src")
+    default_root = "/app" if in_docker else os.path.abspath(".")
+    default_output = "/app/output" if in_docker else os.path.join(default_root, "output")
+    default_workers = max(1, (os.cpu_count() or 1) - 2)
+
+    parser = argparse.ArgumentParser(description="Ridecide spam e qualità sugli output salvati.")
+    parser.add_argument("--output-dir", type=str, default=default_output, help="Output dell'esecuzione da ridecidere")
+    parser.add_argument("--rejected-dir", type=str, default=None, help="Scarti dell'esecuzione (default: OUTPUT_DIR/rejected)")
+    parser.add_argument("--target-dir", type=str, default=None, help="Dove scrivere i nuovi output, cartella ricreata da zero (default: OUTPUT_DIR/redecided)")
+    parser.add_argument("--model-path", type=str, default=os.path.join(default_root, "models"))
+    parser.add_argument("--spam-model", type=str, default=None, help="Nuovo modello spam; se omesso si riusano gli score spam salvati")
+    parser.add_argument("--quality-model", type=str, default=None, help="Modello qualità (default: MODEL_PATH/lgbm_quality_model.joblib)")
+    parser.add_argument("--spam-threshold", type=float, default=SPAM_THRESHOLD)
+    parser.add_argument("--quality-threshold", type=float, default=QUALITY_THRESHOLD)
+    parser.add_argument("--feature-store", type=str, default=None, help="Archivio delle feature da cui prendere statistiche e feature spam da ricalcolare")
+    parser.add_argument("--workers", type=int, default=default_workers)
+    parser.add_argument("--tasks", type=int, default=None, help="Numero di task (default: workers, al massimo uno per file)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--model-backend", type=str, default="lightgbm", choices=["lightgbm", "numpy"])
+    return parser.parse_args()
+
+
+def main():
+    args = extract_args()
+    output_dir = os.path.abspath(args.output_dir)
+    rejected_dir = os.path.abspath(args.rejected_dir or os.path.join(output_dir, "rejected"))
+    target_dir = os.path.abspath(args.target_dir or os.path.join(output_dir, "redecided"))
+    target_rejected = os.path.join(target_dir, "rejected")
+    if target_dir in (output_dir, rejected_dir):
+        raise SystemExit("--target-dir deve essere diverso dalle cartelle lette")
+
+    inputs = redecide_inputs(output_dir, rejected_dir)
+    all_files = [path for paths in inputs.values() for path in paths]
+    if not all_files:
+        raise SystemExit(f"Nessun output da ridecidere in {output_dir}")
+
+    # I file possono stare in cartelle diverse: percorsi relativi alla radice comune
+    root = os.path.commonpath([output_dir, rejected_dir])
+    files = {os.path.relpath(path, root): {"size": os.path.getsize(path)} for path in all_files}
+    num_tasks = args.tasks or max(1, min(args.workers, len(files)))
+    assignment = pack_files(files, num_tasks)
+
+    shutil.rmtree(target_dir, ignore_errors=True)
+    quality_filter = ItalianClassification(
+        model_path=args.quality_model or os.path.join(args.model_path, "lgbm_quality_model.joblib"),
+        rejected_dir=target_rejected,
+        output_folder=target_dir,
+        threshold=args.quality_threshold,
+        batch_size=args.batch_size,
+        backend=args.model_backend,
+    )
+    pipeline = [
+        get_jsonl_reader(root, pattern=None, file_assignment=assignment),
+        ResetDecisions(),
+        RedecideSpamFilter(
+            model_path=args.spam_model or os.path.join(args.model_path, "spam_lgbm.joblib"),
+            rejected_dir=target_rejected,
+            threshold=args.spam_threshold,
+            batch_size=args.batch_size,
+            backend=args.model_backend,
+            rescore=args.spam_model is not None,
+            feature_store=args.feature_store,
+        ),
+        # Solo le statistiche lette dal modello qualità (anche un modello addestrato su meno feature)
+        FillQualityFeatures(
+            feature_dir=os.path.join(target_dir, "feature"),
+            features=quality_filter.required_features(),
+            feature_store=args.feature_store,
+        ),
+        quality_filter,
+        get_jsonl_writer(target_dir),
+    ]
+    print(f"Ridecisione: {len(files)} file | {num_tasks} task | {args.workers} workers | soglia spam {args.spam_threshold} | soglia qualità {args.quality_threshold}")
+    LocalPipelineExecutor(pipeline=pipeline, tasks=num_tasks, workers=args.workers).run()
+
+    # Gli scarti della lingua restano tali: vengono solo copiati
+    for folder in sorted(os.listdir(rejected_dir)) if os.path.isdir(rejected_dir) else []:
+        source = os.path.join(rejected_dir, folder)
+        if folder not in REDECIDED_REJECTED and os.path.isdir(source):
+            shutil.copytree(source, os.path.join(target_rejected, folder), dirs_exist_ok=True)
+
+    after = redecide_inputs(target_dir, target_rejected)
+    print("\n--- Documenti per categoria (prima -> dopo) ---")
+    for category in inputs:
+        print(f"{category}: {count_docs(inputs[category])} -> {count_docs(after[category])}")
+    print(f"\nOperazione completata. Nuovi output in: {target_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Manifest dell'input: elenco dei file con dimensione, mtime, numero di righe e lunghezza media
+dei documenti, salvato in JSON e riusato dalle esecuzioni successive.
+
+Il manifest serve a tre cose:
+- non riscansionare l'input a ogni avvio: se le cartelle raggiunte dal pattern hanno lo stesso
+  mtime dell'ultima scansione (nessun file aggiunto, tolto o rinominato) l'elenco dei file viene
+  preso dal manifest senza glob né stat dei file. Un file modificato sul posto non cambia il mtime
+  della cartella: in quel caso serve ``rescan=True`` (``--rescan-input``), che confronta dimensione
+  e mtime di ogni file e rilegge solo quelli cambiati;
+- dividere i file tra i task in modo bilanciato per byte (``pack_files``), invece che per
+  posizione nell'elenco come fa DataTrove;
+- stimare la durata prima di partire (``estimate_seconds``), usando il throughput per worker
+  misurato nell'esecuzione precedente (``record_run``) o, alla prima esecuzione,
+  ``DEFAULT_BYTES_PER_SECOND``.
+"""
+
+from __future__ import annotations
+
+import glob
+import heapq
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from datatrove.io import open_file
+
+MANIFEST_VERSION = 1
+# Righe lette da ogni file per stimare la lunghezza media dei documenti
+DEFAULT_SAMPLE_DOCS = 200
+_READ_CHUNK = 1 << 20
+# Throughput per worker usato per l'ETA finché record_run non ne ha misurato uno: ~437 kB/s
+# misurati con la pipeline completa su data/dataset e un worker, arrotondati per difetto
+DEFAULT_BYTES_PER_SECOND = 400e3
+
+
+def _scan_file(path: str, sample_docs: int) -> Dict:
+    """Conta le righe del file e stima la lunghezza media del testo sui primi ``sample_docs`` documenti."""
+    lengths = []
+    with open_file(path, mode="rb", compression="infer") as f:
+        for line in f:
+            if len(lengths) >= sample_docs:
+                break
+            try:
+                text = json.loads(line).get("text")
+            except (ValueError, AttributeError):
+                continue
+            if isinstance(text, str):
+                lengths.append(len(text))
+
+    lines = 0
+    last = b"\n"
+    with open_file(path, mode="rb", compression="infer") as f:
+        while chunk := f.read(_READ_CHUNK):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1
+    return {
+        "lines": lines,
+        "avg_doc_chars": sum(lengths) / len(lengths) if lengths else 0.0,
+        "sampled_docs": len(lengths),
+    }
+
+
+def load_manifest(manifest_path: str) -> Dict:
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        print(f"[WARN] Manifest {manifest_path} di una versione diversa, lo ricostruisco.")
+    return {"version": MANIFEST_VERSION, "files": {}, "throughput": None}
+
+
+def save_manifest(manifest: Dict, manifest_path: str) -> None:
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def _has_magic(part: str) -> bool:
+    return any(c in part for c in "*?[")
+
+
+def _pattern_dirs(data_dir: str, pattern: str) -> Dict[str, int]:
+    """
+    mtime (in ns) delle cartelle in cui ``pattern`` può trovare file: la sola cartella del pattern
+    se non contiene caratteri jolly, altrimenti la parte fissa iniziale e tutte le sue
+    sottocartelle (solo cartelle, senza stat dei file). Chiavi relative a ``data_dir``.
+    """
+    parts = os.path.dirname(pattern).split("/") if os.path.dirname(pattern) else []
+    fixed = []
+    for part in parts:
+        if _has_magic(part):
+            break
+        fixed.append(part)
+    base = os.path.join(data_dir, *fixed)
+    if not os.path.isdir(base):
+        return {}
+    if len(fixed) == len(parts):
+        return {os.path.relpath(base, data_dir): os.stat(base).st_mtime_ns}
+    dirs = {}
+    for root, _, _ in os.walk(base):
+        dirs[os.path.relpath(root, data_dir)] = os.stat(root).st_mtime_ns
+    return dirs
+
+
+def update_manifest(
+    data_dir: str,
+    pattern: str,
+    manifest_path: str,
+    sample_docs: int = DEFAULT_SAMPLE_DOCS,
+    rescan: bool = False,
+) -> Dict:
+    """
+    Elenca i file di ``pattern`` sotto ``data_dir`` e aggiorna il manifest: i file con la stessa
+    dimensione e mtime vengono riusati, quelli nuovi o modificati vengono scansionati, quelli
+    spariti vengono tolti. Le chiavi di ``files`` sono percorsi relativi a ``data_dir``.
+    Senza ``rescan``, se ``data_dir``, ``pattern`` e mtime delle cartelle coincidono con quelli
+    salvati il manifest viene restituito così com'è.
+    """
+    manifest = load_manifest(manifest_path)
+    source = {"data_dir": os.path.abspath(data_dir), "pattern": pattern}
+    dirs = _pattern_dirs(data_dir, pattern)
+    saved = manifest.get("input") or {}
+    if not rescan and saved.get("dirs") == dirs and {k: saved.get(k) for k in source} == source:
+        print(f"[OK] Manifest input: {len(manifest['files'])} file (0 scansionati, cartelle invariate) -> {manifest_path}")
+        return manifest
+
+    previous = manifest["files"]
+    files = {}
+    scanned = 0
+    for path in sorted(glob.glob(os.path.join(data_dir, pattern), recursive=True)):
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        rel_path = os.path.relpath(path, data_dir)
+        entry = previous.get(rel_path)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime, **_scan_file(path, sample_docs)}
+            scanned += 1
+        files[rel_path] = entry
+
+    manifest["files"] = files
+    manifest["input"] = {**source, "dirs": dirs}
+    save_manifest(manifest, manifest_path)
+    print(f"[OK] Manifest input: {len(files)} file ({scanned} scansionati, {len(files) - scanned} dal manifest) -> {manifest_path}")
+    return manifest
+
+
+def pack_files(files: Dict[str, Dict], num_tasks: int) -> List[List[str]]:
+    """
+    Divide i file in ``num_tasks`` gruppi di dimensione totale simile: dal più grande al più
+    piccolo, ogni file va al gruppo più leggero (Longest Processing Time). Ogni gruppo è ordinato
+    per percorso, i gruppi vuoti restano vuoti se i file sono meno dei task.
+    """
+    bins: List[List[str]] = [[] for _ in range(num_tasks)]
+    heap = [(0, task) for task in range(num_tasks)]
+    for path in sorted(files, key=lambda p: (-files[p]["size"], p)):
+        load, task = heapq.heappop(heap)
+        bins[task].append(path)
+        heapq.heappush(heap, (load + files[path]["size"], task))
+    return [sorted(paths) for paths in bins]
+
+
+def estimate_seconds(bin_bytes: List[int], workers: int, bytes_per_second: float) -> float:
+    """Durata stimata: i gruppi vengono eseguiti su ``workers`` processi, ognuno al throughput misurato."""
+    loads = [0.0] * max(1, workers)
+    for size in sorted(bin_bytes, reverse=True):
+        loads[loads.index(min(loads))] += size
+    return max(loads) / bytes_per_second
+
+
+def describe_plan(manifest: Dict, bins: List[List[str]], workers: int) -> str:
+    """Riepilogo di input, bilanciamento dei task e durata stimata da stampare prima di partire."""
+    files = manifest["files"]
+    bin_bytes = [sum(files[p]["size"] for p in paths) for paths in bins]
+    total_bytes = sum(bin_bytes)
+    total_docs = sum(entry["lines"] for entry in files.values())
+    sampled = [e for e in files.values() if e["sampled_docs"]]
+    avg_chars = sum(e["avg_doc_chars"] * e["lines"] for e in sampled) / max(1, sum(e["lines"] for e in sampled))
+    lines = [
+        f"Input: {len(files)} file | {total_bytes / 1e6:.1f} MB | ~{total_docs} documenti | ~{avg_chars:.0f} caratteri/doc",
+        f"Task: {len(bins)} | byte per task min {min(bin_bytes, default=0) / 1e6:.1f} MB, max {max(bin_bytes, default=0) / 1e6:.1f} MB",
+    ]
+    throughput: Optional[Dict] = manifest.get("throughput")
+    if throughput:
+        eta = estimate_seconds(bin_bytes, workers, throughput["bytes_per_second"])
+        lines.append(
+            f"ETA: ~{eta / 60:.1f} min con {workers} worker "
+            f"({throughput['bytes_per_second'] / 1e3:.0f} kB/s per worker, misurati il {throughput['measured_at']})"
+        )
+    else:
+        eta = estimate_seconds(bin_bytes, workers, DEFAULT_BYTES_PER_SECOND)
+        lines.append(
+            f"ETA: ~{eta / 60:.1f} min con {workers} worker "
+            f"(stima predefinita a {DEFAULT_BYTES_PER_SECOND / 1e3:.0f} kB/s per worker, nessuna esecuzione registrata nel manifest)"
+        )
+    return "\n".join(lines)
+
+
+def record_run(manifest: Dict, manifest_path: str, bins: List[List[str]], workers: int, elapsed: float) -> None:
+    """
+    Registra il throughput per worker dell'esecuzione appena conclusa: byte letti diviso il
+    tempo totale e il numero di worker effettivamente occupati.
+    """
+    files = manifest["files"]
+    total_bytes = sum(files[p]["size"] for paths in bins for p in paths)
+    busy_workers = max(1, min(workers, sum(1 for paths in bins if paths)))
+    if total_bytes == 0 or elapsed <= 0:
+        return
+    manifest["throughput"] = {
+        "bytes_per_second": total_bytes / elapsed / busy_workers,
+        "measured_at": time.strftime("%Y-%m-%d %H:%M"),
+    }
+    save_manifest(manifest, manifest_path)
@@ -0,0 +1,221 @@
+"""
+Stima a campione di un'esecuzione completa (``main.py --estimate``): durata con MAX_WORKERS,
+quota di tempo di ogni step, dimensione dell'output e documenti per cartella degli scarti
+(``1_language``, ``2_spam``, ``3_quality``), con intervalli di confidenza al 95%.
+
+Il campione è stratificato per file: ogni file di input contribuisce con righe estratte a caso, in
+numero proporzionale alle sue (almeno una per file). Con l'allocazione proporzionale ogni riga ha
+circa la stessa probabilità di essere estratta, quindi le medie del campione stimano quelle
+dell'input. Il campione viene diviso in ``replicates`` sottocampioni casuali, stratificati anche
+loro, che attraversano la pipeline uno alla volta con un rank diverso (file di output separati).
+Ogni sottocampione dà una stima indipendente di ogni grandezza: la stima finale è la media e
+l'intervallo viene dalla t di Student sulle stime dei sottocampioni (metodo dei sottocampioni
+replicati), così comprende anche la variabilità dei tempi, che non si misurano per documento.
+
+La durata usa i secondi per byte del campione e la divisione dell'input tra i task
+(``task_bytes``) con ``estimate_seconds`` di utils.input_manifest. Restano fuori l'avvio dei
+worker, il caricamento dei modelli e la contesa tra processi: con molti worker la durata vera può
+essere più alta.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import random
+import time
+from collections import deque
+from typing import Dict, List, Sequence
+
+import numpy as np
+import orjson
+from datatrove.io import open_file
+from scipy.stats import t as student_t
+
+from utils.input_manifest import estimate_seconds, pack_files
+
+DEFAULT_ESTIMATE_DOCS = 2000
+DEFAULT_REPLICATES = 10
+# Righe senza testo: il reader le salta, non arrivano a nessun filtro
+NO_TEXT_BUCKET = "no_text"
+
+
+def task_bytes(files: Dict[str, Dict], num_tasks: int, mode: str = "files") -> List[int]:
+    """
+    Byte letti da ogni task. ``mode`` è "manifest" (file divisi per dimensione, pack_files),
+    "split" (intervalli di byte o coda di lavoro: input diviso in parti uguali) o "files"
+    (DataTrove: file in ordine di percorso, il task ``rank`` legge ``files[rank::num_tasks]``).
+    """
+    paths = sorted(files)
+    total = sum(files[p]["size"] for p in paths)
+    if mode == "manifest":
+        return [sum(files[p]["size"] for p in group) for group in pack_files(files, num_tasks)]
+    if mode == "split":
+        return [total / num_tasks] * num_tasks
+    return [sum(files[p]["size"] for p in paths[rank::num_tasks]) for rank in range(num_tasks)]
+
+
+def stratified_sample(data_dir: str, files: Dict[str, Dict], sample_docs: int, seed: int = 0) -> Dict[str, List[tuple]]:
+    """
+    Righe estratte da ogni file (``files`` del manifest, con ``lines``), in proporzione alle sue:
+    ``{file: [(indice della riga, riga), ...]}``. I file vengono letti in streaming fino
+    all'ultima riga estratta.
+    """
+    rng = random.Random(seed)
+    total_lines = sum(entry["lines"] for entry in files.values())
+    sample: Dict[str, List[tuple]] = {}
+    for rel_path in sorted(files):
+        lines = files[rel_path]["lines"]
+        if lines == 0:
+            continue
+        n = min(lines, max(1, round(sample_docs * lines / total_lines)))
+        wanted = set(rng.sample(range(lines), n))
+        last = max(wanted)
+        picked = []
+        with open_file(os.path.join(data_dir, rel_path), mode="rb", compression="infer") as f:
+            for index, line in enumerate(f):
+                if index in wanted:
+                    picked.append((index, line))
+                if index >= last:
+                    break
+        sample[rel_path] = picked
+    return sample
+
+
+def split_replicates(sample: Dict[str, List[tuple]], replicates: int, seed: int = 0) -> List[List[tuple]]:
+    """Sottocampioni casuali, ognuno con una parte delle righe di ogni file: ``[(file, indice, riga), ...]``."""
+    rng = random.Random(seed + 1)
+    groups: List[List[tuple]] = [[] for _ in range(replicates)]
+    offset = 0
+    for rel_path, picked in sample.items():
+        picked = list(picked)
+        rng.shuffle(picked)
+        # Il giro riparte da dove era arrivato il file precedente: i sottocampioni restano bilanciati
+        for i, (index, line) in enumerate(picked):
+            groups[(offset + i) % replicates].append((rel_path, index, line))
+        offset += len(picked)
+    return [group for group in groups if group]
+
+
+def _count_lines(paths: Sequence[str]) -> tuple:
+    lines, size = 0, 0
+    for path in paths:
+        size += os.path.getsize(path)
+        with open(path, "rb") as f:
+            lines += sum(1 for _ in f)
+    return lines, size
+
+
+def run_replicate(pipeline: list, rows: List[tuple], output_dir: str, rejected_dir: str, rank: int, world_size: int) -> Dict:
+    """
+    Fa passare le righe di un sottocampione dalla pipeline (reader escluso: i documenti vengono
+    creati con il suo adapter) con rank ``rank`` e conta documenti e byte di output e scarti.
+    """
+    reader, steps = pipeline[0], pipeline[1:]
+    docs = []
+    start = time.perf_counter()
+    for rel_path, index, line in rows:
+        doc = reader.get_document_from_dict(orjson.loads(line), rel_path, index)
+        if doc is not None:
+            docs.append(doc)
+    seconds = {"reader": time.perf_counter() - start}
+
+    before = [step.stats.time_stats.total for step in steps]
+    stream = iter(docs)
+    for step in steps:
+        stream = step.run(stream, rank=rank, world_size=world_size)
+    deque(stream, maxlen=0)
+    for step, previous in zip(steps, before):
+        seconds[step.name] = seconds.get(step.name, 0.0) + step.stats.time_stats.total - previous
+
+    kept, output_bytes = _count_lines(glob.glob(os.path.join(output_dir, f"*_{rank:05d}.jsonl")))
+    buckets = {NO_TEXT_BUCKET: len(rows) - len(docs)}
+    for folder in sorted(os.listdir(rejected_dir)) if os.path.isdir(rejected_dir) else []:
+        buckets[folder] = _count_lines(glob.glob(os.path.join(rejected_dir, folder, f"*_{rank:05d}.jsonl")))[0]
+    return {"rows": len(rows), "kept": kept, "output_bytes": output_bytes, "buckets": buckets, "seconds": seconds}
+
+
+def _interval(values: Sequence[float]) -> Dict[str, float]:
+    """Media delle stime dei sottocampioni e intervallo al 95% (t di Student)."""
+    values = np.asarray(values, dtype=float)
+    mean = float(values.mean())
+    if len(values) < 2:
+        return {"estimate": mean, "low": mean, "high": mean}
+    half = float(student_t.ppf(0.975, len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values)))
+    return {"estimate": mean, "low": mean - half, "high": mean + half}
+
+
+def estimate_run(
+    data_dir: str,
+    files: Dict[str, Dict],
+    pipeline: list,
+    output_dir: str,
+    rejected_dir: str,
+    bins: List[int],
+    workers: int,
+    sample_docs: int = DEFAULT_ESTIMATE_DOCS,
+    replicates: int = DEFAULT_REPLICATES,
+    seed: int = 0,
+) -> Dict:
+    """
+    Stima dell'esecuzione completa di ``pipeline`` (costruita con ``output_dir`` e
+    ``rejected_dir`` temporanee) su ``files`` del manifest; ``bins`` sono i byte di ogni task
+    (``task_bytes``) e ``workers`` i processi dell'executor.
+    """
+    total_lines = sum(entry["lines"] for entry in files.values())
+    total_bytes = sum(entry["size"] for entry in files.values())
+    groups = split_replicates(stratified_sample(data_dir, files, sample_docs, seed), replicates, seed)
+    results = [
+        run_replicate(pipeline, rows, output_dir, rejected_dir, rank, len(groups))
+        for rank, rows in enumerate(groups)
+    ]
+
+    def projected(value) -> Dict[str, float]:
+        # Ogni sottocampione stima il totale dell'input dalla propria media per riga
+        return _interval([total_lines * value(r) / r["rows"] for r in results])
+
+    buckets = sorted({name for r in results for name in r["buckets"]})
+    steps = list(dict.fromkeys(name for r in results for name in r["seconds"]))
+    cpu = [total_lines * sum(r["seconds"].values()) / r["rows"] for r in results]
+    return {
+        "input": {"files": len(files), "lines": total_lines, "bytes": total_bytes},
+        "sample": {"docs": sum(r["rows"] for r in results), "replicates": len(results), "seed": seed},
+        "workers": workers,
+        "tasks": len(bins),
+        "wall_seconds": _interval([
+            estimate_seconds(bins, workers, total_bytes / seconds) if seconds > 0 else 0.0 for seconds in cpu
+        ]),
+        "cpu_seconds": _interval(cpu),
+        "time_share": {
+            name: _interval([r["seconds"].get(name, 0.0) / sum(r["seconds"].values()) for r in results])
+            for name in steps
+        },
+        "kept_docs": projected(lambda r: r["kept"]),
+        "output_bytes": projected(lambda r: r["output_bytes"]),
+        "rejected_docs": {name: projected(lambda r, name=name: r["buckets"].get(name, 0)) for name in buckets},
+    }
+
+
+def _fmt(interval: Dict[str, float], scale: float = 1.0, digits: int = 0) -> str:
+    return (
+        f"{interval['estimate'] / scale:.{digits}f} "
+        f"[{interval['low'] / scale:.{digits}f}, {interval['high'] / scale:.{digits}f}]"
+    )
+
+
+def format_estimate(report: Dict) -> str:
+    """Riepilogo leggibile di ``estimate_run`` (stima [intervallo al 95%])."""
+    inp, sample = report["input"], report["sample"]
+    lines = [
+        f"Input: {inp['files']} file | {inp['bytes'] / 1e6:.1f} MB | {inp['lines']} documenti",
+        f"Campione: {sample['docs']} documenti in {sample['replicates']} sottocampioni (stima [intervallo al 95%])",
+        f"Durata con {report['workers']} worker e {report['tasks']} task: {_fmt(report['wall_seconds'], 60, 1)} min "
+        f"(tempo di calcolo {_fmt(report['cpu_seconds'], 60, 1)} min)",
+        f"Documenti tenuti: {_fmt(report['kept_docs'])} | output: {_fmt(report['output_bytes'], 1e6, 1)} MB",
+    ]
+    for name, interval in report["rejected_docs"].items():
+        lines.append(f"  {name}: {_fmt(interval)} documenti")
+    lines.append("Quota di tempo per step:")
+    for name, interval in sorted(report["time_share"].items(), key=lambda item: -item[1]["estimate"]):
+        lines.append(f"  {name}: {_fmt(interval, 0.01, 1)} %")
+    return "\n".join(lines)